@@ -0,0 +1,94 @@
+"""Measure the per-iteration overhead of the supervisord main loop.
+
+Builds a supervisord with N idle RUNNING processes (each with stdout and
+stderr dispatchers) and a poller that never reports any events, then
+times single passes through Supervisor.runforever().  The "rebuild"
+column times the bookkeeping the main loop used to do on every pass
+(rebuilding the fd -> dispatcher map from every group, sorting the
+groups and re-registering every fd) for comparison.
+
+Usage: python benchmarks/bench_mainloop.py [-i ITERATIONS] [N ...]
+"""
+
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supervisor.process import ProcessGroup
+from supervisor.process import Subprocess
+from supervisor.states import ProcessStates
+from supervisor.supervisord import Supervisor
+from supervisor.tests.base import DummyDispatcher
+from supervisor.tests.base import DummyOptions
+from supervisor.tests.base import DummyPConfig
+from supervisor.tests.base import DummyPGroupConfig
+
+PROCESSES_PER_GROUP = 10
+
+def make_supervisor(nprocs):
+    options = DummyOptions()
+    options.test = True
+    supervisord = Supervisor(options)
+    fd = 100
+    for groupnum in range(0, nprocs, PROCESSES_PER_GROUP):
+        gconfig = DummyPGroupConfig(options, 'group%d' % groupnum,
+                                    priority=groupnum % 7)
+        group = ProcessGroup(gconfig)
+        for procnum in range(groupnum,
+                             min(groupnum + PROCESSES_PER_GROUP, nprocs)):
+            pconfig = DummyPConfig(options, 'proc%d' % procnum, '/bin/cat')
+            process = Subprocess(pconfig)
+            process.group = group
+            process.pid = procnum + 2
+            process.state = ProcessStates.RUNNING
+            process.laststart = time.time() - 60
+            for _ in ('stdout', 'stderr'):
+                dispatcher = DummyDispatcher(readable=True, fd=fd)
+                process.dispatchers[fd] = dispatcher
+                options.add_dispatcher(dispatcher)
+                fd += 1
+            group.processes[pconfig.name] = process
+        supervisord.process_groups[gconfig.name] = group
+        supervisord.sorted_groups.append(group)
+    supervisord.sorted_groups.sort()
+    return supervisord
+
+def rebuild_pass(supervisord):
+    options = supervisord.options
+    combined_map = {}
+    combined_map.update(options.get_socket_map())
+    for group in supervisord.process_groups.values():
+        combined_map.update(group.get_dispatchers())
+    pgroups = list(supervisord.process_groups.values())
+    pgroups.sort()
+    for fd, dispatcher in combined_map.items():
+        if dispatcher.readable():
+            options.poller.register_readable(fd)
+        if dispatcher.writable():
+            options.poller.register_writable(fd)
+
+def bench(func, iterations):
+    # best of three runs, reported per iteration in microseconds
+    timer = timeit.Timer(func)
+    return min(timer.repeat(3, iterations)) / iterations * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-i', '--iterations', type=int, default=200)
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[100, 1000, 10000])
+    args = parser.parse_args(argv)
+
+    print('%10s %16s %16s' % ('processes', 'runforever(us)', 'rebuild(us)'))
+    for nprocs in args.sizes:
+        supervisord = make_supervisor(nprocs)
+        loop = bench(supervisord.runforever, args.iterations)
+        rebuild = bench(lambda: rebuild_pass(supervisord), args.iterations)
+        print('%10d %16.1f %16.1f' % (nprocs, loop, rebuild))
+
+if __name__ == '__main__':
+    main()
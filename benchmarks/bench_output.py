@@ -0,0 +1,97 @@
+"""Measure how fast supervisord moves child output from the pipe to the log.
+
+Starts N programs that each write SIZE MB to stdout as fast as they can
+and drives their dispatchers with the poller, like the mainloop does,
+until every child has exited and its output has been logged.  Reports
+the throughput per child and in total, and how busy supervisord itself
+was (100% is one core).  The logs go to a temporary
+directory, or to /dev/null with --devnull so that only supervisord's
+own overhead is measured.
+
+Usage: python benchmarks/bench_output.py [-s SIZE] [--devnull] [N ...]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supervisor.options import ServerOptions
+from supervisor.tests.base import DummyLogger
+
+def make_options(nprograms, size, tempdir, devnull):
+    conf = os.path.join(tempdir, 'supervisord.conf')
+    with open(conf, 'w') as f:
+        f.write('[supervisord]\n')
+        for i in range(nprograms):
+            if devnull:
+                logfile = os.devnull
+            else:
+                logfile = os.path.join(tempdir, 'p%d.log' % i)
+            f.write('[program:p%d]\n'
+                    'command=head -c %d /dev/zero\n'
+                    'stdout_logfile=%s\n'
+                    'stdout_logfile_maxbytes=0\n'
+                    'stderr_logfile=NONE\n' % (i, size, logfile))
+    options = ServerOptions()
+    options.realize(['-c', conf])
+    options.logger = DummyLogger()
+    return options
+
+def bench(options):
+    processes = []
+    for config in options.process_group_configs:
+        process = config.process_configs[0].make_process()
+        processes.append(process)
+    poller = options.poller
+    start = time.time()
+    cpu_start = sum(os.times()[:2])
+    stdouts = []
+    for process in processes:
+        process.spawn()
+        stdouts.append(process.dispatchers[process.pipes['stdout']])
+    while [ d for d in stdouts if not d.closed ]:
+        r, w = poller.poll(1)
+        for fd in r:
+            dispatcher = options.process_map.get(fd)
+            if dispatcher is not None:
+                dispatcher.handle_read_event()
+    elapsed = time.time() - start
+    cpu = sum(os.times()[:2]) - cpu_start
+    for process in processes:
+        for dispatcher in process.dispatchers.values():
+            dispatcher.close()
+        if process.pid: # not reaped through a pidfd yet
+            pid, sts = os.waitpid(process.pid, 0)
+            process.finish(pid, sts)
+    return elapsed, cpu
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-s', '--size', type=int, default=1024,
+                        help='MB written by each child')
+    parser.add_argument('--devnull', action='store_true',
+                        help='log to /dev/null')
+    parser.add_argument('sizes', nargs='*', type=int, default=[1, 4, 16])
+    args = parser.parse_args(argv)
+
+    size = args.size * 1024 * 1024
+    print('%10s %18s %16s %8s' % ('children', 'per child (MB/s)',
+                                  'total (MB/s)', 'cpu (%)'))
+    for nprograms in args.sizes:
+        tempdir = tempfile.mkdtemp()
+        try:
+            options = make_options(nprograms, size, tempdir, args.devnull)
+            elapsed, cpu = bench(options)
+        finally:
+            shutil.rmtree(tempdir)
+        total = nprograms * args.size / elapsed
+        print('%10d %18.0f %16.0f %8.0f' % (nprograms, total / nprograms,
+                                            total, cpu / elapsed * 100))
+
+if __name__ == '__main__':
+    main()
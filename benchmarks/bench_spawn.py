@@ -0,0 +1,80 @@
+"""Measure how many processes supervisord can spawn per second.
+
+Loads a configuration with N programs (so supervisord's heap holds N
+ProcessConfig objects, plus an optional ballast to emulate a bigger
+heap), then times Subprocess.spawn() followed by reaping the child, once
+with the fork() + exec path and once with the posix_spawn() path.  The
+programs run /bin/true.
+
+Usage: python benchmarks/bench_spawn.py [-s SPAWNS] [-b MB] [N ...]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supervisor.options import ServerOptions
+from supervisor.tests.base import DummyLogger
+
+def make_options(nprograms, tempdir):
+    conf = os.path.join(tempdir, 'supervisord.conf')
+    with open(conf, 'w') as f:
+        f.write('[supervisord]\n')
+        f.write('minfds=4096\n')
+        for i in range(nprograms):
+            f.write('[program:p%d]\ncommand=/bin/true\n'
+                    'stdout_logfile=NONE\nstderr_logfile=NONE\n' % i)
+    options = ServerOptions()
+    options.realize(['-c', conf])
+    options.logger = DummyLogger()
+    return options
+
+def bench(options, spawns, posix_spawn):
+    options.posix_spawn_available = posix_spawn
+    processes = []
+    for config in options.process_group_configs[:spawns]:
+        process = config.process_configs[0].make_process()
+        processes.append(process)
+    start = time.time()
+    for process in processes:
+        pid = process.spawn()
+        _, sts = os.waitpid(pid, 0)
+        options.pidhistory.pop(pid, None)
+        process.finish(pid, sts)
+    return len(processes) / (time.time() - start)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-s', '--spawns', type=int, default=200)
+    parser.add_argument('-b', '--ballast', type=int, default=0,
+                        help='extra MB of heap to allocate')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[100, 1000, 10000])
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, 'posix_spawn'):
+        sys.exit('os.posix_spawn is not available (requires Python 3.8+)')
+
+    ballast = bytearray(args.ballast * 1024 * 1024)
+    for i in range(0, len(ballast), 4096): # touch every page
+        ballast[i] = 1
+
+    print('%10s %16s %22s' % ('programs', 'fork(spawns/s)',
+                              'posix_spawn(spawns/s)'))
+    for nprograms in args.sizes:
+        tempdir = tempfile.mkdtemp()
+        try:
+            options = make_options(max(nprograms, args.spawns), tempdir)
+            forked = bench(options, args.spawns, False)
+            spawned = bench(options, args.spawns, True)
+        finally:
+            shutil.rmtree(tempdir)
+        print('%10d %16.0f %22.0f' % (nprograms, forked, spawned))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Measure how fast supervisord strips ANSI escapes from child output.
+
+Generates SIZE MB of colored log lines, like a program run with
+strip_ansi=true writes, and strips the escapes from all of it at once
+with stripEscapes() and in 64KB reads, like the dispatchers do, with
+EscapeStripper.  Reports the throughput of both.
+
+Usage: python benchmarks/bench_strip_ansi.py [-s SIZE] [-r READSIZE]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supervisor import dispatchers
+
+LINES = (
+    b'\x1b[2m2024-01-01 00:00:00\x1b[0m \x1b[1;32mINFO\x1b[0m '
+    b'request handled in \x1b[36m12ms\x1b[0m\n',
+    b'\x1b[2m2024-01-01 00:00:01\x1b[0m \x1b[1;33mWARN\x1b[0m '
+    b'slow query: \x1b[35mSELECT * FROM table\x1b[0m\n',
+    b'plain line without any colors at all, written by a library\n',
+)
+
+def make_output(size):
+    chunk = b''.join(LINES) * 1000
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+def bench_whole(data):
+    start = time.time()
+    dispatchers.stripEscapes(data)
+    return time.time() - start
+
+def bench_chunked(data, readsize):
+    stripper = dispatchers.EscapeStripper()
+    start = time.time()
+    for i in range(0, len(data), readsize):
+        stripper.strip(data[i:i + readsize])
+    return time.time() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-s', '--size', type=int, default=16,
+                        help='MB of output')
+    parser.add_argument('-r', '--readsize', type=int, default=1 << 16,
+                        help='bytes per read')
+    args = parser.parse_args(argv)
+
+    data = make_output(args.size * 1024 * 1024)
+    print('%20s %10s' % ('', 'MB/s'))
+    elapsed = bench_whole(data)
+    print('%20s %10.0f' % ('stripEscapes', args.size / elapsed))
+    if hasattr(dispatchers, 'EscapeStripper'):
+        elapsed = bench_chunked(data, args.readsize)
+        print('%20s %10.0f' % ('EscapeStripper', args.size / elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import time
 
 from supervisor.compat import xmlrpclib
 from supervisor.compat import long
+from supervisor.compat import as_bytes
 from supervisor.compat import as_string
 
 from supervisor.xmlrpc import SupervisorTransport
@@ -43,6 +44,13 @@ class ProcessCommunicationsProtocol:
         fp.write(ProcessCommunicationEvent.END_TOKEN)
         fp.flush()
 
+    def sendframe(self, msg, fp=sys.stdout):
+        # the frame says how many bytes follow, not characters
+        data = as_bytes(msg)
+        fp.write(as_bytes(ProcessCommunicationEvent.FRAME_TOKEN % len(data)))
+        fp.write(data)
+        fp.flush()
+
     def stdout(self, msg):
         return self.send(msg, sys.stdout)
 
@@ -85,6 +85,11 @@ try: # pragma: no cover
 except ImportError: # pragma: no cover
     syslog = None
 
+try: # pragma: no cover
+    import lzma
+except ImportError: # pragma: no cover
+    lzma = None
+
 try: # pragma: no cover
     import ConfigParser
 except ImportError: # pragma: no cover
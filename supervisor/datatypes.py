@@ -7,6 +7,7 @@ import shlex
 
 from supervisor.compat import urlparse
 from supervisor.compat import long
+from supervisor.compat import lzma
 from supervisor.loggers import getLevelNumByDescription
 
 def process_or_group_name(name):
@@ -357,6 +358,25 @@ def existing_dirpath(v):
     raise ValueError('The directory named as part of the path %s '
                      'does not exist' % v)
 
+def log_rotation(value):
+    s = str(value).lower()
+    if s not in ('rename', 'segments'):
+        raise ValueError('value %r is not a valid log rotation scheme' % value)
+    return s
+
+def log_compression(value):
+    s = str(value).lower()
+    if s == 'none':
+        return None
+    if s == 'lzma':
+        s = 'xz'
+    if s not in ('gzip', 'xz'):
+        raise ValueError('value %r is not a valid log compression' % value)
+    if s == 'xz' and lzma is None:
+        raise ValueError('log compression %r requires the lzma module, '
+                         'which this Python does not have' % value)
+    return s
+
 def logging_level(value):
     s = str(value).lower()
     level = getLevelNumByDescription(s)
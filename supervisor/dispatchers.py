@@ -1,7 +1,10 @@
 import errno
+import os
+import re
 from supervisor.medusa.asynchat_25 import find_prefix_at_end
 from supervisor.medusa.asyncore_25 import compact_traceback
 
+from supervisor.compat import as_bytes
 from supervisor.compat import as_string
 from supervisor.events import notify
 from supervisor.events import EventRejectedEvent
@@ -10,12 +13,14 @@ from supervisor.events import ProcessLogStdoutEvent
 from supervisor.states import EventListenerStates
 from supervisor.states import getEventListenerStateDescription
 from supervisor import loggers
+from supervisor.logwriter import QueuedHandler
 
 class PDispatcher:
     """ Asyncore dispatcher for mainloop, representing a process channel
     (stdin, stdout, or stderr).  This class is abstract. """
 
     closed = False # True if close() has been called
+    queued_handlers = () # log handlers written by LogWriter threads
 
     def __init__(self, process, channel, fd):
         self.process = process  # process which "owns" this dispatcher
@@ -56,9 +61,13 @@ class PDispatcher:
 
     def close(self):
         if not self.closed:
-            self.process.config.options.logger.debug(
+            options = self.process.config.options
+            options.logger.debug(
                 'fd %s closed, stopped monitoring %s' % (self.fd, self))
+            options.remove_dispatcher(self)
             self.closed = True
+            # let the process notice that its pipe is gone
+            options.timers.schedule(self.process, 0)
 
     def flush(self):
         pass
@@ -80,6 +89,9 @@ class POutputDispatcher(PDispatcher):
     capturelog = None # the logger used while we're in capturemode
     capturemode = False # are we capturing process event data
     output_buffer = b'' # data waiting to be logged
+    capture_remaining = None # bytes left to capture after a FRAME_TOKEN
+    splicelog = None # file handler output is spliced to, if any
+    tail = None # OutputTail of the channel, if it has one
 
     def __init__(self, process, event_type, fd):
         """
@@ -103,11 +115,62 @@ class POutputDispatcher(PDispatcher):
         endtoken = self.event_type.END_TOKEN
         self.begintoken_data = (begintoken, len(begintoken))
         self.endtoken_data = (endtoken, len(endtoken))
+        framestart, frameend = [ as_bytes(part) for part in
+                                 self.event_type.FRAME_TOKEN.split('%d') ]
+        self.begintoken_re = re.compile(
+            re.escape(begintoken) + b'|' + re.escape(framestart) +
+            b'([0-9]{1,20})' + re.escape(frameend))
+        self.frametoken_data = (framestart, frameend,
+                                len(framestart) + 20 + len(frameend))
         self.mainlog_level = loggers.LevelsByName.DEBG
         config = self.process.config
         self.log_to_mainlog = config.options.loglevel <= self.mainlog_level
         self.stdout_events_enabled = config.stdout_events_enabled
         self.stderr_events_enabled = config.stderr_events_enabled
+        self.escape_stripper = EscapeStripper()
+
+        self._init_tail()
+        self._init_splicelog()
+
+    def _init_tail(self):
+        """
+        Set self.tail to the OutputTail of this channel of the process if
+        it is configured to have one, making it on first use.
+        """
+        config = self.process.config
+        maxbytes = getattr(config, '%s_tail_maxbytes' % self.channel)
+        if not maxbytes:
+            return
+        tail = self.process.output_tails.get(self.channel)
+        if tail is None:
+            tail = OutputTail(maxbytes)
+            self.process.output_tails[self.channel] = tail
+        tail.queued_handlers = self.queued_handlers
+        self.tail = tail
+
+    def _init_splicelog(self):
+        """
+        If the output of this channel only goes to a log file, it doesn't
+        need to pass through supervisord: it can be moved from the pipe to
+        the file by the kernel.  Sets self.splicelog to the file handler if
+        that is the case.
+        """
+        if not hasattr(os, 'splice'): # Linux, Python 3.10+
+            return
+        config = self.process.config
+        if self.channel == 'stdout':
+            events_enabled = self.stdout_events_enabled
+        else:
+            events_enabled = self.stderr_events_enabled
+        if (self.capturelog is not None or events_enabled or
+                self.log_to_mainlog or config.options.strip_ansi or
+                self.tail is not None):
+            return
+        if self.normallog is None or len(self.normallog.handlers) != 1:
+            return
+        handler = self.normallog.handlers[0]
+        if isinstance(handler, loggers.FileHandler):
+            self.splicelog = handler
 
     def _init_normallog(self):
         """
@@ -132,8 +195,10 @@ class POutputDispatcher(PDispatcher):
                 fmt='%(message)s',
                 rotating=not not maxbytes, # optimization
                 maxbytes=maxbytes,
-                backups=backups
+                backups=backups,
+                **_logfile_options(config, channel)
             )
+            self.queued_handlers = _queued_handlers(self, self.normallog)
 
         if to_syslog:
             loggers.handle_syslog(
@@ -170,11 +235,27 @@ class POutputDispatcher(PDispatcher):
                 for handler in log.handlers:
                     handler.reopen()
 
+    def flushlogs(self):
+        if self.normallog is not None:
+            for handler in self.normallog.handlers:
+                handler.flush()
+
     def _log(self, data):
         if data:
             config = self.process.config
+            if isinstance(data, memoryview):
+                if self.channel == 'stdout':
+                    events_enabled = self.stdout_events_enabled
+                else:
+                    events_enabled = self.stderr_events_enabled
+                if (config.options.strip_ansi or self.log_to_mainlog or
+                        events_enabled):
+                    # the view is only good until the next read
+                    data = data.tobytes()
             if config.options.strip_ansi:
-                data = stripEscapes(data)
+                data = self.escape_stripper.strip(data)
+            if self.tail is not None and not self.capturemode:
+                self.tail.write(data)
             if self.childlog:
                 self.childlog.info(data)
             if self.log_to_mainlog:
@@ -215,28 +296,70 @@ class POutputDispatcher(PDispatcher):
         else:
             token, tokenlen = self.begintoken_data
 
-        if len(self.output_buffer) <= tokenlen:
+        if (self.capture_remaining is None and
+                len(self.output_buffer) <= tokenlen):
             return # not enough data
 
         data = self.output_buffer
         self.output_buffer = b''
 
-        try:
-            before, after = data.split(token, 1)
-        except ValueError:
-            after = None
-            index = find_prefix_at_end(data, token)
-            if index:
-                self.output_buffer = self.output_buffer + data[-index:]
-                data = data[:-index]
-            self._log(data)
-        else:
-            self._log(before)
-            self.toggle_capturemode()
-            self.output_buffer = after
-
-        if after:
-            self.record_output()
+        # scan the buffer once, from token to token; whatever might be
+        # the start of a token is kept for the next call
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self.capture_remaining is not None:
+                stop = min(end, pos + self.capture_remaining)
+                self._log(data[pos:stop])
+                self.capture_remaining -= stop - pos
+                pos = stop
+                if not self.capture_remaining:
+                    self.capture_remaining = None
+                    self.toggle_capturemode()
+            elif self.capturemode:
+                token, tokenlen = self.endtoken_data
+                index = data.find(token, pos)
+                if index == -1:
+                    keep = min(find_prefix_at_end(data, token), end - pos)
+                    self._log(data[pos:end - keep])
+                    self.output_buffer = data[end - keep:]
+                    return
+                self._log(data[pos:index])
+                pos = index + tokenlen
+                self.toggle_capturemode()
+            else:
+                match = self.begintoken_re.search(data, pos)
+                if match is None:
+                    keep = self._begintoken_prefix_at_end(data, pos)
+                    self._log(data[pos:end - keep])
+                    self.output_buffer = data[end - keep:]
+                    return
+                self._log(data[pos:match.start()])
+                pos = match.end()
+                self.toggle_capturemode()
+                size = match.group(1)
+                if size is not None:
+                    self.capture_remaining = int(size)
+                    if not self.capture_remaining:
+                        self.capture_remaining = None
+                        self.toggle_capturemode()
+
+    def _begintoken_prefix_at_end(self, data, pos):
+        """ Return the length of the end of data[pos:] that may be the
+        start of a BEGIN_TOKEN or FRAME_TOKEN. """
+        framestart, frameend, maxlen = self.frametoken_data
+        index = data.rfind(b'<', max(pos, len(data) - maxlen))
+        if index == -1:
+            return 0
+        tail = data[index:]
+        if (self.begintoken_data[0].startswith(tail) or
+                framestart.startswith(tail)):
+            return len(tail)
+        if tail.startswith(framestart):
+            rest = tail[len(framestart):].lstrip(b'0123456789')
+            if frameend.startswith(rest):
+                return len(tail)
+        return 0
 
     def toggle_capturemode(self):
         self.capturemode = not self.capturemode
@@ -268,18 +391,49 @@ class POutputDispatcher(PDispatcher):
     def readable(self):
         if self.closed:
             return False
-        return True
+        return not _backlogged(self.queued_handlers)
 
     def handle_read_event(self):
-        data = self.process.config.options.readfd(self.fd)
-        self.output_buffer += data
-        self.record_output()
+        if self.splicelog is not None:
+            if self._splice():
+                return
+        data = self.process.config.options.readfd_view(self.fd)
+        if self.capturelog is None:
+            # there are no tokens to look for, so hand what we read
+            # straight to the log handlers without buffering it
+            self._log(data)
+        else:
+            self.output_buffer += data.tobytes()
+            self.record_output()
         if not data:
             # if we get no data back from the pipe, it means that the
             # child process has ended.  See
             # mail.python.org/pipermail/python-dev/2004-August/046850.html
             self.close()
 
+    def _splice(self):
+        """ Move what is in the pipe to the log file.  Return False if
+        the file can't be spliced to, in which case we stop trying and
+        the data is read and logged as usual. """
+        try:
+            moved = self.splicelog.splice(self.fd, 2 << 16)
+        except OSError as why:
+            if why.args[0] in (errno.EAGAIN, errno.EINTR):
+                return True
+            if why.args[0] == errno.EBADF:
+                self.close()
+                return True
+            self.process.config.options.logger.debug(
+                'cannot splice output of %r to %s (%s), logging it '
+                'instead' % (self.process.config.name,
+                             self.splicelog.baseFilename, why))
+            self.splicelog = None
+            return False
+        if not moved:
+            # the child process has ended, see handle_read_event()
+            self.close()
+        return True
+
 class PEventListenerDispatcher(PDispatcher):
     """ An output dispatcher that monitors and changes a process'
     listener_state """
@@ -299,13 +453,15 @@ class PEventListenerDispatcher(PDispatcher):
         self.process.event = None
         self.result = b''
         self.resultlen = None
+        self.escape_stripper = EscapeStripper()
 
         logfile = getattr(process.config, '%s_logfile' % channel)
 
         if logfile:
-            maxbytes = getattr(process.config, '%s_logfile_maxbytes' % channel)
-            backups = getattr(process.config, '%s_logfile_backups' % channel)
-            self.childlog = process.config.options.getLogger()
+            config = process.config
+            maxbytes = getattr(config, '%s_logfile_maxbytes' % channel)
+            backups = getattr(config, '%s_logfile_backups' % channel)
+            self.childlog = config.options.getLogger()
             loggers.handle_file(
                 self.childlog,
                 logfile,
@@ -313,7 +469,9 @@ class PEventListenerDispatcher(PDispatcher):
                 rotating=not not maxbytes, # optimization
                 maxbytes=maxbytes,
                 backups=backups,
+                **_logfile_options(config, channel)
             )
+            self.queued_handlers = _queued_handlers(self, self.childlog)
 
     def removelogs(self):
         if self.childlog is not None:
@@ -326,6 +484,11 @@ class PEventListenerDispatcher(PDispatcher):
             for handler in self.childlog.handlers:
                 handler.reopen()
 
+    def flushlogs(self):
+        if self.childlog is not None:
+            for handler in self.childlog.handlers:
+                handler.flush()
+
 
     def writable(self):
         return False
@@ -333,7 +496,7 @@ class PEventListenerDispatcher(PDispatcher):
     def readable(self):
         if self.closed:
             return False
-        return True
+        return not _backlogged(self.queued_handlers)
 
     def handle_read_event(self):
         data = self.process.config.options.readfd(self.fd)
@@ -345,7 +508,7 @@ class PEventListenerDispatcher(PDispatcher):
 
             if self.childlog:
                 if self.process.config.options.strip_ansi:
-                    data = stripEscapes(data)
+                    data = self.escape_stripper.strip(data)
                 self.childlog.info(data)
         else:
             # if we get no data back from the pipe, it means that the
@@ -473,6 +636,10 @@ class PEventListenerDispatcher(PDispatcher):
         process.config.options.logger.debug(msg)
 
         process.listener_state = new_state
+        if new_state == EventListenerStates.READY:
+            if process.group is not None:
+                # the pool may have buffered events to send us
+                process.config.options.timers.schedule(process.group, 0)
         if new_state == EventListenerStates.UNKNOWN:
             msg = ('%s: has entered the UNKNOWN state and will no longer '
                    'receive events, this usually indicates the process '
@@ -511,31 +678,232 @@ class PInputDispatcher(PDispatcher):
                 else:
                     raise
 
+class PExitDispatcher(PDispatcher):
+    """ Dispatcher for a pidfd (Linux only) referring to a process.  The
+    pidfd becomes readable when the process exits, at which point we reap
+    exactly that process instead of waiting for waitpid(-1) to find it. """
+
+    def __init__(self, process, fd):
+        PDispatcher.__init__(self, process, 'pidfd', fd)
+
+    def readable(self):
+        return not self.closed
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        process = self.process
+        options = process.config.options
+        if process.pid:
+            pid, sts = options.waitpid(process.pid)
+            if pid:
+                process.finish(pid, sts) # closes us
+                options.pidhistory.pop(pid, None)
+        # the process exited but was already reaped elsewhere
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            PDispatcher.close(self)
+            self.process.config.options.close_fd(self.fd)
+
+class PExecStatusDispatcher(PDispatcher):
+    """ Dispatcher for the pipe a forked child reports a failure to
+    exec through (see Subprocess.spawn).  The child closes its end
+    without a word when the exec succeeds, or writes why it failed and
+    exits; either way the process is told by exec_status() once the pipe
+    is closed, and the mainloop goes on in the meantime however long the
+    child takes to get there (e.g. looking up a user or changing to a
+    directory on a hung network filesystem). """
+
+    def __init__(self, process, fd):
+        PDispatcher.__init__(self, process, 'execstatus', fd)
+        self.data = b''
+
+    def readable(self):
+        return not self.closed
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        data = self.process.config.options.read_exec_status(self.fd)
+        if data:
+            self.data += data
+        else:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            PDispatcher.close(self)
+            self.process.config.options.close_fd(self.fd)
+            self.process.exec_status(self.data)
+
+def _logfile_options(config, channel):
+    """ The arguments to loggers.handle_file() for the log file of
+    channel: its rotation scheme, buffering, compression, retention by
+    size and time index, if the config asks for those, and the log writer
+    threads, if supervisord has any.  Its offsets are always kept, so that
+    it can be read from an offset across rollovers. """
+    kwargs = {'rotation': getattr(config, '%s_logfile_rotation' % channel),
+              'offsets': True}
+    if getattr(config, '%s_logfile_index' % channel):
+        kwargs['index'] = True
+    compress = getattr(config, '%s_logfile_compress' % channel)
+    if compress:
+        kwargs['compress'] = compress
+        kwargs['compressor'] = config.options.logcompressor
+    backups_maxbytes = getattr(config, '%s_logfile_backups_maxbytes' % channel)
+    if backups_maxbytes:
+        kwargs['backups_maxbytes'] = backups_maxbytes
+    writer = config.options.logwriter
+    if writer.nthreads:
+        kwargs['writer'] = writer
+    buffersize = getattr(config, '%s_logfile_buffer' % channel)
+    if buffersize:
+        kwargs['buffersize'] = buffersize
+        if not writer.nthreads: # the writer threads flush what they write
+            kwargs['timers'] = config.options.timers
+            kwargs['flushdelay'] = config.options.childlog_flush_ms / 1000.0
+    return kwargs
+
+def _queued_handlers(dispatcher, logger):
+    """ The handlers of logger that are written by LogWriter threads;
+    dispatcher is read again when they are no longer backlogged. """
+    handlers = []
+    for handler in logger.handlers:
+        if isinstance(handler, QueuedHandler):
+            handler.reader = dispatcher
+            handlers.append(handler)
+    return handlers
+
+def _backlogged(handlers):
+    for handler in handlers:
+        if handler.backlogged():
+            return True
+    return False
+
 ANSI_ESCAPE_BEGIN = b'\x1b['
 ANSI_TERMINATORS = (b'H', b'f', b'A', b'B', b'C', b'D', b'R', b's', b'u', b'J',
                     b'K', b'h', b'l', b'p', b'm')
 
+# an escape runs from ANSI_ESCAPE_BEGIN through the first terminator
+_terminators = b''.join(ANSI_TERMINATORS)
+_escape_body = b'[^' + _terminators + b']*'
+_COMPLETE_ESCAPE_RE = re.compile(re.escape(ANSI_ESCAPE_BEGIN) + _escape_body +
+                                 b'[' + _terminators + b']')
+_ESCAPE_REST_RE = re.compile(_escape_body + b'[' + _terminators + b']')
+_TERMINATOR_RE = re.compile(b'[' + _terminators + b']')
+
 def stripEscapes(s):
     """
-    Remove all ANSI color escapes from the given string.
+    Remove all ANSI color escapes from the given string.  An escape that
+    isn't terminated removes the rest of the string.
     """
-    result = b''
-    show = 1
-    i = 0
-    L = len(s)
-    while i < L:
-        if show == 0 and s[i:i + 1] in ANSI_TERMINATORS:
-            show = 1
-        elif show:
-            n = s.find(ANSI_ESCAPE_BEGIN, i)
-            if n == -1:
-                return result + s[i:]
-            else:
-                result = result + s[i:n]
-                i = n
-                show = 0
-        i += 1
-    return result
+    start = _find_unterminated(s)
+    if start != -1:
+        s = s[:start]
+    return _COMPLETE_ESCAPE_RE.sub(b'', s)
+
+class EscapeStripper:
+    """
+    Removes ANSI color escapes from output that arrives in chunks, like
+    stripEscapes(), but also those that are split between two chunks:
+    the start of an escape at the end of a chunk is held back until the
+    next chunk shows where it ends.
+    """
+
+    in_escape = False # the last chunk ended inside an escape
+    pending = b'' # a lone ESC at the end of the last chunk
+
+    def strip(self, data):
+        if self.in_escape:
+            match = _ESCAPE_REST_RE.match(data)
+            if match is None:
+                return b'' # still inside the escape
+            data = data[match.end():]
+            self.in_escape = False
+        elif self.pending:
+            data = self.pending + data
+            self.pending = b''
+        start = _find_unterminated(data)
+        if start != -1:
+            self.in_escape = True
+            data = data[:start]
+        elif data.endswith(b'\x1b'):
+            self.pending = b'\x1b'
+            data = data[:-1]
+        return _COMPLETE_ESCAPE_RE.sub(b'', data)
+
+def _find_unterminated(data):
+    """ Return where the escape that runs to the end of data starts, or -1
+    if every escape in data is terminated. """
+    start = data.rfind(ANSI_ESCAPE_BEGIN)
+    if start == -1 or _TERMINATOR_RE.search(data, start + 2):
+        return -1
+    # the escape starts at the first ANSI_ESCAPE_BEGIN after the last
+    # terminator, which may come before the last one
+    while True:
+        before = data.rfind(ANSI_ESCAPE_BEGIN, 0, start)
+        if before == -1 or _TERMINATOR_RE.search(data, before + 2, start):
+            return start
+        start = before
+
+class OutputTail:
+    """
+    The last maxbytes of the output of one channel of a process, kept in
+    a bytearray of that size used as a ring, so that tails can be served
+    without going to the log file (or when there is none).  Offsets count
+    every byte written since the tail was made: the bytes from start up
+    to end are held.  It belongs to the process rather than to one of its
+    dispatchers so that it outlives the process it was filled by.
+    """
+
+    queued_handlers = () # handlers writing the same output to the log file
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.buf = bytearray(maxbytes)
+        self.start = 0
+        self.end = 0
+
+    def write(self, data):
+        size = len(data)
+        offset = self.end
+        if size > self.maxbytes:
+            # only the last maxbytes are kept
+            offset += size - self.maxbytes
+            data = data[size - self.maxbytes:]
+            size = self.maxbytes
+        pos = offset % self.maxbytes
+        first = min(size, self.maxbytes - pos)
+        self.buf[pos:pos + first] = data[:first]
+        if first < size:
+            self.buf[:size - first] = data[first:]
+        self.end = offset + size
+        self.start = max(self.start, self.end - self.maxbytes)
+
+    def read(self, offset, length):
+        """ Up to length bytes from offset on, as far as they are held. """
+        offset = max(offset, self.start)
+        stop = min(offset + length, self.end)
+        if stop <= offset:
+            return b''
+        pos = offset % self.maxbytes
+        size = stop - offset
+        if pos + size <= self.maxbytes:
+            return bytes(self.buf[pos:pos + size])
+        return bytes(self.buf[pos:] + self.buf[:pos + size - self.maxbytes])
+
+    def clear(self):
+        self.start = self.end
+
+    def pending(self):
+        """ The bytes written here that the log writer threads have yet to
+        write to the log file. """
+        return sum([ handler.queued_bytes
+                     for handler in self.queued_handlers ])
 
 class RejectEvent(Exception):
     """ The exception type expected by a dispatcher when a handler wants
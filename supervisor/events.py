@@ -57,6 +57,10 @@ class ProcessCommunicationEvent(Event):
     # event mode tokens
     BEGIN_TOKEN = b'<!--XSUPERVISOR:BEGIN-->'
     END_TOKEN   = b'<!--XSUPERVISOR:END-->'
+    # begins a capture of exactly as many bytes as it says, which needs
+    # no END_TOKEN and lets the data contain anything; a str to be
+    # formatted and then encoded, as bytes can't be %-formatted on 3.4
+    FRAME_TOKEN = '<!--XSUPERVISOR:BEGIN:%d-->'
 
     def __init__(self, process, pid, data):
         self.process = process
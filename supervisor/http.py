@@ -1,4 +1,5 @@
 import os
+import re
 import stat
 import time
 import sys
@@ -13,9 +14,11 @@ except ImportError:  # Windows
     import getpass as pwd
 
 from supervisor.compat import urllib
+from supervisor.compat import urlparse
 from supervisor.compat import sha1
 from supervisor.compat import as_bytes
 from supervisor.compat import as_string
+from supervisor import loggers
 from supervisor.medusa import asyncore_25 as asyncore
 from supervisor.medusa import http_date
 from supervisor.medusa import http_server
@@ -337,12 +340,15 @@ class deferring_http_channel(http_server.http_channel):
 
     delay = 0 # seconds
     last_writable_check = 0 # timestamp of last writable check; 0 if never
+    idle = False # the deferred producer waits for wake(), see sleep()
 
     def writable(self, now=None):
         if now is None:  # for unit tests
             now = time.time()
 
         if self.delay:
+            if self.idle and not self.ac_out_buffer:
+                return False
             # we called a deferred producer via this channel (see refill_buffer)
             elapsed = now - self.last_writable_check
             if (elapsed > self.delay) or (elapsed < 0):
@@ -353,6 +359,25 @@ class deferring_http_channel(http_server.http_channel):
 
         return http_server.http_channel.writable(self)
 
+    def get_deadline(self):
+        """ Return the time at which a deferred producer should next be
+        checked, or None if we are not waiting on one """
+        if self.delay and not self.idle:
+            return self.last_writable_check + self.delay
+        return None
+
+    def sleep(self):
+        """ Called by a deferred producer that will call wake() when it
+        has more to say, so that the channel doesn't check on it every
+        delay seconds until then. """
+        self.idle = True
+
+    def wake(self):
+        """ Check on the deferred producer on the next pass of the
+        mainloop. """
+        self.idle = False
+        self.last_writable_check = 0
+
     def refill_buffer (self):
         """ Implement deferreds """
         while 1:
@@ -379,6 +404,7 @@ class deferring_http_channel(http_server.http_channel):
                 elif data:
                     self.ac_out_buffer = self.ac_out_buffer + data
                     self.delay = False
+                    self.idle = False
                     return
                 else:
                     self.producer_fifo.pop()
@@ -688,6 +714,159 @@ class tail_f_producer:
     def _fsize(self):
         return os.fstat(self.file.fileno())[stat.ST_SIZE]
 
+class log_follow_producer:
+    """ Follows a log file like tail_f_producer, but through the
+    logfollow.LogFollower shared by every client following that file
+    (see logfollow.LogFollowers).  Output that the client is too slow to
+    take is dropped once more than maxpending bytes are waiting. """
+    maxpending = 1 << 20
+
+    def __init__(self, request, followers, filename, head):
+        self.request = weakref.ref(request)
+        self.delay = 0.1
+        self.pending = []
+        self.size = 0 # of pending
+        self.follower = followers.follow(filename, self, head)
+
+    def __del__(self):
+        self.follower.unsubscribe(self)
+
+    def push(self, data):
+        """ Called by the follower with what was added to the log. """
+        self.pending.append(data)
+        self.size += len(data)
+        if self.size > self.maxpending:
+            dropped = self.size - len(data)
+            self.pending = [as_bytes('==> Skipped %d bytes <==\n' % dropped),
+                            data]
+            self.size = len(data)
+        channel = self._channel()
+        if channel is not None:
+            channel.wake()
+
+    def more(self):
+        if not self.pending:
+            self.follower.poll()
+        if self.pending:
+            data = b''.join(self.pending)
+            self.pending = []
+            self.size = 0
+            return data
+        if self.follower.watched:
+            channel = self._channel()
+            if channel is not None:
+                channel.sleep()
+        return NOT_DONE_YET
+
+    def _channel(self):
+        request = self.request()
+        channel = getattr(request, 'channel', None)
+        if hasattr(channel, 'wake'):
+            return channel
+        return None
+
+class log_span_producer:
+    """ Follows a log file like tail_f_producer, but from an offset
+    counted across rollovers (see loggers.LogOffsets): what was rolled
+    over into a backup since is read from there rather than skipped. """
+    chunk = 1 << 16
+
+    def __init__(self, request, filename, offset):
+        self.request = weakref.ref(request)
+        self.filename = filename
+        self.file = None # the log file, once everything before it was read
+        self.start = 0 # the offset of its first byte
+        self.key = None # the inodes of the log file and its offsets file
+        self.span = None # what get_log_span() returned for span_key
+        self.span_key = None
+        files = self._get_span(self._key())
+        self.pos = loggers.find_span_offset(files, offset)
+
+    def __del__(self):
+        self._close()
+
+    def more(self):
+        if self.file is not None:
+            if self._key() == self.key:
+                self.file.seek(self.pos - self.start)
+                data = self.file.read(self.chunk)
+                if data:
+                    self.pos += len(data)
+                    return data
+                if self._fsize() >= self.pos - self.start:
+                    return NOT_DONE_YET
+            # rolled over, cleared or truncated
+            self._close()
+        key = self._key()
+        files = self._get_span(key)
+        data, offset, end = loggers.read_log_span(files, self.pos, self.chunk)
+        self.pos = offset + len(data)
+        if data:
+            return data
+        # caught up, go on with the log file itself
+        try:
+            self.file = open(self.filename, 'rb')
+        except (IOError, OSError):
+            return NOT_DONE_YET
+        if os.fstat(self.file.fileno())[stat.ST_INO] != key[0]:
+            self._close() # rolled over in the meantime
+            return NOT_DONE_YET
+        self.start = files[-1][1]
+        self.key = key
+        return NOT_DONE_YET
+
+    def _get_span(self, key):
+        # the backups only change when the log is rolled over or cleared,
+        # which gives the log file or its offsets file a new inode, so
+        # they are looked for (and compressed ones read through) once
+        # per rollover rather than every time we are polled
+        if self.span is None or key != self.span_key:
+            self.span = loggers.get_log_span(self.filename)
+            self.span_key = key
+            return self.span
+        name, start, length = self.span[-1]
+        try:
+            length = os.path.getsize(name)
+        except OSError:
+            length = 0
+        return self.span[:-1] + [(name, start, length)]
+
+    def _key(self):
+        key = []
+        for filename in (self.filename, self.filename + '.offsets'):
+            try:
+                key.append(os.stat(filename)[stat.ST_INO])
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    def _fsize(self):
+        return os.fstat(self.file.fileno())[stat.ST_SIZE]
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class output_tail_producer:
+    """ Follows the OutputTail of a process channel that has no log
+    file, like tail_f_producer follows a log file. """
+    def __init__(self, request, tail, head):
+        self.request = weakref.ref(request)
+        self.tail = tail
+        self.pos = max(tail.start, tail.end - head)
+
+    def more(self):
+        tail = self.tail
+        if self.pos < tail.start:
+            # fell behind (or the tail was cleared)
+            self.pos = tail.start
+        if tail.end > self.pos:
+            data = tail.read(self.pos, tail.end - self.pos)
+            self.pos = tail.end
+            return data
+        return NOT_DONE_YET
+
 class logtail_handler:
     IDENT = 'Logtail HTTP Request Handler'
     path = '/logtail'
@@ -735,6 +914,15 @@ class logtail_handler:
             return
 
         logfile = getattr(process.config, '%s_logfile' % channel, None)
+        tail = process.output_tails.get(channel)
+
+        if logfile is None and tail is not None:
+            # the output is only kept in memory
+            request['Content-Type'] = 'text/plain;charset=utf-8'
+            request['X-Accel-Buffering'] = 'no'
+            request.push(output_tail_producer(request, tail, 1024))
+            request.done()
+            return
 
         if logfile is None or not os.path.exists(logfile):
             # we return 404 because no logfile is a temporary condition.
@@ -744,6 +932,16 @@ class logtail_handler:
             request.error(404) # not found
             return
 
+        # ?offset=N follows the log from an offset counted across rollovers
+        offset = urlparse.parse_qs((query or '').lstrip('?')).get('offset')
+        if offset is not None:
+            try:
+                offset = int(offset[0])
+            except ValueError:
+                request.error(400) # bad request
+                return
+
+        process.flushlogs()
         mtime = os.stat(logfile)[stat.ST_MTIME]
         request['Last-Modified'] = http_date.build_http_date(mtime)
         request['Content-Type'] = 'text/plain;charset=utf-8'
@@ -753,8 +951,84 @@ class logtail_handler:
         # tell reverse proxy server (e.g., nginx) to disable proxy buffering
         # (see also http://nginx.org/en/docs/http/ngx_http_proxy_module.html#proxy_buffering)
 
-        request.push(tail_f_producer(request, logfile, 1024))
+        if offset is None:
+            request.push(log_follow_producer(
+                request, self.supervisord.options.logfollowers, logfile, 1024))
+        else:
+            producer = log_span_producer(request, logfile, offset)
+            request['X-Log-Offset'] = str(producer.pos)
+            request.push(producer)
+
+        request.done()
+
+class log_search_producer:
+    """ Streams the lines found by a logsearch.LogSearch as they come
+    in, one "name channel offset line" line for each. """
+    def __init__(self, request, search):
+        self.request = weakref.ref(request)
+        self.search = search
+
+    def __del__(self):
+        # the client went away
+        self.search.cancel()
+
+    def more(self):
+        done = self.search.done
+        found = self.search.pop()
+        if found:
+            return b''.join([ as_bytes('%s %s %d ' % (name, channel, offset))
+                              + line + b'\n'
+                              for name, channel, offset, line in found ])
+        if not done:
+            return NOT_DONE_YET
+        if self.search.error is not None:
+            return as_bytes('==> Search failed: %s <==\n' % self.search.error)
+        return b''
+
+class logsearch_handler:
+    IDENT = 'Log Search HTTP Request Handler'
+    path = '/logsearch'
+
+    def __init__(self, supervisord):
+        self.supervisord = supervisord
+
+    def match(self, request):
+        return request.uri.startswith(self.path)
+
+    def handle_request(self, request):
+        if request.command != 'GET':
+            request.error (400) # bad request
+            return
+
+        from supervisor import logsearch
 
+        path, params, query, fragment = request.split_uri()
+        query = urlparse.parse_qs((query or '').lstrip('?'))
+
+        try:
+            pattern = query['pattern'][0]
+            channel = query.get('channel', ['stdout'])[0]
+            maxmatches = int(query.get('maxmatches', ['1000'])[0])
+            regex = logsearch.compile_pattern(pattern)
+        except (KeyError, ValueError, re.error):
+            request.error(400) # bad request
+            return
+        if channel not in ('stdout', 'stderr') or maxmatches < 1:
+            request.error(400) # bad request
+            return
+
+        try:
+            logs = logsearch.get_search_logs(self.supervisord,
+                                             query.get('name', []), channel)
+        except KeyError:
+            request.error(404) # not found
+            return
+
+        search = logsearch.LogSearch(logs, regex, maxmatches)
+        search.start()
+        request['Content-Type'] = 'text/plain;charset=utf-8'
+        request['X-Accel-Buffering'] = 'no'
+        request.push(log_search_producer(request, search))
         request.done()
 
 class mainlogtail_handler:
@@ -787,7 +1061,8 @@ class mainlogtail_handler:
         # the lack of a Content-Length header makes the outputter
         # send a 'Transfer-Encoding: chunked' response
 
-        request.push(tail_f_producer(request, logfile, 1024))
+        request.push(log_follow_producer(
+            request, self.supervisord.options.logfollowers, logfile, 1024))
 
         request.done()
 
@@ -831,6 +1106,7 @@ def make_http_servers(options, supervisord):
         xmlrpchandler = supervisor_xmlrpc_handler(supervisord, subinterfaces)
         tailhandler = logtail_handler(supervisord)
         maintailhandler = mainlogtail_handler(supervisord)
+        searchhandler = logsearch_handler(supervisord)
         uihandler = supervisor_ui_handler(supervisord)
         here = os.path.abspath(os.path.dirname(__file__))
         templatedir = os.path.join(here, 'ui')
@@ -847,6 +1123,7 @@ def make_http_servers(options, supervisord):
             xmlrpchandler = supervisor_auth_handler(users, xmlrpchandler)
             tailhandler = supervisor_auth_handler(users, tailhandler)
             maintailhandler = supervisor_auth_handler(users, maintailhandler)
+            searchhandler = supervisor_auth_handler(users, searchhandler)
             uihandler = supervisor_auth_handler(users, uihandler)
             defaulthandler = supervisor_auth_handler(users, defaulthandler)
         else:
@@ -858,6 +1135,7 @@ def make_http_servers(options, supervisord):
         hs.install_handler(defaulthandler)
         hs.install_handler(uihandler)
         hs.install_handler(maintailhandler)
+        hs.install_handler(searchhandler)
         hs.install_handler(tailhandler)
         hs.install_handler(xmlrpchandler) # last for speed (first checked)
         servers.append((config, hs))
@@ -0,0 +1,325 @@
+import errno
+import os
+import stat
+import struct
+import sys
+import time
+import weakref
+
+from supervisor.compat import as_bytes
+from supervisor.medusa import asyncore_25 as asyncore
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+
+_EVENT = struct.Struct('iIII') # wd, mask, cookie, len; then the name
+
+class Inotify:
+    """ A Linux inotify instance, used through ctypes as the standard
+    library has no binding for it.  Raises OSError if it can't be
+    created, e.g. because this isn't Linux. """
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            self._init1 = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+        except (ImportError, OSError, AttributeError) as why:
+            raise OSError(errno.ENOSYS, 'inotify is not available: %s' % why)
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+        self.fd = self._init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self):
+        code = self._get_errno()
+        raise OSError(code, os.strerror(code))
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        """ Watch path (a file or a directory) for the events in mask and
+        return the watch descriptor the events will carry.  Watching a
+        path again returns the same descriptor. """
+        wd = self._add_watch(self.fd, as_bytes(path), mask)
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd) # gone already if its file was removed
+
+    def read(self):
+        """ The events that came in since the last call, as (wd, mask,
+        name) tuples; name is the name of the file the event is about in
+        a watched directory, or b'' for a watched file. """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except OSError as why:
+                if why.args[0] in (errno.EAGAIN, errno.EINTR):
+                    return events
+                raise
+            if not data:
+                return events
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                name = data[pos:pos + length].rstrip(b'\0')
+                pos += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class LogFollower:
+    """ Follows one log file for all of the clients tailing it, so that
+    the file is looked at once rather than once per client: new bytes
+    are read once and handed to push() of every subscriber.  A log that
+    was rotated (its name given to a new file) is read to its end and
+    then left for the new file; a log that was truncated is read from
+    its start again after "==> File truncated <==".
+
+    The follower is checked when inotify (see LogFollowers) says the file
+    changed, or, without inotify, by poll() at most every interval
+    seconds however many subscribers call it. """
+
+    def __init__(self, followers, filename, interval=0.1):
+        self.followers = followers
+        self.filename = filename
+        self.dirname, self.basename = os.path.split(filename)
+        self.basename = as_bytes(self.basename)
+        self.interval = interval
+        self.subscribers = weakref.WeakSet()
+        self.file = None
+        self.ino = None
+        self.pos = 0 # of the next byte to read in file
+        self.checked = 0 # when poll() last checked
+        self.watched = False # true while inotify tells us about changes
+        if self._open():
+            # start at the end, like tail -f; a new file after a rotation
+            # is read from its start
+            self.file.seek(0, 2)
+            self.pos = self.file.tell()
+
+    def _open(self):
+        try:
+            # unbuffered, or a truncated log would be read from a buffer
+            # holding what was there before
+            f = open(self.filename, 'rb', 0)
+        except (IOError, OSError):
+            return False
+        if self.file is not None:
+            self.file.close()
+        self.file = f
+        self.ino = os.fstat(f.fileno())[stat.ST_INO]
+        self.pos = 0
+        self.watched = self.followers.watch(self)
+        return True
+
+    def subscribe(self, subscriber, head):
+        """ Hand the last head bytes of the log to subscriber and from
+        now on what is added to it. """
+        self.subscribers.add(subscriber)
+        if self.file is not None and head > 0:
+            start = max(self.pos - head, 0)
+            self.file.seek(start)
+            data = self.file.read(self.pos - start)
+            if data:
+                subscriber.push(data)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers:
+            self.followers.remove(self)
+
+    def poll(self, now=None):
+        """ Check the log unless it was checked less than interval
+        seconds ago or inotify tells us when it changes. """
+        if self.watched:
+            return
+        if now is None:
+            now = time.time()
+        elapsed = now - self.checked
+        if elapsed >= self.interval or elapsed < 0:
+            self.checked = now
+            self.check()
+
+    def check(self):
+        """ Read what was added to the log and hand it out. """
+        if self.file is not None:
+            try:
+                size = os.fstat(self.file.fileno())[stat.ST_SIZE]
+            except (OSError, ValueError):
+                size = self.pos
+            if size < self.pos:
+                self.pos = 0
+                self._push(b'==> File truncated <==\n')
+            if size > self.pos:
+                self.file.seek(self.pos)
+                data = self.file.read(size - self.pos)
+                self.pos += len(data)
+                self._push(data)
+        try:
+            ino = os.stat(self.filename)[stat.ST_INO]
+        except OSError:
+            return # removed; keep what we have until it is created again
+        if ino != self.ino and self._open():
+            # rotated: what was left in the old file was read above
+            self.check()
+
+    def _push(self, data):
+        if data:
+            for subscriber in list(self.subscribers):
+                subscriber.push(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class LogFollowers:
+    """ The LogFollower of every log file being followed, by file name.
+    On Linux they are told about changes by inotify, through a dispatcher
+    in the asyncore socket map (map) that the mainloop polls along with
+    the HTTP channels, so that a log nobody writes to costs nothing.
+    Where inotify isn't available (or inotify is false), followers poll
+    their file, once for all of their subscribers. """
+
+    def __init__(self, map=None, inotify=True):
+        self.map = map
+        self.use_inotify = inotify
+        self.followers = {}
+        self.inotify = None
+        self.dispatcher = None
+        self.watches = {} # inotify watch descriptor -> LogFollower set
+        self.wds = {} # LogFollower -> its watch descriptors
+
+    def follow(self, filename, subscriber, head):
+        """ Subscribe subscriber to the log file filename, see
+        LogFollower.subscribe(), and return its follower. """
+        follower = self.followers.get(filename)
+        if follower is None:
+            follower = LogFollower(self, filename)
+            self.followers[filename] = follower
+        follower.subscribe(subscriber, head)
+        return follower
+
+    def remove(self, follower):
+        if self.followers.get(follower.filename) is follower:
+            del self.followers[follower.filename]
+        self._unwatch(follower)
+        follower.close()
+        if not self.followers:
+            self._close_inotify()
+
+    def watch(self, follower):
+        """ Watch the file of follower, and its directory for the file
+        being created again; true if it is watched. """
+        self._unwatch(follower)
+        inotify = self._get_inotify()
+        if inotify is None:
+            return False
+        try:
+            wds = [inotify.add_watch(follower.filename, FILE_EVENTS),
+                   inotify.add_watch(follower.dirname or '.', DIR_EVENTS)]
+        except OSError:
+            return False
+        for wd in wds:
+            self.watches.setdefault(wd, set()).add(follower)
+        self.wds[follower] = wds
+        return True
+
+    def _unwatch(self, follower):
+        for wd in self.wds.pop(follower, ()):
+            followers = self.watches.get(wd)
+            if followers is not None:
+                followers.discard(follower)
+                if not followers:
+                    del self.watches[wd]
+                    self.inotify.rm_watch(wd)
+
+    def _get_inotify(self):
+        if self.inotify is None and self.use_inotify:
+            try:
+                self.inotify = Inotify()
+            except OSError:
+                self.use_inotify = False # don't try again
+            else:
+                self.dispatcher = InotifyDispatcher(self, self.map)
+        return self.inotify
+
+    def _close_inotify(self):
+        if self.dispatcher is not None:
+            self.dispatcher.del_channel()
+            self.dispatcher = None
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+        self.watches = {}
+        self.wds = {}
+
+    def handle_events(self):
+        """ Check the followers whose files changed. """
+        changed = set()
+        for wd, mask, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.followers.values())
+                continue
+            for follower in self.watches.get(wd, ()):
+                if not name or name == follower.basename:
+                    changed.add(follower)
+            if mask & IN_IGNORED:
+                # the watched file was removed; _open() watches the new one
+                for follower in self.watches.pop(wd, ()):
+                    self.wds[follower].remove(wd)
+        for follower in changed:
+            if self.followers.get(follower.filename) is follower:
+                follower.check()
+
+    def close(self):
+        for follower in list(self.followers.values()):
+            self.remove(follower)
+
+class InotifyDispatcher(asyncore.file_dispatcher):
+    """ Hands the events of the inotify instance of followers (a
+    LogFollowers) to it when the mainloop sees it is readable. """
+
+    def __init__(self, followers, map=None):
+        self.followers = followers
+        asyncore.file_dispatcher.__init__(self, followers.inotify.fd, map)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.followers.handle_events()
+
+    def handle_close(self):
+        self.close()
@@ -8,12 +8,20 @@ idiosyncratic and a bit slow for our purposes (we don't use threads).
 # avoid circular import problems
 
 import os
+import bisect
 import errno
+import gzip
+import mmap
+import re
+import shutil
+import stat
 import sys
+import threading
 import time
 import traceback
 
 from supervisor.compat import syslog
+from supervisor.compat import lzma
 from supervisor.compat import long
 from supervisor.compat import is_text_stream
 from supervisor.compat import as_string
@@ -89,7 +97,7 @@ class Handler:
     def emit(self, record):
         try:
             binary = (self.fmt == '%(message)s' and
-                      isinstance(record.msg, bytes) and
+                      isinstance(record.msg, (bytes, memoryview)) and
                       (not record.kw or record.kw == {'exc_info': None}))
             binary_stream = not is_text_stream(self.stream)
             if binary:
@@ -106,10 +114,14 @@ class Handler:
                 # which deliberately raises an exception the first
                 # time it's called. So just do it again
                 self.stream.write(msg)
-            self.flush()
+            self.written(len(msg))
         except:
             self.handleError()
 
+    def written(self, size):
+        """ Called by emit() after size bytes were written to the stream """
+        self.flush()
+
     def handleError(self):
         ei = sys.exc_info()
         traceback.print_exception(ei[0], ei[1], ei[2], None, sys.stderr)
@@ -129,7 +141,7 @@ class StreamHandler(Handler):
 class BoundIO:
     def __init__(self, maxbytes, buf=b''):
         self.maxbytes = maxbytes
-        self.buf = buf
+        self.buf = bytearray(buf)
 
     def flush(self):
         pass
@@ -140,24 +152,43 @@ class BoundIO:
     def write(self, b):
         blen = len(b)
         if len(self.buf) + blen > self.maxbytes:
-            self.buf = self.buf[blen:]
+            del self.buf[:blen]
         self.buf += b
 
     def getvalue(self):
-        return self.buf
+        return bytes(self.buf)
 
     def clear(self):
-        self.buf = b''
+        del self.buf[:]
 
 class FileHandler(Handler):
     """File handler which supports reopening of logs.
+
+    If buffersize is not 0, records aren't flushed to the file one by
+    one: the stream buffers up to buffersize bytes and is flushed when
+    its buffer is full, when the handler is closed or reopened and, if
+    timers (a TimerQueue) is given, at most flushdelay seconds after a
+    record was written, when the mainloop transitions the handler.
+
+    If offsets is true, the LogOffsets of the file are kept in memory and
+    written out when the file is rolled over or removed, so that its
+    bytes keep their offsets (see get_log_span()).
     """
+    _splice_fd = None # descriptor splice() writes to, opened on first use
+    offsets = None # the LogOffsets of the file, if they are kept
 
-    def __init__(self, filename, mode='ab'):
+    def __init__(self, filename, mode='ab', buffersize=0, timers=None,
+                 flushdelay=1, offsets=False):
         Handler.__init__(self)
+        self.baseFilename = filename
+        self.buffersize = buffersize
+        self.timers = timers
+        self.flushdelay = flushdelay
+        if offsets:
+            self.offsets = LogOffsets(filename)
 
         try:
-            self.stream = open(filename, mode)
+            self.stream = self._open(mode)
         except OSError as e:
             if mode == 'ab' and e.errno == errno.ESPIPE:
                 # Python 3 can't open special files like
@@ -165,29 +196,88 @@ class FileHandler(Handler):
                 # that fails with ESPIPE. Retry in 'w' mode.
                 # See: http://bugs.python.org/issue27805
                 mode = 'wb'
-                self.stream = open(filename, mode)
+                self.stream = self._open(mode)
             else:
                 raise
 
-        self.baseFilename = filename
         self.mode = mode
 
+    def _open(self, mode):
+        if self.buffersize:
+            return open(self.baseFilename, mode, self.buffersize)
+        return open(self.baseFilename, mode)
+
+    def written(self, size):
+        if not self.buffersize:
+            self.flush()
+        elif self.timers is not None:
+            if self.timers.get_deadline(self) is None:
+                self.timers.schedule(self, time.time() + self.flushdelay)
+
+    def transition(self):
+        """ Called by the mainloop when buffered records are due to be
+        flushed. """
+        self.flush()
+
+    def flush(self):
+        if not self.closed:
+            Handler.flush(self)
+
+    def close(self):
+        if self.timers is not None:
+            self.timers.cancel(self)
+        self._close_splice_fd()
+        Handler.close(self)
+
     def reopen(self):
         self.close()
-        self.stream = open(self.baseFilename, self.mode)
+        self.stream = self._open(self.mode)
         self.closed = False
 
+    def splice(self, fd, count):
+        """Move up to count bytes from the pipe fd to the end of the file
+        without copying them into supervisord (Linux only).  Return the
+        number of bytes moved; 0 means that the write end of the pipe has
+        been closed.  Raises OSError like os.splice(), e.g. EAGAIN if the
+        pipe is empty or EINVAL if the file doesn't support splicing."""
+        out, offset = self._get_splice_target()
+        return os.splice(fd, out, count, offset_dst=offset,
+                         flags=os.SPLICE_F_NONBLOCK)
+
+    def _get_splice_target(self):
+        # what we have buffered comes before what we splice
+        self.stream.flush()
+        if self._splice_fd is None:
+            # the kernel refuses to splice to a file opened for appending,
+            # so we write through a second descriptor at the end of the file
+            self._splice_fd = os.open(
+                '/proc/self/fd/%d' % self.stream.fileno(), os.O_WRONLY)
+        st = os.fstat(self._splice_fd)
+        if stat.S_ISREG(st.st_mode):
+            return self._splice_fd, st.st_size
+        return self._splice_fd, None # e.g. /dev/null or a pipe
+
+    def _close_splice_fd(self):
+        if self._splice_fd is not None:
+            os.close(self._splice_fd)
+            self._splice_fd = None
+
     def remove(self):
         self.close()
         try:
+            size = os.path.getsize(self.baseFilename)
             os.remove(self.baseFilename)
         except OSError as why:
             if why.args[0] != errno.ENOENT:
                 raise
+        else:
+            if size and self.offsets is not None:
+                self.offsets.cleared(size)
 
 class RotatingFileHandler(FileHandler):
     def __init__(self, filename, mode='ab', maxBytes=512*1024*1024,
-                 backupCount=10):
+                 backupCount=10, buffersize=0, timers=None, flushdelay=1,
+                 offsets=False):
         """
         Open the specified file and use it as the stream for logging.
 
@@ -210,12 +300,27 @@ class RotatingFileHandler(FileHandler):
         """
         if maxBytes > 0:
             mode = 'ab' # doesn't make sense otherwise!
-        FileHandler.__init__(self, filename, mode)
+        FileHandler.__init__(self, filename, mode, buffersize, timers,
+                             flushdelay, offsets)
         self.maxBytes = maxBytes
         self.backupCount = backupCount
         self.counter = 0
         self.every = 10
 
+    def _open(self, mode):
+        stream = FileHandler._open(self, mode)
+        # keep track of the size of the file ourselves rather than asking
+        # the stream for its position after every record
+        try:
+            self.size = os.fstat(stream.fileno()).st_size
+        except (AttributeError, OSError):
+            self.size = 0
+        return stream
+
+    def written(self, size):
+        self.size += size
+        FileHandler.written(self, size)
+
     def emit(self, record):
         """
         Emit a record.
@@ -226,6 +331,22 @@ class RotatingFileHandler(FileHandler):
         FileHandler.emit(self, record)
         self.doRollover()
 
+    def splice(self, fd, count):
+        """
+        Move data from the pipe fd to the file like FileHandler.splice(),
+        but stop at maxBytes and roll the file over there.
+        """
+        out, offset = self._get_splice_target()
+        if self.maxBytes > 0 and offset is not None:
+            count = max(1, min(count, self.maxBytes - offset))
+        moved = os.splice(fd, out, count, offset_dst=offset,
+                          flags=os.SPLICE_F_NONBLOCK)
+        if offset is not None:
+            self.size = offset + moved
+            if self.maxBytes > 0 and self.size >= self.maxBytes:
+                self._rollover()
+        return moved
+
     def _remove(self, fn): # pragma: no cover
         # this is here to service stubbing in unit tests
         return os.remove(fn)
@@ -261,19 +382,748 @@ class RotatingFileHandler(FileHandler):
         if self.maxBytes <= 0:
             return
 
-        if not (self.stream.tell() >= self.maxBytes):
+        if self.size < self.maxBytes:
             return
 
+        self._rollover()
+
+    def _rollover(self):
+        self._close_splice_fd()
         self.stream.close()
+        size = None
+        if self.offsets is not None:
+            try:
+                size = os.path.getsize(self.baseFilename)
+            except OSError:
+                pass # removed from under us
+        backups = 0
         if self.backupCount > 0:
-            for i in range(self.backupCount - 1, 0, -1):
-                sfn = "%s.%d" % (self.baseFilename, i)
-                dfn = "%s.%d" % (self.baseFilename, i + 1)
-                if os.path.exists(sfn):
-                    self.removeAndRename(sfn, dfn)
-            dfn = self.baseFilename + ".1"
-            self.removeAndRename(self.baseFilename, dfn)
-        self.stream = open(self.baseFilename, 'wb')
+            self._backup()
+            if size is not None:
+                backups = self._count_backups()
+        if size is not None:
+            self.offsets.rolled(size, backups)
+        self.stream = self._open('wb')
+
+    def _count_backups(self):
+        # the most backups there can be after a rollover; the offsets
+        # of older ones are forgotten
+        return self.backupCount
+
+    def _backup(self):
+        # move the backups up by one and the full file to backup 1
+        for i in range(self.backupCount - 1, 0, -1):
+            sfn = "%s.%d" % (self.baseFilename, i)
+            dfn = "%s.%d" % (self.baseFilename, i + 1)
+            if os.path.exists(sfn):
+                self.removeAndRename(sfn, dfn)
+        dfn = self.baseFilename + ".1"
+        self.removeAndRename(self.baseFilename, dfn)
+
+class SegmentedFileHandler(RotatingFileHandler):
+    """A RotatingFileHandler that keeps its backups as LogSegments, so
+    that a rollover takes one rename (and the removal of the oldest
+    segment) however many backups there are.  The file being written to
+    is always filename, like with RotatingFileHandler.  The LogOffsets of
+    the file are kept up to date as it is rolled over and removed."""
+
+    def __init__(self, filename, mode='ab', maxBytes=512*1024*1024,
+                 backupCount=10, buffersize=0, timers=None, flushdelay=1,
+                 compress=None, compressor=None, backupsMaxBytes=0,
+                 index=False):
+        """
+        If compress ('gzip' or 'xz') is given, each segment is compressed
+        after the rollover that made it, by compressor (a LogCompressor)
+        if there is one or else right away.  If backupsMaxBytes is not 0,
+        the oldest segments are also removed while the segments take up
+        more than that many bytes (compressed, where they are).  If index
+        is true, a TimeIndex of the file is kept in filename.idx, and it
+        becomes the index of the segment the file is rolled over into.
+        """
+        self.index = None
+        if index:
+            self.index = TimeIndex(filename + '.idx')
+        RotatingFileHandler.__init__(self, filename, mode, maxBytes,
+                                     backupCount, buffersize, timers,
+                                     flushdelay)
+        self.segments = LogSegments(filename)
+        self.offsets = LogOffsets(filename, self.segments)
+        self.compress = compress
+        self.compressor = compressor
+        self.backupsMaxBytes = backupsMaxBytes
+        if compress:
+            # left behind by an earlier supervisord
+            for number in self.segments.uncompressed():
+                self._compress(number)
+
+    def _open(self, mode):
+        stream = RotatingFileHandler._open(self, mode)
+        if self.index is not None:
+            self.index.open(self.size, 'w' in mode)
+        return stream
+
+    def written(self, size):
+        if self.index is not None:
+            self.index.note(self.size)
+        RotatingFileHandler.written(self, size)
+
+    def splice(self, fd, count):
+        if self.index is not None:
+            # the spliced bytes (if any) go at the end of the file
+            self.index.note(self.size)
+        return RotatingFileHandler.splice(self, fd, count)
+
+    def close(self):
+        RotatingFileHandler.close(self)
+        if self.index is not None:
+            self.index.close()
+
+    def remove(self):
+        RotatingFileHandler.remove(self)
+        if self.index is not None:
+            self.index.remove()
+
+    def _count_backups(self):
+        # segments may also have been removed for backupsMaxBytes
+        return self.segments.count()
+
+    def _backup(self):
+        segment = self.segments.next_name()
+        try:
+            self._rename(self.baseFilename, segment)
+        except OSError as why:
+            # the file was removed from under us, e.g. by a cleanup script
+            if why.args[0] != errno.ENOENT:
+                raise
+        else:
+            if self.index is not None:
+                self.index.close()
+                self.index.rename(segment + '.idx')
+            number = self.segments.added(self.backupCount,
+                                         self.backupsMaxBytes,
+                                         bool(self.compress))
+            if self.compress:
+                self._compress(number)
+
+    def _compress(self, number):
+        if self.compressor is None:
+            self.segments.compress(number, self.compress, self.backupCount,
+                                   self.backupsMaxBytes)
+        else:
+            self.compressor.put(self.segments, number, self.compress,
+                                self.backupCount, self.backupsMaxBytes)
+
+class LogSegments:
+    """The backups of a log file that is rolled over into segments:
+    each full file becomes filename.NNNNNN, numbered in the order they
+    were made, and the oldest ones are removed once there are more than
+    the number of backups (or, if a limit is given, once they take up
+    more bytes than that).  A segment may be compressed afterwards, which
+    adds the suffix of the compression to its name.  The names of the
+    segments, oldest first, are kept in filename.segments so that nobody
+    has to look for them.
+
+    A segment may be compressed by another thread than the one that
+    rolls the file over, so changes are made holding the lock."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.manifest = filename + '.segments'
+        self.lock = threading.Lock()
+        self.suffixes = {} # number -> suffix of a compressed segment
+        self.sizes = {} # number -> bytes the segment takes up
+        self.pending = set() # numbers of segments waiting for compression
+        self.numbers = self._load()
+
+    def _load(self):
+        dirname, basename = os.path.split(self.filename)
+        try:
+            with open(self.manifest, 'r') as f:
+                names = f.read().split()
+        except (IOError, OSError):
+            # no manifest (yet), pick up segments made without one
+            try:
+                names = os.listdir(dirname or '.')
+            except OSError:
+                names = []
+        pattern = re.compile(re.escape(basename) +
+                             r'\.([0-9]{6,})(\.gz|\.xz)?$')
+        numbers = set()
+        for name in names:
+            match = pattern.match(name)
+            if match is not None:
+                numbers.add(int(match.group(1)))
+        for number in list(numbers):
+            # look at the files rather than trusting the names, in case
+            # supervisord went away in the middle of a compression
+            for suffix in ('.gz', '.xz', ''):
+                try:
+                    self.sizes[number] = os.path.getsize(
+                        self.name(number) + suffix)
+                except OSError:
+                    continue
+                if suffix:
+                    self.suffixes[number] = suffix
+                break
+            else:
+                numbers.remove(number)
+        return sorted(numbers)
+
+    def name(self, number):
+        return '%s.%06d' % (self.filename, number)
+
+    def path(self, number):
+        """ The name of the file of a segment, compressed or not. """
+        return self.name(number) + self.suffixes.get(number, '')
+
+    def next_name(self):
+        """ The name of the next segment; call added() once it exists. """
+        if self.numbers:
+            return self.name(self.numbers[-1] + 1)
+        return self.name(1)
+
+    def added(self, backups, maxbytes=0, compress=False):
+        """ Record that the segment named by next_name() was made and
+        remove the oldest segments if there are more than backups or they
+        take up more than maxbytes.  If compress is true, the new segment
+        is going to be compressed and is left out of the byte count until
+        it is.  Returns the number of the new segment. """
+        with self.lock:
+            if self.numbers:
+                number = self.numbers[-1] + 1
+            else:
+                number = 1
+            try:
+                self.sizes[number] = os.path.getsize(self.name(number))
+            except OSError:
+                self.sizes[number] = 0
+            self.numbers.append(number)
+            if compress:
+                self.pending.add(number)
+            self._prune(backups, maxbytes)
+            self._write()
+        return number
+
+    def uncompressed(self):
+        """ The numbers of the segments that aren't compressed and aren't
+        waiting to be; they are counted as waiting from now on. """
+        with self.lock:
+            numbers = [ number for number in self.numbers
+                        if number not in self.suffixes and
+                        number not in self.pending ]
+            self.pending.update(numbers)
+        return numbers
+
+    def compress(self, number, method, backups, maxbytes=0):
+        """ Compress a segment with method ('gzip' or 'xz') into a file
+        named after it with the suffix of method, then remove it.
+        Nothing is done if it was removed in the meantime.  Returns the
+        name of the compressed file, or None. """
+        src = self.name(number)
+        dst = src + COMPRESSION_SUFFIXES[method]
+        tmp = dst + '.tmp'
+        try:
+            compress_file(src, tmp, method)
+        except (IOError, OSError) as why:
+            if why.args[0] != errno.ENOENT:
+                with self.lock:
+                    self.pending.discard(number)
+                self._discard(tmp)
+                raise
+            # gone, or compressed already by an earlier LogSegments
+            tmp = None
+        with self.lock:
+            self.pending.discard(number)
+            if number not in self.numbers:
+                if tmp is not None:
+                    self._discard(tmp)
+                return None
+            if tmp is not None:
+                os.rename(tmp, dst)
+                self._discard(src)
+            elif not os.path.exists(dst):
+                return None
+            self.suffixes[number] = COMPRESSION_SUFFIXES[method]
+            self.sizes[number] = os.path.getsize(dst)
+            self._prune(backups, maxbytes)
+            self._write()
+            if number not in self.numbers:
+                return None
+        return dst
+
+    def count(self):
+        """ The number of segments. """
+        with self.lock:
+            return len(self.numbers)
+
+    def get_names(self):
+        """ The names of the segments, oldest first. """
+        return [ self.path(number) for number in self.numbers ]
+
+    def get_size(self):
+        """ The bytes all segments take up. """
+        return sum([ self.sizes.get(number, 0) for number in self.numbers ])
+
+    def _prune(self, backups, maxbytes):
+        total = 0
+        if maxbytes:
+            total = sum([ self.sizes.get(number, 0)
+                          for number in self.numbers
+                          if number not in self.pending ])
+        while self.numbers and (len(self.numbers) > backups or
+                                (maxbytes and total > maxbytes)):
+            number = self.numbers.pop(0)
+            if number not in self.pending:
+                total -= self.sizes.get(number, 0)
+            self._discard(self.path(number))
+            self._discard(self.name(number) + '.idx')
+            self.suffixes.pop(number, None)
+            self.sizes.pop(number, None)
+
+    def _discard(self, filename):
+        try:
+            os.remove(filename)
+        except OSError as why:
+            if why.args[0] != errno.ENOENT:
+                raise
+
+    def _write(self):
+        tmp = self.manifest + '.tmp'
+        with open(tmp, 'w') as f:
+            for number in self.numbers:
+                f.write(os.path.basename(self.path(number)) + '\n')
+        os.rename(tmp, self.manifest)
+
+class TimeIndex:
+    """A sparse index of when the bytes of a log file were written,
+    kept in a file of its own: a line "time offset" whenever a record is
+    written at least interval_bytes after, or interval_seconds later
+    than, the last one that was noted, and for the first record of the
+    file.  The bytes from an offset on were all written at or after its
+    time, so a reader looking for what was written at some time can
+    start at the last entry before it.  The index of a segment is named
+    after the segment (uncompressed) with .idx appended."""
+
+    interval_bytes = 1 << 16
+    interval_seconds = 1.0
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stream = None
+        self.last_offset = None
+        self.last_time = None
+
+    def open(self, size, truncate=False):
+        """ Open the index of a log file of size bytes for appending,
+        dropping it if truncate is true or the file was truncated or
+        replaced since. """
+        self.close()
+        entries = []
+        if not truncate:
+            entries = read_time_index(self.filename)
+        mode = 'a'
+        if truncate or (entries and entries[-1][1] > size):
+            entries = []
+            mode = 'w'
+        if entries:
+            self.last_time, self.last_offset = entries[-1]
+        else:
+            self.last_time = self.last_offset = None
+        self.stream = open(self.filename, mode)
+
+    def note(self, offset):
+        """ Called with the offset at which a record is about to be
+        written (or has just been). """
+        if self.stream is None:
+            return
+        now = time.time()
+        if (self.last_offset is None or
+                offset - self.last_offset >= self.interval_bytes or
+                now - self.last_time >= self.interval_seconds):
+            if offset == self.last_offset:
+                return # nothing was written since
+            self.stream.write('%.6f %d\n' % (now, offset))
+            self.stream.flush()
+            self.last_time = now
+            self.last_offset = offset
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def rename(self, filename):
+        """ Make the (closed) index the index of filename, which the log
+        file was renamed to. """
+        try:
+            os.rename(self.filename, filename)
+        except OSError as why:
+            if why.args[0] != errno.ENOENT:
+                raise
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.filename)
+        except OSError as why:
+            if why.args[0] != errno.ENOENT:
+                raise
+
+def read_time_index(filename):
+    """ The entries of the TimeIndex in filename as (time, offset)
+    tuples, oldest first; [] if there is none.  An entry cut short by a
+    crash is ignored. """
+    entries = []
+    try:
+        with open(filename, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2 or not line.endswith('\n'):
+                    continue
+                try:
+                    entries.append((float(parts[0]), int(parts[1])))
+                except ValueError:
+                    continue
+    except (IOError, OSError):
+        pass
+    return entries
+
+def read_log_by_time(filename, start, end, maxbytes):
+    """ Read at most maxbytes of what was written to the log file
+    filename and its segments between the times start and end (end may
+    be 0 for no end), oldest first, using their TimeIndex files to seek
+    to the first byte that may have been written at or after start and
+    to stop at the last that may have been written before end.  The
+    index is sparse, so a little more than was asked for may be
+    returned.  Files without an index are left out. """
+    segments = LogSegments(filename)
+    files = [ (segments.path(number), segments.name(number) + '.idx')
+              for number in segments.numbers ]
+    files.append((filename, filename + '.idx'))
+    indexes = [ read_time_index(idx) for path, idx in files ]
+    # a file ends where the next indexed one starts
+    ends = []
+    following = None
+    for entries in reversed(indexes):
+        ends.append(following)
+        if entries:
+            following = entries[0][0]
+    ends.reverse()
+    chunks = []
+    remaining = maxbytes
+    for i, (path, idx) in enumerate(files):
+        entries = indexes[i]
+        if not entries:
+            continue
+        if end and entries[0][0] >= end:
+            break
+        if ends[i] is not None and ends[i] <= start:
+            continue
+        times = [ entry[0] for entry in entries ]
+        pos = bisect.bisect_right(times, start) - 1
+        offset = entries[pos][1] if pos >= 0 else 0
+        stop = None
+        if end:
+            pos = bisect.bisect_left(times, end)
+            if pos < len(entries):
+                stop = entries[pos][1]
+        length = remaining
+        if stop is not None:
+            length = min(length, stop - offset)
+        if length > 0:
+            try:
+                with open_log(path) as f:
+                    f.seek(offset)
+                    data = f.read(length)
+            except (IOError, OSError, EOFError):
+                continue # removed or cut short in the meantime
+            chunks.append(data)
+            remaining -= len(data)
+        if remaining <= 0:
+            break
+    return b''.join(chunks)
+
+class LogOffsets:
+    """The offsets of the bytes written to a log file counted across
+    its rollovers, so that a byte keeps its offset when the file is
+    rolled over into a backup and a reader can go on from where it was
+    whatever happened to the file in the meantime.  The offset of the
+    first byte of the file and the offset and length of each of its
+    backups, newest first, are kept in filename.offsets.  Without that
+    file, the backups that exist are taken to be all that was written
+    before the file, oldest first, from offset 0 on; segments (the
+    LogSegments of filename) saves looking for them if it is given.
+
+    The handlers of the logs of child processes keep the file up to
+    date (see FileHandler and copytruncate()); for other logs it is
+    worked out from the backups whenever it is needed."""
+
+    def __init__(self, filename, segments=None):
+        self.filename = filename
+        self.path = filename + '.offsets'
+        self.start = 0
+        self.backups = [] # (offset, length) of each backup, newest first
+        if not self._load():
+            if segments is not None:
+                names = segments.get_names()
+                names.reverse()
+            else:
+                names = get_backups(filename)
+            lengths = [ get_log_length(name) for name in names ]
+            self.start = sum(lengths)
+            start = self.start
+            for length in lengths:
+                start -= length
+                self.backups.append((start, length))
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.read().splitlines()
+            start = int(lines[0])
+            backups = []
+            for line in lines[1:]:
+                offset, length = line.split()
+                backups.append((int(offset), int(length)))
+        except (IOError, OSError, IndexError, ValueError):
+            return False
+        self.start = start
+        self.backups = backups
+        return True
+
+    def rolled(self, size, backups, length=None):
+        """ Record that the size bytes of the file were rolled over into
+        a new backup, or thrown away if backups is 0, and that there are
+        backups backups now.  If length is given, the backup only holds
+        the first length of them. """
+        if length is None:
+            length = size
+        if backups > 0:
+            self.backups.insert(0, (self.start, length))
+        del self.backups[backups:]
+        self.start += size
+        self._write()
+
+    def cleared(self, size):
+        """ Record that the size bytes of the file were removed. """
+        self.start += size
+        self._write()
+
+    def _write(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('%d\n' % self.start)
+            for offset, length in self.backups:
+                f.write('%d %d\n' % (offset, length))
+        os.rename(tmp, self.path)
+
+def get_log_span(filename):
+    """ The files that hold what was written to the log file filename
+    and is still kept, oldest first, as (name, offset, length) tuples:
+    its backups and then the file itself, with the offsets of their
+    first bytes counted across rollovers (see LogOffsets).  Backups that
+    LogOffsets doesn't know about, e.g. left over from when more of them
+    were kept, are left out. """
+    offsets = LogOffsets(filename)
+    try:
+        length = os.path.getsize(filename)
+    except OSError:
+        length = 0
+    files = [(filename, offsets.start, length)]
+    for name, (start, length) in zip(get_backups(filename), offsets.backups):
+        files.append((name, start, length))
+    files.reverse()
+    return files
+
+def find_span_offset(files, offset):
+    """ Where reading files (see get_log_span) from offset starts:
+    offset itself, counted back from the end if it is negative, unless
+    the bytes there are no longer kept, in which case the first of the
+    kept ones after it, or the end. """
+    name, start, length = files[-1]
+    end = start + length
+    if offset < 0:
+        offset = max(end + offset, 0)
+    for name, start, length in files:
+        if offset < start + length:
+            return max(offset, start)
+    return end
+
+def read_log_span(files, offset, length):
+    """ Read at most length bytes of files (see get_log_span) from the
+    offset offset on (see find_span_offset), going on from a backup into
+    the file made after it.  Returns (data, offset, end): the bytes, the
+    offset of the first of them and the offset just after the last byte
+    written to the log file.  Bytes that can't be read, e.g. because a
+    backup was removed in the meantime, are skipped like those that are
+    no longer kept. """
+    name, start, size = files[-1]
+    end = start + size
+    offset = find_span_offset(files, offset)
+    chunks = []
+    pos = offset
+    remaining = length
+    for name, start, size in files:
+        if remaining <= 0:
+            break
+        if start + size <= pos:
+            continue
+        if start > pos:
+            if chunks:
+                break # what was in between is gone
+            pos = offset = start
+        try:
+            with open_log(name) as f:
+                f.seek(pos - start)
+                data = f.read(min(remaining, start + size - pos))
+        except (IOError, OSError, EOFError):
+            if chunks:
+                break
+            pos = offset = start + size
+            continue
+        chunks.append(data)
+        pos += len(data)
+        remaining -= len(data)
+        if pos < start + size:
+            break # cut short
+    if not chunks:
+        offset = min(offset, end)
+    return b''.join(chunks), offset, end
+
+def search_log_span(files, regex, maxline=8192):
+    """ Yield the lines of files (see get_log_span) that regex, a
+    compiled bytes pattern, matches, oldest first, as (offset, line)
+    tuples: the offset of the line counted across rollovers and the line
+    without its newline, cut short at maxline bytes.  Use re.MULTILINE
+    for ^ and $ to match at the start and end of every line.  Plain
+    backups are mapped into memory rather than read; compressed backups
+    and the active file are read a chunk at a time, the latter because it
+    may be truncated while it is searched, and reading a mapping past the
+    end of its file kills the process with SIGBUS.  Files that can't be
+    read, e.g. because they were removed in the meantime, are skipped. """
+    for i, (name, start, length) in enumerate(files):
+        if (i == len(files) - 1 or
+                name.endswith(tuple(COMPRESSION_SUFFIXES.values()))):
+            lines = _search_read(name, regex, maxline, length)
+        else:
+            lines = _search_mapped(name, length, regex, maxline)
+        try:
+            for offset, line in lines:
+                yield start + offset, line
+        except (IOError, OSError, EOFError, ValueError):
+            continue
+
+def _search_mapped(filename, length, regex, maxline):
+    if length <= 0:
+        return
+    with open(filename, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+        try:
+            for match in _search_buffer(buf, 0, length, regex, maxline):
+                yield match
+        finally:
+            buf.close()
+
+def _search_read(filename, regex, maxline, length=None, chunk=1<<20):
+    # reads up to length bytes, or all of them if length is None
+    with open_log(filename) as f:
+        offset = 0 # of the first byte of buf
+        buf = b''
+        while True:
+            if length is None:
+                data = f.read(chunk)
+            else:
+                data = f.read(max(min(chunk, length - offset - len(buf)), 0))
+            buf += data
+            end = len(buf)
+            if data:
+                # search up to the last whole line
+                end = buf.rfind(b'\n') + 1
+                if not end:
+                    if len(buf) <= maxline:
+                        continue
+                    end = len(buf) # too long, search it in pieces
+            for pos, line in _search_buffer(buf, 0, end, regex, maxline):
+                yield offset + pos, line
+            if not data:
+                return
+            buf = buf[end:]
+            offset += end
+
+def _search_buffer(buf, pos, end, regex, maxline):
+    # pos is always at the start of a line
+    while pos < end:
+        match = regex.search(buf, pos, end)
+        if match is None:
+            return
+        first = buf.rfind(b'\n', pos, match.start()) + 1 or pos
+        last = buf.find(b'\n', match.start(), end)
+        if last < 0:
+            last = end
+        yield first, buf[first:min(last, first + maxline)]
+        pos = last + 1
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'xz': '.xz'}
+
+def compress_file(src, dst, method):
+    """ Write the contents of the file named src compressed with method
+    ('gzip' or 'xz') to the file named dst. """
+    with open(src, 'rb') as f:
+        with open(dst, 'wb') as raw:
+            if method == 'gzip':
+                # named after src rather than the temporary file dst may be
+                out = gzip.GzipFile(os.path.basename(src), 'wb', 6, raw)
+            else:
+                out = lzma.LZMAFile(raw, 'wb')
+            try:
+                shutil.copyfileobj(f, out, 1<<16)
+            finally:
+                out.close()
+
+def open_log(filename):
+    """ Open a log file or one of its backups for reading in binary
+    mode, decompressing it if its name says that it is compressed. """
+    if filename.endswith('.gz'):
+        return gzip.GzipFile(filename, 'rb')
+    if filename.endswith('.xz') and lzma is not None:
+        return lzma.LZMAFile(filename, 'rb')
+    return open(filename, 'rb')
+
+def get_log_length(filename):
+    """ The number of bytes in a log file or one of its backups, as if
+    it was not compressed; 0 if it can't be read. """
+    if not filename.endswith(tuple(COMPRESSION_SUFFIXES.values())):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+    length = 0
+    try:
+        with open_log(filename) as f:
+            while True:
+                data = f.read(1 << 16)
+                if not data:
+                    break
+                length += len(data)
+    except (IOError, OSError, EOFError):
+        pass
+    return length
+
+def get_backups(filename):
+    """ The names of the backups of a log file that exist, newest first:
+    its segments if it has any, or else filename.1, filename.2 and so
+    on. """
+    segments = LogSegments(filename)
+    if segments.numbers:
+        names = segments.get_names()
+        names.reverse()
+        return names
+    names = []
+    i = 1
+    while os.path.exists('%s.%d' % (filename, i)):
+        names.append('%s.%d' % (filename, i))
+        i += 1
+    return names
 
 class LogRecord:
     def __init__(self, level, msg, **kw):
@@ -289,7 +1139,10 @@ class LogRecord:
             part1 = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
             asctime = '%s,%03d' % (part1, msecs)
             levelname = LOG_LEVELS_BY_NUM[self.level]
-            msg = as_string(self.msg)
+            msg = self.msg
+            if isinstance(msg, memoryview):
+                msg = msg.tobytes()
+            msg = as_string(msg)
             if self.kw:
                 msg = msg % self.kw
             self.dictrepr = {'message':msg, 'levelname':levelname,
@@ -382,6 +1235,45 @@ class SyslogHandler(Handler):
 def getLogger(level=None):
     return Logger(level)
 
+def copytruncate(filename, backups, segments=None, maxbytes=0,
+                 compress=False, offsets=None):
+    """Roll over a log file that another process writes to through a
+    descriptor it can't be made to reopen (opened with O_APPEND): move
+    the backups up by one, copy the file to filename.1 and truncate it.
+    The other process goes on writing at the new end of the file; what
+    it writes between the copy and the truncation is lost.  If backups
+    is 0, the file is only truncated.  If segments (the LogSegments of
+    filename) is given, the file is copied to the next segment instead
+    and its number is returned; maxbytes and compress are passed on to
+    LogSegments.added().  If offsets (the LogOffsets of filename) is
+    given, they are kept up to date."""
+    number = None
+    with open(filename, 'r+b') as f:
+        copied = count = 0
+        if backups > 0:
+            if segments is not None:
+                dfn = segments.next_name()
+            else:
+                for i in range(backups - 1, 0, -1):
+                    sfn = "%s.%d" % (filename, i)
+                    if os.path.exists(sfn):
+                        os.rename(sfn, "%s.%d" % (filename, i + 1))
+                dfn = filename + ".1"
+            with open(dfn, 'wb') as backup:
+                shutil.copyfileobj(f, backup)
+            copied = f.tell()
+            if segments is not None:
+                number = segments.added(backups, maxbytes, compress)
+                count = segments.count()
+            else:
+                count = backups
+        f.seek(0, 2)
+        size = f.tell()
+        f.truncate(0)
+    if offsets is not None:
+        offsets.rolled(size, count, copied)
+    return number
+
 _2MB = 1<<21
 
 def handle_boundIO(logger, fmt, maxbytes=_2MB):
@@ -407,16 +1299,40 @@ def handle_syslog(logger, fmt):
     handler.setLevel(logger.level)
     logger.addHandler(handler)
 
-def handle_file(logger, filename, fmt, rotating=False, maxbytes=0, backups=0):
+def handle_file(logger, filename, fmt, rotating=False, maxbytes=0, backups=0,
+                buffersize=0, timers=None, flushdelay=1, writer=None,
+                rotation='rename', compress=None, compressor=None,
+                backups_maxbytes=0, index=False, offsets=False):
     """Attach a new file handler to an existing Logger. If the filename
-    is the magic name of 'syslog' then make it a syslog handler instead."""
+    is the magic name of 'syslog' then make it a syslog handler instead.
+    See FileHandler for buffersize, timers, flushdelay and offsets (which
+    are always kept for segments).  If writer (a
+    LogWriterPool) is given, the file is written by its threads.  If
+    rotating and rotation is 'segments', the backups are kept as
+    LogSegments; see SegmentedFileHandler for compress, compressor,
+    backups_maxbytes and index (which implies segments)."""
     if filename == 'syslog': # TODO remove this
         handler = SyslogHandler()
     else:
-        if rotating is False:
-            handler = FileHandler(filename)
+        if index:
+            handler = SegmentedFileHandler(filename, 'ab', maxbytes, backups,
+                                           buffersize, timers, flushdelay,
+                                           compress, compressor,
+                                           backups_maxbytes, index)
+        elif rotating is False:
+            handler = FileHandler(filename, 'ab', buffersize, timers,
+                                  flushdelay, offsets)
+        elif rotation == 'segments':
+            handler = SegmentedFileHandler(filename, 'ab', maxbytes, backups,
+                                           buffersize, timers, flushdelay,
+                                           compress, compressor,
+                                           backups_maxbytes)
         else:
-            handler = RotatingFileHandler(filename, 'a', maxbytes, backups)
+            handler = RotatingFileHandler(filename, 'a', maxbytes, backups,
+                                          buffersize, timers, flushdelay,
+                                          offsets)
+        if writer is not None:
+            handler = writer.wrap(handler)
     handler.setFormat(fmt)
     handler.setLevel(logger.level)
     logger.addHandler(handler)
@@ -0,0 +1,108 @@
+import re
+import threading
+
+from supervisor import loggers
+from supervisor.compat import as_bytes
+from supervisor.options import make_namespec
+from supervisor.options import split_namespec
+
+def get_search_logs(supervisord, names, channel):
+    """ The (name, channel, filename) of the channel ('stdout' or
+    'stderr') log files of the processes named by names ('name',
+    'group:name' or 'group:*'), or of all of them, in lexical order, if
+    names is empty.  Processes without a log file are left out.  Raises
+    KeyError for a name that doesn't name a process or group. """
+    selected = []
+    if not names:
+        for group_name in sorted(supervisord.process_groups.keys()):
+            group = supervisord.process_groups[group_name]
+            for process_name in sorted(group.processes.keys()):
+                selected.append((group, group.processes[process_name]))
+    for name in names:
+        group_name, process_name = split_namespec(name)
+        group = supervisord.process_groups.get(group_name)
+        if group is None:
+            raise KeyError(name)
+        if process_name is None:
+            for process_name in sorted(group.processes.keys()):
+                selected.append((group, group.processes[process_name]))
+        else:
+            process = group.processes.get(process_name)
+            if process is None:
+                raise KeyError(name)
+            selected.append((group, process))
+    logs = []
+    for group, process in selected:
+        filename = getattr(process.config, '%s_logfile' % channel)
+        if filename is not None:
+            process.flushlogs()
+            name = make_namespec(group.config.name, process.config.name)
+            logs.append((name, channel, filename))
+    return logs
+
+def compile_pattern(pattern):
+    """ Compile a search pattern, with ^ and $ matching at the start and
+    end of every line.  Raises re.error if it isn't valid. """
+    return re.compile(as_bytes(pattern), re.MULTILINE)
+
+class LogSearch:
+    """ A search of log files (and their backups) for the lines that
+    match a regular expression, made by a thread of its own so that the
+    mainloop goes on while the files are read.  The lines found are
+    taken with pop() as they come in; done is true once the search is
+    over, because maxmatches lines were found, every file was searched
+    or it was cancelled.  An unexpected failure ends the search early
+    and is kept in error. """
+
+    def __init__(self, logs, regex, maxmatches):
+        self.logs = logs # (name, channel, filename) tuples
+        self.regex = regex
+        self.maxmatches = maxmatches
+        self.lock = threading.Lock()
+        self.found = [] # lines not taken by pop() yet
+        self.count = 0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run,
+                                       name='supervisor-logsearch')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.search()
+        except Exception as why:
+            self.error = str(why)
+        finally:
+            with self.lock:
+                self.done = True
+
+    def search(self):
+        for name, channel, filename in self.logs:
+            files = loggers.get_log_span(filename)
+            for offset, line in loggers.search_log_span(files, self.regex):
+                with self.lock:
+                    if self.cancelled:
+                        return
+                    self.found.append((name, channel, offset, line))
+                    self.count += 1
+                    if self.count >= self.maxmatches:
+                        return
+            if self.cancelled:
+                return
+
+    def pop(self):
+        """ The lines found since the last call, as (name, channel,
+        offset, line) tuples: the name of the process, the channel, the
+        offset of the line counted across rollovers (see
+        loggers.LogOffsets) and the line (bytes). """
+        with self.lock:
+            found, self.found = self.found, []
+        return found
+
+    def cancel(self):
+        self.cancelled = True
@@ -0,0 +1,344 @@
+import threading
+import time
+
+from collections import deque
+
+from supervisor.loggers import LogRecord
+
+class LogWriterPool:
+    """ Threads that write child process logs so that a slow disk (or a
+    hung network filesystem) stalls the logs written to it rather than
+    the mainloop.
+
+    A handler is wrapped in a QueuedHandler by wrap() and belongs to one
+    of ``nthreads`` threads from then on, which does everything that
+    touches its file, in the order the mainloop asked for it: writes,
+    rollovers, reopening and removing the file.  The records queued for a
+    handler are bounded: once ``maxbytes`` are waiting, backlogged() is
+    true and the dispatcher that logs to it stops reading the pipe of the
+    child until the thread has caught up, which the pool tells the
+    mainloop about by calling ``wakeup`` (from the thread) and through
+    pop_drained().
+
+    If ``nthreads`` is 0, wrap() returns handlers as they are.  The
+    threads are started when they are first needed, so the pool may be
+    created before supervisord daemonizes.  stop() waits at most
+    stop_timeout seconds in all for them to write out what is queued. """
+    stop_timeout = 5.0
+
+    def __init__(self, wakeup=None, nthreads=0, maxbytes=1<<20):
+        self.wakeup = wakeup
+        self.nthreads = nthreads
+        self.maxbytes = maxbytes
+        self.writers = []
+        self._drained = deque() # handlers that are no longer backlogged
+        self._next = 0
+
+    def wrap(self, handler):
+        """ Return a handler that writes through this pool in place of
+        handler. """
+        if not self.nthreads:
+            return handler
+        if len(self.writers) < self.nthreads:
+            writer = LogWriter(self)
+            writer.start()
+            self.writers.append(writer)
+        else:
+            writer = self.writers[self._next % len(self.writers)]
+        self._next += 1
+        return QueuedHandler(handler, writer, self.maxbytes)
+
+    def drained(self, handler):
+        """ Called by a writer thread when handler is no longer
+        backlogged. """
+        self._drained.append(handler)
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def pop_drained(self):
+        """ Return the handlers that are no longer backlogged since the
+        last call, so that the mainloop reads for them again. """
+        handlers = []
+        while self._drained:
+            handlers.append(self._drained.popleft())
+        return handlers
+
+    def flush(self, timeout=None):
+        """ Wait until the threads have written out what was queued
+        before the call, at most timeout seconds in all; true if they
+        did. """
+        events = [ writer.sync() for writer in self.writers ]
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        for event in events:
+            if deadline is None:
+                event.wait()
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0 or not event.wait(remaining):
+                return False
+        return True
+
+    def stop(self, timeout=None):
+        """ Stop the threads once they have written out everything
+        queued, waiting at most timeout (stop_timeout if None) seconds in
+        all rather than per thread.  A thread that is still writing when
+        the time is up is left to finish (or not) on its own. """
+        if timeout is None:
+            timeout = self.stop_timeout
+        for writer in self.writers:
+            writer.stop()
+        deadline = time.time() + timeout
+        for writer in self.writers:
+            writer.join(max(deadline - time.time(), 0))
+        self.writers = []
+
+class LogWriter(threading.Thread):
+    """ A thread of a LogWriterPool that writes the records queued for
+    its handlers.  Calls queued after stop() are still written by the
+    thread until it has finished. """
+
+    def __init__(self, pool):
+        threading.Thread.__init__(self, name='supervisor-logwriter')
+        self.daemon = True
+        self.pool = pool
+        self.cond = threading.Condition()
+        self.queue = deque() # (handler, method, arg, size, queued)
+        self.stopping = False
+        self.finished = False
+
+    def put(self, handler, method, arg=None, size=0):
+        """ Queue a call of handler.method(arg) on the wrapped handler. """
+        with self.cond:
+            if not self.finished:
+                handler.queued_bytes += size
+                handler.queued_records += 1
+                self.queue.append((handler, method, arg, size, time.time()))
+                self.cond.notify()
+                return
+        # the thread has stopped, there is nobody to hand the call to
+        handler.call(method, arg)
+
+    def sync(self):
+        """ Return an event that is set once the thread has written out
+        what is queued now. """
+        event = threading.Event()
+        with self.cond:
+            if self.finished:
+                event.set()
+            else:
+                self.queue.append((None, None, event, 0, time.time()))
+                self.cond.notify()
+        return event
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+
+    def run(self):
+        while 1:
+            with self.cond:
+                while not self.queue and not self.stopping:
+                    self.cond.wait()
+                if not self.queue:
+                    self.finished = True
+                    return
+                batch = self.queue
+                self.queue = deque()
+            self.write(batch)
+
+    def write(self, batch):
+        """ Carry out a batch of queued calls, then flush the files they
+        wrote to (they may be buffered) and account for them. """
+        done = {} # id(handler) -> [handler, bytes, records, oldest]
+        synced = []
+        for handler, method, arg, size, queued in batch:
+            if handler is None:
+                synced.append(arg) # see sync()
+                continue
+            handler.call(method, arg)
+            entry = done.get(id(handler))
+            if entry is None:
+                done[id(handler)] = [handler, size, 1, queued]
+            else:
+                entry[1] += size
+                entry[2] += 1
+        for handler, size, records, oldest in done.values():
+            handler.call('flush')
+            now = time.time()
+            with self.cond:
+                was_backlogged = handler.backlogged()
+                handler.queued_bytes -= size
+                handler.queued_records -= records
+                handler.last_latency = now - oldest
+                if handler.last_latency > handler.max_latency:
+                    handler.max_latency = handler.last_latency
+                if was_backlogged and not handler.backlogged():
+                    self.pool.drained(handler)
+        for event in synced:
+            event.set()
+
+class QueuedHandler:
+    """ Stands in for a log handler whose file is written by a
+    LogWriter thread.  Records are queued by emit(); flush(), reopen(),
+    doRollover() and remove() are queued behind them and return at once,
+    so that the mainloop never waits for the thread: a log read after
+    flush() holds what the thread has written so far (see
+    LogWriterPool.flush()).
+
+    queued_bytes and queued_records are what is waiting to be written,
+    last_latency and max_latency the time in seconds between queueing
+    a record and it having been written to the file. """
+    reader = None # the dispatcher reading the output logged here, if any
+
+    def __init__(self, handler, writer, maxbytes):
+        self.handler = handler
+        self.writer = writer
+        self.maxbytes = maxbytes
+        self.level = handler.level
+        self.baseFilename = getattr(handler, 'baseFilename', None)
+        self.queued_bytes = 0
+        self.queued_records = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.closed = False
+
+    def setFormat(self, fmt):
+        self.handler.setFormat(fmt)
+
+    def setLevel(self, level):
+        self.level = level
+        self.handler.setLevel(level)
+
+    def backlogged(self):
+        return self.queued_bytes >= self.maxbytes
+
+    def emit(self, record):
+        msg = record.msg
+        if isinstance(msg, memoryview):
+            # the view is only good until the next read
+            msg = msg.tobytes()
+        copy = LogRecord(record.level, msg, **record.kw)
+        if (self.handler.fmt != '%(message)s' or
+                not isinstance(msg, bytes) or record.kw):
+            # timestamp the record now rather than when it is written
+            copy.asdict()
+        self.writer.put(self, 'emit', copy, len(msg))
+
+    def flush(self):
+        self.writer.put(self, 'flush')
+
+    def reopen(self):
+        self.closed = False
+        self.writer.put(self, 'reopen')
+
+    def doRollover(self):
+        self.writer.put(self, 'doRollover')
+
+    def remove(self):
+        self.closed = True
+        self.writer.put(self, 'remove')
+
+    def close(self):
+        self.closed = True
+        self.writer.put(self, 'close')
+
+    def call(self, method, arg=None):
+        """ Call method of the wrapped handler (in the writer thread). """
+        try:
+            if method == 'emit':
+                self.handler.emit(arg)
+            else:
+                getattr(self.handler, method)()
+        except:
+            self.handler.handleError()
+
+    def stats(self):
+        return {'logfile': self.baseFilename,
+                'queued_bytes': self.queued_bytes,
+                'queued_records': self.queued_records,
+                'backlogged': self.backlogged(),
+                'last_latency': self.last_latency,
+                'max_latency': self.max_latency}
+
+class LogCompressor:
+    """ A thread that compresses the segments of rolled over log files
+    (see loggers.SegmentedFileHandler) so that neither the mainloop nor
+    the threads writing the logs wait for it.  Segments are compressed
+    one at a time, in the order they were handed to put().  The thread
+    is started when it is first needed and exits once nothing is left
+    to compress.
+
+    Failures are reported to ``logger``, if there is one. """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.cond = threading.Condition()
+        self.queue = deque() # (segments, number, method, backups, maxbytes)
+        self.thread = None
+        self.stopping = False
+
+    def put(self, segments, number, method, backups, maxbytes=0):
+        """ Queue a call of segments.compress(). """
+        with self.cond:
+            if self.stopping:
+                return
+            self.queue.append((segments, number, method, backups, maxbytes))
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='supervisor-logcompressor')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        while 1:
+            with self.cond:
+                if not self.queue or self.stopping:
+                    self.thread = None
+                    self.cond.notify_all()
+                    return
+                job = self.queue.popleft()
+            self.compress(*job)
+
+    def compress(self, segments, number, method, backups, maxbytes):
+        try:
+            segments.compress(number, method, backups, maxbytes)
+        except Exception as why:
+            if self.logger is not None:
+                self.logger.warn("couldn't compress %s: %s" % (
+                    segments.name(number), why))
+
+    def pending(self):
+        """ The number of segments waiting to be compressed. """
+        with self.cond:
+            return len(self.queue)
+
+    def wait(self, timeout=None):
+        """ Wait until everything queued is compressed (for tests and
+        benchmarks). """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self.cond:
+            while self.thread is not None:
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                else:
+                    self.cond.wait()
+        return True
+
+    def stop(self):
+        """ Finish the segment being compressed and drop the rest; what
+        is left uncompressed is picked up by the next supervisord. """
+        with self.cond:
+            self.stopping = True
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        with self.cond:
+            self.queue.clear()
@@ -14,6 +14,8 @@ import glob
 import platform
 import warnings
 import fcntl
+import time
+from collections import OrderedDict
 
 from supervisor.compat import PY2
 from supervisor.compat import ConfigParser
@@ -40,6 +42,8 @@ from supervisor.datatypes import list_of_strings
 from supervisor.datatypes import octal_type
 from supervisor.datatypes import existing_directory
 from supervisor.datatypes import logging_level
+from supervisor.datatypes import log_rotation
+from supervisor.datatypes import log_compression
 from supervisor.datatypes import colon_separated_user_group
 from supervisor.datatypes import inet_address
 from supervisor.datatypes import InetStreamSocketConfig
@@ -54,6 +58,11 @@ from supervisor import loggers
 from supervisor import states
 from supervisor import xmlrpc
 from supervisor import poller
+from supervisor.logwriter import LogWriterPool
+from supervisor.logwriter import LogCompressor
+from supervisor.logfollow import LogFollowers
+from supervisor.scheduler import SpawnScheduler
+from supervisor.timers import TimerQueue
 
 def _read_version_txt():
     mydir = os.path.abspath(os.path.dirname(__file__))
@@ -480,6 +489,18 @@ class ServerOptions(Options):
                  "a:", "minfds=", int, default=1024)
         self.add("minprocs", "supervisord.minprocs",
                  "", "minprocs=", int, default=200)
+        self.add("maxstarting", "supervisord.maxstarting",
+                 "", "maxstarting=", int, default=0)
+        self.add("spawnrate", "supervisord.spawnrate",
+                 "", "spawnrate=", int, default=0)
+        self.add("childlog_flush_ms", "supervisord.childlog_flush_ms",
+                 "", "childlog_flush_ms=", int, default=1000)
+        self.add("childlog_writers", "supervisord.childlog_writers",
+                 "", "childlog_writers=", int, default=0)
+        self.add("childlog_queue_maxbytes",
+                 "supervisord.childlog_queue_maxbytes",
+                 "", "childlog_queue_maxbytes=", byte_size,
+                 default=1024 * 1024) # 1MB
         self.add("nocleanup", "supervisord.nocleanup",
                  "k", "nocleanup", flag=1, default=0)
         self.add("strip_ansi", "supervisord.strip_ansi",
@@ -489,9 +510,23 @@ class ServerOptions(Options):
         self.add("silent", "supervisord.silent",
                  "s", "silent", flag=1, default=0)
         self.pidhistory = {}
+        self.process_map = {} # map of fd to dispatcher for live processes
         self.process_group_configs = []
         self.signal_receiver = SignalReceiver()
+        self.signal_wakeup_fd = None # read end of the signal wakeup pipe
+        self._signal_wakeup_pipe = None
         self.poller = poller.Poller(self)
+        self.timers = TimerQueue()
+        self.spawn_scheduler = SpawnScheduler(self.timers)
+        self.logwriter = LogWriterPool(self.wake_mainloop)
+        self.logcompressor = LogCompressor()
+        self.logreaders = LogReaderCache()
+        self.logfollowers = LogFollowers()
+        self._read_buffer = bytearray(2 << 16) # 128K, see readfd_view()
+        self._read_view = memoryview(self._read_buffer)
+        # fork() gets slower as supervisord's heap grows; posix_spawn()
+        # (Python 3.8+) doesn't copy it
+        self.posix_spawn_available = hasattr(os, 'posix_spawn')
 
     def version(self, dummy):
         """Print version to stdout and exit(0).
@@ -583,6 +618,11 @@ class ServerOptions(Options):
         new = self.configroot.supervisord.process_group_configs
         self.process_group_configs = new
 
+        self.spawn_scheduler.maxstarting = self.maxstarting
+        self.spawn_scheduler.spawnrate = self.spawnrate
+        self.logwriter.nthreads = self.childlog_writers
+        self.logwriter.maxbytes = self.childlog_queue_maxbytes
+
     def read_config(self, fp):
         # Clear parse messages, since we may be re-reading the
         # config a second time after a reload.
@@ -634,6 +674,26 @@ class ServerOptions(Options):
 
         section.minfds = integer(get('minfds', 1024))
         section.minprocs = integer(get('minprocs', 200))
+        section.maxstarting = integer(get('maxstarting', 0))
+        if section.maxstarting < 0:
+            raise ValueError('[supervisord] section sets invalid '
+                             'maxstarting (%d)' % section.maxstarting)
+        section.spawnrate = integer(get('spawnrate', 0))
+        if section.spawnrate < 0:
+            raise ValueError('[supervisord] section sets invalid '
+                             'spawnrate (%d)' % section.spawnrate)
+        section.childlog_flush_ms = integer(get('childlog_flush_ms', 1000))
+        if section.childlog_flush_ms < 0:
+            raise ValueError('[supervisord] section sets invalid '
+                             'childlog_flush_ms (%d)' %
+                             section.childlog_flush_ms)
+        section.childlog_writers = integer(get('childlog_writers', 0))
+        if section.childlog_writers < 0:
+            raise ValueError('[supervisord] section sets invalid '
+                             'childlog_writers (%d)' %
+                             section.childlog_writers)
+        section.childlog_queue_maxbytes = byte_size(
+            get('childlog_queue_maxbytes', '1MB'))
 
         directory = get('directory', None)
         if directory is None:
@@ -694,6 +754,13 @@ class ServerOptions(Options):
             kwargs['expansions'] = expansions
             return parser.saneget(section, opt, default, **kwargs)
 
+        def get_maxstarting(section):
+            maxstarting = integer(get(section, 'maxstarting', 0))
+            if maxstarting < 0:
+                raise ValueError('[%s] section sets invalid maxstarting (%d)'
+                                 % (section, maxstarting))
+            return maxstarting
+
         # process heterogeneous groups
         for section in all_sections:
             if not section.startswith('group:'):
@@ -701,6 +768,7 @@ class ServerOptions(Options):
             group_name = process_or_group_name(section.split(':', 1)[1])
             programs = list_of_strings(get(section, 'programs', None))
             priority = integer(get(section, 'priority', 999))
+            maxstarting = get_maxstarting(section)
             group_processes = []
             for program in programs:
                 program_section = "program:%s" % program
@@ -719,7 +787,8 @@ class ServerOptions(Options):
 
                 group_processes.extend(processes)
             groups.append(
-                ProcessGroupConfig(self, group_name, priority, group_processes)
+                ProcessGroupConfig(self, group_name, priority, group_processes,
+                                   maxstarting=maxstarting)
                 )
 
         # process "normal" homogeneous groups
@@ -729,10 +798,12 @@ class ServerOptions(Options):
                 continue
             program_name = process_or_group_name(section.split(':', 1)[1])
             priority = integer(get(section, 'priority', 999))
+            maxstarting = get_maxstarting(section)
             processes=self.processes_from_section(parser, section, program_name,
                                                   ProcessConfig)
             groups.append(
-                ProcessGroupConfig(self, program_name, priority, processes)
+                ProcessGroupConfig(self, program_name, priority, processes,
+                                   maxstarting=maxstarting)
                 )
 
         # process "event listener" homogeneous groups
@@ -744,6 +815,7 @@ class ServerOptions(Options):
             # give listeners a "high" default priority so they are started first
             # and stopped last at mainloop exit
             priority = integer(get(section, 'priority', -1))
+            maxstarting = get_maxstarting(section)
 
             buffer_size = integer(get(section, 'buffer_size', 10))
             if buffer_size < 1:
@@ -780,13 +852,20 @@ class ServerOptions(Options):
                     'but this is not allowed because it will interfere '
                     'with the eventlistener protocol' % section)
 
+            direct = boolean(get(section, 'stdout_logfile_direct', 'false'))
+            if direct:
+                raise ValueError('[%s] section sets stdout_logfile_direct=true '
+                    'but this is not allowed because it will interfere '
+                    'with the eventlistener protocol' % section)
+
             processes=self.processes_from_section(parser, section, pool_name,
                                                   EventListenerConfig)
 
             groups.append(
                 EventListenerPoolConfig(self, pool_name, priority, processes,
                                         buffer_size, pool_events,
-                                        result_handler)
+                                        result_handler,
+                                        maxstarting=maxstarting)
                 )
 
         # process fastcgi homogeneous groups
@@ -796,6 +875,7 @@ class ServerOptions(Options):
                 continue
             program_name = process_or_group_name(section.split(':', 1)[1])
             priority = integer(get(section, 'priority', 999))
+            maxstarting = get_maxstarting(section)
             fcgi_expansions = {'program_name': program_name}
 
             # find proc_uid from "user" option
@@ -845,7 +925,7 @@ class ServerOptions(Options):
                                                   FastCGIProcessConfig)
             groups.append(
                 FastCGIGroupConfig(self, program_name, priority, processes,
-                                   socket_config)
+                                   socket_config, maxstarting=maxstarting)
                 )
 
         groups.sort()
@@ -933,6 +1013,8 @@ class ServerOptions(Options):
         stdout_events = boolean(get(section, 'stdout_events_enabled','false'))
         stderr_cmaxbytes = byte_size(get(section,'stderr_capture_maxbytes','0'))
         stderr_events = boolean(get(section, 'stderr_events_enabled','false'))
+        stdout_tmaxbytes = byte_size(get(section, 'stdout_tail_maxbytes', '0'))
+        stderr_tmaxbytes = byte_size(get(section, 'stderr_tail_maxbytes', '0'))
         serverurl = get(section, 'serverurl', None)
         if serverurl and serverurl.strip().upper() == 'AUTO':
             serverurl = None
@@ -1016,6 +1098,60 @@ class ServerOptions(Options):
                         'rollover, set maxbytes > 0 to avoid filling up '
                         'filesystem unintentionally' % (section, lf_key))
 
+                di_key = '%s_logfile_direct' % k
+                direct = boolean(get(section, di_key, 'false'))
+                logfiles[di_key] = direct
+
+                bf_key = '%s_logfile_buffer' % k
+                logfiles[bf_key] = byte_size(get(section, bf_key, '0'))
+
+                ro_key = '%s_logfile_rotation' % k
+                logfiles[ro_key] = log_rotation(get(section, ro_key, 'rename'))
+
+                # compression and retention by size are done on segments
+                co_key = '%s_logfile_compress' % k
+                logfiles[co_key] = log_compression(get(section, co_key, 'none'))
+                bm_key = '%s_logfile_backups_maxbytes' % k
+                logfiles[bm_key] = byte_size(get(section, bm_key, '0'))
+                ix_key = '%s_logfile_index' % k
+                logfiles[ix_key] = boolean(get(section, ix_key, 'false'))
+                for key in (co_key, bm_key, ix_key):
+                    if logfiles[key] and logfiles[ro_key] != 'segments':
+                        raise ValueError(
+                            '%s requires %s=segments' % (key, ro_key))
+
+            for k, cmaxbytes, events_enabled in (
+                    ('stdout', stdout_cmaxbytes, stdout_events),
+                    ('stderr', stderr_cmaxbytes, stderr_events)):
+                di_key = '%s_logfile_direct' % k
+                if not logfiles[di_key]:
+                    continue
+                if k == 'stderr' and redirect_stderr:
+                    # stderr goes wherever stdout goes
+                    logfiles[di_key] = False
+                    continue
+                # the child writes to the file itself, so supervisord never
+                # sees the output
+                if logfiles['%s_logfile' % k] is None:
+                    raise ValueError(
+                        '%s=true requires %s_logfile to be set' % (di_key, k))
+                if logfiles['%s_syslog' % k]:
+                    raise ValueError(
+                        '%s=true cannot be used with %s_syslog=true' % (
+                        di_key, k))
+                if cmaxbytes:
+                    raise ValueError(
+                        '%s=true cannot be used with %s_capture_maxbytes' % (
+                        di_key, k))
+                if events_enabled:
+                    raise ValueError(
+                        '%s=true cannot be used with %s_events_enabled=true'
+                        % (di_key, k))
+                if logfiles['%s_logfile_index' % k]:
+                    raise ValueError(
+                        '%s=true cannot be used with %s_logfile_index=true'
+                        % (di_key, k))
+
             if redirect_stderr:
                 if logfiles['stderr_logfile'] not in (Automatic, None):
                     self.parse_warnings.append(
@@ -1048,12 +1184,28 @@ class ServerOptions(Options):
                 stdout_logfile_backups=logfiles['stdout_logfile_backups'],
                 stdout_logfile_maxbytes=logfiles['stdout_logfile_maxbytes'],
                 stdout_syslog=logfiles['stdout_syslog'],
+                stdout_logfile_direct=logfiles['stdout_logfile_direct'],
+                stdout_logfile_buffer=logfiles['stdout_logfile_buffer'],
+                stdout_logfile_rotation=logfiles['stdout_logfile_rotation'],
+                stdout_logfile_compress=logfiles['stdout_logfile_compress'],
+                stdout_logfile_backups_maxbytes=logfiles[
+                    'stdout_logfile_backups_maxbytes'],
+                stdout_logfile_index=logfiles['stdout_logfile_index'],
+                stdout_tail_maxbytes=stdout_tmaxbytes,
                 stderr_logfile=logfiles['stderr_logfile'],
                 stderr_capture_maxbytes = stderr_cmaxbytes,
                 stderr_events_enabled = stderr_events,
                 stderr_logfile_backups=logfiles['stderr_logfile_backups'],
                 stderr_logfile_maxbytes=logfiles['stderr_logfile_maxbytes'],
                 stderr_syslog=logfiles['stderr_syslog'],
+                stderr_logfile_direct=logfiles['stderr_logfile_direct'],
+                stderr_logfile_buffer=logfiles['stderr_logfile_buffer'],
+                stderr_logfile_rotation=logfiles['stderr_logfile_rotation'],
+                stderr_logfile_compress=logfiles['stderr_logfile_compress'],
+                stderr_logfile_backups_maxbytes=logfiles[
+                    'stderr_logfile_backups_maxbytes'],
+                stderr_logfile_index=logfiles['stderr_logfile_index'],
+                stderr_tail_maxbytes=stderr_tmaxbytes,
                 stopsignal=stopsignal,
                 stopwaitsecs=stopwaitsecs,
                 stopasgroup=stopasgroup,
@@ -1221,6 +1373,11 @@ class ServerOptions(Options):
                     self._try_unlink(socketname)
         if self.unlink_pidfile:
             self._try_unlink(self.pidfile)
+        self.logwriter.stop()
+        self.logcompressor.stop()
+        self.logreaders.close()
+        self.logfollowers.close()
+        self.close_signal_wakeup_fd()
         self.poller.close()
 
     def _try_unlink(self, path):
@@ -1263,10 +1420,74 @@ class ServerOptions(Options):
         signal.signal(signal.SIGHUP, receive)
         signal.signal(signal.SIGCHLD, receive)
         signal.signal(signal.SIGUSR2, receive)
+        self.open_signal_wakeup_fd()
+
+    def open_signal_wakeup_fd(self):
+        """ Have the interpreter write a byte to a pipe whenever a signal
+        arrives so that a poller watching signal_wakeup_fd returns right
+        away instead of at the end of its timeout.  If this is not possible
+        (e.g. we are not running in the main thread), signal_wakeup_fd is
+        left as None. """
+        if self._signal_wakeup_pipe is not None:
+            return
+        r, w = os.pipe()
+        for fd in (r, w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NDELAY
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags)
+        try:
+            signal.set_wakeup_fd(w)
+        except (AttributeError, ValueError):
+            self.close_fd(r)
+            self.close_fd(w)
+            return
+        self._signal_wakeup_pipe = (r, w)
+        self.signal_wakeup_fd = r
+
+    def close_signal_wakeup_fd(self):
+        if self._signal_wakeup_pipe is None:
+            return
+        try:
+            signal.set_wakeup_fd(-1)
+        except ValueError: # not in the main thread
+            pass
+        for fd in self._signal_wakeup_pipe:
+            self.close_fd(fd)
+        self._signal_wakeup_pipe = None
+        self.signal_wakeup_fd = None
+
+    def drain_signal_wakeup_fd(self):
+        """ Empty the signal wakeup pipe after it has woken the poller.
+        The bytes themselves are not interesting; the signals are collected
+        by the signal receiver. """
+        while self.readfd(self.signal_wakeup_fd):
+            pass
+
+    def wake_mainloop(self):
+        """ Make the poller return now if it is waiting; safe to call
+        from any thread.  Without a signal wakeup pipe, the mainloop wakes
+        up at least once a second anyway. """
+        pipe = self._signal_wakeup_pipe
+        if pipe is not None:
+            try:
+                os.write(pipe[1], b'\0')
+            except OSError: # full, so the poller is woken up already
+                pass
+
+    def update_log_readers(self):
+        """ Read again from the pipes whose log writer threads have
+        caught up with their backlog. """
+        for handler in self.logwriter.pop_drained():
+            if handler.reader is not None:
+                self.update_dispatcher(handler.reader)
 
     def get_signal(self):
         return self.signal_receiver.get_signal()
 
+    def has_signal(self):
+        return self.signal_receiver.has_signal()
+
     def openhttpservers(self, supervisord):
         try:
             self.httpservers = self.make_http_servers(supervisord)
@@ -1317,6 +1538,47 @@ class ServerOptions(Options):
     def get_socket_map(self):
         return asyncore.socket_map
 
+    def get_process_map(self):
+        return self.process_map
+
+    def add_dispatcher(self, dispatcher):
+        """ Start monitoring a process dispatcher in the main loop. """
+        fd = dispatcher.fd
+        # the fd number may still be registered on behalf of an earlier
+        # owner that was closed without telling the poller
+        self.unregister_fd(fd)
+        self.process_map[fd] = dispatcher
+        self.update_dispatcher(dispatcher)
+
+    def remove_dispatcher(self, dispatcher):
+        """ Stop monitoring a process dispatcher.  This must be called
+        before its fd is closed. """
+        fd = dispatcher.fd
+        if self.process_map.get(fd) is dispatcher:
+            del self.process_map[fd]
+            self.unregister_fd(fd)
+
+    def update_dispatcher(self, dispatcher):
+        """ Bring the poller's interest in a monitored dispatcher's fd in
+        line with its readable() and writable() state. """
+        fd = dispatcher.fd
+        if self.process_map.get(fd) is not dispatcher:
+            return
+        if dispatcher.readable():
+            self.poller.register_readable(fd)
+        elif fd in self.poller.readables:
+            self.poller.unregister_readable(fd)
+        if dispatcher.writable():
+            self.poller.register_writable(fd)
+        elif fd in self.poller.writables:
+            self.poller.unregister_writable(fd)
+
+    def unregister_fd(self, fd):
+        if fd in self.poller.readables:
+            self.poller.unregister_readable(fd)
+        if fd in self.poller.writables:
+            self.poller.unregister_writable(fd)
+
     def cleanup_fds(self):
         # try to close any leaked file descriptors (for reload)
         start = 5
@@ -1325,7 +1587,50 @@ class ServerOptions(Options):
     def kill(self, pid, signal):
         os.kill(pid, signal)
 
-    def waitpid(self):
+    def pidfd_open(self, pid):
+        """ Return a pidfd (a file descriptor that refers to the process
+        and becomes readable when it exits) for the child pid, or None if
+        the platform does not support pidfds (non-Linux, Linux < 5.3,
+        Python < 3.9). """
+        pidfd_open = getattr(os, 'pidfd_open', None)
+        if pidfd_open is None:
+            return None
+        try:
+            return pidfd_open(pid)
+        except OSError as exc:
+            self.logger.blather('pidfd_open error %r for pid %s'
+                                % (exc.args[0], pid))
+            return None
+
+    def pidfd_send_signal(self, pidfd, sig):
+        signal.pidfd_send_signal(pidfd, sig)
+
+    def make_exec_status_pipe(self):
+        """ Return a (read, write) pipe that a forked child can use to
+        report a failure to exec to us.  Both ends are close-on-exec, so
+        a successful exec closes the write end without writing anything.
+        Return None if no pipe could be made. """
+        try:
+            r, w = os.pipe()
+        except OSError:
+            return None
+        for fd in (r, w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags)
+        return r, w
+
+    def read_exec_status(self, fd):
+        """ Read what a forked child wrote to its exec status pipe since
+        the last call; b'' once it has exec'd or exited (or the pipe
+        can't be read). """
+        while 1:
+            try:
+                return os.read(fd, 4096)
+            except OSError as why:
+                if why.args[0] != errno.EINTR:
+                    return b''
+
+    def waitpid(self, pid=-1, block=False):
         # Need pthread_sigmask here to avoid concurrent sigchld, but Python
         # doesn't offer in Python < 3.4.  There is still a race condition here;
         # we can get a sigchld while we're sitting in the waitpid call.
@@ -1336,7 +1641,7 @@ class ServerOptions(Options):
         # appears to be true, or at least stopping 50 processes at once never
         # left zombies laying around.
         try:
-            pid, sts = os.waitpid(-1, os.WNOHANG)
+            pid, sts = os.waitpid(pid, 0 if block else os.WNOHANG)
         except OSError as exc:
             code = exc.args[0]
             if code not in (errno.ECHILD, errno.EINTR):
@@ -1489,6 +1794,7 @@ class ServerOptions(Options):
         # must be called after realize() and after supervisor does setuid()
         format = '%(asctime)s %(levelname)s %(message)s\n'
         self.logger = loggers.getLogger(self.loglevel)
+        self.logcompressor.logger = self.logger
         if self.nodaemon and not self.silent:
             loggers.handle_stdout(self.logger, format)
         loggers.handle_file(
@@ -1514,6 +1820,32 @@ class ServerOptions(Options):
     def fork(self):
         return os.fork()
 
+    def posix_spawn(self, filename, argv, env, file_actions):
+        # setpgroup=0 puts the child in its own process group, like the
+        # setpgrp() call made by a forked child (see Subprocess)
+        return os.posix_spawn(filename, argv, env,
+                              file_actions=file_actions, setpgroup=0)
+
+    def get_inheritable_fds(self):
+        """ Return the file descriptors open in this process that a child
+        would inherit across an exec. """
+        for fd_dir in ('/proc/self/fd', '/dev/fd'):
+            try:
+                fds = [ int(name) for name in os.listdir(fd_dir) ]
+            except (OSError, ValueError):
+                continue
+            break
+        else:
+            fds = range(self.minfds)
+        inheritable = []
+        for fd in fds:
+            try:
+                if os.get_inheritable(fd):
+                    inheritable.append(fd)
+            except OSError: # not open, e.g. the fd listdir() used
+                pass
+        return inheritable
+
     def dup2(self, frm, to):
         return os.dup2(frm, to)
 
@@ -1587,14 +1919,33 @@ class ServerOptions(Options):
             data = b''
         return data
 
+    def readfd_view(self, fd):
+        """ Like readfd() but read into a buffer that every call reuses
+        and return a memoryview of the bytes read, which saves allocating
+        a new 128K bytes object for every read.  The view is only good
+        until the next call; copy (tobytes()) what has to be kept. """
+        buf = self._read_buffer
+        try:
+            if hasattr(os, 'readv'): # Python 3.3+
+                n = os.readv(fd, [buf])
+            else:
+                data = os.read(fd, len(buf))
+                n = len(data)
+                buf[:n] = data
+        except OSError as why:
+            if why.args[0] not in (errno.EWOULDBLOCK, errno.EBADF, errno.EINTR):
+                raise
+            n = 0
+        return self._read_view[:n]
+
     def chdir(self, dir):
         os.chdir(dir)
 
-    def make_pipes(self, stderr=True):
+    def make_pipes(self, stderr=True, stdout=True):
         """ Create pipes for parent to child stdin/stdout/stderr
         communications.  Open fd in non-blocking mode so we can read them
-        in the mainloop without blocking.  If stderr is False, don't
-        create a pipe for stderr. """
+        in the mainloop without blocking.  If stderr (or stdout) is False,
+        don't create a pipe for stderr (or stdout). """
 
         pipes = {'child_stdin':None,
                  'stdin':None,
@@ -1605,8 +1956,9 @@ class ServerOptions(Options):
         try:
             stdin, child_stdin = os.pipe()
             pipes['child_stdin'], pipes['stdin'] = stdin, child_stdin
-            stdout, child_stdout = os.pipe()
-            pipes['stdout'], pipes['child_stdout'] = stdout, child_stdout
+            if stdout:
+                stdout, child_stdout = os.pipe()
+                pipes['stdout'], pipes['child_stdout'] = stdout, child_stdout
             if stderr:
                 stderr, child_stderr = os.pipe()
                 pipes['stderr'], pipes['child_stderr'] = stderr, child_stderr
@@ -1621,6 +1973,13 @@ class ServerOptions(Options):
                     self.close_fd(fd)
             raise
 
+    def open_direct_logfile(self, filename):
+        """ Open a log file for a child to write to directly, instead of
+        through a pipe.  Every write goes to the end of the file, even
+        after the file has been truncated by log rotation. """
+        return os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                       0o666)
+
     def close_parent_pipes(self, pipes):
         for fdname in ('stdin', 'stdout', 'stderr'):
             fd = pipes.get(fdname)
@@ -1878,7 +2237,20 @@ class ProcessConfig(Config):
         'stderr_events_enabled', 'stderr_syslog',
         'stopsignal', 'stopwaitsecs', 'stopasgroup', 'killasgroup',
         'exitcodes', 'redirect_stderr' ]
-    optional_param_names = [ 'environment', 'serverurl' ]
+    optional_param_names = [ 'environment', 'serverurl',
+                             'stdout_logfile_direct', 'stderr_logfile_direct',
+                             'stdout_logfile_buffer', 'stderr_logfile_buffer',
+                             'stdout_logfile_rotation',
+                             'stderr_logfile_rotation',
+                             'stdout_logfile_compress',
+                             'stderr_logfile_compress',
+                             'stdout_logfile_backups_maxbytes',
+                             'stderr_logfile_backups_maxbytes',
+                             'stdout_logfile_index',
+                             'stderr_logfile_index',
+                             'stdout_tail_maxbytes',
+                             'stderr_tail_maxbytes' ]
+    spawn_plan = None # see compile_spawn_plan()
 
     def __init__(self, options, **params):
         self.options = options
@@ -1918,15 +2290,49 @@ class ProcessConfig(Config):
         if self.stderr_logfile is Automatic:
             self.stderr_logfile = get_autoname(name, sid, 'stderr')
 
+    def compile_spawn_plan(self):
+        """ Parse the command, find its executable and build its
+        environment once now instead of on every spawn. """
+        from supervisor.process import SpawnPlan
+        try:
+            self.spawn_plan = SpawnPlan(self)
+        except ProcessException:
+            # reported when the program is started
+            self.spawn_plan = None
+        else:
+            self.spawn_plan.resolve()
+
     def make_process(self, group=None):
         from supervisor.process import Subprocess
         process = Subprocess(self)
         process.group = group
         return process
 
+    def make_pipes(self, use_stderr):
+        """ Make the pipes for the channels that supervisord reads.  The
+        child gets a descriptor for its log file instead of a pipe for a
+        channel that it writes to its log file directly. """
+        options = self.options
+        direct_stdout = self.stdout_logfile_direct
+        direct_stderr = use_stderr and self.stderr_logfile_direct
+        p = options.make_pipes(use_stderr and not direct_stderr,
+                               stdout=not direct_stdout)
+        try:
+            if direct_stdout:
+                p['child_stdout'] = options.open_direct_logfile(
+                    self.stdout_logfile)
+            if direct_stderr:
+                p['child_stderr'] = options.open_direct_logfile(
+                    self.stderr_logfile)
+        except (OSError, IOError):
+            options.close_parent_pipes(p)
+            options.close_child_pipes(p)
+            raise
+        return p
+
     def make_dispatchers(self, proc):
         use_stderr = not self.redirect_stderr
-        p = self.options.make_pipes(use_stderr)
+        p = self.make_pipes(use_stderr)
         stdout_fd,stderr_fd,stdin_fd = p['stdout'],p['stderr'],p['stdin']
         dispatchers = {}
         from supervisor.dispatchers import POutputDispatcher
@@ -1947,7 +2353,7 @@ class EventListenerConfig(ProcessConfig):
         # always use_stderr=True for eventlisteners because mixing stderr
         # messages into stdout would break the eventlistener protocol
         use_stderr = True
-        p = self.options.make_pipes(use_stderr)
+        p = self.make_pipes(use_stderr)
         stdout_fd,stderr_fd,stdin_fd = p['stdout'],p['stderr'],p['stdin']
         dispatchers = {}
         from supervisor.dispatchers import PEventListenerDispatcher
@@ -1985,11 +2391,13 @@ class FastCGIProcessConfig(ProcessConfig):
         return dispatchers, p
 
 class ProcessGroupConfig(Config):
-    def __init__(self, options, name, priority, process_configs):
+    def __init__(self, options, name, priority, process_configs,
+                 maxstarting=0):
         self.options = options
         self.name = name
         self.priority = priority
         self.process_configs = process_configs
+        self.maxstarting = maxstarting # 0 is no limit
 
     def __eq__(self, other):
         if not isinstance(other, ProcessGroupConfig):
@@ -2001,12 +2409,15 @@ class ProcessGroupConfig(Config):
             return False
         if self.process_configs != other.process_configs:
             return False
+        if self.maxstarting != other.maxstarting:
+            return False
 
         return True
 
     def after_setuid(self):
         for config in self.process_configs:
             config.create_autochildlogs()
+            config.compile_spawn_plan()
 
     def make_group(self):
         from supervisor.process import ProcessGroup
@@ -2014,7 +2425,7 @@ class ProcessGroupConfig(Config):
 
 class EventListenerPoolConfig(Config):
     def __init__(self, options, name, priority, process_configs, buffer_size,
-                 pool_events, result_handler):
+                 pool_events, result_handler, maxstarting=0):
         self.options = options
         self.name = name
         self.priority = priority
@@ -2022,6 +2433,7 @@ class EventListenerPoolConfig(Config):
         self.buffer_size = buffer_size
         self.pool_events = pool_events
         self.result_handler = result_handler
+        self.maxstarting = maxstarting # 0 is no limit
 
     def __eq__(self, other):
         if not isinstance(other, EventListenerPoolConfig):
@@ -2032,7 +2444,8 @@ class EventListenerPoolConfig(Config):
             (self.process_configs == other.process_configs) and
             (self.buffer_size == other.buffer_size) and
             (self.pool_events == other.pool_events) and
-            (self.result_handler == other.result_handler)):
+            (self.result_handler == other.result_handler) and
+            (self.maxstarting == other.maxstarting)):
             return True
 
         return False
@@ -2040,19 +2453,22 @@ class EventListenerPoolConfig(Config):
     def after_setuid(self):
         for config in self.process_configs:
             config.create_autochildlogs()
+            config.compile_spawn_plan()
 
     def make_group(self):
         from supervisor.process import EventListenerPool
         return EventListenerPool(self)
 
 class FastCGIGroupConfig(ProcessGroupConfig):
-    def __init__(self, options, name, priority, process_configs, socket_config):
+    def __init__(self, options, name, priority, process_configs, socket_config,
+                 maxstarting=0):
         ProcessGroupConfig.__init__(
             self,
             options,
             name,
             priority,
             process_configs,
+            maxstarting,
             )
         self.socket_config = socket_config
 
@@ -2069,20 +2485,99 @@ class FastCGIGroupConfig(ProcessGroupConfig):
         from supervisor.process import FastCGIProcessGroup
         return FastCGIProcessGroup(self)
 
-def readFile(filename, offset, length):
+class LogReaderCache:
+    """ Log files kept open between reads by readFile() and tailFile(),
+    so that a log polled again and again (``supervisorctl tail -f``) is
+    read with a seek and a read instead of an open, a seek, a read and a
+    close every time.  A file is known by its name and inode: once the
+    name is given to another file (the log was rotated or removed and
+    created again) the old one is closed and the new one opened.  At
+    most maxfiles files are kept open, the least recently read is closed
+    first, and a file that hasn't been read for maxidle seconds is
+    closed so that a removed log doesn't hold on to its disk space. """
+
+    def __init__(self, maxfiles=32, maxidle=60):
+        self.maxfiles = maxfiles
+        self.maxidle = maxidle
+        self.files = OrderedDict() # filename -> (file, inode, last read)
+
+    def open(self, filename):
+        """ An open file object for filename, to be used before the next
+        call and not closed by the caller.  Raises OSError or IOError
+        if the file can't be opened. """
+        now = time.time()
+        self._close_idle(now)
+        entry = self.files.pop(filename, None)
+        try:
+            st = os.stat(filename)
+        except (OSError, IOError):
+            if entry is not None:
+                entry[0].close()
+            raise
+        ino = (st.st_dev, st.st_ino)
+        if entry is not None and entry[1] != ino:
+            entry[0].close()
+            entry = None
+        if entry is None:
+            # unbuffered: a log truncated in place keeps its inode, and a
+            # buffer would go on serving what was there before
+            f = open(filename, 'rb', 0)
+            fst = os.fstat(f.fileno())
+            entry = (f, (fst.st_dev, fst.st_ino), now)
+            while len(self.files) >= self.maxfiles:
+                self.files.popitem(last=False)[1][0].close()
+        self.files[filename] = (entry[0], entry[1], now)
+        return entry[0]
+
+    def _close_idle(self, now):
+        for filename, (f, ino, used) in list(self.files.items()):
+            if 0 <= now - used < self.maxidle:
+                break
+            del self.files[filename]
+            f.close()
+
+    def close(self):
+        while self.files:
+            self.files.popitem()[1][0].close()
+
+def _open_log(filename, cache):
+    compressed = tuple(loggers.COMPRESSION_SUFFIXES.values())
+    if cache is None or filename.endswith(compressed):
+        return loggers.open_log(filename)
+    return _CachedFile(cache.open(filename))
+
+class _CachedFile:
+    # a file from a LogReaderCache, left open at the end of a with block
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self, *exc):
+        return False
+
+def readFile(filename, offset, length, cache=None):
     """ Read length bytes from the file named by filename starting at
-    offset """
+    offset.  A compressed log backup (see loggers.open_log) is read as
+    if it was not compressed.  The file is opened through cache (a
+    LogReaderCache) if one is given. """
 
     absoffset = abs(offset)
     abslength = abs(length)
 
     try:
-        with open(filename, 'rb') as f:
+        with _open_log(filename, cache) as f:
             if absoffset != offset:
                 # negative offset returns offset bytes from tail of the file
                 if length:
                     raise ValueError('BAD_ARGUMENTS')
-                f.seek(0, 2)
+                try:
+                    f.seek(0, 2)
+                except ValueError:
+                    # gzip files can't seek from the end, read up to it
+                    while f.read(1 << 16):
+                        pass
                 sz = f.tell()
                 pos = int(sz - absoffset)
                 if pos < 0:
@@ -2098,38 +2593,94 @@ def readFile(filename, offset, length):
                 else:
                     f.seek(offset)
                     data = f.read(length)
-    except (OSError, IOError):
+    except (OSError, IOError, EOFError):
+        # EOFError: a compressed file that was cut short
         raise ValueError('FAILED')
 
     return data
 
-def tailFile(filename, offset, length):
+def readBuffer(tail, size, offset, length, clip=False):
+    """ Like readFile(), but for a log file of size bytes whose last bytes
+    are held by tail (a dispatchers.OutputTail): its offset o is offset
+    o + tail.end - size of tail.  Returns None if some of the bytes asked
+    for are no longer held, unless clip is true, in which case only those
+    that are held are returned. """
+
+    absoffset = abs(offset)
+    abslength = abs(length)
+
+    if absoffset != offset:
+        # negative offset returns offset bytes from tail of the file
+        if length:
+            raise ValueError('BAD_ARGUMENTS')
+        pos = max(size - absoffset, 0)
+        stop = size
+    else:
+        if abslength != length:
+            raise ValueError('BAD_ARGUMENTS')
+        pos = offset
+        stop = size
+        if length:
+            stop = min(offset + length, size)
+
+    return _readTail(tail, size, pos, stop, clip)
+
+def _readTail(tail, size, pos, stop, clip):
+    if stop <= pos:
+        return b''
+    base = tail.end - size
+    if pos + base < tail.start:
+        if not clip:
+            return None
+        pos = tail.start - base
+    return tail.read(pos + base, stop - pos)
+
+def _tailRange(sz, offset, length):
+    """ The offset and length tailFile() reads for a file of sz bytes,
+    and whether it overflowed. """
+    overflow = False
+
+    if sz > (offset + length):
+        overflow = True
+        offset = sz - 1
+
+    if (offset + length) > sz:
+        if offset > (sz - 1):
+            length = 0
+        offset = sz - length
+
+    if offset < 0:
+        offset = 0
+    if length < 0:
+        length = 0
+
+    return offset, length, overflow
+
+def tailBuffer(tail, size, offset, length, clip=False):
+    """ Like tailFile(), but for a log file of size bytes whose last bytes
+    are held by tail, like readBuffer(), which explains clip.  Returns
+    None if some of the bytes asked for are no longer held. """
+    offset, length, overflow = _tailRange(size, offset, length)
+    data = _readTail(tail, size, offset, offset + length, clip)
+    if data is None:
+        return None
+    return [as_string(data), size, overflow]
+
+def tailFile(filename, offset, length, cache=None):
     """
     Read length bytes from the file named by filename starting at
     offset, automatically increasing offset and setting overflow
     flag if log size has grown beyond (offset + length).  If length
     bytes are not available, as many bytes as are available are returned.
+    The file is opened through cache (a LogReaderCache) if one is given.
     """
 
     try:
-        with open(filename, 'rb') as f:
-            overflow = False
+        with _open_log(filename, cache) as f:
             f.seek(0, 2)
             sz = f.tell()
 
-            if sz > (offset + length):
-                overflow = True
-                offset = sz - 1
-
-            if (offset + length) > sz:
-                if offset > (sz - 1):
-                    length = 0
-                offset = sz - length
-
-            if offset < 0:
-                offset = 0
-            if length < 0:
-                length = 0
+            offset, length, overflow = _tailRange(sz, offset, length)
 
             if length == 0:
                 data = b''
@@ -2209,6 +2760,9 @@ class SignalReceiver:
             sig = None
         return sig
 
+    def has_signal(self):
+        return bool(self._signals_recvd)
+
 # miscellaneous utility functions
 
 def expand(s, expansions, name):
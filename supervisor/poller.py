@@ -121,6 +121,8 @@ class PollPoller(BasePoller):
 
     def _poll_fds(self, timeout):
         try:
+            if timeout is None:
+                return self._poller.poll()
             return self._poller.poll(timeout * 1000)
         except select.error as err:
             if err.args[0] == errno.EINTR:
@@ -183,6 +185,11 @@ class KQueuePoller(BasePoller):
             if error.errno == errno.EBADF:
                 self.options.logger.blather('EBADF encountered in kqueue. '
                                             'Invalid file descriptor %s' % fd)
+            elif error.errno == errno.ENOENT:
+                # deleting a filter of an fd that was closed (which drops
+                # its kevents) and whose number has since been reused
+                self.options.logger.blather('ENOENT encountered in kqueue. '
+                                            'Unknown file descriptor %s' % fd)
             else:
                 raise
 
@@ -219,13 +226,127 @@ class KQueuePoller(BasePoller):
         self._kqueue.close()
         self._kqueue = None
 
+class EPollPoller(BasePoller):
+    '''
+    Wrapper for select.epoll().  Registrations are kept in the kernel
+    across iterations of the mainloop; the interest mask of a file
+    descriptor is only changed (with an epoll_ctl call) when its
+    readable or writable state actually flips.
+    '''
+
+    def initialize(self):
+        self._epoll = select.epoll()
+        self.READ = select.EPOLLIN | select.EPOLLPRI | select.EPOLLHUP
+        self.WRITE = select.EPOLLOUT
+        self.readables = set()
+        self.writables = set()
+        self._eventmasks = {} # fd -> eventmask currently in the kernel
+
+    def register_readable(self, fd):
+        if fd not in self.readables:
+            self.readables.add(fd)
+            self._update_eventmask(fd)
+
+    def register_writable(self, fd):
+        if fd not in self.writables:
+            self.writables.add(fd)
+            self._update_eventmask(fd)
+
+    def unregister_readable(self, fd):
+        if fd in self.readables:
+            self.readables.discard(fd)
+            self._update_eventmask(fd)
+
+    def unregister_writable(self, fd):
+        if fd in self.writables:
+            self.writables.discard(fd)
+            self._update_eventmask(fd)
+
+    def _update_eventmask(self, fd):
+        eventmask = 0
+        if fd in self.readables:
+            eventmask |= self.READ
+        if fd in self.writables:
+            eventmask |= self.WRITE
+        current = self._eventmasks.get(fd)
+        if eventmask == current:
+            return
+        try:
+            if not eventmask:
+                del self._eventmasks[fd]
+                self._epoll.unregister(fd)
+            elif current is None:
+                self._eventmasks[fd] = eventmask
+                self._epoll.register(fd, eventmask)
+            else:
+                self._eventmasks[fd] = eventmask
+                self._epoll.modify(fd, eventmask)
+        except (IOError, OSError) as error:
+            code = error.args[0]
+            if code == errno.EBADF:
+                # the fd was closed before it was unregistered; the kernel
+                # has already forgotten about it
+                self.options.logger.blather('EBADF encountered in epoll. '
+                                            'Invalid file descriptor %s' % fd)
+                self._forget(fd)
+            elif code == errno.ENOENT:
+                # the fd was closed (which drops it from the epoll set) and
+                # its number was reused since we registered it
+                if eventmask:
+                    self._epoll.register(fd, eventmask)
+            elif code == errno.EEXIST:
+                self._epoll.modify(fd, eventmask)
+            else:
+                raise
+
+    def _forget(self, fd):
+        self.readables.discard(fd)
+        self.writables.discard(fd)
+        self._eventmasks.pop(fd, None)
+
+    def poll(self, timeout):
+        readables, writables = [], []
+
+        try:
+            if timeout is None:
+                timeout = -1
+            events = self._epoll.poll(timeout)
+        except (IOError, OSError) as error:
+            if error.args[0] == errno.EINTR:
+                self.options.logger.blather('EINTR encountered in poll')
+                return readables, writables
+            raise
+
+        for fd, eventmask in events:
+            if eventmask & select.EPOLLERR:
+                # report errors to whichever handler is interested so
+                # that the dispatcher notices the failure on its next
+                # read or write
+                eventmask |= self.READ | self.WRITE
+            if eventmask & self.READ and fd in self.readables:
+                readables.append(fd)
+            if eventmask & (self.WRITE | select.EPOLLHUP) and (
+                    fd in self.writables):
+                writables.append(fd)
+
+        return readables, writables
+
+    def close(self):
+        self._epoll.close()
+        self._epoll = None
+
 def implements_poll():
     return hasattr(select, 'poll')
 
 def implements_kqueue():
     return hasattr(select, 'kqueue')
 
-if implements_kqueue():
+def implements_epoll():
+    return hasattr(select, 'epoll')
+
+if implements_epoll():
+    Poller = EPollPoller
+elif implements_kqueue():
     Poller = KQueuePoller
 elif implements_poll():
     Poller = PollPoller
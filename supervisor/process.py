@@ -3,6 +3,7 @@ import functools
 import os
 import signal
 import shlex
+import stat
 import time
 import traceback
 
@@ -23,8 +24,11 @@ from supervisor.options import signame
 from supervisor.options import ProcessException, BadCommand
 
 from supervisor.dispatchers import EventListenerStates
+from supervisor.dispatchers import PExitDispatcher
+from supervisor.dispatchers import PExecStatusDispatcher
 
 from supervisor import events
+from supervisor import loggers
 
 from supervisor.datatypes import RestartUnconditionally
 
@@ -55,6 +59,11 @@ class Subprocess(object):
     exitstatus = None # status attached to dead process by finish()
     spawnerr = None # error message attached by spawn() if any
     group = None # ProcessGroup instance if process is in the group
+    pidfd_dispatcher = None # PExitDispatcher for the running process, if any
+    exec_status_dispatcher = None # PExecStatusDispatcher until the child exec'd
+    exec_error = None # why the child couldn't exec, as it told us
+    directlogs = () # DirectLog for each channel written to a file directly
+    _exec_status_fd = None # in a forked child, where to report exec failure
 
     def __init__(self, config):
         """Constructor.
@@ -64,18 +73,73 @@ class Subprocess(object):
         self.config = config
         self.dispatchers = {}
         self.pipes = {}
+        self.output_tails = {} # channel -> dispatchers.OutputTail
         self.state = ProcessStates.STOPPED
+        self.directlogs = [
+            DirectLog(self, channel) for channel in ('stdout', 'stderr')
+            if getattr(config, '%s_logfile_direct' % channel) ]
 
     def removelogs(self):
         for dispatcher in self.dispatchers.values():
             if hasattr(dispatcher, 'removelogs'):
                 dispatcher.removelogs()
+        for directlog in self.directlogs:
+            directlog.removelogs()
+        for tail in self.output_tails.values():
+            tail.clear()
+
+    def get_output_tail(self, channel):
+        """ Return the OutputTail of channel, if it has one, and the size
+        of the log file whose last bytes it holds: the offsets of the file
+        are those of the tail less (tail.end - size).  The size is the end
+        of the tail if the channel has no log file, and None if the file
+        can't be matched up with the tail, e.g. because log writer threads
+        have yet to write some of it or something else writes to the file
+        too.  Call flushlogs() first. """
+        tail = self.output_tails.get(channel)
+        if tail is None:
+            return None, None
+        logfile = getattr(self.config, '%s_logfile' % channel)
+        if logfile is None:
+            return tail, tail.end
+        if tail.pending() or self._logfile_shared(channel):
+            return tail, None
+        try:
+            return tail, os.path.getsize(logfile)
+        except OSError:
+            return tail, None
+
+    def _logfile_shared(self, channel):
+        # whether the log file of channel is also configured as the log
+        # file of the other channel, of another process or of supervisord
+        logfile = os.path.abspath(getattr(self.config, '%s_logfile' % channel))
+        options = self.config.options
+        others = [options.logfile]
+        for other in ('stdout', 'stderr'):
+            if other != channel:
+                others.append(getattr(self.config, '%s_logfile' % other))
+        for group in options.process_group_configs:
+            for pconfig in group.process_configs:
+                if pconfig is self.config or pconfig == self.config:
+                    continue
+                others.append(getattr(pconfig, 'stdout_logfile', None))
+                others.append(getattr(pconfig, 'stderr_logfile', None))
+        for other in others:
+            if other and other != 'syslog':
+                if os.path.abspath(other) == logfile:
+                    return True
+        return False
 
     def reopenlogs(self):
         for dispatcher in self.dispatchers.values():
             if hasattr(dispatcher, 'reopenlogs'):
                 dispatcher.reopenlogs()
 
+    def flushlogs(self):
+        for dispatcher in self.dispatchers.values():
+            if hasattr(dispatcher, 'flushlogs'):
+                dispatcher.flushlogs()
+
     def drain(self):
         for dispatcher in self.dispatchers.values():
             # note that we *must* call readable() for every
@@ -84,6 +148,11 @@ class Subprocess(object):
             # event listener processes)
             if dispatcher.readable():
                 dispatcher.handle_read_event()
+            elif dispatcher.queued_handlers and not dispatcher.closed:
+                # held back until the log writer threads catch up, but
+                # the pipe is closed next: log what the child wrote
+                # before it exited anyway
+                dispatcher.handle_read_event()
             if dispatcher.writable():
                 dispatcher.handle_write_event()
 
@@ -101,52 +170,29 @@ class Subprocess(object):
 
         dispatcher.input_buffer += chars
         dispatcher.flush() # this must raise EPIPE if the pipe is closed
+        # anything that could not be written now is sent by the mainloop
+        self.config.options.update_dispatcher(dispatcher)
 
     def get_execv_args(self):
         """Internal: turn a program name into a file name, using $PATH,
         make sure it exists / is executable, raising a ProcessException
         if not """
-        try:
-            commandargs = shlex.split(self.config.command)
-        except ValueError as e:
-            raise BadCommand("can't parse command %r: %s" % \
-                (self.config.command, str(e)))
-
-        if commandargs:
-            program = commandargs[0]
-        else:
-            raise BadCommand("command is empty")
-
-        if "/" in program:
-            filename = program
-            try:
-                st = self.config.options.stat(filename)
-            except OSError:
-                st = None
-
-        else:
-            path = self.config.get_path()
-            found = None
-            st = None
-            for dir in path:
-                found = os.path.join(dir, program)
-                try:
-                    st = self.config.options.stat(found)
-                except OSError:
-                    pass
-                else:
-                    break
-            if st is None:
-                filename = program
-            else:
-                filename = found
+        plan = self._get_spawn_plan()
+        filename, st = plan.resolve()
 
         # check_execv_args will raise a ProcessException if the execv
         # args are bogus, we break it out into a separate options
         # method call here only to service unit tests
-        self.config.options.check_execv_args(filename, commandargs, st)
+        self.config.options.check_execv_args(filename, plan.argv, st)
+
+        return filename, list(plan.argv)
 
-        return filename, commandargs
+    def _get_spawn_plan(self):
+        config = self.config
+        plan = config.spawn_plan
+        if plan is None or plan.command != config.command:
+            plan = config.spawn_plan = SpawnPlan(config)
+        return plan
 
     event_map = {
         ProcessStates.BACKOFF: events.ProcessStateBackoffEvent,
@@ -166,10 +212,19 @@ class Subprocess(object):
             return False
 
         self.state = new_state
+        scheduler = self.config.options.spawn_scheduler
+        scheduler.discard(self)
+        if new_state == ProcessStates.STARTING:
+            scheduler.started(self)
+        elif old_state == ProcessStates.STARTING:
+            scheduler.finished(self)
         if new_state == ProcessStates.BACKOFF:
             now = time.time()
             self.backoff += 1
             self.delay = now + self.backoff
+        # have transition() look at the new state on the next pass of the
+        # mainloop; it works out when it needs to run after that
+        self.config.options.timers.schedule(self, 0)
 
         event_class = self.event_map.get(new_state)
         if event_class is not None:
@@ -237,6 +292,13 @@ class Subprocess(object):
             self.change_state(ProcessStates.BACKOFF)
             return
 
+        if self._can_posix_spawn():
+            return self._spawn_with_posix_spawn(filename, argv)
+
+        # the child reports a failure to exec through this pipe; it is
+        # closed without a word when the exec succeeds (see _spawn_as_child)
+        status_pipe = options.make_exec_status_pipe()
+
         try:
             pid = options.fork()
         except OSError as why:
@@ -253,14 +315,94 @@ class Subprocess(object):
             self.change_state(ProcessStates.BACKOFF)
             options.close_parent_pipes(self.pipes)
             options.close_child_pipes(self.pipes)
+            if status_pipe is not None:
+                options.close_fd(status_pipe[0])
+                options.close_fd(status_pipe[1])
             return
 
         if pid != 0:
+            if status_pipe is not None:
+                options.close_fd(status_pipe[1])
+                self.exec_status_dispatcher = PExecStatusDispatcher(
+                    self, status_pipe[0])
+                options.add_dispatcher(self.exec_status_dispatcher)
             return self._spawn_as_parent(pid)
 
         else:
+            if status_pipe is not None:
+                self._exec_status_fd = status_pipe[1]
             return self._spawn_as_child(filename, argv)
 
+    def exec_status(self, error):
+        """ Called by the PExecStatusDispatcher of the process once the
+        child has exec'd (error is empty) or told us why it couldn't, after
+        which it exits and finish() moves the process to BACKOFF. """
+        self.exec_status_dispatcher = None
+        if error:
+            self.exec_error = as_string(error)
+            self.record_spawnerr(self.exec_error)
+
+    def _can_posix_spawn(self):
+        """ Return True if the child can be started with posix_spawn()
+        instead of fork() and exec.  posix_spawn() can't change the user,
+        working directory or umask of the child, so programs that need any
+        of those are always forked. """
+        config = self.config
+        return (config.options.posix_spawn_available and
+                config.uid is None and
+                config.directory is None and
+                config.umask is None)
+
+    def _get_posix_spawn_file_actions(self):
+        """ Return the posix_spawn() file actions that do what
+        _prepare_child_fds() does in a forked child. """
+        options = self.config.options
+        stdout = self.pipes['child_stdout']
+        if self.config.redirect_stderr:
+            stderr = stdout
+        else:
+            stderr = self.pipes['child_stderr']
+        file_actions = [
+            (os.POSIX_SPAWN_DUP2, self.pipes['child_stdin'], 0),
+            (os.POSIX_SPAWN_DUP2, stdout, 1),
+            (os.POSIX_SPAWN_DUP2, stderr, 2),
+            ]
+        # close-on-exec descriptors (everything supervisord itself opens
+        # on Python 3) are closed by the exec anyway, so only the few
+        # inheritable ones need closing instead of every fd up to minfds
+        for fd in options.get_inheritable_fds():
+            if fd > 2:
+                file_actions.append((os.POSIX_SPAWN_CLOSE, fd))
+        return file_actions
+
+    def _spawn_with_posix_spawn(self, filename, argv):
+        options = self.config.options
+        try:
+            pid = options.posix_spawn(filename, argv, self._get_child_env(),
+                                      self._get_posix_spawn_file_actions())
+        except OSError as why:
+            code = why.args[0]
+            if code == errno.EAGAIN:
+                # process table full
+                msg  = ('Too many processes in process table to spawn \'%s\'' %
+                        as_string(self.config.name))
+            else:
+                msg = "couldn't exec %s: %s" % (
+                      argv[0], errno.errorcode.get(code, code))
+            self.record_spawnerr(msg)
+            self._assertInState(ProcessStates.STARTING)
+            self.change_state(ProcessStates.BACKOFF)
+            options.close_parent_pipes(self.pipes)
+            options.close_child_pipes(self.pipes)
+            return
+        return self._spawn_as_parent(pid)
+
+    def _get_child_env(self):
+        group_name = None
+        if self.group:
+            group_name = self.group.config.name
+        return self._get_spawn_plan().get_env(group_name)
+
     def _spawn_as_parent(self, pid):
         # Parent
         self.pid = pid
@@ -270,6 +412,15 @@ class Subprocess(object):
         self.spawnerr = None
         self.delay = time.time() + self.config.startsecs
         options.pidhistory[pid] = self
+        for dispatcher in self.dispatchers.values():
+            if not dispatcher.closed:
+                options.add_dispatcher(dispatcher)
+        pidfd = options.pidfd_open(pid)
+        if pidfd is not None:
+            self.pidfd_dispatcher = PExitDispatcher(self, pidfd)
+            options.add_dispatcher(self.pidfd_dispatcher)
+        for directlog in self.directlogs:
+            directlog.start()
         return pid
 
     def _prepare_child_fds(self):
@@ -281,7 +432,8 @@ class Subprocess(object):
         else:
             options.dup2(self.pipes['child_stderr'], 2)
         for i in range(3, options.minfds):
-            options.close_fd(i)
+            if i != self._exec_status_fd:
+                options.close_fd(i)
 
     def _spawn_as_child(self, filename, argv):
         options = self.config.options
@@ -304,22 +456,11 @@ class Subprocess(object):
             if setuid_msg:
                 uid = self.config.uid
                 msg = "couldn't setuid to %s: %s\n" % (uid, setuid_msg)
-                options.write(2, "supervisor: " + msg)
+                self._report_child_error(msg)
                 return # finally clause will exit the child process
 
             # set environment
-            env = os.environ.copy()
-            env['SUPERVISOR_ENABLED'] = '1'
-            serverurl = self.config.serverurl
-            if serverurl is None: # unset
-                serverurl = self.config.options.serverurl # might still be None
-            if serverurl:
-                env['SUPERVISOR_SERVER_URL'] = serverurl
-            env['SUPERVISOR_PROCESS_NAME'] = self.config.name
-            if self.group:
-                env['SUPERVISOR_GROUP_NAME'] = self.group.config.name
-            if self.config.environment is not None:
-                env.update(self.config.environment)
+            env = self._get_child_env()
 
             # change directory
             cwd = self.config.directory
@@ -329,7 +470,7 @@ class Subprocess(object):
             except OSError as why:
                 code = errno.errorcode.get(why.args[0], why.args[0])
                 msg = "couldn't chdir to %s: %s\n" % (cwd, code)
-                options.write(2, "supervisor: " + msg)
+                self._report_child_error(msg)
                 return # finally clause will exit the child process
 
             # set umask, then execve
@@ -340,12 +481,12 @@ class Subprocess(object):
             except OSError as why:
                 code = errno.errorcode.get(why.args[0], why.args[0])
                 msg = "couldn't exec %s: %s\n" % (argv[0], code)
-                options.write(2, "supervisor: " + msg)
+                self._report_child_error(msg)
             except:
                 (file, fun, line), t,v,tbinfo = asyncore.compact_traceback()
                 error = '%s, %s: file: %s line: %s' % (t, v, file, line)
                 msg = "couldn't exec %s: %s\n" % (filename, error)
-                options.write(2, "supervisor: " + msg)
+                self._report_child_error(msg)
 
             # this point should only be reached if execve failed.
             # the finally clause will exit the child process.
@@ -354,6 +495,16 @@ class Subprocess(object):
             options.write(2, "supervisor: child process was not spawned\n")
             options._exit(127) # exit process with code for spawn failure
 
+    def _report_child_error(self, msg):
+        # in a forked child: tell both the process log and the parent
+        options = self.config.options
+        options.write(2, "supervisor: " + msg)
+        if self._exec_status_fd is not None:
+            try:
+                options.write(self._exec_status_fd, msg.rstrip('\n'))
+            except OSError:
+                pass
+
     def _check_and_adjust_for_system_clock_rollback(self, test_time):
         """
         Check if system clock has rolled backward beyond test_time. If so, set
@@ -375,6 +526,51 @@ class Subprocess(object):
         elif self.state == ProcessStates.BACKOFF:
             if self.delay > 0 and test_time < (self.delay - self.backoff):
                 self.delay = test_time + self.backoff
+        self._schedule_transition()
+
+    def _get_deadline(self):
+        """ Return the time at which transition() will next have something
+        to do for this process, or None if only an external event (a
+        request, an exit, a signal) can change its state. """
+        state = self.state
+        if state == ProcessStates.STARTING:
+            return self.laststart + self.config.startsecs
+        if state == ProcessStates.STOPPING:
+            return self.delay
+        if state == ProcessStates.BACKOFF:
+            if self.backoff > self.config.startretries:
+                return 0 # give up right away
+        if self.config.options.spawn_scheduler.is_queued(self):
+            return None # the spawn scheduler transitions us
+        if self.config.options.mood > SupervisorStates.RESTARTING:
+            if state == ProcessStates.BACKOFF:
+                return self.delay
+            if state == ProcessStates.EXITED:
+                if self.config.autorestart:
+                    if self.config.autorestart is RestartUnconditionally:
+                        return 0
+                    if self.exitstatus not in self.config.exitcodes:
+                        return 0
+            elif state == ProcessStates.STOPPED and not self.laststart:
+                if self.config.autostart:
+                    return 0
+        return None
+
+    def _autospawn(self, now):
+        """ Spawn the process on our own (not by request) unless the
+        spawn scheduler holds it back; if it does, it transitions us again
+        when it's our turn. """
+        if self.config.options.spawn_scheduler.acquire(self, now):
+            self.spawn()
+
+    def _schedule_transition(self):
+        """ Let the mainloop know when to wake up to transition us. """
+        timers = self.config.options.timers
+        deadline = self._get_deadline()
+        if deadline is None:
+            timers.cancel(self)
+        else:
+            timers.schedule(self, deadline)
 
     def stop(self):
         """ Administrative stop """
@@ -456,6 +652,9 @@ class Subprocess(object):
                             ProcessStates.STARTING,
                             ProcessStates.STOPPING)
         self.change_state(ProcessStates.STOPPING)
+        # change_state() does nothing if we were already STOPPING but the
+        # SIGKILL deadline has moved
+        self._schedule_transition()
 
         pid = self.pid
         if killasgroup:
@@ -464,7 +663,12 @@ class Subprocess(object):
 
         try:
             try:
-                options.kill(pid, sig)
+                if killasgroup or self.pidfd_dispatcher is None:
+                    options.kill(pid, sig)
+                else:
+                    # unlike the pid, the pidfd can't refer to some other
+                    # process that has reused the pid after ours exited
+                    options.pidfd_send_signal(self.pidfd_dispatcher.fd, sig)
             except OSError as exc:
                 if exc.errno == errno.ESRCH:
                     msg = ("unable to signal %s (pid %s), it probably just exited "
@@ -512,7 +716,10 @@ class Subprocess(object):
 
         try:
             try:
-                options.kill(self.pid, sig)
+                if self.pidfd_dispatcher is None:
+                    options.kill(self.pid, sig)
+                else:
+                    options.pidfd_send_signal(self.pidfd_dispatcher.fd, sig)
             except OSError as exc:
                 if exc.errno == errno.ESRCH:
                     msg = ("unable to signal %s (pid %s), it probably just now exited "
@@ -537,6 +744,11 @@ class Subprocess(object):
         """ The process was reaped and we need to report and manage its state
         """
         self.drain()
+        # the child is gone and so is its end of the exec status pipe,
+        # so what it said (if anything) can be read without waiting
+        dispatcher = self.exec_status_dispatcher
+        while dispatcher is not None and not dispatcher.closed:
+            dispatcher.handle_read_event()
 
         es, msg = decode_wait_status(sts)
 
@@ -573,6 +785,13 @@ class Subprocess(object):
             else:
                 self.config.options.logger.warn(msg)
 
+        elif self.exec_error is not None:
+            # the child couldn't exec and told us why (see exec_status())
+            # implies STARTING -> BACKOFF
+            self.exitstatus = None
+            self.spawnerr = self.exec_error
+            self._assertInState(ProcessStates.STARTING)
+            self.change_state(ProcessStates.BACKOFF)
 
         elif too_quickly:
             # the program did not stay up long enough to make it to RUNNING
@@ -613,6 +832,14 @@ class Subprocess(object):
                 self.config.options.logger.warn(msg)
 
         self.pid = 0
+        self.exec_error = None
+        if self.pidfd_dispatcher is not None:
+            self.pidfd_dispatcher.close()
+            self.pidfd_dispatcher = None
+        for directlog in self.directlogs:
+            directlog.stop()
+        for dispatcher in self.dispatchers.values():
+            self.config.options.remove_dispatcher(dispatcher)
         self.config.options.close_parent_pipes(self.pipes)
         self.pipes = {}
         self.dispatchers = {}
@@ -667,27 +894,29 @@ class Subprocess(object):
                 if self.config.autorestart:
                     if self.config.autorestart is RestartUnconditionally:
                         # EXITED -> STARTING
-                        self.spawn()
+                        self._autospawn(now)
                     else: # autorestart is RestartWhenExitUnexpected
                         if self.exitstatus not in self.config.exitcodes:
                             # EXITED -> STARTING
-                            self.spawn()
+                            self._autospawn(now)
             elif state == ProcessStates.STOPPED and not self.laststart:
                 if self.config.autostart:
                     # STOPPED -> STARTING
-                    self.spawn()
+                    self._autospawn(now)
             elif state == ProcessStates.BACKOFF:
                 if self.backoff <= self.config.startretries:
                     if now > self.delay:
                         # BACKOFF -> STARTING
-                        self.spawn()
+                        self._autospawn(now)
 
         processname = as_string(self.config.name)
         if state == ProcessStates.STARTING:
-            if now - self.laststart > self.config.startsecs:
+            if (now - self.laststart > self.config.startsecs and
+                    self.exec_status_dispatcher is None and
+                    self.exec_error is None):
                 # STARTING -> RUNNING if the proc has started
-                # successfully and it has stayed up for at least
-                # proc.config.startsecs,
+                # successfully (exec'd, if we're told about that) and
+                # it has stayed up for at least proc.config.startsecs,
                 self.delay = 0
                 self.backoff = 0
                 self._assertInState(ProcessStates.STARTING)
@@ -717,6 +946,221 @@ class Subprocess(object):
                                                           self.pid))
                 self.kill(signal.SIGKILL)
 
+        self._schedule_transition()
+
+class SpawnPlan(object):
+    """ The parts of starting a program that are the same on every spawn:
+    its parsed command line, the executable the command resolves to and
+    its environment.  A plan is compiled once per ProcessConfig when its
+    group is added (at startup and on reload or update) and reused by
+    every spawn.  The executable is only looked up again (e.g. along
+    $PATH) if a stat() of the one found before no longer matches. """
+
+    filename = None # executable the command resolved to
+    st = None # stat of filename when it was resolved
+
+    def __init__(self, config):
+        self.config = config
+        self.command = config.command
+        try:
+            self.argv = shlex.split(config.command)
+        except ValueError as e:
+            raise BadCommand("can't parse command %r: %s" % \
+                (config.command, str(e)))
+        if not self.argv:
+            raise BadCommand("command is empty")
+        self._envs = {} # group name -> environment
+
+    def resolve(self):
+        """ Return the executable for the command and its stat (or None
+        if it can't be found). """
+        options = self.config.options
+        if self.filename is not None:
+            try:
+                st = options.stat(self.filename)
+            except OSError:
+                st = None
+            if st is not None and _stat_key(st) == _stat_key(self.st):
+                return self.filename, st
+            self.filename = self.st = None
+
+        program = self.argv[0]
+        if "/" in program:
+            filename = program
+            try:
+                st = options.stat(filename)
+            except OSError:
+                st = None
+
+        else:
+            path = self.config.get_path()
+            found = None
+            st = None
+            for dir in path:
+                found = os.path.join(dir, program)
+                try:
+                    st = options.stat(found)
+                except OSError:
+                    pass
+                else:
+                    break
+            if st is None:
+                filename = program
+            else:
+                filename = found
+
+        if st is not None:
+            self.filename, self.st = filename, st
+        return filename, st
+
+    def get_env(self, group_name=None):
+        """ Return the environment for the child of a process in the group
+        named group_name. """
+        env = self._envs.get(group_name)
+        if env is None:
+            config = self.config
+            env = os.environ.copy()
+            env['SUPERVISOR_ENABLED'] = '1'
+            serverurl = config.serverurl
+            if serverurl is None: # unset
+                serverurl = config.options.serverurl # might still be None
+            if serverurl:
+                env['SUPERVISOR_SERVER_URL'] = serverurl
+            env['SUPERVISOR_PROCESS_NAME'] = config.name
+            if group_name:
+                env['SUPERVISOR_GROUP_NAME'] = group_name
+            if config.environment is not None:
+                env.update(config.environment)
+            self._envs[group_name] = env
+        return env.copy()
+
+def _stat_key(st):
+    # a replaced, moved, rebuilt or chmod'ed executable changes one of these
+    return (st[stat.ST_DEV], st[stat.ST_INO], st[stat.ST_MODE],
+            st[stat.ST_MTIME])
+
+class DirectLog(object):
+    """ The log file of a channel (stdout or stderr) that the child
+    writes to directly instead of through a pipe (see
+    ProcessConfig.make_pipes).  supervisord never sees that output, so
+    while the process runs it looks at the size of the file every
+    `interval` seconds and rolls it over with loggers.copytruncate() once
+    it has reached maxbytes.  Like the spawn scheduler, it is woken up
+    by the mainloop through the timer queue.  The file is looked at,
+    copied and cleared by a DirectLogHandler, in a log writer thread if
+    supervisord has any (childlog_writers). """
+
+    interval = 1
+    segments = None # loggers.LogSegments of the file, if it has any
+    offsets = None # loggers.LogOffsets of the file, once it is rolled over
+    handler = None # the DirectLogHandler of the file, made on first use
+
+    def __init__(self, process, channel):
+        self.process = process
+        self.channel = channel
+
+    def __repr__(self):
+        return '<DirectLog at %s for %s (%s)>' % (id(self), self.process,
+                                                   self.channel)
+
+    def _get(self, name):
+        return getattr(self.process.config, '%s_%s' % (self.channel, name))
+
+    def start(self):
+        if self._get('logfile_maxbytes') > 0:
+            self.process.config.options.timers.schedule(
+                self, time.time() + self.interval)
+
+    def stop(self):
+        self.process.config.options.timers.cancel(self)
+
+    def transition(self):
+        handler = self._get_handler()
+        if not handler.queued_records: # else the last check is pending
+            handler.doRollover()
+        self.start()
+
+    def _get_handler(self):
+        if self.handler is None:
+            writer = self.process.config.options.logwriter
+            self.handler = writer.wrap(DirectLogHandler(self))
+        return self.handler
+
+    def rollover(self):
+        """ Roll the file over if it has reached maxbytes. """
+        logfile = self._get('logfile')
+        try:
+            if os.path.getsize(logfile) >= self._get('logfile_maxbytes'):
+                backups = self._get('logfile_backups')
+                maxbytes = self._get('logfile_backups_maxbytes')
+                compress = self._get('logfile_compress')
+                numbers = []
+                if self._load_offsets() and compress:
+                    # left behind by an earlier supervisord
+                    numbers = self.segments.uncompressed()
+                number = loggers.copytruncate(logfile, backups, self.segments,
+                                              maxbytes, bool(compress),
+                                              self.offsets)
+                if compress:
+                    if number is not None:
+                        numbers.append(number)
+                    compressor = self.process.config.options.logcompressor
+                    for number in numbers:
+                        compressor.put(self.segments, number, compress,
+                                       backups, maxbytes)
+        except (IOError, OSError) as why:
+            if why.args[0] != errno.ENOENT: # removed by someone else
+                self.process.config.options.logger.warn(
+                    "couldn't roll over %s: %s" % (logfile, why))
+
+    def _load_offsets(self):
+        # true if the offsets (and the segments, if any) were loaded now
+        if self.offsets is not None:
+            return False
+        logfile = self._get('logfile')
+        if self._get('logfile_rotation') == 'segments':
+            self.segments = loggers.LogSegments(logfile)
+        self.offsets = loggers.LogOffsets(logfile, self.segments)
+        return True
+
+    def removelogs(self):
+        self._get_handler().remove()
+
+    def truncate(self):
+        # the child may still have the file open, so it is truncated
+        # rather than removed and created again
+        logfile = self._get('logfile')
+        self._load_offsets()
+        try:
+            with open(logfile, 'r+b') as f:
+                f.seek(0, 2)
+                size = f.tell()
+                f.truncate(0)
+        except (IOError, OSError) as why:
+            if why.args[0] != errno.ENOENT:
+                raise
+        else:
+            if size and self.offsets is not None:
+                self.offsets.cleared(size)
+
+class DirectLogHandler(loggers.Handler):
+    """ Stands in for a log handler of the file of a DirectLog, so that
+    a logwriter.LogWriterPool can take rolling it over (which copies up
+    to maxbytes) and clearing it off the mainloop like it does for the
+    log files supervisord writes itself. """
+    queued_records = 0 # what a QueuedHandler has waiting for its thread
+
+    def __init__(self, directlog):
+        loggers.Handler.__init__(self)
+        self.directlog = directlog
+        self.baseFilename = directlog._get('logfile')
+
+    def doRollover(self):
+        self.directlog.rollover()
+
+    def remove(self):
+        self.directlog.truncate()
+
 class FastCGISubprocess(Subprocess):
     """Extends Subprocess class to handle FastCGI subprocesses"""
 
@@ -776,7 +1220,17 @@ class FastCGISubprocess(Subprocess):
         else:
             options.dup2(self.pipes['child_stderr'], 2)
         for i in range(3, options.minfds):
-            options.close_fd(i)
+            if i != self._exec_status_fd:
+                options.close_fd(i)
+
+    def _get_posix_spawn_file_actions(self):
+        """
+        Overrides Subprocess._get_posix_spawn_file_actions()
+        The FastCGI socket needs to be set to file descriptor 0 in the child
+        """
+        file_actions = Subprocess._get_posix_spawn_file_actions(self)
+        file_actions[0] = (os.POSIX_SPAWN_DUP2, self.fcgi_sock.fileno(), 0)
+        return file_actions
 
 @functools.total_ordering
 class ProcessGroupBase(object):
@@ -810,6 +1264,10 @@ class ProcessGroupBase(object):
         for process in self.processes.values():
             process.reopenlogs()
 
+    def flushlogs(self):
+        for process in self.processes.values():
+            process.flushlogs()
+
     def stop_all(self):
         processes = list(self.processes.values())
         processes.sort()
@@ -899,8 +1357,20 @@ class EventListenerPool(ProcessGroupBase):
                     self.last_dispatch = now;
 
                 if now - self.last_dispatch < self.dispatch_throttle:
+                    self._schedule_dispatch()
                     return
             self.dispatch()
+        if dispatch_capable and self.event_buffer:
+            self._schedule_dispatch()
+        else:
+            # nothing to send or nobody to send it to; a listener becoming
+            # ready is noticed when we read its stdout
+            self.config.options.timers.cancel(self)
+
+    def _schedule_dispatch(self):
+        """ Let the mainloop know when buffered events may next be sent. """
+        self.config.options.timers.schedule(
+            self, self.last_dispatch + self.dispatch_throttle)
 
     def before_remove(self):
         self._unsubscribe()
@@ -945,6 +1415,7 @@ class EventListenerPool(ProcessGroupBase):
             self.event_buffer.insert(0, event)
         else:
             self.event_buffer.append(event)
+        self._schedule_dispatch()
 
     def _dispatchEvent(self, event):
         pool_serial = event.pool_serials[self.config.name]
@@ -997,15 +1468,28 @@ class EventListenerPool(ProcessGroupBase):
                 'pool:%(pool_name)s poolserial:%(pool_serial)s '
                 'eventname:%(event_name)s len:%(len)s\n%(payload)s' % D)
 
+    def handle_process_state_change(self, event):
+        if not self.event_buffer:
+            return
+        for process in self.processes.values():
+            if process is event.process:
+                # one of our listeners may now be able to take an event
+                self.config.options.timers.schedule(self, 0)
+                break
+
     def _subscribe(self):
         for event_type in self.config.pool_events:
             events.subscribe(event_type, self._acceptEvent)
         events.subscribe(events.EventRejectedEvent, self.handle_rejected)
+        events.subscribe(events.ProcessStateEvent,
+                         self.handle_process_state_change)
 
     def _unsubscribe(self):
         for event_type in self.config.pool_events:
             events.unsubscribe(event_type, self._acceptEvent)
         events.unsubscribe(events.EventRejectedEvent, self.handle_rejected)
+        events.unsubscribe(events.ProcessStateEvent,
+                           self.handle_process_state_change)
 
 
 class GlobalSerial(object):
@@ -1,4 +1,5 @@
 import os
+import re
 import time
 import datetime
 import errno
@@ -8,13 +9,18 @@ from supervisor.compat import as_string
 from supervisor.compat import as_bytes
 from supervisor.compat import unicode
 
+from supervisor import loggers
+from supervisor import logsearch
+
 from supervisor.datatypes import (
     Automatic,
     signal_number,
     )
 
 from supervisor.options import readFile
+from supervisor.options import readBuffer
 from supervisor.options import tailFile
+from supervisor.options import tailBuffer
 from supervisor.options import BadCommand
 from supervisor.options import NotExecutable
 from supervisor.options import NotFound
@@ -86,15 +92,19 @@ class SupervisorNamespaceRPCInterface:
     def getState(self):
         """ Return current state of supervisord as a struct
 
-        @return struct A struct with keys int statecode, string statename
+        @return struct A struct with keys int statecode, string statename,
+                       int queued, int starting
         """
         self._update('getState')
 
         state = self.supervisord.options.mood
         statename = getSupervisorStateDescription(state)
+        scheduler = self.supervisord.options.spawn_scheduler
         data =  {
             'statecode':state,
             'statename':statename,
+            'queued':len(scheduler),
+            'starting':scheduler.get_starting_count(),
             }
         return data
 
@@ -121,7 +131,8 @@ class SupervisorNamespaceRPCInterface:
             raise RPCError(Faults.NO_FILE, logfile)
 
         try:
-            return as_string(readFile(logfile, int(offset), int(length)))
+            return as_string(readFile(logfile, int(offset), int(length),
+                                      self.supervisord.options.logreaders))
         except ValueError as inst:
             why = inst.args[0]
             raise RPCError(getattr(Faults, why))
@@ -587,6 +598,15 @@ class SupervisorNamespaceRPCInterface:
                      'stdout_logfile_backups': pconfig.stdout_logfile_backups,
                      'stdout_logfile_maxbytes': pconfig.stdout_logfile_maxbytes,
                      'stdout_syslog': pconfig.stdout_syslog,
+                     'stdout_logfile_direct': pconfig.stdout_logfile_direct,
+                     'stdout_logfile_buffer': pconfig.stdout_logfile_buffer,
+                     'stdout_logfile_rotation': pconfig.stdout_logfile_rotation,
+                     'stdout_logfile_compress':
+                         pconfig.stdout_logfile_compress or 'none',
+                     'stdout_logfile_backups_maxbytes':
+                         pconfig.stdout_logfile_backups_maxbytes,
+                     'stdout_logfile_index': pconfig.stdout_logfile_index,
+                     'stdout_tail_maxbytes': pconfig.stdout_tail_maxbytes,
                      'stopsignal': int(pconfig.stopsignal), # enum on py3
                      'stopwaitsecs': pconfig.stopwaitsecs,
                      'stderr_capture_maxbytes': pconfig.stderr_capture_maxbytes,
@@ -595,6 +615,15 @@ class SupervisorNamespaceRPCInterface:
                      'stderr_logfile_backups': pconfig.stderr_logfile_backups,
                      'stderr_logfile_maxbytes': pconfig.stderr_logfile_maxbytes,
                      'stderr_syslog': pconfig.stderr_syslog,
+                     'stderr_logfile_direct': pconfig.stderr_logfile_direct,
+                     'stderr_logfile_buffer': pconfig.stderr_logfile_buffer,
+                     'stderr_logfile_rotation': pconfig.stderr_logfile_rotation,
+                     'stderr_logfile_compress':
+                         pconfig.stderr_logfile_compress or 'none',
+                     'stderr_logfile_backups_maxbytes':
+                         pconfig.stderr_logfile_backups_maxbytes,
+                     'stderr_logfile_index': pconfig.stderr_logfile_index,
+                     'stderr_tail_maxbytes': pconfig.stderr_tail_maxbytes,
                      'serverurl': pconfig.serverurl,
                     }
                 # no support for these types in xml-rpc
@@ -709,11 +738,21 @@ class SupervisorNamespaceRPCInterface:
 
         logfile = getattr(process.config, '%s_logfile' % channel)
 
-        if logfile is None or not os.path.exists(logfile):
-            raise RPCError(Faults.NO_FILE, logfile)
-
+        process.flushlogs()
         try:
-            return as_string(readFile(logfile, int(offset), int(length)))
+            # recent output is served from memory if it is still there
+            tail, size = process.get_output_tail(channel)
+            if size is not None:
+                data = readBuffer(tail, size, int(offset), int(length),
+                                  clip=logfile is None)
+                if data is not None:
+                    return as_string(data)
+
+            if logfile is None or not os.path.exists(logfile):
+                raise RPCError(Faults.NO_FILE, logfile)
+
+            return as_string(readFile(logfile, int(offset), int(length),
+                                      self.supervisord.options.logreaders))
         except ValueError as inst:
             why = inst.args[0]
             raise RPCError(getattr(Faults, why))
@@ -742,6 +781,182 @@ class SupervisorNamespaceRPCInterface:
         self._update('readProcessStderrLog')
         return self._readProcessLog(name, offset, length, 'stderr')
 
+    def readProcessBackupLog(self, name, channel, backup, offset, length):
+        """ Read length bytes from a backup of name's stdout or stderr log
+        starting at offset, as if it was not compressed
+
+        @param string name        the name of the process (or 'group:name')
+        @param string channel     'stdout' or 'stderr'
+        @param int backup         which backup, 1 being the newest
+        @param int offset         offset to start reading from.
+        @param int length         number of bytes to read from the log.
+        @return string result     Bytes of log
+        """
+        self._update('readProcessBackupLog')
+
+        group, process = self._getGroupAndProcess(name)
+
+        if process is None:
+            raise RPCError(Faults.BAD_NAME, name)
+
+        if channel not in ('stdout', 'stderr'):
+            raise RPCError(Faults.BAD_ARGUMENTS, channel)
+
+        logfile = getattr(process.config, '%s_logfile' % channel)
+
+        if logfile is None:
+            raise RPCError(Faults.NO_FILE, logfile)
+
+        backups = loggers.get_backups(logfile)
+        backup = int(backup)
+        if backup < 1 or backup > len(backups):
+            raise RPCError(Faults.NO_FILE, '%s backup %d' % (logfile, backup))
+
+        try:
+            return as_string(readFile(backups[backup - 1], int(offset),
+                                      int(length)))
+        except ValueError as inst:
+            why = inst.args[0]
+            raise RPCError(getattr(Faults, why))
+
+    def readProcessLogByTime(self, name, channel, start, end, maxbytes):
+        """ Read at most maxbytes of what name wrote to its stdout or
+        stderr log between the times start and end, seeking with the
+        time index of the log and its segments (see
+        stdout_logfile_index).  The index is sparse, so a little output
+        from before start or after end may be included.
+
+        @param string name        the name of the process (or 'group:name')
+        @param string channel     'stdout' or 'stderr'
+        @param int start          UNIX timestamp to read from
+        @param int end            UNIX timestamp to read up to, 0 for now
+        @param int maxbytes       maximum number of bytes to return
+        @return string result     Bytes of log
+        """
+        self._update('readProcessLogByTime')
+
+        group, process = self._getGroupAndProcess(name)
+
+        if process is None:
+            raise RPCError(Faults.BAD_NAME, name)
+
+        if channel not in ('stdout', 'stderr'):
+            raise RPCError(Faults.BAD_ARGUMENTS, channel)
+
+        start, end, maxbytes = float(start), float(end), int(maxbytes)
+        if start < 0 or end < 0 or maxbytes < 1 or (end and end < start):
+            raise RPCError(Faults.BAD_ARGUMENTS)
+
+        logfile = getattr(process.config, '%s_logfile' % channel)
+
+        if logfile is None or not os.path.exists(logfile):
+            raise RPCError(Faults.NO_FILE, logfile)
+
+        process.flushlogs()
+        return as_string(loggers.read_log_by_time(logfile, start, end,
+                                                  maxbytes))
+
+    def readProcessLogSpan(self, name, channel, offset, length):
+        """ Read at most length bytes of name's stdout or stderr log
+        from offset on, counting the offsets across rollovers: a byte
+        keeps its offset when the log is rotated, and reading goes on
+        from a backup into the newer ones and then the log itself, so a
+        client can resume from where it was.  Offsets are doubles as
+        they may not fit in an int.
+
+        @param string name        the name of the process (or 'group:name')
+        @param string channel     'stdout' or 'stderr'
+        @param double offset      offset to start reading from, counted
+                                  back from the end if negative
+        @param int length         maximum number of bytes to return
+        @return struct result     'data': the bytes, 'offset': the offset
+                                  of the first of them (later than the one
+                                  asked for if those are no longer kept),
+                                  'next': the offset to go on from, 'end':
+                                  the offset of the end of the log
+        """
+        self._update('readProcessLogSpan')
+
+        group, process = self._getGroupAndProcess(name)
+
+        if process is None:
+            raise RPCError(Faults.BAD_NAME, name)
+
+        if channel not in ('stdout', 'stderr'):
+            raise RPCError(Faults.BAD_ARGUMENTS, channel)
+
+        offset, length = int(offset), int(length)
+        if length < 1:
+            raise RPCError(Faults.BAD_ARGUMENTS)
+
+        logfile = getattr(process.config, '%s_logfile' % channel)
+
+        if logfile is None or not os.path.exists(logfile):
+            raise RPCError(Faults.NO_FILE, logfile)
+
+        process.flushlogs()
+        files = loggers.get_log_span(logfile)
+        data, offset, end = loggers.read_log_span(files, offset, length)
+        return {'data': as_string(data),
+                'offset': float(offset),
+                'next': float(offset + len(data)),
+                'end': float(end)}
+
+    def searchProcessLogs(self, names, pattern, channel, maxmatches):
+        """ Search the stdout or stderr logs of processes, backups
+        included, for the lines that match a regular expression.  The
+        logs are searched by a thread so that supervisord goes on in the
+        meantime, and the lines are returned once it is done.
+
+        @param array names        names of processes (or 'group:name' or
+                                  'group:*'), all processes if empty
+        @param string pattern     Python regular expression; ^ and $ match
+                                  at the start and end of every line
+        @param string channel     'stdout' or 'stderr'
+        @param int maxmatches     maximum number of lines to return
+        @return array result      An array of structs of the lines found,
+                                  oldest first for each log: name,
+                                  channel, offset (a double counted across
+                                  rotations, see readProcessLogSpan) and
+                                  line
+        """
+        self._update('searchProcessLogs')
+
+        if channel not in ('stdout', 'stderr'):
+            raise RPCError(Faults.BAD_ARGUMENTS, channel)
+
+        maxmatches = int(maxmatches)
+        if maxmatches < 1:
+            raise RPCError(Faults.BAD_ARGUMENTS)
+
+        try:
+            regex = logsearch.compile_pattern(pattern)
+        except re.error as why:
+            raise RPCError(Faults.BAD_ARGUMENTS, why)
+
+        try:
+            logs = logsearch.get_search_logs(self.supervisord, names, channel)
+        except KeyError as why:
+            raise RPCError(Faults.BAD_NAME, why.args[0])
+
+        search = logsearch.LogSearch(logs, regex, maxmatches)
+        search.start()
+
+        def onwait():
+            if not search.done:
+                return NOT_DONE_YET
+            if search.error is not None:
+                raise RPCError(Faults.FAILED, search.error)
+            return [ {'name': name,
+                      'channel': channel,
+                      'offset': float(offset),
+                      'line': line.decode('utf-8', 'replace')}
+                     for name, channel, offset, line in search.pop() ]
+
+        onwait.delay = 0.05
+        onwait.rpcinterface = self
+        return onwait # deferred
+
     def _tailProcessLog(self, name, offset, length, channel):
         group, process = self._getGroupAndProcess(name)
 
@@ -750,10 +965,19 @@ class SupervisorNamespaceRPCInterface:
 
         logfile = getattr(process.config, '%s_logfile' % channel)
 
+        process.flushlogs()
+        tail, size = process.get_output_tail(channel)
+        if size is not None:
+            result = tailBuffer(tail, size, int(offset), int(length),
+                                clip=logfile is None)
+            if result is not None:
+                return result
+
         if logfile is None or not os.path.exists(logfile):
             return ['', 0, False]
 
-        return tailFile(logfile, int(offset), int(length))
+        return tailFile(logfile, int(offset), int(length),
+                        self.supervisord.options.logreaders)
 
     def tailProcessStdoutLog(self, name, offset, length):
         """
@@ -801,6 +1025,30 @@ class SupervisorNamespaceRPCInterface:
         self._update('tailProcessStderrLog')
         return self._tailProcessLog(name, offset, length, 'stderr')
 
+    def getProcessLogQueueInfo(self, name):
+        """ Get info about the queues of the log files of a process that
+        are written by log writer threads (see childlog_writers)
+
+        @param string name   The name of the process (or 'group:name')
+        @return array result An array of structs, one per queued log file
+        """
+        self._update('getProcessLogQueueInfo')
+
+        group, process = self._getGroupAndProcess(name)
+
+        if process is None:
+            raise RPCError(Faults.BAD_NAME, name)
+
+        output = []
+        dispatchers = sorted(process.dispatchers.values(),
+                             key=lambda d: d.channel)
+        for dispatcher in dispatchers:
+            for handler in dispatcher.queued_handlers:
+                info = handler.stats()
+                info['channel'] = dispatcher.channel
+                output.append(info)
+        return output
+
     def clearProcessLogs(self, name):
         """ Clear the stdout and stderr logs for the named process and
         reopen them.
@@ -1001,24 +1249,13 @@ def make_allfunc(processes, predicate, func, **extra_kwargs):
 
         return results
 
-    # XXX the above implementation has a weakness inasmuch as the
-    # first call into each individual process callback will always
-    # return NOT_DONE_YET, so they need to be called twice.  The
-    # symptom of this is that calling this method causes the
-    # client to block for much longer than it actually requires to
-    # kill all of the running processes.  After the first call to
-    # the killit callback, the process is actually dead, but the
-    # above killall method processes the callbacks one at a time
-    # during the select loop, which, because there is no output
-    # from child processes after e.g. stopAllProcesses is called,
-    # is not busy, so hits the timeout for each callback.  I
-    # attempted to make this better, but the only way to make it
-    # better assumes totally synchronous reaping of child
-    # processes, which requires infrastructure changes to
-    # supervisord that are scary at the moment as it could take a
-    # while to pin down all of the platform differences and might
-    # require a C extension to the Python signal module to allow
-    # the setting of ignore flags to signals.
+    # The first call into each process callback usually returns
+    # NOT_DONE_YET, so allfunc is called again (by the deferring http
+    # channel, see http.deferring_http_channel) until every process has
+    # finished.  SIGCHLD wakes the main loop through the signal wakeup
+    # fd, so each process is reaped as soon as it exits rather than at
+    # the next poll timeout, and the client is answered shortly after
+    # the last one is gone.
     return allfunc
 
 def isRunning(process):
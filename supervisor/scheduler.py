@@ -0,0 +1,180 @@
+# This module must not depend on any other non-stdlib module to prevent
+# circular import problems.
+
+import heapq
+import time
+
+class SpawnScheduler:
+    """ Decides when processes that supervisord starts on its own
+    (autostart, autorestart and retries from BACKOFF) may spawn.
+
+    At most ``maxstarting`` processes may be in the STARTING state at
+    once, and at most the ``maxstarting`` of its group config for the
+    processes of a group; a spawn leaves STARTING once the process is
+    RUNNING or has failed.  At most ``spawnrate`` processes are spawned
+    per second.  A limit of 0 means no limit.  Processes that may not
+    spawn yet wait in a queue in priority order (the priority of their
+    group first) and are transitioned again by the scheduler, which the
+    mainloop transitions like a process, once it is their turn.
+
+    Processes started through the RPC interface are not queued but they
+    count against the STARTING limits. """
+
+    def __init__(self, timers, maxstarting=0, spawnrate=0):
+        self.timers = timers
+        self.maxstarting = maxstarting
+        self.spawnrate = spawnrate
+        self._starting = {} # id(process) -> group name of STARTING processes
+        self._group_starting = {} # group name -> number of them
+        self._queue = [] # heap of [key, seq, process] entries
+        self._queued = {} # id(process) -> live heap entry
+        self._seq = 0
+        self._granted = None # process being transitioned by transition()
+        self._tokens = None # spawns left in the spawnrate budget
+        self._refilled = None # when the budget was last topped up
+
+    def __len__(self):
+        """ The number of processes waiting to spawn. """
+        return len(self._queued)
+
+    def get_starting_count(self):
+        return len(self._starting)
+
+    def is_queued(self, process):
+        return id(process) in self._queued
+
+    def acquire(self, process, now):
+        """ Called by a process that wants to spawn by itself.  Return True
+        if it may spawn now; otherwise queue it and return False.  A queued
+        process is transitioned again when it may spawn. """
+        if process is self._granted:
+            self._take_token(now)
+            return True
+        if (not self._queued and self._has_room(process) and
+                self._has_token(now)):
+            self._take_token(now)
+            return True
+        if id(process) not in self._queued:
+            self._seq += 1
+            entry = [_queue_key(process), self._seq, process]
+            self._queued[id(process)] = entry
+            heapq.heappush(self._queue, entry)
+        self._schedule(now)
+        return False
+
+    def discard(self, process):
+        """ Take process out of the queue, e.g. because it was started or
+        stopped through the RPC interface or its group was removed. """
+        self._queued.pop(id(process), None)
+
+    def started(self, process):
+        """ Called when process enters the STARTING state. """
+        key = id(process)
+        if key in self._starting:
+            return
+        name = _group_name(process)
+        self._starting[key] = name
+        if name is not None:
+            self._group_starting[name] = self._group_starting.get(name, 0) + 1
+
+    def finished(self, process):
+        """ Called when process leaves the STARTING state. """
+        name = self._starting.pop(id(process), None)
+        if name is not None:
+            count = self._group_starting[name] - 1
+            if count:
+                self._group_starting[name] = count
+            else:
+                del self._group_starting[name]
+        if self._queued:
+            self._schedule(time.time())
+
+    def transition(self):
+        """ Let queued processes spawn, in priority order, as far as the
+        limits allow. """
+        now = time.time()
+        held = [] # entries whose group is at its limit
+        queue = self._queue
+        while queue and self._has_room(None) and self._has_token(now):
+            entry = heapq.heappop(queue)
+            process = entry[2]
+            if self._queued.get(id(process)) is not entry:
+                continue # discarded
+            if not self._has_room(process):
+                held.append(entry)
+                continue
+            del self._queued[id(process)]
+            # transition() asks us again and calls spawn() if the process
+            # still wants to start; if it doesn't, it has left the queue
+            self._granted = process
+            try:
+                process.transition()
+            finally:
+                self._granted = None
+        for entry in held:
+            heapq.heappush(queue, entry)
+        if self._has_room(None):
+            # if we stopped because of the spawnrate, come back when the
+            # budget allows the next spawn; if we stopped because every
+            # group with queued processes is at its limit, finished() will
+            # wake us up
+            if queue and len(held) < len(self._queued):
+                self._schedule(now)
+            else:
+                self.timers.cancel(self)
+        else:
+            self.timers.cancel(self)
+
+    def _schedule(self, now):
+        if not self._queued or not self._has_room(None):
+            # finished() will wake us up
+            self.timers.cancel(self)
+        elif self._has_token(now):
+            self.timers.schedule(self, 0)
+        else:
+            wait = (1 - self._tokens) / float(self.spawnrate)
+            self.timers.schedule(self, now + wait)
+
+    def _has_room(self, process):
+        """ Whether one more process may be STARTING, globally or (if
+        process is not None) in the group of process. """
+        if self.maxstarting and len(self._starting) >= self.maxstarting:
+            return False
+        if process is not None:
+            name = _group_name(process)
+            if name is not None:
+                limit = process.group.config.maxstarting
+                if limit and self._group_starting.get(name, 0) >= limit:
+                    return False
+        return True
+
+    def _has_token(self, now):
+        if not self.spawnrate:
+            return True
+        rate = float(self.spawnrate)
+        burst = max(rate, 1)
+        if self._tokens is None:
+            self._tokens = burst
+        elif now > self._refilled:
+            self._tokens = min(burst,
+                               self._tokens + (now - self._refilled) * rate)
+        # if the system clock moved backwards, we just start over from now
+        self._refilled = now
+        return self._tokens >= 1
+
+    def _take_token(self, now):
+        if self.spawnrate and self._has_token(now):
+            self._tokens -= 1
+
+def _group_name(process):
+    group = process.group
+    if group is None:
+        return None
+    return group.config.name
+
+def _queue_key(process):
+    # the same order the mainloop transitions processes in
+    group = process.group
+    if group is None:
+        return (process.config.priority,)
+    return (group.config.priority, process.config.priority)
@@ -25,6 +25,8 @@ Options:
 -a/--minfds NUM -- the minimum number of file descriptors for start success
 -t/--strip_ansi -- strip ansi escape codes from process output
 --minprocs NUM  -- the minimum number of processes available for start success
+--maxstarting NUM -- the maximum number of processes STARTING at once
+--spawnrate NUM -- the maximum number of automatic process starts per second
 --profile_options OPTIONS -- run supervisord under profiler and output
                              results based on OPTIONS, which  is a comma-sep'd
                              list of 'cumulative', 'calls', and/or 'callers',
@@ -34,6 +36,7 @@ Options:
 import os
 import time
 import signal
+import bisect
 
 from supervisor.medusa import asyncore_25 as asyncore
 
@@ -49,11 +52,13 @@ class Supervisor:
     stopping = False # set after we detect that we are handling a stop request
     lastshutdownreport = 0 # throttle for delayed process error reports at stop
     process_groups = None # map of process group name to process group object
+    sorted_groups = None # process group objects in priority order
     stop_groups = None # list used for priority ordered shutdown
 
     def __init__(self, options):
         self.options = options
         self.process_groups = {}
+        self.sorted_groups = []
         self.ticks = {}
 
     def main(self):
@@ -79,6 +84,7 @@ class Supervisor:
 
     def run(self):
         self.process_groups = {} # clear
+        self.sorted_groups = [] # clear
         self.stop_groups = None # clear
         events.clear()
         try:
@@ -93,6 +99,10 @@ class Supervisor:
             self.options.write_pidfile()
             self.runforever()
         finally:
+            # write out what buffered log handlers still hold; log writer
+            # threads are given a bounded time to do so by cleanup()
+            for group in self.process_groups.values():
+                group.flushlogs()
             self.options.cleanup()
 
     def diff_to_active(self):
@@ -114,7 +124,13 @@ class Supervisor:
         name = config.name
         if name not in self.process_groups:
             config.after_setuid()
-            self.process_groups[name] = config.make_group()
+            group = config.make_group()
+            self.process_groups[name] = group
+            # insort_right keeps groups of equal priority in the order
+            # they were added
+            bisect.insort_right(self.sorted_groups, group)
+            # transition the new group (e.g. autostart) right away
+            self.options.timers.schedule(group, 0)
             events.notify(events.ProcessGroupAddedEvent(name))
             return True
         return False
@@ -122,16 +138,23 @@ class Supervisor:
     def remove_process_group(self, name):
         if self.process_groups[name].get_unstopped_processes():
             return False
-        self.process_groups[name].before_remove()
+        group = self.process_groups[name]
+        group.before_remove()
         del self.process_groups[name]
+        self.options.timers.cancel(group)
+        for process in group.processes.values():
+            self.options.timers.cancel(process)
+            self.options.spawn_scheduler.discard(process)
+        # groups compare equal by priority, so remove by identity
+        for i, sorted_group in enumerate(self.sorted_groups):
+            if sorted_group is group:
+                del self.sorted_groups[i]
+                break
         events.notify(events.ProcessGroupRemovedEvent(name))
         return True
 
     def get_process_map(self):
-        process_map = {}
-        for group in self.process_groups.values():
-            process_map.update(group.get_dispatchers())
-        return process_map
+        return self.options.get_process_map()
 
     def shutdown_report(self):
         unstopped = []
@@ -173,24 +196,33 @@ class Supervisor:
 
     def runforever(self):
         events.notify(events.SupervisorRunningEvent())
-        timeout = 1 # this cannot be fewer than the smallest TickEvent (5)
-
         socket_map = self.options.get_socket_map()
+        process_map = self.get_process_map()
+        poller = self.options.poller
+        timers = self.options.timers
+        registered_sockets = {}
+        last_time = time.time()
+
+        # we sleep until the nearest deadline (see TimerQueue).  Signals
+        # (most importantly SIGCHLD) wake the poller through the signal
+        # wakeup fd; if we could not set one up, they do not interrupt
+        # the poller, so we wake up at least once a second to look
+        wakeup_fd = self.options.signal_wakeup_fd
+        if wakeup_fd is None:
+            maxtimeout = 1
+        else:
+            maxtimeout = None
+            poller.register_readable(wakeup_fd)
+        # schedule the first tick so we don't sleep past it
+        self.tick()
 
         while 1:
-            combined_map = {}
-            combined_map.update(socket_map)
-            combined_map.update(self.get_process_map())
-
-            pgroups = list(self.process_groups.values())
-            pgroups.sort()
-
             if self.options.mood < SupervisorStates.RUNNING:
                 if not self.stopping:
                     # first time, set the stopping flag, do a
                     # notification and set stop_groups
                     self.stopping = True
-                    self.stop_groups = pgroups[:]
+                    self.stop_groups = self.sorted_groups[:]
                     events.notify(events.SupervisorStoppingEvent())
 
                 self.ordered_stop_groups_phase_1()
@@ -200,60 +232,135 @@ class Supervisor:
                     # killing everything), it's OK to shutdown or reload
                     raise asyncore.ExitNow
 
-            for fd, dispatcher in combined_map.items():
+            # process dispatchers keep the poller up to date themselves
+            # (see ServerOptions.add_dispatcher), but the socket map is
+            # owned by asyncore so we have to look at it on every pass.
+            for fd, dispatcher in registered_sockets.items():
+                if socket_map.get(fd) is not dispatcher:
+                    if fd not in process_map:
+                        # the channel went away (or its fd number was
+                        # reused by a new one) since the last iteration;
+                        # drop the stale registration so pollers that keep
+                        # state across iterations (e.g. epoll) start fresh
+                        self.options.unregister_fd(fd)
+
+            deadline = timers.next_deadline()
+
+            for fd, dispatcher in socket_map.items():
                 if dispatcher.readable():
-                    self.options.poller.register_readable(fd)
+                    poller.register_readable(fd)
+                elif fd in poller.readables:
+                    poller.unregister_readable(fd)
                 if dispatcher.writable():
-                    self.options.poller.register_writable(fd)
-
-            r, w = self.options.poller.poll(timeout)
+                    poller.register_writable(fd)
+                elif fd in poller.writables:
+                    poller.unregister_writable(fd)
+                # channels waiting on a deferred producer need to be
+                # woken up to check on it again
+                get_deadline = getattr(dispatcher, 'get_deadline', None)
+                if get_deadline is not None:
+                    channel_deadline = get_deadline()
+                    if channel_deadline is not None:
+                        if deadline is None or channel_deadline < deadline:
+                            deadline = channel_deadline
+
+            registered_sockets = socket_map.copy()
+
+            timeout = maxtimeout
+            if deadline is not None:
+                timeout = max(deadline - time.time(), 0)
+                if maxtimeout is not None:
+                    timeout = min(timeout, maxtimeout)
+            if wakeup_fd is not None and self.options.has_signal():
+                # handle_signal() handles one signal per pass and the
+                # wakeup bytes of the others have already been drained
+                timeout = 0
+
+            r, w = poller.poll(timeout)
+
+            # resume reading output whose log has caught up (see
+            # LogWriterPool); that's often what woke us up
+            self.options.update_log_readers()
 
             for fd in r:
-                if fd in combined_map:
+                if fd == wakeup_fd:
+                    self.options.drain_signal_wakeup_fd()
+                    continue
+                dispatcher = process_map.get(fd)
+                if dispatcher is None:
+                    dispatcher = socket_map.get(fd)
+                if dispatcher is not None:
                     try:
-                        dispatcher = combined_map[fd]
                         self.options.logger.blather(
                             'read event caused by %(dispatcher)r',
                             dispatcher=dispatcher)
                         dispatcher.handle_read_event()
-                        if not dispatcher.readable():
-                            self.options.poller.unregister_readable(fd)
+                        if fd in process_map:
+                            self.options.update_dispatcher(dispatcher)
+                        elif not dispatcher.readable():
+                            poller.unregister_readable(fd)
                     except asyncore.ExitNow:
                         raise
                     except:
-                        combined_map[fd].handle_error()
+                        dispatcher.handle_error()
+                elif fd in registered_sockets or fd not in poller.readables:
+                    # its dispatcher was closed by an earlier handler in
+                    # this pass (e.g. a process was reaped through its
+                    # pidfd and its pipes closed); nothing unexpected
+                    continue
                 else:
-                    # if the fd is not in combined_map, we should unregister it. otherwise,
+                    # if the fd is not in either map, we should unregister it. otherwise,
                     # it will be polled every time, which may cause 100% cpu usage
                     self.options.logger.warn('unexpected read event from fd %r' % fd)
                     try:
-                        self.options.poller.unregister_readable(fd)
+                        poller.unregister_readable(fd)
                     except:
                         pass
 
             for fd in w:
-                if fd in combined_map:
+                dispatcher = process_map.get(fd)
+                if dispatcher is None:
+                    dispatcher = socket_map.get(fd)
+                if dispatcher is not None:
                     try:
-                        dispatcher = combined_map[fd]
                         self.options.logger.blather(
                             'write event caused by %(dispatcher)r',
                             dispatcher=dispatcher)
                         dispatcher.handle_write_event()
-                        if not dispatcher.writable():
-                            self.options.poller.unregister_writable(fd)
+                        if fd in process_map:
+                            self.options.update_dispatcher(dispatcher)
+                        elif not dispatcher.writable():
+                            poller.unregister_writable(fd)
                     except asyncore.ExitNow:
                         raise
                     except:
-                        combined_map[fd].handle_error()
+                        dispatcher.handle_error()
+                elif fd in registered_sockets or fd not in poller.writables:
+                    continue
                 else:
                     self.options.logger.warn('unexpected write event from fd %r' % fd)
                     try:
-                        self.options.poller.unregister_writable(fd)
+                        poller.unregister_writable(fd)
                     except:
                         pass
 
-            for group in pgroups:
-                group.transition()
+            now = time.time()
+            if now < last_time:
+                # the system clock moved backwards, which makes pending
+                # deadlines meaningless; transition() adjusts the
+                # timestamps of each process and reschedules it
+                for group in self.sorted_groups:
+                    timers.schedule(group, 0)
+            last_time = now
+
+            # only transition what asked for it: processes whose state
+            # changed or whose deadline passed, pools with events to send
+            # and newly added groups
+            expired = [ obj for obj in timers.pop_expired(now)
+                        if obj is not self ]
+            expired.sort(key=transition_order)
+            for obj in expired:
+                obj.transition()
 
             self.reap()
             self.handle_signal()
@@ -281,6 +388,10 @@ class Supervisor:
             if this_tick != last_tick:
                 self.ticks[period] = this_tick
                 events.notify(event(this_tick, self))
+        # wake up in time for the next tick boundary
+        next_tick = min([ self.ticks[event.period] + event.period
+                          for event in events.TICK_EVENTS ])
+        self.options.timers.schedule(self, next_tick)
 
     def reap(self, once=False, recursionguard=0):
         if recursionguard == 100:
@@ -330,6 +441,19 @@ class Supervisor:
     def get_state(self):
         return self.options.mood
 
+def transition_order(obj):
+    """ Sort key putting groups and processes due for a transition in
+    priority order.  A process sorts by the priority of its group first,
+    and a group sorts before its own processes.  The spawn scheduler sorts
+    last so that it sees the room the others have freed up, along with the
+    direct log files being watched for rotation. """
+    if getattr(obj, 'config', None) is None: # spawn scheduler or DirectLog
+        return (float('inf'),)
+    group = getattr(obj, 'group', None)
+    if group is None:
+        return (obj.config.priority, float('-inf'))
+    return (group.config.priority, obj.config.priority)
+
 def timeslice(period, when):
     return int(when - (when % period))
 
@@ -29,11 +29,13 @@ class DummyOptions:
     execv_exception = None
     kill_exception = None
     make_pipes_exception = None
+    open_direct_logfile_exception = None
     remove_exception = None
     write_exception = None
 
     def __init__(self):
         self.identifier = 'supervisor'
+        self.direct_logfiles_opened = []
         self.childlogdir = '/tmp'
         self.uid = 999
         self.logger = self.getLogger()
@@ -41,7 +43,9 @@ class DummyOptions:
         self.logfile = '/tmp/logfile'
         self.nocleanup = False
         self.strip_ansi = False
+        self.childlog_flush_ms = 1000
         self.pidhistory = {}
+        self.process_map = {}
         self.process_group_configs = []
         self.nodaemon = False
         self.socket_map = {}
@@ -61,10 +65,19 @@ class DummyOptions:
         self.directory = None
         self.waitpid_return = None, None
         self.kills = {}
+        self.pidfd_open_result = None
+        self.pidfd_signals = {}
         self._signal = None
+        self.signal_wakeup_fd = None
+        self.signal_wakeup_drained = False
         self.parent_pipes_closed = None
         self.child_pipes_closed = None
         self.forkpid = 0
+        self.posix_spawn_available = False
+        self.exec_status_pipe = None
+        self.exec_status = b''
+        self.posix_spawn_args = None
+        self.inheritable_fds = [0, 1, 2]
         self.pgrp_set = None
         self.duped = {}
         self.written = {}
@@ -88,6 +101,18 @@ class DummyOptions:
         self.changed_directory = False
         self.umaskset = None
         self.poller = DummyPoller(self)
+        from supervisor.timers import TimerQueue
+        self.timers = TimerQueue()
+        from supervisor.scheduler import SpawnScheduler
+        self.spawn_scheduler = SpawnScheduler(self.timers)
+        from supervisor.logwriter import LogWriterPool
+        from supervisor.logwriter import LogCompressor
+        self.logwriter = LogWriterPool()
+        self.logcompressor = LogCompressor()
+        self.logreaders = None
+        from supervisor.logfollow import LogFollowers
+        self.logfollowers = LogFollowers(map={})
+        self.log_readers_updated = False
         self.silent = False
 
     def getLogger(self, *args, **kw):
@@ -126,9 +151,43 @@ class DummyOptions:
     def get_signal(self):
         return self._signal
 
+    def has_signal(self):
+        return self._signal is not None
+
+    def drain_signal_wakeup_fd(self):
+        self.signal_wakeup_drained = True
+
+    def update_log_readers(self):
+        self.log_readers_updated = True
+
     def get_socket_map(self):
         return self.socket_map
 
+    def get_process_map(self):
+        return self.process_map
+
+    def add_dispatcher(self, dispatcher):
+        self.process_map[dispatcher.fd] = dispatcher
+        self.update_dispatcher(dispatcher)
+
+    def remove_dispatcher(self, dispatcher):
+        if self.process_map.get(dispatcher.fd) is dispatcher:
+            del self.process_map[dispatcher.fd]
+            self.unregister_fd(dispatcher.fd)
+
+    def update_dispatcher(self, dispatcher):
+        if self.process_map.get(dispatcher.fd) is not dispatcher:
+            return
+        self.unregister_fd(dispatcher.fd)
+        if dispatcher.readable():
+            self.poller.register_readable(dispatcher.fd)
+        if dispatcher.writable():
+            self.poller.register_writable(dispatcher.fd)
+
+    def unregister_fd(self, fd):
+        self.poller.unregister_readable(fd)
+        self.poller.unregister_writable(fd)
+
     def make_logger(self):
         pass
 
@@ -144,9 +203,26 @@ class DummyOptions:
     def write_pidfile(self):
         self.pidfile_written = True
 
-    def waitpid(self):
+    def waitpid(self, pid=-1, block=False):
+        self.waitpid_pid = pid
+        self.waitpid_blocked = block
         return self.waitpid_return
 
+    def make_exec_status_pipe(self):
+        return self.exec_status_pipe
+
+    def read_exec_status(self, fd):
+        data, self.exec_status = self.exec_status, b''
+        return data
+
+    def pidfd_open(self, pid):
+        return self.pidfd_open_result
+
+    def pidfd_send_signal(self, pidfd, sig):
+        if self.kill_exception is not None:
+            raise self.kill_exception
+        self.pidfd_signals[pidfd] = sig
+
     def kill(self, pid, sig):
         if self.kill_exception is not None:
             raise self.kill_exception
@@ -168,10 +244,12 @@ class DummyOptions:
             from supervisor.options import NotFound
             raise NotFound('bad filename')
 
-    def make_pipes(self, stderr=True):
+    def make_pipes(self, stderr=True, stdout=True):
         if self.make_pipes_exception is not None:
             raise self.make_pipes_exception
         pipes = {'child_stdin': 3, 'stdin': 4, 'stdout': 5, 'child_stdout': 6}
+        if not stdout:
+            pipes['stdout'], pipes['child_stdout'] = None, None
         if stderr:
             pipes['stderr'], pipes['child_stderr'] = (7, 8)
         else:
@@ -193,9 +271,24 @@ class DummyOptions:
             raise self.fork_exception
         return self.forkpid
 
+    def posix_spawn(self, filename, argv, env, file_actions):
+        self.posix_spawn_args = filename, argv, env, file_actions
+        if self.fork_exception is not None:
+            raise self.fork_exception
+        return self.forkpid
+
+    def get_inheritable_fds(self):
+        return self.inheritable_fds
+
     def close_fd(self, fd):
         self.fds_closed.append(fd)
 
+    def open_direct_logfile(self, filename):
+        if self.open_direct_logfile_exception is not None:
+            raise self.open_direct_logfile_exception
+        self.direct_logfiles_opened.append(filename)
+        return 10 + len(self.direct_logfiles_opened)
+
     def close_parent_pipes(self, pipes):
         self.parent_pipes_closed = pipes
 
@@ -226,6 +319,9 @@ class DummyOptions:
     def readfd(self, fd):
         return self.readfd_result
 
+    def readfd_view(self, fd):
+        return memoryview(as_bytes(self.readfd_result))
+
     def reopenlogs(self):
         self.logs_reopened = True
 
@@ -416,8 +512,12 @@ class DummyProcess(object):
         self.pipes = {}
         self.rpipes = {}
         self.dispatchers = {}
+        self.output_tails = {}
+        self.output_tail_sizes = {}
         self.finished = None
+        self.exec_status_error = None
         self.logs_reopened = False
+        self.logs_flushed = False
         self.execv_arg_exception = None
         self.input_fd_drained = None
         self.output_fd_drained = None
@@ -426,6 +526,15 @@ class DummyProcess(object):
     def reopenlogs(self):
         self.logs_reopened = True
 
+    def flushlogs(self):
+        self.logs_flushed = True
+
+    def get_output_tail(self, channel):
+        tail = self.output_tails.get(channel)
+        if tail is None:
+            return None, None
+        return tail, self.output_tail_sizes.get(channel, tail.end)
+
     def removelogs(self):
         if self.error_at_clear:
             raise IOError('whatever')
@@ -471,6 +580,9 @@ class DummyProcess(object):
     def finish(self, pid, sts):
         self.finished = pid, sts
 
+    def exec_status(self, error):
+        self.exec_status_error = error
+
     def give_up(self):
         from supervisor.process import ProcessStates
         self.state = ProcessStates.FATAL
@@ -510,11 +622,19 @@ class DummyPConfig:
                  uid=None, stdout_logfile=None, stdout_capture_maxbytes=0,
                  stdout_events_enabled=False,
                  stdout_logfile_backups=0, stdout_logfile_maxbytes=0,
-                 stdout_syslog=False,
+                 stdout_syslog=False, stdout_logfile_direct=False,
+                 stdout_logfile_buffer=0, stdout_logfile_rotation='rename',
+                 stdout_logfile_compress=None,
+                 stdout_logfile_backups_maxbytes=0,
+                 stdout_logfile_index=False, stdout_tail_maxbytes=0,
                  stderr_logfile=None, stderr_capture_maxbytes=0,
                  stderr_events_enabled=False,
                  stderr_logfile_backups=0, stderr_logfile_maxbytes=0,
-                 stderr_syslog=False,
+                 stderr_syslog=False, stderr_logfile_direct=False,
+                 stderr_logfile_buffer=0, stderr_logfile_rotation='rename',
+                 stderr_logfile_compress=None,
+                 stderr_logfile_backups_maxbytes=0,
+                 stderr_logfile_index=False, stderr_tail_maxbytes=0,
                  redirect_stderr=False,
                  stopsignal=None, stopwaitsecs=10, stopasgroup=False, killasgroup=False,
                  exitcodes=(0,), environment=None, serverurl=None):
@@ -533,12 +653,26 @@ class DummyPConfig:
         self.stdout_logfile_backups = stdout_logfile_backups
         self.stdout_logfile_maxbytes = stdout_logfile_maxbytes
         self.stdout_syslog = stdout_syslog
+        self.stdout_logfile_direct = stdout_logfile_direct
+        self.stdout_logfile_buffer = stdout_logfile_buffer
+        self.stdout_logfile_rotation = stdout_logfile_rotation
+        self.stdout_logfile_compress = stdout_logfile_compress
+        self.stdout_logfile_backups_maxbytes = stdout_logfile_backups_maxbytes
+        self.stdout_logfile_index = stdout_logfile_index
+        self.stdout_tail_maxbytes = stdout_tail_maxbytes
         self.stderr_logfile = stderr_logfile
         self.stderr_capture_maxbytes = stderr_capture_maxbytes
         self.stderr_events_enabled = stderr_events_enabled
         self.stderr_logfile_backups = stderr_logfile_backups
         self.stderr_logfile_maxbytes = stderr_logfile_maxbytes
         self.stderr_syslog = stderr_syslog
+        self.stderr_logfile_direct = stderr_logfile_direct
+        self.stderr_logfile_buffer = stderr_logfile_buffer
+        self.stderr_logfile_rotation = stderr_logfile_rotation
+        self.stderr_logfile_compress = stderr_logfile_compress
+        self.stderr_logfile_backups_maxbytes = stderr_logfile_backups_maxbytes
+        self.stderr_logfile_index = stderr_logfile_index
+        self.stderr_tail_maxbytes = stderr_tail_maxbytes
         self.redirect_stderr = redirect_stderr
         if stopsignal is None:
             import signal
@@ -553,6 +687,8 @@ class DummyPConfig:
         self.umask = umask
         self.autochildlogs_created = False
         self.serverurl = serverurl
+        self.spawn_plan = None
+        self.spawn_plan_compiled = False
 
     def get_path(self):
         return ["/bin", "/usr/bin", "/usr/local/bin"]
@@ -560,6 +696,9 @@ class DummyPConfig:
     def create_autochildlogs(self):
         self.autochildlogs_created = True
 
+    def compile_spawn_plan(self):
+        self.spawn_plan_compiled = True
+
     def make_process(self, group=None):
         process = DummyProcess(self)
         process.group = group
@@ -572,11 +711,14 @@ class DummyPConfig:
                                         pipes['stdin'])
         dispatchers = {}
         if stdout_fd is not None:
-            dispatchers[stdout_fd] = DummyDispatcher(readable=True)
+            dispatchers[stdout_fd] = DummyDispatcher(readable=True,
+                                                     fd=stdout_fd)
         if stderr_fd is not None:
-            dispatchers[stderr_fd] = DummyDispatcher(readable=True)
+            dispatchers[stderr_fd] = DummyDispatcher(readable=True,
+                                                     fd=stderr_fd)
         if stdin_fd is not None:
-            dispatchers[stdin_fd] = DummyDispatcher(writable=True)
+            dispatchers[stdin_fd] = DummyDispatcher(writable=True,
+                                                    fd=stdin_fd)
         return dispatchers, pipes
 
 def makeExecutable(file, substitutions=None):
@@ -1017,6 +1159,7 @@ class DummyPGroupConfig:
         self.after_setuid_called = False
         self.pool_events = []
         self.buffer_size = 10
+        self.maxstarting = 0
 
     def after_setuid(self):
         self.after_setuid_called = True
@@ -1042,6 +1185,10 @@ class DummyProcessGroup(object):
         self.dispatchers = {}
         self.unstopped_processes = []
         self.before_remove_called = False
+        self.processes = {}
+
+    def __lt__(self, other):
+        return self.config.priority < other.config.priority
 
     def transition(self):
         self.transitioned = True
@@ -1067,6 +1214,9 @@ class DummyProcessGroup(object):
     def reopenlogs(self):
         self.logs_reopened = True
 
+    def flushlogs(self):
+        self.logs_flushed = True
+
 class DummyFCGIProcessGroup(DummyProcessGroup):
 
     def __init__(self, config):
@@ -1096,6 +1246,20 @@ class PopulatedDummySupervisor(DummySupervisor):
     def reap(self):
         self.reaped = True
 
+class DummyQueuedHandler:
+    is_backlogged = False
+
+    def __init__(self, reader=None):
+        self.reader = reader
+
+    def backlogged(self):
+        return self.is_backlogged
+
+    def stats(self):
+        return {'logfile': '/tmp/foo', 'queued_bytes': 10,
+                'queued_records': 1, 'backlogged': self.is_backlogged,
+                'last_latency': 0.5, 'max_latency': 1.0}
+
 class DummyDispatcher:
     flush_exception = None
 
@@ -1104,10 +1268,13 @@ class DummyDispatcher:
     error_handled = False
     logs_reopened = False
     logs_removed = False
+    logs_flushed = False
     closed = False
     flushed = False
+    queued_handlers = ()
 
-    def __init__(self, readable=False, writable=False, error=False):
+    def __init__(self, readable=False, writable=False, error=False, fd=None):
+        self.fd = fd
         self._readable = readable
         self._writable = writable
         self._error = error
@@ -1120,6 +1287,9 @@ class DummyDispatcher:
             def removelogs():
                 self.logs_removed = True
             self.removelogs = removelogs
+            def flushlogs():
+                self.logs_flushed = True
+            self.flushlogs = flushlogs
 
     def readable(self):
         return self._readable
@@ -1182,14 +1352,23 @@ class DummyPoller:
     def __init__(self, options):
         self.result = [], []
         self.closed = False
+        self.readables = set()
+        self.writables = set()
 
     def register_readable(self, fd):
-        pass
+        self.readables.add(fd)
 
     def register_writable(self, fd):
-        pass
+        self.writables.add(fd)
+
+    def unregister_readable(self, fd):
+        self.readables.discard(fd)
+
+    def unregister_writable(self, fd):
+        self.writables.discard(fd)
 
     def poll(self, timeout):
+        self.timeout = timeout
         return self.result
 
     def close(self):
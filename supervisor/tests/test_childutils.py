@@ -58,6 +58,21 @@ class TestProcessCommunicationsProtocol(unittest.TestCase):
         end = ProcessCommunicationEvent.END_TOKEN
         self.assertEqual(stdout.getvalue(), begin + b'hello' + end)
 
+    def test_sendframe(self):
+        from supervisor.childutils import pcomm
+        stdout = BytesIO()
+        pcomm.sendframe(b'hello', stdout)
+        self.assertEqual(stdout.getvalue(),
+                         b'<!--XSUPERVISOR:BEGIN:5-->hello')
+
+    def test_sendframe_multibyte(self):
+        from supervisor.childutils import pcomm
+        stdout = BytesIO()
+        pcomm.sendframe(u'h\u00e9llo \u2603', stdout)
+        # the length is that of the encoded payload
+        self.assertEqual(stdout.getvalue(),
+                         b'<!--XSUPERVISOR:BEGIN:10-->h\xc3\xa9llo \xe2\x98\x83')
+
     def test_stdout(self):
         from supervisor.childutils import pcomm
         old = sys.stdout
@@ -420,6 +420,39 @@ class LoggingLevelTests(unittest.TestCase):
         self.assertRaises(ValueError,
                           self._callFUT, "foo")
 
+class LogRotationTests(unittest.TestCase):
+    def _callFUT(self, arg):
+        return datatypes.log_rotation(arg)
+
+    def test_returns_scheme_case_insensitive(self):
+        self.assertEqual(self._callFUT('Rename'), 'rename')
+        self.assertEqual(self._callFUT('SEGMENTS'), 'segments')
+
+    def test_raises_for_bad_scheme(self):
+        self.assertRaises(ValueError, self._callFUT, 'timestamps')
+
+class LogCompressionTests(unittest.TestCase):
+    def _callFUT(self, arg):
+        return datatypes.log_compression(arg)
+
+    def test_none(self):
+        self.assertEqual(self._callFUT('None'), None)
+
+    def test_gzip(self):
+        self.assertEqual(self._callFUT('GZIP'), 'gzip')
+
+    def test_xz(self):
+        with patch.object(datatypes, 'lzma', object()):
+            self.assertEqual(self._callFUT('xz'), 'xz')
+            self.assertEqual(self._callFUT('lzma'), 'xz')
+
+    def test_xz_without_lzma(self):
+        with patch.object(datatypes, 'lzma', None):
+            self.assertRaises(ValueError, self._callFUT, 'xz')
+
+    def test_raises_for_bad_compression(self):
+        self.assertRaises(ValueError, self._callFUT, 'bzip2')
+
 class UrlTests(unittest.TestCase):
     def _callFUT(self, arg):
         return datatypes.url(arg)
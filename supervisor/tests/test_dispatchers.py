@@ -6,6 +6,7 @@ from supervisor.compat import as_bytes
 from supervisor.tests.base import DummyOptions
 from supervisor.tests.base import DummyProcess
 from supervisor.tests.base import DummyPConfig
+from supervisor.tests.base import DummyQueuedHandler
 from supervisor.tests.base import DummyLogger
 from supervisor.tests.base import DummyEvent
 
@@ -80,6 +81,17 @@ class POutputDispatcherTests(unittest.TestCase):
         dispatcher.closed = True
         self.assertEqual(dispatcher.readable(), False)
 
+    def test_readable_log_backlogged(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        handler = DummyQueuedHandler()
+        dispatcher.queued_handlers = [handler]
+        self.assertEqual(dispatcher.readable(), True)
+        handler.is_backlogged = True
+        self.assertEqual(dispatcher.readable(), False)
+
     def test_handle_write_event(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'process1', '/bin/process1')
@@ -97,6 +109,110 @@ class POutputDispatcherTests(unittest.TestCase):
         self.assertEqual(dispatcher.handle_read_event(), None)
         self.assertEqual(dispatcher.output_buffer, b'abc')
 
+    def test_handle_read_event_no_capture_logs_without_buffering(self):
+        options = DummyOptions()
+        options.readfd_result = b'abc'
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.output_buffer, b'')
+        self.assertEqual(len(dispatcher.childlog.data), 1)
+        data = dispatcher.childlog.data[0]
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual(data.tobytes(), b'abc')
+        self.assertFalse(dispatcher.closed)
+
+    def test_handle_read_event_no_capture_no_data_closes(self):
+        options = DummyOptions()
+        options.readfd_result = b''
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.childlog.data, [])
+        self.assertTrue(dispatcher.closed)
+
+    def test_handle_read_event_copies_data_kept_by_events(self):
+        options = DummyOptions()
+        options.readfd_result = b'hello from stdout'
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo',
+                              stdout_events_enabled=True)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        L = []
+        from supervisor import events
+        events.subscribe(events.EventTypes.PROCESS_LOG_STDOUT, L.append)
+        dispatcher.handle_read_event()
+        self.assertEqual(len(L), 1)
+        self.assertEqual(type(L[0].data), bytes)
+        self.assertEqual(L[0].data, b'hello from stdout')
+        self.assertEqual(dispatcher.childlog.data, [b'hello from stdout'])
+
+    def test_handle_read_event_copies_data_for_mainlog(self):
+        options = DummyOptions()
+        from supervisor import loggers
+        options.loglevel = loggers.LevelsByName.TRAC
+        options.readfd_result = b'abc'
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.handle_read_event()
+        self.assertEqual(options.logger.data[0],
+             "'process1' stdout output:\nabc")
+
+    def _makeSplicing(self, result):
+        options = DummyOptions()
+        options.readfd_result = b'abc'
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.splicelog = DummySpliceHandler(result)
+        return dispatcher
+
+    def test_handle_read_event_splices(self):
+        dispatcher = self._makeSplicing(10)
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.splicelog.spliced, [(0, 2 << 16)])
+        self.assertEqual(dispatcher.childlog.data, [])
+        self.assertFalse(dispatcher.closed)
+
+    def test_handle_read_event_splices_no_data_closes(self):
+        dispatcher = self._makeSplicing(0)
+        dispatcher.handle_read_event()
+        self.assertTrue(dispatcher.closed)
+
+    def test_handle_read_event_splice_would_block(self):
+        import errno
+        dispatcher = self._makeSplicing(OSError(errno.EAGAIN, 'again'))
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.childlog.data, [])
+        self.assertFalse(dispatcher.closed)
+        self.assertNotEqual(dispatcher.splicelog, None)
+
+    def test_handle_read_event_splice_bad_fd_closes(self):
+        import errno
+        dispatcher = self._makeSplicing(OSError(errno.EBADF, 'bad fd'))
+        dispatcher.handle_read_event()
+        self.assertTrue(dispatcher.closed)
+
+    def test_handle_read_event_splice_unsupported_falls_back(self):
+        import errno
+        dispatcher = self._makeSplicing(OSError(errno.EINVAL, 'invalid'))
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.splicelog, None)
+        self.assertEqual(len(dispatcher.childlog.data), 1)
+        self.assertEqual(dispatcher.childlog.data[0].tobytes(), b'abc')
+        options = dispatcher.process.config.options
+        self.assertEqual(options.logger.data[0],
+            "cannot splice output of 'process1' to /tmp/foo "
+            "([Errno 22] invalid), "
+            "logging it instead")
+
     def test_handle_read_event_no_data_closes(self):
         options = DummyOptions()
         options.readfd_result = b''
@@ -405,6 +521,103 @@ class POutputDispatcherTests(unittest.TestCase):
             except (OSError, IOError):
                 pass
 
+    def _makeCapturing(self):
+        # the capture log is real, the normal log is a DummyLogger
+        from supervisor.events import ProcessCommunicationEvent
+        from supervisor.events import subscribe
+        events = []
+        subscribe(ProcessCommunicationEvent, events.append)
+        options = DummyOptions()
+        from supervisor.loggers import getLogger
+        options.getLogger = getLogger
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_capture_maxbytes=1000)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.normallog = dispatcher.childlog = DummyLogger()
+        return dispatcher, events
+
+    def test_record_output_many_events_in_one_buffer(self):
+        from supervisor.events import ProcessCommunicationEvent
+        BEGIN_TOKEN = ProcessCommunicationEvent.BEGIN_TOKEN
+        END_TOKEN = ProcessCommunicationEvent.END_TOKEN
+        dispatcher, events = self._makeCapturing()
+        log = dispatcher.normallog
+        dispatcher.output_buffer = (BEGIN_TOKEN + b'hello' + END_TOKEN +
+                                    b'line\n') * 5000
+        dispatcher.record_output()
+        self.assertEqual(len(events), 5000)
+        self.assertEqual(set(event.data for event in events), set([b'hello']))
+        self.assertEqual(b''.join(log.data), b'line\n' * 5000)
+        self.assertEqual(dispatcher.output_buffer, b'')
+        self.assertEqual(dispatcher.childlog, log)
+
+    def test_record_output_frame(self):
+        from supervisor.events import ProcessCommunicationEvent
+        END_TOKEN = ProcessCommunicationEvent.END_TOKEN
+        FRAME_TOKEN = ProcessCommunicationEvent.FRAME_TOKEN
+        dispatcher, events = self._makeCapturing()
+        payload = b'can contain ' + END_TOKEN
+        dispatcher.output_buffer = (b'before' + as_bytes(FRAME_TOKEN % len(payload)) +
+                                    payload + b'after')
+        dispatcher.record_output()
+        self.assertEqual([event.data for event in events], [payload])
+        self.assertEqual(dispatcher.normallog.data, [b'before', b'after'])
+        self.assertEqual(dispatcher.capture_remaining, None)
+        self.assertFalse(dispatcher.capturemode)
+
+    def test_record_output_frame_multibyte(self):
+        from io import BytesIO
+        from supervisor.childutils import pcomm
+        dispatcher, events = self._makeCapturing()
+        stdout = BytesIO()
+        payload = u'\u2603 snowman'
+        pcomm.sendframe(payload, stdout)
+        dispatcher.output_buffer = stdout.getvalue() + b'after'
+        dispatcher.record_output()
+        self.assertEqual([event.data for event in events],
+                         [payload.encode('utf-8')])
+        self.assertEqual(dispatcher.normallog.data, [b'after'])
+
+    def test_record_output_frame_split_between_reads(self):
+        from supervisor.events import ProcessCommunicationEvent
+        FRAME_TOKEN = ProcessCommunicationEvent.FRAME_TOKEN
+        dispatcher, events = self._makeCapturing()
+        data = b'before' + as_bytes(FRAME_TOKEN % 10) + b'0123456789after'
+        # split inside the token and inside the payload
+        for chunk in (data[:20], data[20:30], data[30:40], data[40:]):
+            dispatcher.output_buffer += chunk
+            dispatcher.record_output()
+        self.assertEqual([event.data for event in events], [b'0123456789'])
+        self.assertEqual(b''.join(dispatcher.normallog.data),
+                         b'beforeafter')
+
+    def test_record_output_frame_keeps_partial_token(self):
+        dispatcher, events = self._makeCapturing()
+        dispatcher.output_buffer = b'before<!--XSUPERVISOR:BEGIN:12-'
+        dispatcher.record_output()
+        self.assertEqual(dispatcher.normallog.data, [b'before'])
+        self.assertEqual(dispatcher.output_buffer,
+                         b'<!--XSUPERVISOR:BEGIN:12-')
+
+    def test_record_output_frame_not_a_token(self):
+        dispatcher, events = self._makeCapturing()
+        dispatcher.output_buffer = b'before<!--XSUPERVISOR:BEGIN:12x'
+        dispatcher.record_output()
+        self.assertEqual(dispatcher.normallog.data,
+                         [b'before<!--XSUPERVISOR:BEGIN:12x'])
+        self.assertEqual(dispatcher.output_buffer, b'')
+        self.assertEqual(events, [])
+
+    def test_record_output_empty_frame(self):
+        from supervisor.events import ProcessCommunicationEvent
+        FRAME_TOKEN = ProcessCommunicationEvent.FRAME_TOKEN
+        dispatcher, events = self._makeCapturing()
+        dispatcher.output_buffer = as_bytes(FRAME_TOKEN % 0) + b'after'
+        dispatcher.record_output()
+        self.assertEqual([event.data for event in events], [b''])
+        self.assertEqual(dispatcher.normallog.data, [b'after'])
+
     def test_strip_ansi(self):
         options = DummyOptions()
         options.strip_ansi = True
@@ -427,6 +640,20 @@ class POutputDispatcherTests(unittest.TestCase):
         self.assertEqual(len(dispatcher.childlog.data), 2)
         self.assertEqual(dispatcher.childlog.data[1], ansi)
 
+    def test_strip_ansi_escape_split_between_reads(self):
+        options = DummyOptions()
+        options.strip_ansi = True
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+
+        dispatcher.output_buffer = b'Hello \x1b[3'
+        dispatcher.record_output()
+        dispatcher.output_buffer = b'4mworld\x1b[0m'
+        dispatcher.record_output()
+        self.assertEqual(dispatcher.childlog.data, [b'Hello ', b'world'])
+
     def test_ctor_no_logfiles(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'process1', '/bin/process1')
@@ -526,6 +753,113 @@ class POutputDispatcherTests(unittest.TestCase):
         self.assertEqual(dispatcher.normallog.handlers[0].__class__, FileHandler)
         dispatcher.normallog.close()
 
+    def test_ctor_stdout_logfile_buffer(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        options.childlog_flush_ms = 500
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'),
+                              stdout_logfile_buffer=1024)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.addCleanup(dispatcher.normallog.close)
+        handler = dispatcher.normallog.handlers[0]
+        self.assertEqual(handler.buffersize, 1024)
+        self.assertEqual(handler.timers, options.timers)
+        self.assertEqual(handler.flushdelay, 0.5)
+
+    def test_ctor_stdout_logfile_rotation_segments(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName, SegmentedFileHandler
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'),
+                              stdout_logfile_maxbytes=100,
+                              stdout_logfile_rotation='segments')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.addCleanup(dispatcher.normallog.close)
+        handler = dispatcher.normallog.handlers[0]
+        self.assertEqual(handler.__class__, SegmentedFileHandler)
+
+    def test_ctor_stdout_logfile_compress(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'),
+                              stdout_logfile_maxbytes=100,
+                              stdout_logfile_rotation='segments',
+                              stdout_logfile_compress='gzip',
+                              stdout_logfile_backups_maxbytes=1000)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.addCleanup(dispatcher.normallog.close)
+        handler = dispatcher.normallog.handlers[0]
+        self.assertEqual(handler.compress, 'gzip')
+        self.assertEqual(handler.compressor, options.logcompressor)
+        self.assertEqual(handler.backupsMaxBytes, 1000)
+
+    def test_ctor_stdout_logfile_index(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'),
+                              stdout_logfile_rotation='segments',
+                              stdout_logfile_index=True)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.addCleanup(dispatcher.normallog.close)
+        handler = dispatcher.normallog.handlers[0]
+        self.assertEqual(handler.index.filename, '/tmp/foo.idx')
+        handler.remove()
+
+    def test_flushlogs(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        dispatcher.flushlogs()
+        self.assertEqual(dispatcher.normallog.handlers[0].flushed, True)
+
+    def test_ctor_stdout_logfile_with_logwriter(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.logwriter import QueuedHandler
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        options.logwriter.nthreads = 1
+        self.addCleanup(options.logwriter.stop)
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'),
+                              stdout_logfile_buffer=1024)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        handler = dispatcher.normallog.handlers[0]
+        self.addCleanup(handler.handler.close)
+        self.assertEqual(handler.__class__, QueuedHandler)
+        self.assertEqual(dispatcher.queued_handlers, [handler])
+        self.assertTrue(handler.reader is dispatcher)
+        # the writer thread flushes the buffer, not the mainloop
+        self.assertEqual(handler.handler.buffersize, 1024)
+        # child logs keep their offsets
+        self.assertNotEqual(handler.handler.offsets, None)
+        self.assertEqual(handler.handler.timers, None)
+        # output is not spliced past the writer thread
+        self.assertEqual(dispatcher.splicelog, None)
+
     def test_ctor_stdout_logfile_str_and_stdout_syslog_true(self):
         from supervisor.datatypes import boolean, logfile_name
         from supervisor.loggers import FileHandler, LevelsByName, SyslogHandler
@@ -547,6 +881,112 @@ class POutputDispatcherTests(unittest.TestCase):
             dispatcher.normallog.handlers))
         dispatcher.normallog.close()
 
+    def _makeSpliceable(self, **kw):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.options import ServerOptions
+        options = ServerOptions() # need real options to get a real logger
+        options.loglevel = LevelsByName.INFO
+        options.strip_ansi = kw.pop('strip_ansi', False)
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'), **kw)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.addCleanup(dispatcher.normallog.close)
+        return dispatcher
+
+    if hasattr(os, 'splice'):
+        def test_ctor_logfile_only_splices(self):
+            dispatcher = self._makeSpliceable()
+            self.assertEqual(dispatcher.splicelog,
+                             dispatcher.normallog.handlers[0])
+
+    def test_ctor_no_splice_with_syslog(self):
+        dispatcher = self._makeSpliceable(stdout_syslog=True)
+        self.assertEqual(dispatcher.splicelog, None)
+
+    def test_ctor_no_splice_with_events(self):
+        dispatcher = self._makeSpliceable(stdout_events_enabled=True)
+        self.assertEqual(dispatcher.splicelog, None)
+
+    def test_ctor_no_splice_with_capture(self):
+        dispatcher = self._makeSpliceable(stdout_capture_maxbytes=100)
+        self.assertEqual(dispatcher.splicelog, None)
+
+    def test_ctor_no_splice_with_strip_ansi(self):
+        dispatcher = self._makeSpliceable(strip_ansi=True)
+        self.assertEqual(dispatcher.splicelog, None)
+
+    def test_ctor_no_splice_with_tail(self):
+        dispatcher = self._makeSpliceable(stdout_tail_maxbytes=100)
+        self.assertEqual(dispatcher.splicelog, None)
+
+    def test_ctor_tail(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_tail_maxbytes=100)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.assertEqual(dispatcher.tail.maxbytes, 100)
+        self.assertEqual(process.output_tails, {'stdout': dispatcher.tail})
+        # the next dispatcher of the process goes on with the same tail
+        dispatcher2 = self._makeOne(process)
+        self.assertTrue(dispatcher2.tail is dispatcher.tail)
+
+    def test_ctor_tail_gets_queued_handlers(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo',
+                              stdout_tail_maxbytes=100)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.assertTrue(dispatcher.tail.queued_handlers is
+                        dispatcher.queued_handlers)
+
+    def test_ctor_no_tail(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.assertEqual(dispatcher.tail, None)
+        self.assertEqual(process.output_tails, {})
+
+    def test_record_output_writes_tail_but_not_captured_output(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_capture_maxbytes=100,
+                              stdout_tail_maxbytes=100)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        from supervisor.events import ProcessCommunicationEvent as E
+        dispatcher.output_buffer = (b'before' + E.BEGIN_TOKEN + b'captured' +
+                                    E.END_TOKEN + b'after')
+        dispatcher.record_output()
+        self.assertEqual(dispatcher.tail.read(0, 100), b'beforeafter')
+
+    def test_record_output_writes_tail_without_logfile(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_tail_maxbytes=100)
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        self.assertEqual(dispatcher.childlog, None)
+        dispatcher.output_buffer = b'hello'
+        dispatcher.record_output()
+        self.assertEqual(dispatcher.tail.read(0, 100), b'hello')
+
+    def test_ctor_no_splice_with_mainlog(self):
+        from supervisor.datatypes import logfile_name
+        from supervisor.loggers import LevelsByName
+        from supervisor.options import ServerOptions
+        options = ServerOptions()
+        options.loglevel = LevelsByName.DEBG
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile=logfile_name('/tmp/foo'))
+        dispatcher = self._makeOne(DummyProcess(config))
+        self.addCleanup(dispatcher.normallog.close)
+        self.assertEqual(dispatcher.splicelog, None)
+
     def test_repr(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'process1', '/bin/process1')
@@ -569,6 +1009,17 @@ class POutputDispatcherTests(unittest.TestCase):
         dispatcher.close() # make sure we don't error if we try to close twice
         self.assertEqual(dispatcher.closed, True)
 
+    def test_close_removes_dispatcher_from_process_map(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        options.add_dispatcher(dispatcher)
+        self.assertEqual(options.poller.readables, set([dispatcher.fd]))
+        dispatcher.close()
+        self.assertEqual(options.process_map, {})
+        self.assertEqual(options.poller.readables, set())
+
 
 class PInputDispatcherTests(unittest.TestCase):
     def _getTargetClass(self):
@@ -708,6 +1159,130 @@ class PInputDispatcherTests(unittest.TestCase):
         dispatcher.close() # make sure we don't error if we try to close twice
         self.assertEqual(dispatcher.closed, True)
 
+class PExitDispatcherTests(unittest.TestCase):
+    def setUp(self):
+        from supervisor.events import clear
+        clear()
+
+    def tearDown(self):
+        from supervisor.events import clear
+        clear()
+
+    def _getTargetClass(self):
+        from supervisor.dispatchers import PExitDispatcher
+        return PExitDispatcher
+
+    def _makeOne(self, process, fd=9):
+        return self._getTargetClass()(process, fd)
+
+    def _makeProcess(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        process.pid = 123
+        options.pidhistory[123] = process
+        return process
+
+    def test_readable_writable(self):
+        dispatcher = self._makeOne(self._makeProcess())
+        self.assertTrue(dispatcher.readable())
+        self.assertFalse(dispatcher.writable())
+        dispatcher.close()
+        self.assertFalse(dispatcher.readable())
+
+    def test_repr(self):
+        dispatcher = self._makeOne(self._makeProcess())
+        drepr = repr(dispatcher)
+        self.assertTrue('PExitDispatcher' in drepr)
+        self.assertTrue(drepr.endswith('(pidfd)>'), drepr)
+
+    def test_handle_read_event_reaps_process(self):
+        process = self._makeProcess()
+        options = process.config.options
+        options.waitpid_return = 123, 0
+        dispatcher = self._makeOne(process)
+        options.add_dispatcher(dispatcher)
+        dispatcher.handle_read_event()
+        self.assertEqual(options.waitpid_pid, 123)
+        self.assertEqual(process.finished, (123, 0))
+        self.assertEqual(options.pidhistory, {})
+        self.assertTrue(dispatcher.closed)
+        self.assertEqual(options.process_map, {})
+        self.assertEqual(options.fds_closed, [9])
+
+    def test_handle_read_event_already_reaped(self):
+        process = self._makeProcess()
+        options = process.config.options
+        options.waitpid_return = None, None
+        dispatcher = self._makeOne(process)
+        dispatcher.handle_read_event()
+        self.assertEqual(process.finished, None)
+        self.assertEqual(options.pidhistory, {123: process})
+        self.assertTrue(dispatcher.closed)
+        self.assertEqual(options.fds_closed, [9])
+
+    def test_close(self):
+        process = self._makeProcess()
+        options = process.config.options
+        dispatcher = self._makeOne(process)
+        dispatcher.close()
+        dispatcher.close() # make sure we don't error if we try to close twice
+        self.assertTrue(dispatcher.closed)
+        self.assertEqual(options.fds_closed, [9])
+
+class PExecStatusDispatcherTests(unittest.TestCase):
+    def _getTargetClass(self):
+        from supervisor.dispatchers import PExecStatusDispatcher
+        return PExecStatusDispatcher
+
+    def _makeOne(self, process, fd=9):
+        return self._getTargetClass()(process, fd)
+
+    def _makeProcess(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        return DummyProcess(config)
+
+    def test_readable_writable(self):
+        dispatcher = self._makeOne(self._makeProcess())
+        self.assertTrue(dispatcher.readable())
+        self.assertFalse(dispatcher.writable())
+        dispatcher.close()
+        self.assertFalse(dispatcher.readable())
+
+    def test_handle_read_event_exec_succeeded(self):
+        process = self._makeProcess()
+        options = process.config.options
+        dispatcher = self._makeOne(process)
+        options.add_dispatcher(dispatcher)
+        dispatcher.handle_read_event()
+        self.assertTrue(dispatcher.closed)
+        self.assertEqual(options.process_map, {})
+        self.assertEqual(options.fds_closed, [9])
+        self.assertEqual(process.exec_status_error, b'')
+
+    def test_handle_read_event_exec_failed(self):
+        process = self._makeProcess()
+        options = process.config.options
+        options.exec_status = b"couldn't chdir to /x: ENOENT"
+        dispatcher = self._makeOne(process)
+        dispatcher.handle_read_event()
+        self.assertFalse(dispatcher.closed)
+        self.assertEqual(process.exec_status_error, None)
+        dispatcher.handle_read_event()
+        self.assertTrue(dispatcher.closed)
+        self.assertEqual(process.exec_status_error,
+                         b"couldn't chdir to /x: ENOENT")
+
+    def test_close(self):
+        process = self._makeProcess()
+        options = process.config.options
+        dispatcher = self._makeOne(process)
+        dispatcher.close()
+        dispatcher.close()
+        self.assertEqual(options.fds_closed, [9])
+        self.assertEqual(process.exec_status_error, b'')
+
 class PEventListenerDispatcherTests(unittest.TestCase):
     def setUp(self):
         from supervisor.events import clear
@@ -748,6 +1323,17 @@ class PEventListenerDispatcherTests(unittest.TestCase):
         dispatcher.closed = True
         self.assertEqual(dispatcher.readable(), False)
 
+    def test_readable_log_backlogged(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'process1', '/bin/process1')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+        handler = DummyQueuedHandler()
+        dispatcher.queued_handlers = [handler]
+        self.assertEqual(dispatcher.readable(), True)
+        handler.is_backlogged = True
+        self.assertEqual(dispatcher.readable(), False)
+
     def test_handle_write_event(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'process1', '/bin/process1')
@@ -1166,6 +1752,20 @@ class PEventListenerDispatcherTests(unittest.TestCase):
         self.assertEqual(len(dispatcher.childlog.data), 2)
         self.assertEqual(dispatcher.childlog.data[1], ansi)
 
+    def test_strip_ansi_escape_split_between_reads(self):
+        options = DummyOptions()
+        options.strip_ansi = True
+        config = DummyPConfig(options, 'process1', '/bin/process1',
+                              stdout_logfile='/tmp/foo')
+        process = DummyProcess(config)
+        dispatcher = self._makeOne(process)
+
+        options.readfd_result = b'Hello \x1b'
+        dispatcher.handle_read_event()
+        options.readfd_result = b'[34mworld'
+        dispatcher.handle_read_event()
+        self.assertEqual(dispatcher.childlog.data, [b'Hello ', b'world'])
+
     def test_ctor_nologfiles(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'process1', '/bin/process1')
@@ -1226,3 +1826,129 @@ class stripEscapeTests(unittest.TestCase):
     def test_noansi(self):
         noansi = b'Hello world... this is longer than a token!'
         self.assertEqual(self._callFUT(noansi), noansi)
+
+    def test_unterminated(self):
+        self.assertEqual(self._callFUT(b'Hello\x1b[34;1'), b'Hello')
+
+    def test_lone_escape(self):
+        self.assertEqual(self._callFUT(b'\x1bHello\x1b\x1b[0m'),
+                         b'\x1bHello\x1b')
+
+class EscapeStripperTests(unittest.TestCase):
+    def _makeOne(self):
+        from supervisor.dispatchers import EscapeStripper
+        return EscapeStripper()
+
+    def _strip(self, chunks):
+        stripper = self._makeOne()
+        return [ stripper.strip(chunk) for chunk in chunks ]
+
+    def test_whole_escapes(self):
+        self.assertEqual(self._strip([b'\x1b[34mHello', b' world\x1b[0m']),
+                         [b'Hello', b' world'])
+
+    def test_escape_split_between_chunks(self):
+        self.assertEqual(self._strip([b'Hello\x1b[3', b'4m world']),
+                         [b'Hello', b' world'])
+
+    def test_escape_split_after_escape_character(self):
+        self.assertEqual(self._strip([b'Hello\x1b', b'[34m world']),
+                         [b'Hello', b' world'])
+
+    def test_escape_spanning_three_chunks(self):
+        self.assertEqual(self._strip([b'Hello\x1b[', b'1;3', b'4m world']),
+                         [b'Hello', b'', b' world'])
+
+    def test_lone_escape_character_at_end_of_chunk(self):
+        self.assertEqual(self._strip([b'Hello\x1b', b'world']),
+                         [b'Hello', b'\x1bworld'])
+
+    def test_lone_escape_character_before_escape(self):
+        self.assertEqual(self._strip([b'Hello\x1b', b'\x1b[0m world']),
+                         [b'Hello', b'\x1b world'])
+
+    def test_unterminated_escape_after_terminated_one(self):
+        self.assertEqual(self._strip([b'\x1b[1mHello\x1b[3', b'4m world']),
+                         [b'Hello', b' world'])
+
+    def test_escape_inside_unterminated_escape(self):
+        self.assertEqual(self._strip([b'Hello\x1b[3\x1b[4', b'm world']),
+                         [b'Hello', b' world'])
+
+    def test_same_result_as_stripEscapes(self):
+        from supervisor.dispatchers import stripEscapes
+        data = b'\x1b[1;32mINFO\x1b[0m \x1b\x1b[mstarted\x1b[31m!\x1b[0m\n'
+        for size in range(1, len(data) + 1):
+            chunks = [ data[i:i + size] for i in range(0, len(data), size) ]
+            self.assertEqual(b''.join(self._strip(chunks)), stripEscapes(data))
+
+class OutputTailTests(unittest.TestCase):
+    def _makeOne(self, maxbytes):
+        from supervisor.dispatchers import OutputTail
+        return OutputTail(maxbytes)
+
+    def test_write_and_read(self):
+        tail = self._makeOne(10)
+        tail.write(b'hello')
+        self.assertEqual((tail.start, tail.end), (0, 5))
+        self.assertEqual(tail.read(0, 100), b'hello')
+        self.assertEqual(tail.read(1, 3), b'ell')
+        self.assertEqual(tail.read(5, 3), b'')
+
+    def test_write_wraps_around(self):
+        tail = self._makeOne(10)
+        tail.write(b'0123456')
+        tail.write(memoryview(b'789abc'))
+        self.assertEqual((tail.start, tail.end), (3, 13))
+        self.assertEqual(tail.read(0, 100), b'3456789abc')
+        self.assertEqual(tail.read(8, 3), b'89a')
+        self.assertEqual(tail.read(9, 4), b'9abc')
+        self.assertEqual(len(tail.buf), 10)
+
+    def test_write_bigger_than_buffer(self):
+        tail = self._makeOne(10)
+        tail.write(b'xyz')
+        tail.write(b'0123456789abcdef')
+        self.assertEqual((tail.start, tail.end), (9, 19))
+        self.assertEqual(tail.read(0, 100), b'6789abcdef')
+        tail.write(b'g')
+        self.assertEqual(tail.read(0, 100), b'789abcdefg')
+
+    def test_same_as_bytes_for_any_write_sizes(self):
+        data = bytes(bytearray(range(256))) * 3
+        for size in (1, 3, 7, 16, 17, 40):
+            tail = self._makeOne(16)
+            for i in range(0, len(data), size):
+                tail.write(data[i:i + size])
+                end = min(i + size, len(data))
+                self.assertEqual(tail.read(0, 100), data[max(0, end - 16):end])
+
+    def test_clear(self):
+        tail = self._makeOne(10)
+        tail.write(b'hello')
+        tail.clear()
+        self.assertEqual((tail.start, tail.end), (5, 5))
+        self.assertEqual(tail.read(0, 100), b'')
+        tail.write(b'!')
+        self.assertEqual(tail.read(0, 100), b'!')
+
+    def test_pending(self):
+        tail = self._makeOne(10)
+        self.assertEqual(tail.pending(), 0)
+        handler = DummyQueuedHandler()
+        handler.queued_bytes = 5
+        tail.queued_handlers = [handler]
+        self.assertEqual(tail.pending(), 5)
+
+class DummySpliceHandler:
+    baseFilename = '/tmp/foo'
+
+    def __init__(self, result):
+        self.result = result
+        self.spliced = []
+
+    def splice(self, fd, count):
+        self.spliced.append((fd, count))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
@@ -1,5 +1,6 @@
 import base64
 import os
+import shutil
 import stat
 import socket
 import tempfile
@@ -56,6 +57,7 @@ class LogtailHandlerTests(HandlerTests, unittest.TestCase):
         self.assertEqual(request._error, 404)
 
     def test_handle_request(self):
+        from supervisor.http import log_follow_producer
         with tempfile.NamedTemporaryFile() as f:
             t = f.name
             options = DummyOptions()
@@ -71,8 +73,145 @@ class LogtailHandlerTests(HandlerTests, unittest.TestCase):
             self.assertEqual(request.headers['Content-Type'], 'text/plain;charset=utf-8')
             self.assertEqual(request.headers['X-Accel-Buffering'], 'no')
             self.assertEqual(len(request.producers), 1)
+            self.assertEqual(request.producers[0].__class__,
+                             log_follow_producer)
             self.assertEqual(request._done, True)
 
+    def test_handle_request_offset(self):
+        from supervisor.http import log_span_producer
+        basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, basedir)
+        logfile = os.path.join(basedir, 'foo.log')
+        with open(logfile, 'wb') as f:
+            f.write(b'abc')
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', 'foo', stdout_logfile=logfile)
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        handler = self._makeOne(supervisord)
+        request = DummyRequest('/logtail/foo', None, '?offset=-2', None)
+        handler.handle_request(request)
+        self.assertEqual(request._error, None)
+        self.assertEqual(request.headers['X-Log-Offset'], '1')
+        self.assertEqual(len(request.producers), 1)
+        self.assertEqual(request.producers[0].__class__, log_span_producer)
+        self.assertEqual(request._done, True)
+
+    def test_handle_request_bad_offset(self):
+        with tempfile.NamedTemporaryFile() as f:
+            options = DummyOptions()
+            pconfig = DummyPConfig(options, 'foo', 'foo',
+                                   stdout_logfile=f.name)
+            supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+            handler = self._makeOne(supervisord)
+            request = DummyRequest('/logtail/foo', None, '?offset=x', None)
+            handler.handle_request(request)
+            self.assertEqual(request._error, 400)
+
+    def test_handle_request_output_tail(self):
+        from supervisor.dispatchers import OutputTail
+        from supervisor.http import output_tail_producer
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', 'foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        process = supervisord.process_groups['foo'].processes['foo']
+        process.output_tails['stdout'] = OutputTail(10)
+        handler = self._makeOne(supervisord)
+        request = DummyRequest('/logtail/foo', None, None, None)
+        handler.handle_request(request)
+        self.assertEqual(request._error, None)
+        self.assertEqual(request.headers['Content-Type'], 'text/plain;charset=utf-8')
+        self.assertEqual(request.headers['X-Accel-Buffering'], 'no')
+        self.assertEqual(len(request.producers), 1)
+        self.assertEqual(request.producers[0].__class__, output_tail_producer)
+        self.assertEqual(request._done, True)
+
+class LogSearchHandlerTests(HandlerTests, unittest.TestCase):
+    def _getTargetClass(self):
+        from supervisor.http import logsearch_handler
+        return logsearch_handler
+
+    def _makeSupervisor(self):
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', 'foo')
+        return PopulatedDummySupervisor(options, 'foo', pconfig)
+
+    def test_handle_request(self):
+        from supervisor.http import log_search_producer
+        handler = self._makeOne(self._makeSupervisor())
+        request = DummyRequest('/logsearch', None,
+                               '?pattern=ERROR&name=foo&maxmatches=5', None)
+        handler.handle_request(request)
+        self.assertEqual(request._error, None)
+        self.assertEqual(request.headers['Content-Type'], 'text/plain;charset=utf-8')
+        self.assertEqual(len(request.producers), 1)
+        producer = request.producers[0]
+        self.assertEqual(producer.__class__, log_search_producer)
+        self.assertEqual(producer.search.maxmatches, 5)
+        self.assertEqual(producer.search.logs, [])
+        self.assertEqual(request._done, True)
+        producer.search.thread.join()
+
+    def test_handle_request_bad_arguments(self):
+        handler = self._makeOne(self._makeSupervisor())
+        for query in (None, '?pattern=(', '?pattern=x&maxmatches=0',
+                      '?pattern=x&maxmatches=y', '?pattern=x&channel=stdin'):
+            request = DummyRequest('/logsearch', None, query, None)
+            handler.handle_request(request)
+            self.assertEqual(request._error, 400)
+
+    def test_handle_request_bad_name(self):
+        handler = self._makeOne(self._makeSupervisor())
+        request = DummyRequest('/logsearch', None, '?pattern=x&name=bar', None)
+        handler.handle_request(request)
+        self.assertEqual(request._error, 404)
+
+class LogSearchProducerTests(unittest.TestCase):
+    def _makeOne(self, request, search):
+        from supervisor.http import log_search_producer
+        return log_search_producer(request, search)
+
+    def test_more(self):
+        request = DummyRequest('/logsearch', None, None, None)
+        search = DummySearch()
+        producer = self._makeOne(request, search)
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        search.found = [('g:foo', 'stdout', 10, b'a'),
+                        ('g:foo', 'stdout', 12, b'b')]
+        self.assertEqual(producer.more(),
+                         b'g:foo stdout 10 a\ng:foo stdout 12 b\n')
+        search.done = True
+        self.assertEqual(producer.more(), b'')
+
+    def test_more_failed(self):
+        request = DummyRequest('/logsearch', None, None, None)
+        search = DummySearch()
+        search.done = True
+        search.error = 'oops'
+        producer = self._makeOne(request, search)
+        self.assertEqual(producer.more(), b'==> Search failed: oops <==\n')
+
+    def test_cancels_search_when_dropped(self):
+        request = DummyRequest('/logsearch', None, None, None)
+        search = DummySearch()
+        producer = self._makeOne(request, search)
+        del producer
+        self.assertTrue(search.cancelled)
+
+class DummySearch:
+    done = False
+    error = None
+    cancelled = False
+
+    def __init__(self):
+        self.found = []
+
+    def pop(self):
+        found, self.found = self.found, []
+        return found
+
+    def cancel(self):
+        self.cancelled = True
+
 class MainLogTailHandlerTests(HandlerTests, unittest.TestCase):
     def _getTargetClass(self):
         from supervisor.http import mainlogtail_handler
@@ -94,6 +233,7 @@ class MainLogTailHandlerTests(HandlerTests, unittest.TestCase):
         self.assertEqual(request._error, 404)
 
     def test_handle_request(self):
+        from supervisor.http import log_follow_producer
         supervisor = DummySupervisor()
         with tempfile.NamedTemporaryFile() as f:
             t = f.name
@@ -107,6 +247,8 @@ class MainLogTailHandlerTests(HandlerTests, unittest.TestCase):
                 http_date.build_http_date(os.stat(t)[stat.ST_MTIME]))
             self.assertEqual(request.headers['Content-Type'], 'text/plain;charset=utf-8')
             self.assertEqual(len(request.producers), 1)
+            self.assertEqual(request.producers[0].__class__,
+                             log_follow_producer)
             self.assertEqual(request._done, True)
 
 
@@ -185,6 +327,211 @@ class TailFProducerTests(unittest.TestCase):
         finally:
              os.unlink(f.name)
 
+class LogFollowProducerTests(unittest.TestCase):
+    def setUp(self):
+        from supervisor.logfollow import LogFollowers
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'foo.log')
+        with open(self.filename, 'wb') as f:
+            f.write(b'abcdef')
+        self.followers = LogFollowers(map={}, inotify=False)
+
+    def tearDown(self):
+        self.followers.close()
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self, request, head):
+        from supervisor.http import log_follow_producer
+        return log_follow_producer(request, self.followers, self.filename,
+                                   head)
+
+    def _makeChannel(self):
+        from supervisor.http import deferring_http_channel
+        return deferring_http_channel(server=None, conn=None, addr=None)
+
+    def _append(self, data):
+        with open(self.filename, 'ab') as f:
+            f.write(data)
+
+    def test_more(self):
+        from supervisor import http
+        request = DummyRequest('/logtail/foo', None, None, None)
+        producer = self._makeOne(request, 4)
+        self.assertEqual(producer.more(), b'cdef')
+        self.assertEqual(producer.more(), http.NOT_DONE_YET)
+        self._append(b'gh')
+        producer.follower.checked = 0
+        self.assertEqual(producer.more(), b'gh')
+
+    def test_shared_follower(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        one = self._makeOne(request, 0)
+        two = self._makeOne(request, 0)
+        self.assertTrue(one.follower is two.follower)
+        self._append(b'gh')
+        one.follower.check()
+        self.assertEqual(one.more(), b'gh')
+        self.assertEqual(two.more(), b'gh')
+
+    def test_del_unsubscribes(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        producer = self._makeOne(request, 0)
+        del producer
+        self.assertEqual(self.followers.followers, {})
+
+    def test_push_drops_what_client_cannot_take(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        producer = self._makeOne(request, 0)
+        producer.maxpending = 4
+        producer.push(b'abc')
+        producer.push(b'def')
+        self.assertEqual(producer.more(), b'==> Skipped 3 bytes <==\ndef')
+
+    def test_push_wakes_channel(self):
+        from supervisor import http
+        request = DummyRequest('/logtail/foo', None, None, None)
+        request.channel = self._makeChannel()
+        producer = self._makeOne(request, 0)
+        producer.follower.watched = True # as if inotify was available
+        self.assertEqual(producer.more(), http.NOT_DONE_YET)
+        self.assertTrue(request.channel.idle)
+        producer.push(b'gh')
+        self.assertFalse(request.channel.idle)
+        self.assertEqual(request.channel.last_writable_check, 0)
+
+class LogSpanProducerTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'foo.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _getTargetClass(self):
+        from supervisor.http import log_span_producer
+        return log_span_producer
+
+    def _makeOne(self, request, filename, offset):
+        return self._getTargetClass()(request, filename, offset)
+
+    def _makeHandler(self):
+        from supervisor.loggers import SegmentedFileHandler
+        return SegmentedFileHandler(self.filename, maxBytes=6, backupCount=2)
+
+    def _emit(self, handler, data):
+        from supervisor.loggers import LogRecord
+        from supervisor.loggers import LevelsByName
+        handler.emit(LogRecord(LevelsByName.INFO, data))
+
+    def test_follows_across_rollovers(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        handler = self._makeHandler()
+        self.addCleanup(handler.close)
+        self._emit(handler, b'abc')
+        producer = self._makeOne(request, self.filename, 1)
+        self.assertEqual(producer.more(), b'bc')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        self._emit(handler, b'de')
+        self.assertEqual(producer.more(), b'de')
+        self._emit(handler, b'fgh') # rolled over
+        self._emit(handler, b'ij')
+        self.assertEqual(producer.more(), b'fghij')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        self._emit(handler, b'k')
+        self.assertEqual(producer.more(), b'k')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+
+    def test_starts_at_first_kept_byte(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        handler = self._makeHandler()
+        self.addCleanup(handler.close)
+        for data in (b'abcdef', b'ghijkl', b'mnopqr', b'st'):
+            self._emit(handler, data)
+        producer = self._makeOne(request, self.filename, 0)
+        self.assertEqual(producer.pos, 6)
+        self.assertEqual(producer.more(), b'ghijklmnopqrst')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+
+    def test_span_looked_for_once_per_rollover(self):
+        from supervisor import loggers
+        request = DummyRequest('/logtail/foo', None, None, None)
+        handler = self._makeHandler()
+        self.addCleanup(handler.close)
+        for data in (b'abcdef', b'gh'):
+            self._emit(handler, data)
+        calls = []
+        original = loggers.get_log_span
+        def get_log_span(filename):
+            calls.append(filename)
+            return original(filename)
+        loggers.get_log_span = get_log_span
+        try:
+            producer = self._makeOne(request, self.filename, 0)
+            producer.chunk = 1
+            for expected in (b'a', b'b', b'c', b'd', b'e', b'f', b'g'):
+                self.assertEqual(producer.more(), expected)
+            self.assertEqual(len(calls), 1)
+            self._emit(handler, b'ijkl') # rolled over
+            self.assertEqual(producer.more(), b'h')
+            self.assertEqual(len(calls), 2)
+            for expected in (b'i', b'j', b'k', b'l'):
+                self.assertEqual(producer.more(), expected)
+            self.assertEqual(len(calls), 2)
+        finally:
+            loggers.get_log_span = original
+
+    def test_file_truncated(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        with open(self.filename, 'wb') as f:
+            f.write(b'abc')
+        producer = self._makeOne(request, self.filename, 0)
+        self.assertEqual(producer.more(), b'abc')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        with open(self.filename, 'wb') as f:
+            f.write(b'd')
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        self.assertEqual(producer.pos, 1)
+
+class OutputTailProducerTests(unittest.TestCase):
+    def _getTargetClass(self):
+        from supervisor.http import output_tail_producer
+        return output_tail_producer
+
+    def _makeOne(self, request, tail, head):
+        return self._getTargetClass()(request, tail, head)
+
+    def _makeTail(self, maxbytes):
+        from supervisor.dispatchers import OutputTail
+        return OutputTail(maxbytes)
+
+    def test_handle_more(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        tail = self._makeTail(100)
+        tail.write(b'a' * 80)
+        producer = self._makeOne(request, tail, 10)
+        self.assertEqual(producer.more(), b'a' * 10)
+        tail.write(b'w' * 50)
+        self.assertEqual(producer.more(), b'w' * 50)
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+
+    def test_handle_more_fell_behind(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        tail = self._makeTail(10)
+        producer = self._makeOne(request, tail, 10)
+        tail.write(b'abcdefghijklmnop')
+        self.assertEqual(producer.more(), b'ghijklmnop')
+
+    def test_handle_more_tail_cleared(self):
+        request = DummyRequest('/logtail/foo', None, None, None)
+        tail = self._makeTail(10)
+        tail.write(b'abc')
+        producer = self._makeOne(request, tail, 10)
+        self.assertEqual(producer.more(), b'abc')
+        tail.clear()
+        self.assertEqual(producer.more(), NOT_DONE_YET)
+        tail.write(b'def')
+        self.assertEqual(producer.more(), b'def')
+
 class DeferringChunkedProducerTests(unittest.TestCase):
     def _getTargetClass(self):
         from supervisor.http import deferring_chunked_producer
@@ -469,6 +816,34 @@ class DeferringHttpChannelTests(unittest.TestCase):
         self.assertTrue(channel.writable(now=later))
         self.assertEqual(channel.last_writable_check, later)
 
+    def test_get_deadline_without_delay_is_None(self):
+        channel = self._makeOne()
+        self.assertEqual(channel.get_deadline(), None)
+
+    def test_get_deadline_with_delay(self):
+        channel = self._makeOne()
+        channel.delay = 2
+        channel.last_writable_check = _NOW
+        self.assertEqual(channel.get_deadline(), _NOW + 2)
+
+    def test_sleep_until_woken(self):
+        channel = self._makeOne()
+        channel.delay = 2
+        channel.last_writable_check = _NOW
+        channel.sleep()
+        self.assertEqual(channel.get_deadline(), None)
+        self.assertFalse(channel.writable(now=_NOW + 3))
+        channel.wake()
+        self.assertTrue(channel.writable(now=_NOW + 3))
+
+    def test_sleep_with_output_left(self):
+        channel = self._makeOne()
+        channel.delay = 2
+        channel.last_writable_check = _NOW
+        channel.ac_out_buffer = b'abc'
+        channel.sleep()
+        self.assertTrue(channel.writable(now=_NOW + 3))
+
     def test_writable_with_delay_is_True_if_system_time_goes_backwards(self):
         channel = self._makeOne()
         channel.delay = 2
@@ -637,6 +1012,7 @@ class TopLevelFunctionTests(unittest.TestCase):
         idents = [
             'Supervisor XML-RPC Handler',
             'Logtail HTTP Request Handler',
+            'Log Search HTTP Request Handler',
             'Main Logtail HTTP Request Handler',
             'Supervisor Web UI HTTP Request Handler',
             'Default HTTP Request Handler'
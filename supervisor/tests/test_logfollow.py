@@ -0,0 +1,198 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+class DummySubscriber:
+    def __init__(self):
+        self.data = []
+
+    def push(self, data):
+        self.data.append(data)
+
+def _inotify_available():
+    from supervisor.logfollow import Inotify
+    try:
+        Inotify().close()
+    except OSError:
+        return False
+    return True
+
+class LogFollowerTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'foo.log')
+        self._write(b'abcdef')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _write(self, data, mode='ab'):
+        with open(self.filename, mode) as f:
+            f.write(data)
+
+    def _makeFollowers(self, inotify=False):
+        from supervisor.logfollow import LogFollowers
+        followers = LogFollowers(map={}, inotify=inotify)
+        self.addCleanup(followers.close)
+        return followers
+
+    def test_follow_head(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 4)
+        self.assertEqual(subscriber.data, [b'cdef'])
+        self.assertEqual(follower.pos, 6)
+        self.assertFalse(follower.watched)
+
+    def test_follow_shares_follower(self):
+        followers = self._makeFollowers()
+        one, two = DummySubscriber(), DummySubscriber()
+        follower = followers.follow(self.filename, one, 0)
+        self.assertTrue(followers.follow(self.filename, two, 0) is follower)
+        self._write(b'gh')
+        follower.check()
+        self.assertEqual(one.data, [b'gh'])
+        self.assertEqual(two.data, [b'gh'])
+
+    def test_poll_interval(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        follower.poll(100)
+        self._write(b'gh')
+        follower.poll(100.05)
+        self.assertEqual(subscriber.data, [])
+        follower.poll(100.2)
+        self.assertEqual(subscriber.data, [b'gh'])
+        self._write(b'ij')
+        follower.poll(50) # the clock went back
+        self.assertEqual(subscriber.data, [b'gh', b'ij'])
+
+    def test_check_truncated(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        self._write(b'xy', 'wb')
+        follower.check()
+        self.assertEqual(subscriber.data, [b'==> File truncated <==\n', b'xy'])
+
+    def test_check_rotated(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        self._write(b'gh')
+        os.rename(self.filename, self.filename + '.1')
+        follower.check()
+        self.assertEqual(subscriber.data, [b'gh'])
+        self._write(b'new')
+        follower.check()
+        self.assertEqual(subscriber.data, [b'gh', b'new'])
+        self.assertEqual(follower.pos, 3)
+
+    def test_check_removed(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        os.remove(self.filename)
+        follower.check()
+        self.assertEqual(subscriber.data, [])
+        self.assertFalse(follower.file is None)
+
+    def test_unsubscribe_last_removes_follower(self):
+        followers = self._makeFollowers()
+        one, two = DummySubscriber(), DummySubscriber()
+        follower = followers.follow(self.filename, one, 0)
+        followers.follow(self.filename, two, 0)
+        follower.unsubscribe(one)
+        self.assertEqual(list(followers.followers.keys()), [self.filename])
+        follower.unsubscribe(two)
+        self.assertEqual(followers.followers, {})
+        self.assertEqual(follower.file, None)
+
+    def test_subscribers_are_weak(self):
+        followers = self._makeFollowers()
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        del subscriber
+        self._write(b'gh')
+        follower.check()
+        self.assertEqual(len(follower.subscribers), 0)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'Linux only')
+    def test_inotify(self):
+        if not _inotify_available():
+            self.skipTest('inotify is not available')
+        map = {}
+        from supervisor.logfollow import LogFollowers
+        followers = LogFollowers(map=map)
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        self.assertTrue(follower.watched)
+        self.assertEqual(list(map.keys()), [followers.inotify.fd])
+        follower.poll() # does nothing, inotify tells us
+        self._write(b'gh')
+        followers.handle_events()
+        self.assertEqual(subscriber.data, [b'gh'])
+        # rotated and created again
+        os.rename(self.filename, self.filename + '.1')
+        self._write(b'new')
+        followers.handle_events()
+        self.assertEqual(subscriber.data, [b'gh', b'new'])
+        self._write(b'er')
+        followers.handle_events()
+        self.assertEqual(subscriber.data, [b'gh', b'new', b'er'])
+        # a file in the same directory that nobody follows
+        with open(os.path.join(self.basedir, 'bar.log'), 'wb') as f:
+            f.write(b'bar')
+        followers.handle_events()
+        self.assertEqual(len(subscriber.data), 3)
+        follower.unsubscribe(subscriber)
+        self.assertEqual(map, {})
+        self.assertEqual(followers.inotify, None)
+
+    def test_inotify_unavailable(self):
+        followers = self._makeFollowers(inotify=True)
+        followers.use_inotify = False
+        subscriber = DummySubscriber()
+        follower = followers.follow(self.filename, subscriber, 0)
+        self.assertFalse(follower.watched)
+        self.assertEqual(followers.dispatcher, None)
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'Linux only')
+class InotifyTests(unittest.TestCase):
+    def setUp(self):
+        if not _inotify_available():
+            self.skipTest('inotify is not available')
+        self.basedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self):
+        from supervisor.logfollow import Inotify
+        inotify = Inotify()
+        self.addCleanup(inotify.close)
+        return inotify
+
+    def test_read(self):
+        from supervisor.logfollow import IN_CREATE
+        from supervisor.logfollow import IN_MODIFY
+        inotify = self._makeOne()
+        self.assertEqual(inotify.read(), [])
+        wd = inotify.add_watch(self.basedir, IN_CREATE)
+        with open(os.path.join(self.basedir, 'foo.log'), 'wb') as f:
+            f.write(b'abc')
+        self.assertEqual(inotify.read(), [(wd, IN_CREATE, b'foo.log')])
+        fwd = inotify.add_watch(os.path.join(self.basedir, 'foo.log'),
+                                IN_MODIFY)
+        with open(os.path.join(self.basedir, 'foo.log'), 'ab') as f:
+            f.write(b'def')
+        self.assertEqual(inotify.read(), [(fwd, IN_MODIFY, b'')])
+
+    def test_add_watch_missing(self):
+        from supervisor.logfollow import IN_MODIFY
+        inotify = self._makeOne()
+        self.assertRaises(OSError, inotify.add_watch,
+                          os.path.join(self.basedir, 'nope'), IN_MODIFY)
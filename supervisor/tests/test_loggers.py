@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 import errno
 import sys
+import time
 import unittest
 import tempfile
 import shutil
 import os
+import gzip
 import syslog
 
 from supervisor.compat import PY2
 from supervisor.compat import as_string
 from supervisor.compat import StringIO
 from supervisor.compat import unicode
+from supervisor.compat import lzma
 
 from supervisor.tests.base import mock
 from supervisor.tests.base import DummyStream
@@ -205,6 +208,14 @@ class FileHandlerTests(HandlerTests, unittest.TestCase):
         with open(self.filename, 'rb') as f:
             self.assertEqual(f.read(), b'fi\xc3\xad')
 
+    def test_emit_memoryview(self):
+        handler = self._makeOne(self.filename)
+        record = self._makeLogRecord(memoryview(b'hello!')[1:])
+        handler.emit(record)
+        handler.close()
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'ello!')
+
     def test_emit_error(self):
         handler = self._makeOne(self.filename)
         handler.stream.close()
@@ -221,6 +232,125 @@ class FileHandlerTests(HandlerTests, unittest.TestCase):
         self.assertTrue(dummy_stderr.written.endswith(b'OSError\n'),
                         dummy_stderr.written)
 
+    def _read(self):
+        with open(self.filename, 'rb') as f:
+            return f.read()
+
+    def test_emit_buffered(self):
+        handler = self._makeOne(self.filename, buffersize=100)
+        handler.emit(self._makeLogRecord(b'hello!'))
+        self.assertEqual(self._read(), b'')
+        handler.emit(self._makeLogRecord(b'x' * 100))
+        # the buffer filled up
+        self.assertEqual(self._read(), b'hello!')
+        handler.close()
+        self.assertEqual(self._read(), b'hello!' + b'x' * 100)
+
+    def test_emit_buffered_schedules_flush(self):
+        from supervisor.timers import TimerQueue
+        timers = TimerQueue()
+        handler = self._makeOne(self.filename, buffersize=100, timers=timers,
+                                flushdelay=5)
+        before = time.time()
+        handler.emit(self._makeLogRecord(b'hello!'))
+        deadline = timers.get_deadline(handler)
+        self.assertTrue(before + 5 <= deadline <= time.time() + 5)
+        # later records don't push the flush back
+        handler.emit(self._makeLogRecord(b'hello!'))
+        self.assertEqual(timers.get_deadline(handler), deadline)
+        self.assertEqual(timers.pop_expired(deadline), [handler])
+        handler.transition()
+        self.assertEqual(self._read(), b'hello!hello!')
+        handler.close()
+
+    def test_close_buffered_cancels_flush(self):
+        from supervisor.timers import TimerQueue
+        timers = TimerQueue()
+        handler = self._makeOne(self.filename, buffersize=100, timers=timers)
+        handler.emit(self._makeLogRecord(b'hello!'))
+        handler.close()
+        self.assertEqual(timers.get_deadline(handler), None)
+        self.assertEqual(self._read(), b'hello!')
+        handler.flush() # does not raise once closed
+
+    def test_reopen_buffered_flushes(self):
+        handler = self._makeOne(self.filename, buffersize=100)
+        handler.emit(self._makeLogRecord(b'hello!'))
+        handler.reopen()
+        self.assertEqual(self._read(), b'hello!')
+        handler.emit(self._makeLogRecord(b'again'))
+        self.assertEqual(self._read(), b'hello!')
+        handler.close()
+        self.assertEqual(self._read(), b'hello!again')
+
+    if hasattr(os, 'splice'):
+        def _makePipe(self, data):
+            r, w = os.pipe()
+            os.write(w, data)
+            self.addCleanup(os.close, r)
+            self.addCleanup(os.close, w)
+            return r, w
+
+        def test_splice_appends_to_file(self):
+            handler = self._makeOne(self.filename)
+            handler.emit(self._makeLogRecord(b'hello '))
+            r, w = self._makePipe(b'world')
+            self.assertEqual(handler.splice(r, 100), 5)
+            handler.emit(self._makeLogRecord(b'!'))
+            handler.close()
+            with open(self.filename, 'rb') as f:
+                self.assertEqual(f.read(), b'hello world!')
+
+        def test_splice_empty_pipe(self):
+            handler = self._makeOne(self.filename)
+            r, w = self._makePipe(b'')
+            try:
+                handler.splice(r, 100)
+            except OSError as why:
+                self.assertEqual(why.args[0], errno.EAGAIN)
+            else:
+                self.fail('splice() should raise EAGAIN')
+            handler.close()
+
+        def test_splice_pipe_closed(self):
+            handler = self._makeOne(self.filename)
+            r, w = os.pipe()
+            os.close(w)
+            try:
+                self.assertEqual(handler.splice(r, 100), 0)
+            finally:
+                os.close(r)
+            handler.close()
+
+        def test_splice_after_logfile_removed(self):
+            handler = self._makeOne(self.filename)
+            os.unlink(self.filename)
+            r, w = self._makePipe(b'abc')
+            self.assertEqual(handler.splice(r, 100), 3)
+            handler.close()
+            self.assertFalse(os.path.exists(self.filename))
+
+        def test_close_closes_splice_fd(self):
+            handler = self._makeOne(self.filename)
+            r, w = self._makePipe(b'abc')
+            handler.splice(r, 100)
+            fd = handler._splice_fd
+            handler.close()
+            self.assertEqual(handler._splice_fd, None)
+            self.assertRaises(OSError, os.fstat, fd)
+
+        def test_reopen_closes_splice_fd(self):
+            handler = self._makeOne(self.filename)
+            r, w = self._makePipe(b'abc')
+            handler.splice(r, 100)
+            handler.reopen()
+            self.assertEqual(handler._splice_fd, None)
+            os.write(w, b'def')
+            handler.splice(r, 100)
+            handler.close()
+            with open(self.filename, 'rb') as f:
+                self.assertEqual(f.read(), b'abcdef')
+
 if os.path.exists('/dev/stdout'):
     StdoutTestsBase = FileHandlerTests
 else:
@@ -292,6 +422,47 @@ class RotatingFileHandlerTests(FileHandlerTests):
         with open(self.filename+'.2', 'rb') as f:
             self.assertEqual(f.read(), b'a' * 12)
 
+    def test_rollover_does_not_record_offsets(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        record = self._makeLogRecord(b'a' * 4)
+        for i in range(9):
+            handler.emit(record)
+        handler.remove()
+        self.assertFalse(os.path.exists(self.filename + '.offsets'))
+
+    def test_rollover_records_offsets_if_asked(self):
+        from supervisor.loggers import LogOffsets
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1,
+                                offsets=True)
+        record = self._makeLogRecord(b'a' * 4)
+        for i in range(9): # 3 rollovers of 12 bytes
+            handler.emit(record)
+        self.assertFalse(os.path.exists(self.filename + '.offsets.tmp'))
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 36)
+        self.assertEqual(offsets.backups, [(24, 12)])
+        handler.remove()
+        self.assertEqual(LogOffsets(self.filename).start, 36)
+
+    def test_resumed_read_past_backupCount(self):
+        from supervisor.loggers import get_log_span
+        from supervisor.loggers import read_log_span
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1,
+                                offsets=True)
+        written = []
+        pos = 0
+        for data in (b'111111', b'222222', b'333333', b'444444',
+                     b'555555', b'666666'):
+            handler.emit(self._makeLogRecord(data))
+            written.append(data)
+            chunk, offset, end = read_log_span(get_log_span(self.filename),
+                                               pos, 1000)
+            self.assertEqual(offset, pos)
+            self.assertEqual(chunk, data)
+            self.assertEqual(end, 6 * len(written))
+            pos = offset + len(chunk)
+        handler.close()
+
     def test_current_logfile_removed(self):
         handler = self._makeOne(self.filename, maxBytes=6, backupCount=1)
         record = self._makeLogRecord(b'a' * 4)
@@ -372,12 +543,971 @@ class RotatingFileHandlerTests(FileHandlerTests):
         self.assertRaises(OSError, inst.removeAndRename, 'foo', 'bar')
         inst.close()
 
+    def test_emit_buffered_does_rollover(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1,
+                                buffersize=100)
+        record = self._makeLogRecord(b'a' * 4)
+        handler.emit(record)
+        handler.emit(record)
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+        handler.emit(record) # 12 bytes, do rollover
+        handler.emit(record)
+        handler.close()
+        with open(self.filename + '.1', 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 12)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 4)
+
+    def test_size_counts_existing_file(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'a' * 8)
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1)
+        self.assertEqual(handler.size, 8)
+        handler.emit(self._makeLogRecord(b'a' * 4)) # 12 bytes, do rollover
+        handler.close()
+        self.assertTrue(os.path.exists(self.filename + '.1'))
+        self.assertEqual(handler.size, 0)
+
     def test_doRollover_maxbytes_lte_zero(self):
         inst = self._makeOne(self.filename)
         inst.maxBytes = 0
         self.assertEqual(inst.doRollover(), None)
         inst.close()
 
+    if hasattr(os, 'splice'):
+        def test_splice_does_rollover_at_maxbytes(self):
+            handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+            r, w = self._makePipe(b'a' * 4)
+            self.assertEqual(handler.splice(r, 100), 4)
+            self.assertFalse(os.path.exists(self.filename + '.1'))
+
+            os.write(w, b'b' * 10)
+            # only up to maxBytes, then roll over
+            self.assertEqual(handler.splice(r, 100), 6)
+            self.assertTrue(os.path.exists(self.filename + '.1'))
+            self.assertFalse(os.path.exists(self.filename + '.2'))
+
+            self.assertEqual(handler.splice(r, 100), 4)
+            handler.close()
+            with open(self.filename, 'rb') as f:
+                self.assertEqual(f.read(), b'b' * 4)
+            with open(self.filename + '.1', 'rb') as f:
+                self.assertEqual(f.read(), b'a' * 4 + b'b' * 6)
+
+        def test_splice_no_maxbytes(self):
+            handler = self._makeOne(self.filename, maxBytes=0)
+            r, w = self._makePipe(b'a' * 20)
+            self.assertEqual(handler.splice(r, 100), 20)
+            handler.close()
+            self.assertFalse(os.path.exists(self.filename + '.1'))
+
+class SegmentedFileHandlerTests(HandlerTests, unittest.TestCase):
+
+    def _getTargetClass(self):
+        from supervisor.loggers import SegmentedFileHandler
+        return SegmentedFileHandler
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def _segment(self, number):
+        return '%s.%06d' % (self.filename, number)
+
+    def test_rollover_records_offsets(self):
+        from supervisor.loggers import LogOffsets
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        record = self._makeLogRecord(b'a' * 4)
+        for i in range(9): # 3 rollovers of 12 bytes
+            handler.emit(record)
+        handler.close()
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 36)
+        self.assertEqual(offsets.backups, [(24, 12), (12, 12)])
+
+    def test_rollover_without_backups_records_offsets(self):
+        from supervisor.loggers import LogOffsets
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=0)
+        record = self._makeLogRecord(b'a' * 4)
+        for i in range(3):
+            handler.emit(record)
+        handler.close()
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 12)
+        self.assertEqual(offsets.backups, [])
+
+    def test_rollover_does_not_look_for_backups(self):
+        from supervisor import loggers
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        record = self._makeLogRecord(b'a' * 4)
+        def listdir(path):
+            raise AssertionError('listdir called')
+        original, loggers.os.listdir = loggers.os.listdir, listdir
+        try:
+            for i in range(9):
+                handler.emit(record)
+        finally:
+            loggers.os.listdir = original
+        handler.close()
+        self.assertEqual(handler.offsets.start, 36)
+
+    def test_emit_does_rollover_into_segments(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        for data in (b'a', b'b', b'c', b'd'):
+            handler.emit(self._makeLogRecord(data * 10))
+        handler.emit(self._makeLogRecord(b'e'))
+        handler.close()
+        self.assertEqual(self._read(self.filename), b'e')
+        self.assertFalse(os.path.exists(self._segment(1)))
+        self.assertFalse(os.path.exists(self._segment(2)))
+        self.assertEqual(self._read(self._segment(3)), b'c' * 10)
+        self.assertEqual(self._read(self._segment(4)), b'd' * 10)
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+        with open(self.filename + '.segments') as f:
+            self.assertEqual(f.read().split(),
+                             ['thelog.000003', 'thelog.000004'])
+        self.assertEqual(handler.segments.get_names(),
+                         [self._segment(3), self._segment(4)])
+
+    def test_rollover_renames_once(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1000)
+        renamed = []
+        rename = handler._rename
+        def record(src, tgt):
+            renamed.append((src, tgt))
+            rename(src, tgt)
+        handler._rename = record
+        def fail(fn):
+            raise AssertionError('looked for %s' % fn)
+        handler._exists = fail
+        for i in range(3):
+            handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        self.assertEqual(renamed, [ (self.filename, self._segment(i))
+                                    for i in (1, 2, 3) ])
+
+    def test_numbering_continues_from_manifest(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=5)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=5)
+        handler.emit(self._makeLogRecord(b'b' * 10))
+        handler.close()
+        self.assertEqual(self._read(self._segment(1)), b'a' * 10)
+        self.assertEqual(self._read(self._segment(2)), b'b' * 10)
+
+    def test_picks_up_segments_without_manifest(self):
+        for name in (self._segment(7), self._segment(12),
+                     self.filename + '.1', self.filename + '.000003.gz',
+                     self.filename + '.000005.bz2',
+                     os.path.join(self.basedir, 'other.000099')):
+            with open(name, 'wb') as f:
+                f.write(b'x')
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        self.assertEqual(handler.segments.numbers, [3, 7, 12])
+        self.assertEqual(handler.segments.path(3),
+                         self.filename + '.000003.gz')
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        self.assertFalse(os.path.exists(self.filename + '.000003.gz'))
+        self.assertFalse(os.path.exists(self._segment(7)))
+        self.assertTrue(os.path.exists(self._segment(12)))
+        self.assertTrue(os.path.exists(self._segment(13)))
+        # backups of the rename scheme are left alone
+        self.assertTrue(os.path.exists(self.filename + '.1'))
+
+    def test_no_backups(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=0)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.emit(self._makeLogRecord(b'b'))
+        handler.close()
+        self.assertEqual(self._read(self.filename), b'b')
+        self.assertFalse(os.path.exists(self._segment(1)))
+        self.assertFalse(os.path.exists(self.filename + '.segments'))
+
+    def test_rollover_file_removed(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        os.remove(self.filename)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        self.assertEqual(handler.segments.numbers, [])
+        self.assertEqual(self._read(self.filename), b'')
+
+    def test_rollover_rename_fails(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2)
+        def raiser(src, tgt):
+            raise OSError(errno.EACCES, 'Permission denied')
+        handler._rename = raiser
+        self.assertRaises(OSError, handler._backup)
+        handler.close()
+
+    def test_handle_file(self):
+        from supervisor import loggers
+        logger = loggers.getLogger()
+        loggers.handle_file(logger, self.filename, '%(message)s',
+                            rotating=True, maxbytes=10, backups=1,
+                            rotation='segments')
+        handler = logger.handlers[0]
+        self.assertEqual(handler.__class__, self._getTargetClass())
+        logger.close()
+
+    def test_handle_file_compress(self):
+        from supervisor import loggers
+        compressor = DummyCompressor()
+        logger = loggers.getLogger()
+        loggers.handle_file(logger, self.filename, '%(message)s',
+                            rotating=True, maxbytes=10, backups=1,
+                            rotation='segments', compress='gzip',
+                            compressor=compressor, backups_maxbytes=100)
+        handler = logger.handlers[0]
+        self.assertEqual(handler.compress, 'gzip')
+        self.assertEqual(handler.compressor, compressor)
+        self.assertEqual(handler.backupsMaxBytes, 100)
+        logger.close()
+
+    def test_rollover_compresses_segment(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2,
+                                compress='gzip')
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.emit(self._makeLogRecord(b'b'))
+        handler.close()
+        self.assertFalse(os.path.exists(self._segment(1)))
+        with gzip.GzipFile(self._segment(1) + '.gz', 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+        self.assertEqual(handler.segments.get_names(),
+                         [self._segment(1) + '.gz'])
+        with open(self.filename + '.segments') as f:
+            self.assertEqual(f.read().split(), ['thelog.000001.gz'])
+
+    def test_rollover_queues_segment_with_compressor(self):
+        compressor = DummyCompressor()
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=2,
+                                compress='gzip', compressor=compressor,
+                                backupsMaxBytes=100)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        self.assertEqual(compressor.jobs,
+                         [(handler.segments, 1, 'gzip', 2, 100)])
+        self.assertEqual(handler.segments.pending, set([1]))
+        self.assertEqual(self._read(self._segment(1)), b'a' * 10)
+
+    def test_compresses_segments_left_uncompressed(self):
+        for number in (1, 2):
+            with open(self._segment(number), 'wb') as f:
+                f.write(b'x')
+        with open(self._segment(3) + '.gz', 'wb') as f:
+            f.write(b'x')
+        compressor = DummyCompressor()
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=5,
+                                compress='gzip', compressor=compressor)
+        handler.close()
+        self.assertEqual([ job[1] for job in compressor.jobs ], [1, 2])
+
+    def test_rollover_removes_segments_beyond_maxbytes(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=5,
+                                backupsMaxBytes=25)
+        for data in (b'a', b'b', b'c', b'd'):
+            handler.emit(self._makeLogRecord(data * 10))
+        handler.close()
+        self.assertEqual(handler.segments.numbers, [3, 4])
+        self.assertFalse(os.path.exists(self._segment(2)))
+        self.assertEqual(handler.segments.get_size(), 20)
+
+    def test_index_notes_records(self):
+        handler = self._makeOne(self.filename, maxBytes=100, backupCount=2,
+                                index=True)
+        handler.index.interval_bytes = 10
+        handler.index.interval_seconds = 3600
+        for data in (b'a' * 6, b'b' * 6, b'c' * 6):
+            handler.emit(self._makeLogRecord(data))
+        handler.close()
+        from supervisor.loggers import read_time_index
+        entries = read_time_index(self.filename + '.idx')
+        self.assertEqual([ offset for t, offset in entries ], [0, 12])
+        self.assertTrue(entries[0][0] <= entries[1][0])
+
+    def test_index_goes_along_with_segment(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=1,
+                                index=True)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.emit(self._makeLogRecord(b'b' * 10))
+        handler.emit(self._makeLogRecord(b'c'))
+        handler.close()
+        from supervisor.loggers import read_time_index
+        self.assertFalse(os.path.exists(self._segment(1) + '.idx'))
+        self.assertEqual([ e[1] for e in read_time_index(
+            self._segment(2) + '.idx') ], [0])
+        self.assertEqual([ e[1] for e in read_time_index(
+            self.filename + '.idx') ], [0])
+
+    def test_index_continues_after_reopen(self):
+        handler = self._makeOne(self.filename, maxBytes=100, backupCount=1,
+                                index=True)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.close()
+        handler = self._makeOne(self.filename, maxBytes=100, backupCount=1,
+                                index=True)
+        handler.index.interval_seconds = 0
+        handler.emit(self._makeLogRecord(b'b' * 10))
+        handler.close()
+        from supervisor.loggers import read_time_index
+        self.assertEqual([ e[1] for e in read_time_index(
+            self.filename + '.idx') ], [0, 10])
+
+    def test_index_without_backups_starts_over(self):
+        handler = self._makeOne(self.filename, maxBytes=10, backupCount=0,
+                                index=True)
+        handler.emit(self._makeLogRecord(b'a' * 10))
+        handler.emit(self._makeLogRecord(b'b'))
+        handler.close()
+        from supervisor.loggers import read_time_index
+        self.assertEqual(len(read_time_index(self.filename + '.idx')), 1)
+
+    def test_index_removed_with_log(self):
+        handler = self._makeOne(self.filename, maxBytes=100, backupCount=1,
+                                index=True)
+        handler.emit(self._makeLogRecord(b'a'))
+        handler.remove()
+        self.assertFalse(os.path.exists(self.filename + '.idx'))
+        handler.reopen()
+        handler.emit(self._makeLogRecord(b'b'))
+        handler.close()
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+
+    def test_handle_file_index(self):
+        from supervisor import loggers
+        logger = loggers.getLogger()
+        loggers.handle_file(logger, self.filename, '%(message)s',
+                            index=True)
+        handler = logger.handlers[0]
+        self.assertEqual(handler.__class__, self._getTargetClass())
+        self.assertEqual(handler.maxBytes, 0)
+        self.assertEqual(handler.index.filename, self.filename + '.idx')
+        logger.close()
+
+    def test_handle_file_index_without_maxbytes_writes_bytes(self):
+        from supervisor import loggers
+        logger = loggers.getLogger()
+        loggers.handle_file(logger, self.filename, '%(message)s',
+                            rotation='segments', maxbytes=0, index=True)
+        handler = logger.handlers[0]
+        handler.emit(self._makeLogRecord(b'hello\n'))
+        logger.close()
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), b'hello\n')
+
+class LogOffsetsTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self):
+        from supervisor.loggers import LogOffsets
+        return LogOffsets(self.filename)
+
+    def _write(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def test_no_record_no_backups(self):
+        offsets = self._makeOne()
+        self.assertEqual(offsets.start, 0)
+        self.assertEqual(offsets.backups, [])
+
+    def test_no_record_backups_come_first(self):
+        self._write(self.filename + '.1', b'bb')
+        self._write(self.filename + '.2', b'aaa')
+        offsets = self._makeOne()
+        self.assertEqual(offsets.start, 5)
+        self.assertEqual(offsets.backups, [(3, 2), (0, 3)])
+
+    def test_no_record_compressed_backups(self):
+        with gzip.GzipFile(self.filename + '.000001.gz', 'wb') as f:
+            f.write(b'a' * 100)
+        offsets = self._makeOne()
+        self.assertEqual(offsets.start, 100)
+        self.assertEqual(offsets.backups, [(0, 100)])
+
+    def test_rolled_and_cleared(self):
+        offsets = self._makeOne()
+        offsets.rolled(10, 1)
+        offsets.rolled(5, 2)
+        offsets.cleared(3)
+        offsets.rolled(4, 2, 2)
+        offsets = self._makeOne()
+        self.assertEqual(offsets.start, 22)
+        self.assertEqual(offsets.backups, [(18, 2), (10, 5)])
+        with open(self.filename + '.offsets') as f:
+            self.assertEqual(f.read(), '22\n18 2\n10 5\n')
+
+    def test_rolled_without_backups(self):
+        offsets = self._makeOne()
+        offsets.rolled(10, 1)
+        offsets.rolled(5, 0)
+        self.assertEqual(offsets.start, 15)
+        self.assertEqual(offsets.backups, [])
+
+    def test_bad_record_ignored(self):
+        self._write(self.filename + '.1', b'aaa')
+        with open(self.filename + '.offsets', 'w') as f:
+            f.write('12\n3\n')
+        offsets = self._makeOne()
+        self.assertEqual(offsets.start, 3)
+        self.assertEqual(offsets.backups, [(0, 3)])
+
+class LogSpanTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _write(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def _record(self, text):
+        with open(self.filename + '.offsets', 'w') as f:
+            f.write(text)
+
+    def _getSpan(self):
+        from supervisor.loggers import get_log_span
+        return get_log_span(self.filename)
+
+    def _read(self, offset, length=1000):
+        from supervisor.loggers import read_log_span
+        return read_log_span(self._getSpan(), offset, length)
+
+    def _makeSegments(self):
+        # 'aaa' at 100, 'bbb' (compressed) at 103, 'cc' at 106
+        self._write(self.filename + '.000001', b'aaa')
+        with gzip.GzipFile(self.filename + '.000002.gz', 'wb') as f:
+            f.write(b'bbb')
+        self._write(self.filename, b'cc')
+        self._record('106\n103 3\n100 3\n')
+
+    def test_get_log_span(self):
+        self._makeSegments()
+        self.assertEqual(self._getSpan(),
+                         [(self.filename + '.000001', 100, 3),
+                          (self.filename + '.000002.gz', 103, 3),
+                          (self.filename, 106, 2)])
+
+    def test_get_log_span_no_file(self):
+        self.assertEqual(self._getSpan(), [(self.filename, 0, 0)])
+
+    def test_get_log_span_leaves_out_backups_not_recorded(self):
+        self._write(self.filename + '.1', b'bb')
+        self._write(self.filename + '.2', b'aaa')
+        self._write(self.filename, b'c')
+        self._record('12\n10 2\n')
+        self.assertEqual(self._getSpan(),
+                         [(self.filename + '.1', 10, 2),
+                          (self.filename, 12, 1)])
+
+    def test_read_across_backups(self):
+        self._makeSegments()
+        self.assertEqual(self._read(101), (b'aabbbcc', 101, 108))
+        self.assertEqual(self._read(101, 4), (b'aabb', 101, 108))
+        self.assertEqual(self._read(104, 3), (b'bbc', 104, 108))
+
+    def test_read_negative_offset(self):
+        self._makeSegments()
+        self.assertEqual(self._read(-3), (b'bcc', 105, 108))
+        self.assertEqual(self._read(-1000), (b'aaabbbcc', 100, 108))
+
+    def test_read_before_kept(self):
+        self._makeSegments()
+        self.assertEqual(self._read(0, 2), (b'aa', 100, 108))
+
+    def test_read_at_and_past_end(self):
+        self._makeSegments()
+        self.assertEqual(self._read(108), (b'', 108, 108))
+        self.assertEqual(self._read(200), (b'', 108, 108))
+
+    def test_read_stops_at_gap(self):
+        # the bytes from 105 to 110 were cleared
+        self._write(self.filename + '.1', b'aaaaa')
+        self._write(self.filename, b'bb')
+        self._record('110\n100 5\n')
+        self.assertEqual(self._read(102), (b'aaa', 102, 112))
+        self.assertEqual(self._read(105), (b'bb', 110, 112))
+
+    def test_read_skips_unreadable_backup(self):
+        self._makeSegments()
+        with open(self.filename + '.000002.gz', 'wb') as f:
+            f.write(b'not gzip')
+        self.assertEqual(self._read(101), (b'aa', 101, 108))
+        self.assertEqual(self._read(103), (b'cc', 106, 108))
+
+    def test_find_span_offset(self):
+        from supervisor.loggers import find_span_offset
+        self._makeSegments()
+        files = self._getSpan()
+        self.assertEqual(find_span_offset(files, 0), 100)
+        self.assertEqual(find_span_offset(files, 104), 104)
+        self.assertEqual(find_span_offset(files, -2), 106)
+        self.assertEqual(find_span_offset(files, 500), 108)
+
+    def test_rollovers_keep_offsets(self):
+        from supervisor.loggers import SegmentedFileHandler
+        from supervisor.loggers import LogRecord
+        from supervisor.loggers import LevelsByName
+        handler = SegmentedFileHandler(self.filename, maxBytes=5,
+                                       backupCount=3)
+        for data in (b'abcde', b'fghij', b'klm'):
+            handler.emit(LogRecord(LevelsByName.INFO, data))
+        handler.close()
+        self.assertEqual(self._read(3), (b'defghijklm', 3, 13))
+        # fewer backups are kept from now on
+        handler = SegmentedFileHandler(self.filename, maxBytes=5,
+                                       backupCount=1)
+        handler.emit(LogRecord(LevelsByName.INFO, b'no'))
+        handler.emit(LogRecord(LevelsByName.INFO, b'pq'))
+        self.assertEqual(self._read(0), (b'klmnopq', 10, 17))
+        handler.remove()
+        handler.close()
+        # what was cleared keeps its offsets
+        self.assertEqual(self._read(0), (b'klmno', 10, 17))
+
+class LogSegmentsTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self):
+        from supervisor.loggers import LogSegments
+        return LogSegments(self.filename)
+
+    def _add(self, segments, data, backups=10, maxbytes=0, compress=False):
+        with open(segments.next_name(), 'wb') as f:
+            f.write(data)
+        return segments.added(backups, maxbytes, compress)
+
+    def test_added_returns_number(self):
+        segments = self._makeOne()
+        self.assertEqual(self._add(segments, b'a'), 1)
+        self.assertEqual(self._add(segments, b'bb'), 2)
+        self.assertEqual(segments.sizes, {1: 1, 2: 2})
+
+    def test_pending_segments_are_not_counted_against_maxbytes(self):
+        segments = self._makeOne()
+        self._add(segments, b'a' * 10, maxbytes=15)
+        self._add(segments, b'b' * 10, maxbytes=15, compress=True)
+        self.assertEqual(segments.numbers, [1, 2])
+        self._add(segments, b'c' * 10, maxbytes=15)
+        self.assertEqual(segments.numbers, [2, 3])
+
+    def test_compress_gzip(self):
+        segments = self._makeOne()
+        number = self._add(segments, b'a' * 1000, compress=True)
+        name = segments.compress(number, 'gzip', 10)
+        self.assertEqual(name, self.filename + '.000001.gz')
+        self.assertFalse(os.path.exists(self.filename + '.000001'))
+        self.assertFalse(os.path.exists(name + '.tmp'))
+        self.assertEqual(segments.pending, set())
+        self.assertEqual(segments.sizes[1], os.path.getsize(name))
+        self.assertTrue(segments.sizes[1] < 1000)
+        with gzip.GzipFile(name, 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 1000)
+
+    if lzma is not None:
+        def test_compress_xz(self):
+            segments = self._makeOne()
+            number = self._add(segments, b'a' * 1000, compress=True)
+            name = segments.compress(number, 'xz', 10)
+            self.assertEqual(name, self.filename + '.000001.xz')
+            with lzma.LZMAFile(name, 'rb') as f:
+                self.assertEqual(f.read(), b'a' * 1000)
+
+    def test_compress_prunes_by_compressed_size(self):
+        segments = self._makeOne()
+        self._add(segments, b'a' * 1000)
+        number = self._add(segments, b'b' * 1000, compress=True)
+        self.assertEqual(segments.numbers, [1, 2])
+        segments.compress(number, 'gzip', 10, 1000)
+        self.assertEqual(segments.numbers, [2])
+        self.assertFalse(os.path.exists(self.filename + '.000001'))
+
+    def test_compress_segment_removed_meanwhile(self):
+        segments = self._makeOne()
+        number = self._add(segments, b'a', compress=True)
+        self._add(segments, b'b', backups=1)
+        self.assertEqual(segments.compress(number, 'gzip', 1), None)
+        self.assertEqual(os.listdir(self.basedir),
+                         ['thelog.000002', 'thelog.segments'])
+
+    def test_compress_pruned_while_compressing(self):
+        segments = self._makeOne()
+        number = self._add(segments, b'a', compress=True)
+        from supervisor import loggers
+        def compress_file(src, dst, method):
+            with open(dst, 'wb') as f:
+                f.write(b'compressed')
+            segments.numbers.remove(number)
+        with mock.patch.object(loggers, 'compress_file', compress_file):
+            self.assertEqual(segments.compress(number, 'gzip', 10), None)
+        self.assertFalse(os.path.exists(self.filename + '.000001.gz.tmp'))
+        self.assertFalse(os.path.exists(self.filename + '.000001.gz'))
+
+    def test_compress_adopts_segment_compressed_already(self):
+        segments = self._makeOne()
+        number = self._add(segments, b'a', compress=True)
+        other = self._makeOne()
+        other.compress(number, 'gzip', 10)
+        self.assertEqual(segments.compress(number, 'gzip', 10),
+                         self.filename + '.000001.gz')
+        self.assertEqual(segments.get_names(), [self.filename + '.000001.gz'])
+
+    def test_compress_fails(self):
+        segments = self._makeOne()
+        number = self._add(segments, b'a', compress=True)
+        from supervisor import loggers
+        def compress_file(src, dst, method):
+            with open(dst, 'wb') as f:
+                f.write(b'partial')
+            raise IOError(errno.ENOSPC, 'No space left on device')
+        with mock.patch.object(loggers, 'compress_file', compress_file):
+            self.assertRaises(IOError, segments.compress, number, 'gzip', 10)
+        self.assertEqual(segments.pending, set())
+        self.assertEqual(sorted(os.listdir(self.basedir)),
+                         ['thelog.000001', 'thelog.segments'])
+
+    def test_load_prefers_compressed_segment(self):
+        # supervisord went away after compressing but before the manifest
+        segments = self._makeOne()
+        self._add(segments, b'a')
+        with gzip.GzipFile(self.filename + '.000001.gz', 'wb') as f:
+            f.write(b'a')
+        os.remove(self.filename + '.000001')
+        segments = self._makeOne()
+        self.assertEqual(segments.get_names(), [self.filename + '.000001.gz'])
+
+    def test_load_drops_missing_segments(self):
+        segments = self._makeOne()
+        self._add(segments, b'a')
+        self._add(segments, b'b')
+        os.remove(self.filename + '.000001')
+        segments = self._makeOne()
+        self.assertEqual(segments.numbers, [2])
+
+    def test_prune_removes_index(self):
+        segments = self._makeOne()
+        self._add(segments, b'a')
+        with open(self.filename + '.000001.idx', 'w') as f:
+            f.write('1.0 0\n')
+        self._add(segments, b'b', backups=1)
+        self.assertFalse(os.path.exists(self.filename + '.000001.idx'))
+
+    def test_uncompressed(self):
+        segments = self._makeOne()
+        self._add(segments, b'a')
+        self._add(segments, b'b', compress=True)
+        self._add(segments, b'c')
+        self.assertEqual(segments.uncompressed(), [1, 3])
+        self.assertEqual(segments.pending, set([1, 2, 3]))
+        self.assertEqual(segments.uncompressed(), [])
+
+class TimeIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self):
+        from supervisor.loggers import TimeIndex
+        index = TimeIndex(self.filename)
+        self.addCleanup(index.close)
+        return index
+
+    def _read(self):
+        from supervisor.loggers import read_time_index
+        return read_time_index(self.filename)
+
+    def test_note_before_open_does_nothing(self):
+        index = self._makeOne()
+        index.note(0)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_note_by_bytes_and_seconds(self):
+        index = self._makeOne()
+        index.interval_bytes = 100
+        index.open(0)
+        with mock.patch('time.time', return_value=10.0):
+            index.note(0)
+            index.note(50)
+            index.note(100)
+        with mock.patch('time.time', return_value=12.0):
+            index.note(120)
+            index.note(130)
+        with mock.patch('time.time', return_value=14.0):
+            index.note(120) # nothing written since the last entry
+            index.note(140)
+        self.assertEqual(self._read(),
+                         [(10.0, 0), (10.0, 100), (12.0, 120), (14.0, 140)])
+
+    def test_open_drops_index_of_truncated_file(self):
+        with open(self.filename, 'w') as f:
+            f.write('1.0 0\n2.0 500\n')
+        index = self._makeOne()
+        index.open(100)
+        index.close()
+        self.assertEqual(self._read(), [])
+
+    def test_open_truncate(self):
+        with open(self.filename, 'w') as f:
+            f.write('1.0 0\n')
+        index = self._makeOne()
+        index.open(100, truncate=True)
+        self.assertEqual(index.last_offset, None)
+        index.close()
+        self.assertEqual(self._read(), [])
+
+    def test_open_continues(self):
+        with open(self.filename, 'w') as f:
+            f.write('1.0 0\n2.0 50\n')
+        index = self._makeOne()
+        index.open(100)
+        self.assertEqual((index.last_time, index.last_offset), (2.0, 50))
+
+    def test_read_ignores_bad_lines(self):
+        with open(self.filename, 'w') as f:
+            f.write('1.0 0\ngarbage\n2.0 x\n3.0 30\n4.0 4')
+        self.assertEqual(self._read(), [(1.0, 0), (3.0, 30)])
+
+    def test_rename_and_remove_missing(self):
+        index = self._makeOne()
+        index.rename(self.filename + '.other')
+        index.remove()
+        self.assertEqual(os.listdir(self.basedir), [])
+
+class ReadLogByTimeTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+        # segment 1: 'a' * 10 at 100, 'b' * 10 at 110
+        # segment 2 (compressed): 'c' * 10 at 120, 'd' * 10 at 130
+        # active file: 'e' * 10 at 140
+        self._make(self.filename + '.000001', b'a' * 10 + b'b' * 10,
+                   [(100.0, 0), (110.0, 10)])
+        with gzip.GzipFile(self.filename + '.000002.gz', 'wb') as f:
+            f.write(b'c' * 10 + b'd' * 10)
+        self._make(None, None, [(120.0, 0), (130.0, 10)],
+                   self.filename + '.000002.idx')
+        self._make(self.filename, b'e' * 10, [(140.0, 0)])
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _make(self, filename, data, entries, idx=None):
+        if filename is not None:
+            with open(filename, 'wb') as f:
+                f.write(data)
+        with open(idx or filename + '.idx', 'w') as f:
+            for t, offset in entries:
+                f.write('%f %d\n' % (t, offset))
+
+    def _callFUT(self, start, end, maxbytes=1000):
+        from supervisor.loggers import read_log_by_time
+        return read_log_by_time(self.filename, start, end, maxbytes)
+
+    def test_everything(self):
+        self.assertEqual(self._callFUT(0, 0),
+                         b'aaaaaaaaaabbbbbbbbbbccccccccccddddddddddeeeeeeeeee')
+
+    def test_within_segment(self):
+        self.assertEqual(self._callFUT(111, 112), b'b' * 10)
+
+    def test_spanning_files(self):
+        self.assertEqual(self._callFUT(115, 135), b'b' * 10 + b'c' * 10 +
+                         b'd' * 10)
+
+    def test_open_ended(self):
+        self.assertEqual(self._callFUT(135, 0), b'd' * 10 + b'e' * 10)
+
+    def test_maxbytes(self):
+        self.assertEqual(self._callFUT(105, 0, 15), b'a' * 10 + b'b' * 5)
+
+    def test_after_everything(self):
+        self.assertEqual(self._callFUT(200, 0), b'e' * 10)
+
+    def test_before_everything(self):
+        self.assertEqual(self._callFUT(10, 50), b'')
+
+    def test_skips_files_without_index(self):
+        os.remove(self.filename + '.000002.idx')
+        self.assertEqual(self._callFUT(115, 145), b'b' * 10 + b'e' * 10)
+
+class OpenLogTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _callFUT(self, filename):
+        from supervisor.loggers import open_log
+        return open_log(filename)
+
+    def test_plain(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'hello')
+        with self._callFUT(self.filename) as f:
+            self.assertEqual(f.read(), b'hello')
+
+    def test_gzip(self):
+        with gzip.GzipFile(self.filename + '.gz', 'wb') as f:
+            f.write(b'hello')
+        with self._callFUT(self.filename + '.gz') as f:
+            self.assertEqual(f.read(), b'hello')
+
+    if lzma is not None:
+        def test_xz(self):
+            with lzma.LZMAFile(self.filename + '.xz', 'wb') as f:
+                f.write(b'hello')
+            with self._callFUT(self.filename + '.xz') as f:
+                self.assertEqual(f.read(), b'hello')
+
+class SearchLogSpanTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _callFUT(self, pattern, files, maxline=8192):
+        import re
+        from supervisor.loggers import search_log_span
+        regex = re.compile(pattern, re.MULTILINE)
+        return list(search_log_span(files, regex, maxline))
+
+    def _write(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return (filename, 0, len(data))
+
+    def test_plain(self):
+        files = [self._write(self.filename, b'ok 1\nERROR 2\nok 3\nERROR 4')]
+        self.assertEqual(self._callFUT(b'ERROR', files),
+                         [(5, b'ERROR 2'), (18, b'ERROR 4')])
+
+    def test_one_match_per_line(self):
+        files = [self._write(self.filename, b'a a a\nb\na\n')]
+        self.assertEqual(self._callFUT(b'a', files),
+                         [(0, b'a a a'), (8, b'a')])
+
+    def test_caret_matches_every_line(self):
+        files = [self._write(self.filename, b'x ok\nok x\nok\n')]
+        self.assertEqual(self._callFUT(b'^ok', files),
+                         [(5, b'ok x'), (10, b'ok')])
+
+    def test_offsets_across_files(self):
+        with gzip.GzipFile(self.filename + '.000001.gz', 'wb') as f:
+            f.write(b'hit 1\nmiss\n')
+        files = [(self.filename + '.000001.gz', 100, 11),
+                 (self.filename, 111, 6)]
+        self._write(self.filename, b'hit 2\n')
+        self.assertEqual(self._callFUT(b'hit', files),
+                         [(100, b'hit 1'), (111, b'hit 2')])
+
+    def test_only_the_length_given(self):
+        self._write(self.filename, b'hit 1\nhit 2\n')
+        files = [(self.filename, 0, 6)]
+        self.assertEqual(self._callFUT(b'hit', files), [(0, b'hit 1')])
+
+    def test_long_line_cut_short(self):
+        files = [self._write(self.filename, b'x' * 100 + b'hit\n')]
+        self.assertEqual(self._callFUT(b'hit', files, 10), [(0, b'x' * 10)])
+
+    def test_unreadable_files_skipped(self):
+        with open(self.filename + '.000001.gz', 'wb') as f:
+            f.write(b'not gzip')
+        files = [(self.filename + '.000001.gz', 0, 10),
+                 (self.filename + '.000002', 10, 10), # missing
+                 (self.filename + '.000003', 20, 0)] # empty
+        files.append((self.filename, 30, 4))
+        self._write(self.filename, b'hit\n')
+        self.assertEqual(self._callFUT(b'hit', files), [(30, b'hit')])
+
+    def test_compressed_in_chunks(self):
+        import re
+        from supervisor.loggers import _search_read
+        with gzip.GzipFile(self.filename + '.gz', 'wb') as f:
+            f.write(b'aaaa\nhit 1\n' + b'x' * 10 + b'hit 2\nhit 3')
+        regex = re.compile(b'hit', re.MULTILINE)
+        self.assertEqual(list(_search_read(self.filename + '.gz', regex,
+                                                 100, chunk=4)),
+                         [(5, b'hit 1'), (11, b'x' * 10 + b'hit 2'),
+                          (27, b'hit 3')])
+
+class GetLogLengthTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _callFUT(self, filename):
+        from supervisor.loggers import get_log_length
+        return get_log_length(filename)
+
+    def test_plain(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'hello')
+        self.assertEqual(self._callFUT(self.filename), 5)
+
+    def test_gzip(self):
+        with gzip.GzipFile(self.filename + '.gz', 'wb') as f:
+            f.write(b'hello' * 1000)
+        self.assertEqual(self._callFUT(self.filename + '.gz'), 5000)
+
+    def test_missing(self):
+        self.assertEqual(self._callFUT(self.filename), 0)
+        self.assertEqual(self._callFUT(self.filename + '.gz'), 0)
+
+class GetBackupsTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _callFUT(self, filename):
+        from supervisor.loggers import get_backups
+        return get_backups(filename)
+
+    def _touch(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(b'x')
+
+    def test_none(self):
+        self.assertEqual(self._callFUT(self.filename), [])
+
+    def test_rename_scheme(self):
+        for suffix in ('.1', '.2', '.4'):
+            self._touch(self.filename + suffix)
+        self.assertEqual(self._callFUT(self.filename),
+                         [self.filename + '.1', self.filename + '.2'])
+
+    def test_segments_newest_first(self):
+        for suffix in ('.000001.gz', '.000002'):
+            self._touch(self.filename + suffix)
+        self.assertEqual(self._callFUT(self.filename),
+                         [self.filename + '.000002',
+                          self.filename + '.000001.gz'])
 
 class BoundIOTests(unittest.TestCase):
     def _getTargetClass(self):
@@ -396,6 +1526,13 @@ class BoundIOTests(unittest.TestCase):
     def test_getvalue(self):
         io = self._makeOne(1, b'a')
         self.assertEqual(io.getvalue(), b'a')
+        self.assertEqual(type(io.getvalue()), bytes)
+
+    def test_write_keeps_latest(self):
+        io = self._makeOne(5, b'')
+        for b in (b'ab', b'cd', b'ef'):
+            io.write(b)
+        self.assertEqual(io.getvalue(), b'cdef')
 
     def test_clear(self):
         io = self._makeOne(1, b'a')
@@ -542,6 +1679,13 @@ class SyslogHandlerTests(HandlerTests, unittest.TestCase):
         handler.emit(record)
         syslog.syslog.assert_called_with('hi!')
 
+    @mock.patch('syslog.syslog', MockSysLog())
+    def test_emit_memoryview(self):
+        handler = self._makeOne()
+        record = self._makeLogRecord(memoryview(b'hello!'))
+        handler.emit(record)
+        syslog.syslog.assert_called_with('hello!')
+
     @mock.patch('syslog.syslog', MockSysLog())
     def test_close(self):
         handler = self._makeOne()
@@ -590,6 +1734,105 @@ class SyslogHandlerTests(HandlerTests, unittest.TestCase):
             handler.emit(record)
             self.assertEqual(called, ['fií'])
 
+class CopyTruncateTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _callFUT(self, filename, backups, segments=None, maxbytes=0,
+                 compress=False):
+        from supervisor.loggers import copytruncate
+        return copytruncate(filename, backups, segments, maxbytes, compress)
+
+    def _write(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def _read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_copies_and_truncates(self):
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, b'abc')
+            self._callFUT(self.filename, 2)
+            os.write(fd, b'de')
+        finally:
+            os.close(fd)
+        self.assertEqual(self._read(self.filename), b'de')
+        self.assertEqual(self._read(self.filename + '.1'), b'abc')
+        self.assertFalse(os.path.exists(self.filename + '.2'))
+
+    def test_moves_backups_up(self):
+        self._write(self.filename, b'new')
+        self._write(self.filename + '.1', b'old')
+        self._write(self.filename + '.2', b'older')
+        self._callFUT(self.filename, 2)
+        self.assertEqual(self._read(self.filename), b'')
+        self.assertEqual(self._read(self.filename + '.1'), b'new')
+        self.assertEqual(self._read(self.filename + '.2'), b'old')
+        self.assertFalse(os.path.exists(self.filename + '.3'))
+
+    def test_no_backups(self):
+        self._write(self.filename, b'abc')
+        self._callFUT(self.filename, 0)
+        self.assertEqual(self._read(self.filename), b'')
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+
+    def test_file_missing(self):
+        self.assertRaises(IOError, self._callFUT, self.filename, 1)
+
+    def test_records_offsets(self):
+        from supervisor.loggers import copytruncate
+        from supervisor.loggers import LogOffsets
+        from supervisor.loggers import LogSegments
+        segments = LogSegments(self.filename)
+        offsets = LogOffsets(self.filename, segments)
+        self._write(self.filename, b'abc')
+        copytruncate(self.filename, 2, segments, offsets=offsets)
+        self._write(self.filename, b'de')
+        copytruncate(self.filename, 0, segments, offsets=offsets)
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 5)
+        self.assertEqual(offsets.backups, [])
+
+    def test_does_not_record_offsets_without_them(self):
+        self._write(self.filename, b'abc')
+        self._callFUT(self.filename, 2)
+        self.assertFalse(os.path.exists(self.filename + '.offsets'))
+
+    def test_segments(self):
+        from supervisor.loggers import LogSegments
+        segments = LogSegments(self.filename)
+        for data in (b'a', b'b', b'c'):
+            self._write(self.filename, data)
+            self._callFUT(self.filename, 2, segments)
+        self.assertEqual(self._read(self.filename), b'')
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+        self.assertFalse(os.path.exists(self.filename + '.000001'))
+        self.assertEqual(self._read(self.filename + '.000002'), b'b')
+        self.assertEqual(self._read(self.filename + '.000003'), b'c')
+
+    def test_segments_returns_number(self):
+        from supervisor.loggers import LogSegments
+        segments = LogSegments(self.filename)
+        self._write(self.filename, b'a')
+        self.assertEqual(self._callFUT(self.filename, 2, segments, 0, True), 1)
+        self.assertEqual(segments.pending, set([1]))
+        self._write(self.filename, b'b')
+        self.assertEqual(self._callFUT(self.filename, 2), None)
+
+class DummyCompressor:
+    def __init__(self):
+        self.jobs = []
+
+    def put(self, segments, number, method, backups, maxbytes=0):
+        self.jobs.append((segments, number, method, backups, maxbytes))
+
 class DummyHandler:
     close = False
     def __init__(self, level):
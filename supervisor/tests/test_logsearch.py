@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from supervisor.tests.base import DummyOptions
+from supervisor.tests.base import DummyPConfig
+from supervisor.tests.base import PopulatedDummySupervisor
+
+class GetSearchLogsTests(unittest.TestCase):
+    def _callFUT(self, supervisord, names, channel='stdout'):
+        from supervisor.logsearch import get_search_logs
+        return get_search_logs(supervisord, names, channel)
+
+    def _makeSupervisor(self):
+        options = DummyOptions()
+        pconfigs = [DummyPConfig(options, 'foo', '/bin/foo',
+                                 stdout_logfile='/tmp/foo.log',
+                                 stderr_logfile='/tmp/foo.err'),
+                    DummyPConfig(options, 'bar', '/bin/bar',
+                                 stdout_logfile='/tmp/bar.log'),
+                    DummyPConfig(options, 'baz', '/bin/baz')]
+        return PopulatedDummySupervisor(options, 'g', *pconfigs)
+
+    def test_all(self):
+        supervisord = self._makeSupervisor()
+        self.assertEqual(self._callFUT(supervisord, []),
+                         [('g:bar', 'stdout', '/tmp/bar.log'),
+                          ('g:foo', 'stdout', '/tmp/foo.log')])
+        process = supervisord.process_groups['g'].processes['foo']
+        self.assertTrue(process.logs_flushed)
+
+    def test_names(self):
+        supervisord = self._makeSupervisor()
+        self.assertEqual(self._callFUT(supervisord, ['g:foo', 'g:baz']),
+                         [('g:foo', 'stdout', '/tmp/foo.log')])
+        self.assertEqual(self._callFUT(supervisord, ['g:*'], 'stderr'),
+                         [('g:foo', 'stderr', '/tmp/foo.err')])
+
+    def test_bad_name(self):
+        supervisord = self._makeSupervisor()
+        for name in ('nope', 'g:nope'):
+            try:
+                self._callFUT(supervisord, [name])
+            except KeyError as why:
+                self.assertEqual(why.args[0], name)
+            else:
+                raise AssertionError("Didn't raise")
+
+class CompilePatternTests(unittest.TestCase):
+    def _callFUT(self, pattern):
+        from supervisor.logsearch import compile_pattern
+        return compile_pattern(pattern)
+
+    def test_lines(self):
+        regex = self._callFUT('^b$')
+        self.assertTrue(regex.search(b'a\nb\nc') is not None)
+
+    def test_bad(self):
+        self.assertRaises(re.error, self._callFUT, '(')
+
+class LogSearchTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.foo = os.path.join(self.basedir, 'foo.log')
+        self.bar = os.path.join(self.basedir, 'bar.log')
+        with open(self.foo + '.1', 'wb') as f:
+            f.write(b'ERROR 1\nok\n')
+        with open(self.foo, 'wb') as f:
+            f.write(b'ERROR 2\n')
+        with open(self.bar, 'wb') as f:
+            f.write(b'ok\nERROR 3\n')
+        self.logs = [('g:foo', 'stdout', self.foo),
+                     ('g:bar', 'stdout', self.bar)]
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self, maxmatches=100, pattern=b'ERROR'):
+        from supervisor.logsearch import LogSearch
+        return LogSearch(self.logs, re.compile(pattern, re.MULTILINE),
+                         maxmatches)
+
+    def test_run(self):
+        search = self._makeOne()
+        search.run()
+        self.assertTrue(search.done)
+        self.assertEqual(search.error, None)
+        self.assertEqual(search.pop(),
+                         [('g:foo', 'stdout', 0, b'ERROR 1'),
+                          ('g:foo', 'stdout', 11, b'ERROR 2'),
+                          ('g:bar', 'stdout', 3, b'ERROR 3')])
+        self.assertEqual(search.pop(), [])
+
+    def test_maxmatches(self):
+        search = self._makeOne(maxmatches=2)
+        search.run()
+        self.assertTrue(search.done)
+        self.assertEqual(len(search.pop()), 2)
+
+    def test_cancel(self):
+        search = self._makeOne()
+        search.cancel()
+        search.run()
+        self.assertTrue(search.done)
+        self.assertEqual(search.pop(), [])
+
+    def test_error(self):
+        search = self._makeOne()
+        search.logs = [('g:foo', 'stdout', None)]
+        search.run()
+        self.assertTrue(search.done)
+        self.assertNotEqual(search.error, None)
+
+    def test_start(self):
+        search = self._makeOne()
+        search.start()
+        search.thread.join()
+        self.assertTrue(search.done)
+        self.assertEqual(len(search.pop()), 3)
@@ -0,0 +1,349 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from supervisor import loggers
+
+class LogWriterPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _getTargetClass(self):
+        from supervisor.logwriter import LogWriterPool
+        return LogWriterPool
+
+    def _makeOne(self, *arg, **kw):
+        pool = self._getTargetClass()(*arg, **kw)
+        self.addCleanup(pool.stop)
+        return pool
+
+    def _makeRecord(self, msg, **kw):
+        return loggers.LogRecord(loggers.LevelsByName.INFO, msg, **kw)
+
+    def _read(self, filename=None):
+        with open(filename or self.filename, 'rb') as f:
+            return f.read()
+
+    def test_wrap_without_threads(self):
+        pool = self._makeOne()
+        handler = DummyHandler()
+        self.assertTrue(pool.wrap(handler) is handler)
+        self.assertEqual(pool.writers, [])
+
+    def test_wrap_assigns_writers_round_robin(self):
+        pool = self._makeOne(nthreads=2)
+        handlers = [pool.wrap(DummyHandler()) for i in range(4)]
+        self.assertEqual(len(pool.writers), 2)
+        writers = [ handler.writer for handler in handlers ]
+        self.assertEqual(writers, pool.writers * 2)
+        for writer in pool.writers:
+            self.assertTrue(writer.is_alive())
+
+    def test_emit_writes_file(self):
+        pool = self._makeOne(nthreads=1)
+        handler = pool.wrap(loggers.FileHandler(self.filename))
+        handler.emit(self._makeRecord(b'hello '))
+        handler.emit(self._makeRecord(memoryview(b'world')))
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(self._read(), b'hello world')
+        self.assertEqual(handler.queued_bytes, 0)
+        self.assertEqual(handler.queued_records, 0)
+        self.assertTrue(handler.last_latency >= 0)
+        self.assertTrue(handler.max_latency >= handler.last_latency)
+
+    def test_emit_copies_memoryview(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler(block=True)
+        handler = pool.wrap(inner)
+        buf = bytearray(b'abc')
+        handler.emit(self._makeRecord(memoryview(buf)))
+        buf[:] = b'xyz' # the next read overwrites the buffer
+        inner.unblock.set()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(inner.records[0].msg, b'abc')
+
+    def test_emit_timestamps_formatted_record(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler(block=True)
+        inner.fmt = '%(asctime)s %(message)s'
+        handler = pool.wrap(inner)
+        handler.emit(self._makeRecord('hello'))
+        inner.unblock.set()
+        self.assertTrue(pool.flush(5))
+        self.assertTrue(inner.records[0].dictrepr is not None)
+
+    def test_emit_rotates(self):
+        pool = self._makeOne(nthreads=1)
+        handler = pool.wrap(loggers.RotatingFileHandler(
+            self.filename, maxBytes=10, backupCount=1))
+        handler.emit(self._makeRecord(b'a' * 10))
+        handler.emit(self._makeRecord(b'b' * 5))
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(self._read(self.filename + '.1'), b'a' * 10)
+        self.assertEqual(self._read(), b'b' * 5)
+
+    def test_emit_buffered_is_flushed_after_batch(self):
+        pool = self._makeOne(nthreads=1)
+        handler = pool.wrap(loggers.FileHandler(self.filename,
+                                                buffersize=1024))
+        handler.emit(self._makeRecord(b'hello'))
+        pool.stop()
+        self.assertEqual(self._read(), b'hello')
+
+    def test_remove_and_reopen_are_queued_behind_records(self):
+        pool = self._makeOne(nthreads=1)
+        inner = loggers.FileHandler(self.filename)
+        handler = pool.wrap(inner)
+        handler.emit(self._makeRecord(b'before'))
+        handler.remove()
+        self.assertTrue(handler.closed)
+        handler.reopen()
+        self.assertFalse(handler.closed)
+        handler.emit(self._makeRecord(b'after'))
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(self._read(), b'after')
+        handler.close()
+        pool.stop()
+        self.assertTrue(inner.closed)
+
+    def test_backlogged_and_drained(self):
+        woken = []
+        pool = self._makeOne(wakeup=lambda: woken.append(True),
+                             nthreads=1, maxbytes=10)
+        inner = DummyHandler(block=True)
+        handler = pool.wrap(inner)
+        handler.emit(self._makeRecord(b'x' * 6))
+        self.assertFalse(handler.backlogged())
+        handler.emit(self._makeRecord(b'x' * 6))
+        self.assertTrue(handler.backlogged())
+        stats = handler.stats()
+        self.assertEqual(stats['queued_bytes'], 12)
+        self.assertEqual(stats['queued_records'], 2)
+        self.assertEqual(stats['backlogged'], True)
+        self.assertEqual(pool.pop_drained(), [])
+        inner.unblock.set()
+        self.assertTrue(pool.flush(5))
+        self.assertFalse(handler.backlogged())
+        self.assertEqual(pool.pop_drained(), [handler])
+        self.assertEqual(pool.pop_drained(), [])
+        self.assertEqual(woken, [True])
+
+    def test_flush_does_not_wait(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler(block=True)
+        handler = pool.wrap(inner)
+        handler.emit(self._makeRecord(b'hello'))
+        start = time.time()
+        handler.flush()
+        self.assertFalse(pool.flush(0.01))
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(inner.records, [])
+        self.assertEqual(inner.flushed, 0)
+        inner.unblock.set()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(len(inner.records), 1)
+        self.assertEqual(inner.flushed, 2) # after the batch, and flush()
+
+    def test_stop_times_out_once(self):
+        pool = self._makeOne(nthreads=2)
+        inners = [DummyHandler(block=True), DummyHandler(block=True)]
+        handlers = [ pool.wrap(inner) for inner in inners ]
+        for handler in handlers:
+            handler.emit(self._makeRecord(b'hello'))
+        writers = pool.writers
+        start = time.time()
+        pool.stop(0.2)
+        self.assertTrue(time.time() - start < 0.35)
+        self.assertEqual(pool.writers, [])
+        # still queued behind the blocked write rather than written here
+        handlers[0].emit(self._makeRecord(b'more'))
+        self.assertEqual(inners[0].records, [])
+        for inner in inners:
+            inner.unblock.set()
+        for writer in writers:
+            writer.join(5)
+        self.assertEqual(len(inners[0].records), 2)
+        self.assertEqual(len(inners[1].records), 1)
+
+    def test_doRollover_is_queued(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler(block=True)
+        handler = pool.wrap(inner)
+        handler.emit(self._makeRecord(b'hello'))
+        handler.doRollover()
+        self.assertEqual(handler.queued_records, 2)
+        self.assertEqual(inner.rolled, 0)
+        inner.unblock.set()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(inner.rolled, 1)
+        self.assertEqual(handler.queued_records, 0)
+
+    def test_handler_error_does_not_stop_writer(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler(error=ValueError('boom'))
+        handler = pool.wrap(inner)
+        handler.reopen()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(inner.errors, 1)
+        self.assertTrue(pool.writers[0].is_alive())
+
+    def test_flush_without_threads(self):
+        pool = self._makeOne()
+        self.assertTrue(pool.flush(0))
+
+    def test_stop_writes_out_queue(self):
+        pool = self._makeOne(nthreads=1)
+        handler = pool.wrap(loggers.FileHandler(self.filename))
+        for i in range(100):
+            handler.emit(self._makeRecord(b'x'))
+        pool.stop()
+        self.assertEqual(pool.writers, [])
+        self.assertEqual(self._read(), b'x' * 100)
+        # the handler is written to directly from now on
+        handler.emit(self._makeRecord(b'y'))
+        self.assertEqual(self._read(), b'x' * 100 + b'y')
+
+    def test_setFormat_and_setLevel(self):
+        pool = self._makeOne(nthreads=1)
+        inner = DummyHandler()
+        handler = pool.wrap(inner)
+        handler.setFormat('%(asctime)s %(message)s')
+        handler.setLevel(loggers.LevelsByName.WARN)
+        self.assertEqual(inner.fmt, '%(asctime)s %(message)s')
+        self.assertEqual(inner.level, loggers.LevelsByName.WARN)
+        self.assertEqual(handler.level, loggers.LevelsByName.WARN)
+
+    def test_handle_file_with_writer(self):
+        from supervisor.logwriter import QueuedHandler
+        pool = self._makeOne(nthreads=1)
+        logger = loggers.getLogger()
+        loggers.handle_file(logger, self.filename, '%(message)s',
+                            writer=pool)
+        handler = logger.handlers[0]
+        self.assertEqual(handler.__class__, QueuedHandler)
+        self.assertEqual(handler.handler.__class__, loggers.FileHandler)
+        logger.info(b'hello')
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(self._read(), b'hello')
+
+class LogCompressorTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'thelog')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def _makeOne(self, logger=None):
+        from supervisor.logwriter import LogCompressor
+        compressor = LogCompressor(logger)
+        self.addCleanup(compressor.stop)
+        return compressor
+
+    def _addSegment(self, segments, data):
+        with open(segments.next_name(), 'wb') as f:
+            f.write(data)
+        return segments.added(10, 0, True)
+
+    def test_put_compresses_in_thread(self):
+        compressor = self._makeOne()
+        segments = loggers.LogSegments(self.filename)
+        for data in (b'a', b'b'):
+            number = self._addSegment(segments, data * 100)
+            compressor.put(segments, number, 'gzip', 10)
+        self.assertTrue(compressor.wait(5))
+        self.assertEqual(compressor.thread, None)
+        self.assertEqual(compressor.pending(), 0)
+        self.assertEqual(segments.get_names(),
+                         [self.filename + '.000001.gz',
+                          self.filename + '.000002.gz'])
+        with loggers.open_log(self.filename + '.000002.gz') as f:
+            self.assertEqual(f.read(), b'b' * 100)
+
+    def test_failure_is_logged(self):
+        from supervisor.tests.base import DummyLogger
+        logger = DummyLogger()
+        compressor = self._makeOne(logger)
+        segments = loggers.LogSegments(self.filename)
+        number = self._addSegment(segments, b'a')
+        def raiser(number, method, backups, maxbytes):
+            raise IOError(28, 'No space left on device')
+        segments.compress = raiser
+        compressor.put(segments, number, 'gzip', 10)
+        self.assertTrue(compressor.wait(5))
+        self.assertEqual(logger.data,
+            ["couldn't compress %s.000001: [Errno 28] No space left on device"
+             % self.filename])
+
+    def test_stop_drops_queue(self):
+        compressor = self._makeOne()
+        segments = loggers.LogSegments(self.filename)
+        started = threading.Event()
+        unblock = threading.Event()
+        def compress(number, method, backups, maxbytes):
+            started.set()
+            unblock.wait()
+        segments.compress = compress
+        compressor.put(segments, 1, 'gzip', 10)
+        compressor.put(segments, 2, 'gzip', 10)
+        started.wait(5)
+        unblock.set()
+        compressor.stop()
+        self.assertEqual(compressor.thread, None)
+        self.assertEqual(compressor.pending(), 0)
+        compressor.put(segments, 3, 'gzip', 10)
+        self.assertEqual(compressor.pending(), 0)
+
+    def test_wait_times_out(self):
+        compressor = self._makeOne()
+        segments = loggers.LogSegments(self.filename)
+        unblock = threading.Event()
+        segments.compress = lambda *arg: unblock.wait()
+        compressor.put(segments, 1, 'gzip', 10)
+        self.assertFalse(compressor.wait(0.01))
+        unblock.set()
+        self.assertTrue(compressor.wait(5))
+
+class DummyHandler:
+    fmt = '%(message)s'
+    level = loggers.LevelsByName.INFO
+
+    def __init__(self, block=False, error=None):
+        self.records = []
+        self.unblock = threading.Event()
+        if not block:
+            self.unblock.set()
+        self.error = error
+        self.errors = 0
+        self.flushed = 0
+        self.rolled = 0
+
+    def setFormat(self, fmt):
+        self.fmt = fmt
+
+    def setLevel(self, level):
+        self.level = level
+
+    def emit(self, record):
+        self.unblock.wait()
+        self.records.append(record)
+
+    def flush(self):
+        self.flushed += 1
+
+    def doRollover(self):
+        self.rolled += 1
+
+    def reopen(self):
+        if self.error is not None:
+            raise self.error
+
+    def handleError(self):
+        self.errors += 1
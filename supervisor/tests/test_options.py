@@ -9,6 +9,8 @@ import signal
 import shutil
 import errno
 import platform
+import fcntl
+import time
 
 from supervisor.compat import StringIO
 from supervisor.compat import as_bytes
@@ -20,6 +22,8 @@ from supervisor.tests.base import DummySupervisor
 from supervisor.tests.base import DummyLogger
 from supervisor.tests.base import DummyOptions
 from supervisor.tests.base import DummyPoller
+from supervisor.tests.base import DummyDispatcher
+from supervisor.tests.base import DummyQueuedHandler
 from supervisor.tests.base import DummyPConfig
 from supervisor.tests.base import DummyProcess
 from supervisor.tests.base import DummySocketConfig
@@ -620,6 +624,11 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         nocleanup=true
         minfds=2048
         minprocs=300
+        maxstarting=50
+        spawnrate=20
+        childlog_flush_ms=250
+        childlog_writers=2
+        childlog_queue_maxbytes=64KB
         environment=FAKE_ENV_VAR=/some/path
 
         [inet_http_server]
@@ -701,6 +710,11 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         self.assertEqual(options.nocleanup, True)
         self.assertEqual(options.minfds, 2048)
         self.assertEqual(options.minprocs, 300)
+        self.assertEqual(options.maxstarting, 50)
+        self.assertEqual(options.spawnrate, 20)
+        self.assertEqual(options.childlog_flush_ms, 250)
+        self.assertEqual(options.childlog_writers, 2)
+        self.assertEqual(options.childlog_queue_maxbytes, 65536)
         self.assertEqual(options.nocleanup, True)
         self.assertEqual(len(options.process_group_configs), 5)
         self.assertEqual(options.environment, dict(FAKE_ENV_VAR='/some/path'))
@@ -854,6 +868,74 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         self.assertEqual(instance.nocleanup, True)
         self.assertEqual(instance.minfds, 2048)
         self.assertEqual(instance.minprocs, 300)
+        self.assertEqual(instance.spawn_scheduler.maxstarting, 50)
+        self.assertEqual(instance.spawn_scheduler.spawnrate, 20)
+        self.assertEqual(instance.logwriter.nthreads, 2)
+        self.assertEqual(instance.logwriter.maxbytes, 65536)
+
+    def test_options_spawn_scheduler_defaults(self):
+        text = lstrip("""
+        [supervisord]
+        """)
+        instance = self._makeOne()
+        instance.configfile = StringIO(text)
+        instance.realize(args=[])
+        self.assertEqual(instance.spawn_scheduler.maxstarting, 0)
+        self.assertEqual(instance.spawn_scheduler.spawnrate, 0)
+        self.assertEqual(instance.logwriter.nthreads, 0)
+        self.assertEqual(instance.logwriter.maxbytes, 1024 * 1024)
+
+    def test_options_maxstarting_negative(self):
+        text = lstrip("""
+        [supervisord]
+        maxstarting=-1
+        """)
+        instance = self._makeOne()
+        try:
+            instance.read_config(StringIO(text))
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0],
+                '[supervisord] section sets invalid maxstarting (-1)')
+
+    def test_options_spawnrate_negative(self):
+        text = lstrip("""
+        [supervisord]
+        spawnrate=-1
+        """)
+        instance = self._makeOne()
+        try:
+            instance.read_config(StringIO(text))
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0],
+                '[supervisord] section sets invalid spawnrate (-1)')
+
+    def test_options_childlog_flush_ms_negative(self):
+        text = lstrip("""
+        [supervisord]
+        childlog_flush_ms=-1
+        """)
+        instance = self._makeOne()
+        try:
+            instance.read_config(StringIO(text))
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0],
+                '[supervisord] section sets invalid childlog_flush_ms (-1)')
+
+    def test_options_childlog_writers_negative(self):
+        text = lstrip("""
+        [supervisord]
+        childlog_writers=-1
+        """)
+        instance = self._makeOne()
+        try:
+            instance.read_config(StringIO(text))
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0],
+                '[supervisord] section sets invalid childlog_writers (-1)')
 
     def test_options_ignores_space_prefixed_inline_comments(self):
         text = lstrip("""
@@ -1147,6 +1229,98 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         else:
             raise AssertionError("Didn't raise")
 
+    def _makeTail(self, maxbytes, data):
+        from supervisor.dispatchers import OutputTail
+        tail = OutputTail(maxbytes)
+        tail.write(data)
+        return tail
+
+    def test_readBuffer(self):
+        from supervisor.options import readBuffer
+        # the tail holds the last 4 bytes of a 10 byte file
+        tail = self._makeTail(4, b'abcdefghij')
+        self.assertEqual(readBuffer(tail, 10, 6, 0), b'ghij')
+        self.assertEqual(readBuffer(tail, 10, 7, 2), b'hi')
+        self.assertEqual(readBuffer(tail, 10, -3, 0), b'hij')
+        self.assertEqual(readBuffer(tail, 10, 10, 0), b'')
+        self.assertEqual(readBuffer(tail, 10, 12, 5), b'')
+        # some of the bytes are only in the file
+        self.assertEqual(readBuffer(tail, 10, 0, 0), None)
+        self.assertEqual(readBuffer(tail, 10, -5, 0), None)
+        # ... unless there is no file
+        self.assertEqual(readBuffer(tail, 10, 0, 0, clip=True), b'ghij')
+        self.assertEqual(readBuffer(tail, 10, 2, 6, clip=True), b'gh')
+
+    def test_readBuffer_file_behind_tail(self):
+        from supervisor.options import readBuffer
+        # the file was truncated after 8 bytes of output
+        tail = self._makeTail(4, b'abcdefghij')
+        self.assertEqual(readBuffer(tail, 2, 0, 0), b'ij')
+
+    def test_readBuffer_badargs(self):
+        from supervisor.options import readBuffer
+        tail = self._makeTail(4, b'abcdefghij')
+        for offset, length in ((-1, 1), (1, -1)):
+            try:
+                readBuffer(tail, 10, offset, length)
+            except ValueError as inst:
+                self.assertEqual(inst.args[0], 'BAD_ARGUMENTS')
+            else:
+                raise AssertionError("Didn't raise")
+
+    def test_tailBuffer(self):
+        from supervisor.options import tailBuffer
+        tail = self._makeTail(4, b'abcdefghij')
+        self.assertEqual(tailBuffer(tail, 10, 0, 3), ['hij', 10, True])
+        self.assertEqual(tailBuffer(tail, 10, 8, 2), ['ij', 10, False])
+        self.assertEqual(tailBuffer(tail, 10, 10, 100), ['', 10, False])
+        self.assertEqual(tailBuffer(tail, 10, 0, 8), None)
+        self.assertEqual(tailBuffer(tail, 10, 0, 8, clip=True),
+                         ['ghij', 10, True])
+
+    def test_tailBuffer_matches_tailFile(self):
+        from supervisor.options import tailBuffer
+        from supervisor.options import tailFile
+        data = b'abcdefghij'
+        tail = self._makeTail(len(data), data)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            for offset in range(0, 12):
+                for length in range(0, 12):
+                    self.assertEqual(
+                        tailBuffer(tail, len(data), offset, length),
+                        tailFile(f.name, offset, length))
+
+    def test_readFile_compressed(self):
+        import gzip
+        from supervisor.options import readFile
+        dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dirname)
+        filename = os.path.join(dirname, 'foo.log.000001.gz')
+        with gzip.GzipFile(filename, 'wb') as f:
+            f.write(b'abcdef')
+        self.assertEqual(readFile(filename, 0, 0), b'abcdef')
+        self.assertEqual(readFile(filename, 2, 2), b'cd')
+        self.assertEqual(readFile(filename, -2, 0), b'ef')
+
+    def test_readFile_compressed_truncated(self):
+        import gzip
+        from supervisor.options import readFile
+        dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dirname)
+        filename = os.path.join(dirname, 'foo.log.000001.gz')
+        with gzip.GzipFile(filename, 'wb') as f:
+            f.write(b'abcdef' * 1000)
+        with open(filename, 'r+b') as f:
+            f.truncate(20)
+        try:
+            readFile(filename, 0, 0)
+        except ValueError as inst:
+            self.assertEqual(inst.args[0], 'FAILED')
+        else:
+            raise AssertionError("Didn't raise")
+
     def test_get_pid(self):
         instance = self._makeOne()
         self.assertEqual(os.getpid(), instance.get_pid())
@@ -1159,6 +1333,324 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         self.assertEqual(instance.get_signal(), signal.SIGCHLD)
         self.assertEqual(instance.get_signal(), None)
 
+    def test_has_signal_delegates_to_signal_receiver(self):
+        instance = self._makeOne()
+        self.assertFalse(instance.has_signal())
+        instance.signal_receiver.receive(signal.SIGCHLD, None)
+        self.assertTrue(instance.has_signal())
+
+    def test_open_signal_wakeup_fd(self):
+        instance = self._makeOne()
+        instance.open_signal_wakeup_fd()
+        try:
+            r, w = instance._signal_wakeup_pipe
+            self.assertEqual(instance.signal_wakeup_fd, r)
+            self.assertEqual(signal.set_wakeup_fd(w), w)
+            for fd in (r, w):
+                self.assertTrue(fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_NDELAY)
+                self.assertTrue(
+                    fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC)
+            # opening it again is a no-op
+            instance.open_signal_wakeup_fd()
+            self.assertEqual(instance._signal_wakeup_pipe, (r, w))
+        finally:
+            instance.close_signal_wakeup_fd()
+        self.assertEqual(instance.signal_wakeup_fd, None)
+        self.assertEqual(signal.set_wakeup_fd(-1), -1)
+        self.assertRaises(OSError, os.fstat, r)
+        self.assertRaises(OSError, os.fstat, w)
+
+    def test_open_signal_wakeup_fd_not_possible(self):
+        instance = self._makeOne()
+        def set_wakeup_fd(fd):
+            raise ValueError('set_wakeup_fd only works in main thread')
+        with patch('signal.set_wakeup_fd', set_wakeup_fd):
+            instance.open_signal_wakeup_fd()
+        self.assertEqual(instance.signal_wakeup_fd, None)
+        self.assertEqual(instance._signal_wakeup_pipe, None)
+        instance.close_signal_wakeup_fd() # shouldn't raise
+
+    def test_drain_signal_wakeup_fd(self):
+        instance = self._makeOne()
+        instance.open_signal_wakeup_fd()
+        try:
+            r, w = instance._signal_wakeup_pipe
+            os.write(w, b'\x11' * 10)
+            instance.drain_signal_wakeup_fd()
+            self.assertRaises(OSError, os.read, r, 1)
+        finally:
+            instance.close_signal_wakeup_fd()
+
+    def test_wake_mainloop(self):
+        instance = self._makeOne()
+        instance.wake_mainloop() # no pipe, shouldn't raise
+        instance.open_signal_wakeup_fd()
+        try:
+            r, w = instance._signal_wakeup_pipe
+            instance.wake_mainloop()
+            self.assertEqual(os.read(r, 10), b'\0')
+            # a full pipe wakes up the poller just as well
+            try:
+                while 1:
+                    os.write(w, b'\0' * 4096)
+            except OSError:
+                pass
+            instance.wake_mainloop()
+        finally:
+            instance.close_signal_wakeup_fd()
+
+    def test_update_log_readers(self):
+        instance = self._makeOne()
+        dispatcher = DummyDispatcher(readable=True, fd=7)
+        instance.add_dispatcher(dispatcher)
+        instance.poller.unregister_readable(7)
+        handler = DummyQueuedHandler(dispatcher)
+        instance.logwriter.drained(handler)
+        instance.logwriter.drained(DummyQueuedHandler(None))
+        instance.update_log_readers()
+        self.assertTrue(7 in instance.poller.readables)
+        self.assertEqual(instance.logwriter.pop_drained(), [])
+
+    def test_cleanup_stops_logwriter(self):
+        from supervisor.loggers import StreamHandler
+        instance = self._makeOne()
+        instance.pidfile = ''
+        instance.logwriter.nthreads = 1
+        instance.logwriter.wrap(StreamHandler())
+        writer = instance.logwriter.writers[0]
+        instance.cleanup()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(instance.logwriter.writers, [])
+
+    def test_cleanup_closes_signal_wakeup_fd(self):
+        instance = self._makeOne()
+        instance.pidfile = ''
+        instance.open_signal_wakeup_fd()
+        instance.cleanup()
+        self.assertEqual(instance.signal_wakeup_fd, None)
+        self.assertEqual(signal.set_wakeup_fd(-1), -1)
+
+    def test_waitpid_specific_pid(self):
+        instance = self._makeOne()
+        pid = os.fork()
+        if pid == 0:
+            os._exit(3)
+        try:
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        except AttributeError: # Python 2
+            time.sleep(0.5)
+        reaped, sts = instance.waitpid(pid)
+        self.assertEqual(reaped, pid)
+        self.assertEqual(os.WEXITSTATUS(sts), 3)
+
+    if hasattr(os, 'posix_spawn'):
+        def test_get_inheritable_fds(self):
+            instance = self._makeOne()
+            r, w = os.pipe()
+            try:
+                os.set_inheritable(w, True)
+                fds = instance.get_inheritable_fds()
+                self.assertTrue(w in fds)
+                self.assertFalse(r in fds)
+            finally:
+                os.close(r)
+                os.close(w)
+
+        def test_posix_spawn(self):
+            instance = self._makeOne()
+            r, w = os.pipe()
+            try:
+                file_actions = [(os.POSIX_SPAWN_DUP2, w, 1)]
+                pid = instance.posix_spawn(
+                    '/bin/sh', ['/bin/sh', '-c', 'echo $FOO; ps -o pgid= $$'],
+                    {'FOO': 'bar', 'PATH': os.environ.get('PATH', '')},
+                    file_actions)
+                os.close(w)
+                w = None
+                reaped, sts = os.waitpid(pid, 0)
+                output = os.read(r, 1024).split()
+            finally:
+                os.close(r)
+                if w is not None:
+                    os.close(w)
+            self.assertEqual(os.WEXITSTATUS(sts), 0)
+            self.assertEqual(output[0], b'bar')
+            if len(output) > 1: # ps may not be installed
+                self.assertEqual(int(output[1]), pid)
+
+    def test_readfd_view(self):
+        instance = self._makeOne()
+        r, w = os.pipe()
+        try:
+            os.write(w, b'foo')
+            view = instance.readfd_view(r)
+            self.assertEqual(view.tobytes(), b'foo')
+            os.write(w, b'bar')
+            view2 = instance.readfd_view(r)
+            self.assertEqual(view2.tobytes(), b'bar')
+            # the buffer is reused
+            self.assertEqual(view.tobytes(), b'bar')
+            os.close(w)
+            w = None
+            self.assertEqual(len(instance.readfd_view(r)), 0)
+        finally:
+            os.close(r)
+            if w is not None:
+                os.close(w)
+
+    def test_readfd_view_reads_at_most_buffer_size(self):
+        instance = self._makeOne()
+        r, w = os.pipe()
+        try:
+            instance._read_buffer = bytearray(4)
+            instance._read_view = memoryview(instance._read_buffer)
+            os.write(w, b'foobar')
+            self.assertEqual(instance.readfd_view(r).tobytes(), b'foob')
+            self.assertEqual(instance.readfd_view(r).tobytes(), b'ar')
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_readfd_view_would_block(self):
+        instance = self._makeOne()
+        r, w = os.pipe()
+        try:
+            fcntl.fcntl(r, fcntl.F_SETFL, os.O_NONBLOCK)
+            self.assertEqual(len(instance.readfd_view(r)), 0)
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_readfd_view_raises_other_errors(self):
+        instance = self._makeOne()
+        def raiser(fd, buffers):
+            raise OSError(errno.EIO, 'I/O error')
+        with patch('os.readv', raiser, create=True):
+            self.assertRaises(OSError, instance.readfd_view, 0)
+
+    def test_make_pipes_without_stdout(self):
+        instance = self._makeOne()
+        pipes = instance.make_pipes(stdout=False)
+        try:
+            self.assertEqual(pipes['stdout'], None)
+            self.assertEqual(pipes['child_stdout'], None)
+            self.assertNotEqual(pipes['stderr'], None)
+            self.assertNotEqual(pipes['stdin'], None)
+        finally:
+            instance.close_parent_pipes(pipes)
+            instance.close_child_pipes(pipes)
+
+    def test_open_direct_logfile(self):
+        instance = self._makeOne()
+        tempdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tempdir, 'foo.log')
+            fd = instance.open_direct_logfile(fn)
+            try:
+                os.write(fd, b'abc')
+                # writes keep going to the end after the file is truncated
+                with open(fn, 'r+b') as f:
+                    f.truncate(0)
+                os.write(fd, b'de')
+            finally:
+                os.close(fd)
+            with open(fn, 'rb') as f:
+                self.assertEqual(f.read(), b'de')
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_make_exec_status_pipe(self):
+        instance = self._makeOne()
+        r, w = instance.make_exec_status_pipe()
+        try:
+            for fd in (r, w):
+                self.assertTrue(
+                    fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC)
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_make_exec_status_pipe_fails(self):
+        instance = self._makeOne()
+        def raiser():
+            raise OSError(errno.EMFILE, 'Too many open files')
+        with patch('os.pipe', raiser):
+            self.assertEqual(instance.make_exec_status_pipe(), None)
+
+    def test_read_exec_status_exec_succeeded(self):
+        instance = self._makeOne()
+        r, w = instance.make_exec_status_pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.execv('/bin/sh', ['/bin/sh', '-c', 'exit 0'])
+        os.close(w)
+        self.addCleanup(os.close, r)
+        self.assertEqual(instance.read_exec_status(r), b'')
+        reaped, sts = instance.waitpid(pid, block=True)
+        self.assertEqual(reaped, pid)
+
+    def test_read_exec_status_exec_failed(self):
+        instance = self._makeOne()
+        r, w = instance.make_exec_status_pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(w, b"couldn't exec /nope: ENOENT")
+            os._exit(127)
+        os.close(w)
+        self.addCleanup(os.close, r)
+        self.assertEqual(instance.read_exec_status(r),
+                         b"couldn't exec /nope: ENOENT")
+        self.assertEqual(instance.read_exec_status(r), b'')
+        reaped, sts = instance.waitpid(pid, block=True)
+        self.assertEqual(os.WEXITSTATUS(sts), 127)
+
+    def test_read_exec_status_error(self):
+        instance = self._makeOne()
+        r, w = instance.make_exec_status_pipe()
+        os.close(r)
+        os.close(w)
+        self.assertEqual(instance.read_exec_status(r), b'')
+
+    def test_pidfd_open_unsupported(self):
+        instance = self._makeOne()
+        saved = getattr(os, 'pidfd_open', None)
+        if saved is not None:
+            del os.pidfd_open
+        try:
+            self.assertEqual(instance.pidfd_open(os.getpid()), None)
+        finally:
+            if saved is not None:
+                os.pidfd_open = saved
+
+    def test_pidfd_open_error(self):
+        instance = self._makeOne()
+        instance.logger = DummyLogger()
+        def raiser(pid):
+            raise OSError(errno.ENOSYS, 'Function not implemented')
+        with patch.object(os, 'pidfd_open', raiser, create=True):
+            self.assertEqual(instance.pidfd_open(1), None)
+        self.assertEqual(instance.logger.data[0],
+                         'pidfd_open error %r for pid 1' % errno.ENOSYS)
+
+    if hasattr(os, 'pidfd_open'):
+        def test_pidfd_open_and_send_signal(self):
+            instance = self._makeOne()
+            pid = os.fork()
+            if pid == 0:
+                time.sleep(10)
+                os._exit(0)
+            try:
+                pidfd = instance.pidfd_open(pid)
+                self.assertTrue(isinstance(pidfd, int))
+                instance.pidfd_send_signal(pidfd, signal.SIGKILL)
+                import select
+                r, w, x = select.select([pidfd], [], [], 5)
+                self.assertEqual(r, [pidfd])
+                os.close(pidfd)
+            finally:
+                reaped, sts = os.waitpid(pid, 0)
+            self.assertEqual(os.WTERMSIG(sts), signal.SIGKILL)
+
     def test_check_execv_args_cant_find_command(self):
         instance = self._makeOne()
         from supervisor.options import NotFound
@@ -1589,6 +2081,61 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         instance.close_logger()
         self.assertEqual(logger.closed, True)
 
+    def test_add_dispatcher(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        dispatcher = DummyDispatcher(readable=True, fd=5)
+        instance.add_dispatcher(dispatcher)
+        self.assertTrue(instance.get_process_map()[5] is dispatcher)
+        self.assertEqual(instance.poller.readables, set([5]))
+        self.assertEqual(instance.poller.writables, set())
+
+    def test_add_dispatcher_drops_stale_registration(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        instance.poller.writables.add(5)
+        instance.add_dispatcher(DummyDispatcher(readable=True, fd=5))
+        self.assertEqual(instance.poller.readables, set([5]))
+        self.assertEqual(instance.poller.writables, set())
+
+    def test_remove_dispatcher(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        dispatcher = DummyDispatcher(readable=True, writable=True, fd=5)
+        instance.add_dispatcher(dispatcher)
+        instance.remove_dispatcher(dispatcher)
+        self.assertEqual(instance.process_map, {})
+        self.assertEqual(instance.poller.readables, set())
+        self.assertEqual(instance.poller.writables, set())
+
+    def test_remove_dispatcher_ignores_replaced_dispatcher(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        old = DummyDispatcher(readable=True, fd=5)
+        new = DummyDispatcher(readable=True, fd=5)
+        instance.add_dispatcher(old)
+        instance.add_dispatcher(new)
+        instance.remove_dispatcher(old)
+        self.assertTrue(instance.process_map[5] is new)
+        self.assertEqual(instance.poller.readables, set([5]))
+
+    def test_update_dispatcher(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        dispatcher = DummyDispatcher(readable=True, fd=5)
+        instance.add_dispatcher(dispatcher)
+        dispatcher._readable = False
+        dispatcher._writable = True
+        instance.update_dispatcher(dispatcher)
+        self.assertEqual(instance.poller.readables, set())
+        self.assertEqual(instance.poller.writables, set([5]))
+
+    def test_update_dispatcher_ignores_unknown_dispatcher(self):
+        instance = self._makeOne()
+        instance.poller = DummyPoller({})
+        instance.update_dispatcher(DummyDispatcher(readable=True, fd=5))
+        self.assertEqual(instance.poller.readables, set())
+
     def test_close_parent_pipes(self):
         instance = self._makeOne()
         closed = []
@@ -1889,6 +2436,185 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         self.assertEqual(pconfigs[0].stderr_logfile, None)
         self.assertEqual(pconfigs[0].stderr_syslog, True)
 
+    def test_processes_from_section_logfile_buffer(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_logfile_buffer = 64KB
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_logfile_buffer, 64 * 1024)
+        self.assertEqual(pconfigs[0].stderr_logfile_buffer, 0)
+
+    def test_processes_from_section_logfile_rotation(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_logfile_rotation = segments
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_logfile_rotation, 'segments')
+        self.assertEqual(pconfigs[0].stderr_logfile_rotation, 'rename')
+
+    def test_processes_from_section_logfile_compress(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_logfile_rotation = segments
+        stdout_logfile_compress = gzip
+        stdout_logfile_backups_maxbytes = 1MB
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_logfile_compress, 'gzip')
+        self.assertEqual(pconfigs[0].stdout_logfile_backups_maxbytes, 1 << 20)
+        self.assertEqual(pconfigs[0].stderr_logfile_compress, None)
+        self.assertEqual(pconfigs[0].stderr_logfile_backups_maxbytes, 0)
+
+    def test_processes_from_section_logfile_index(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stderr_logfile_rotation = segments
+        stderr_logfile_index = true
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_logfile_index, False)
+        self.assertEqual(pconfigs[0].stderr_logfile_index, True)
+
+    def test_processes_from_section_tail_maxbytes(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_tail_maxbytes = 64KB
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_tail_maxbytes, 65536)
+        self.assertEqual(pconfigs[0].stderr_tail_maxbytes, 0)
+
+    def test_processes_from_section_logfile_compress_requires_segments(self):
+        instance = self._makeOne()
+        for option in ('stderr_logfile_compress = gzip',
+                       'stderr_logfile_backups_maxbytes = 1MB',
+                       'stderr_logfile_index = true'):
+            text = lstrip("""\
+            [program:foo]
+            command = /bin/foo
+            %s
+            """ % option)
+            from supervisor.options import UnhosedConfigParser
+            config = UnhosedConfigParser()
+            config.read_string(text)
+            try:
+                instance.processes_from_section(config, 'program:foo', 'bar')
+                self.fail('nothing raised')
+            except ValueError as exc:
+                self.assertTrue('requires stderr_logfile_rotation=segments'
+                                in exc.args[0])
+
+    def test_processes_from_section_bad_logfile_rotation(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stderr_logfile_rotation = timestamps
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        self.assertRaises(ValueError, instance.processes_from_section,
+                          config, 'program:foo', 'bar')
+
+    def test_processes_from_section_logfile_direct(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_logfile = /tmp/foo.log
+        stdout_logfile_direct = true
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stdout_logfile_direct, True)
+        self.assertEqual(pconfigs[0].stderr_logfile_direct, False)
+
+    def test_processes_from_section_logfile_direct_ignored_for_redirected_stderr(self):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        redirect_stderr = true
+        stderr_logfile_direct = true
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        pconfigs = instance.processes_from_section(config, 'program:foo', 'bar')
+        self.assertEqual(pconfigs[0].stderr_logfile_direct, False)
+
+    def _assertLogfileDirectRejected(self, options, msg):
+        instance = self._makeOne()
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/foo
+        stdout_logfile_direct = true
+        """) + options
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        try:
+            instance.processes_from_section(config, 'program:foo', None)
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertTrue(exc.args[0].startswith(msg), exc.args[0])
+
+    def test_processes_from_section_logfile_direct_without_logfile(self):
+        self._assertLogfileDirectRejected('stdout_logfile = NONE\n',
+            'stdout_logfile_direct=true requires stdout_logfile to be set')
+
+    def test_processes_from_section_logfile_direct_with_syslog(self):
+        self._assertLogfileDirectRejected('stdout_syslog = true\n',
+            'stdout_logfile_direct=true cannot be used with '
+            'stdout_syslog=true')
+
+    def test_processes_from_section_logfile_direct_with_capture(self):
+        self._assertLogfileDirectRejected('stdout_capture_maxbytes = 1MB\n',
+            'stdout_logfile_direct=true cannot be used with '
+            'stdout_capture_maxbytes')
+
+    def test_processes_from_section_logfile_direct_with_events(self):
+        self._assertLogfileDirectRejected('stdout_events_enabled = true\n',
+            'stdout_logfile_direct=true cannot be used with '
+            'stdout_events_enabled=true')
+
+    def test_processes_from_section_logfile_direct_with_index(self):
+        self._assertLogfileDirectRejected(
+            'stdout_logfile_rotation = segments\n'
+            'stdout_logfile_index = true\n',
+            'stdout_logfile_direct=true cannot be used with '
+            'stdout_logfile_index=true')
+
     def test_processes_from_section_redirect_stderr_with_auto(self):
         instance = self._makeOne()
         text = lstrip("""\
@@ -2505,8 +3231,41 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         gconfig = gconfigs[0]
         self.assertEqual(gconfig.name, 'many')
         self.assertEqual(gconfig.priority, 1)
+        self.assertEqual(gconfig.maxstarting, 0)
         self.assertEqual(len(gconfig.process_configs), 2)
 
+    def test_homogeneous_process_group_maxstarting(self):
+        text = lstrip("""\
+        [program:many]
+        process_name = %(program_name)s_%(process_num)s
+        command = /bin/cat
+        numprocs = 10
+        maxstarting = 2
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        instance = self._makeOne()
+        gconfigs = instance.process_groups_from_parser(config)
+        self.assertEqual(gconfigs[0].maxstarting, 2)
+
+    def test_process_group_maxstarting_negative(self):
+        text = lstrip("""\
+        [program:foo]
+        command = /bin/cat
+        maxstarting = -1
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        instance = self._makeOne()
+        try:
+            instance.process_groups_from_parser(config)
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0], '[program:foo] section sets '
+                'invalid maxstarting (-1)')
+
     def test_event_listener_pools_from_parser(self):
         text = lstrip("""\
         [eventlistener:dog]
@@ -2642,6 +3401,25 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
                 'redirect_stderr=true but this is not allowed because it '
                 'will interfere with the eventlistener protocol')
 
+    def test_event_listener_pool_disallows_stdout_logfile_direct(self):
+        text = lstrip("""\
+        [eventlistener:dog]
+        events=PROCESS_COMMUNICATION
+        command = /bin/dog
+        stdout_logfile_direct = true
+        """)
+        from supervisor.options import UnhosedConfigParser
+        config = UnhosedConfigParser()
+        config.read_string(text)
+        instance = self._makeOne()
+        try:
+            instance.process_groups_from_parser(config)
+            self.fail('nothing raised')
+        except ValueError as exc:
+            self.assertEqual(exc.args[0], '[eventlistener:dog] section sets '
+                'stdout_logfile_direct=true but this is not allowed because '
+                'it will interfere with the eventlistener protocol')
+
     def test_event_listener_pool_with_event_result_handler(self):
         text = lstrip("""\
         [eventlistener:dog]
@@ -3030,6 +3808,7 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         [group:thegroup]
         programs = one,two
         priority = 5
+        maxstarting = 1
         """)
         from supervisor.options import UnhosedConfigParser
         config = UnhosedConfigParser()
@@ -3040,6 +3819,7 @@ class ServerOptionsTests(unittest.TestCase, IncludeTestsMixin):
         gconfig = gconfigs[0]
         self.assertEqual(gconfig.name, 'thegroup')
         self.assertEqual(gconfig.priority, 5)
+        self.assertEqual(gconfig.maxstarting, 1)
         self.assertEqual(len(gconfig.process_configs), 2)
 
     def test_mixed_process_groups_from_parser1(self):
@@ -3449,6 +4229,21 @@ class ProcessConfigTests(unittest.TestCase):
         self.assertNotEqual(instance.get_path(), options.get_path())
         self.assertEqual(instance.get_path(), ['/a', '/b', '/c'])
 
+    def test_compile_spawn_plan(self):
+        options = DummyOptions()
+        instance = self._makeOne(options, command='/bin/sh -c true',
+                                 environment=None, serverurl=None)
+        instance.compile_spawn_plan()
+        plan = instance.spawn_plan
+        self.assertEqual(plan.argv, ['/bin/sh', '-c', 'true'])
+        self.assertEqual(plan.filename, '/bin/sh')
+
+    def test_compile_spawn_plan_bad_command(self):
+        options = DummyOptions()
+        instance = self._makeOne(options, command='extraquote"')
+        instance.compile_spawn_plan()
+        self.assertEqual(instance.spawn_plan, None)
+
     def test_create_autochildlogs(self):
         options = DummyOptions()
         instance = self._makeOne(options)
@@ -3507,6 +4302,46 @@ class ProcessConfigTests(unittest.TestCase):
             self.assertEqual(pipes['stdout'], 5)
             self.assertEqual(pipes['stderr'], None)
 
+    def test_make_dispatchers_stdout_logfile_direct(self):
+        options = DummyOptions()
+        instance = self._makeOne(options, stdout_logfile='/tmp/out.log',
+                                 stdout_logfile_direct=True,
+                                 stderr_logfile='/tmp/err.log',
+                                 redirect_stderr=False)
+        process1 = DummyProcess(instance)
+        dispatchers, pipes = instance.make_dispatchers(process1)
+        self.assertEqual(options.direct_logfiles_opened, ['/tmp/out.log'])
+        self.assertEqual(pipes['stdout'], None)
+        self.assertEqual(pipes['child_stdout'], 11)
+        self.assertEqual(sorted(d.channel for d in dispatchers.values()),
+                         ['stderr', 'stdin'])
+        dispatchers[7].normallog.close()
+
+    def test_make_dispatchers_stderr_logfile_direct(self):
+        options = DummyOptions()
+        instance = self._makeOne(options, stdout_logfile='/tmp/out.log',
+                                 stderr_logfile='/tmp/err.log',
+                                 stderr_logfile_direct=True,
+                                 redirect_stderr=False)
+        process1 = DummyProcess(instance)
+        dispatchers, pipes = instance.make_dispatchers(process1)
+        self.assertEqual(options.direct_logfiles_opened, ['/tmp/err.log'])
+        self.assertEqual(pipes['stderr'], None)
+        self.assertEqual(pipes['child_stderr'], 11)
+        self.assertEqual(sorted(d.channel for d in dispatchers.values()),
+                         ['stdin', 'stdout'])
+        dispatchers[5].normallog.close()
+
+    def test_make_dispatchers_logfile_direct_open_fails(self):
+        options = DummyOptions()
+        options.open_direct_logfile_exception = OSError(errno.EACCES, '')
+        instance = self._makeOne(options, stdout_logfile='/tmp/out.log',
+                                 stdout_logfile_direct=True)
+        process1 = DummyProcess(instance)
+        self.assertRaises(OSError, instance.make_dispatchers, process1)
+        self.assertEqual(options.parent_pipes_closed['stdin'], 4)
+        self.assertEqual(options.child_pipes_closed['child_stdin'], 3)
+
 class EventListenerConfigTests(unittest.TestCase):
     def _getTargetClass(self):
         from supervisor.options import EventListenerConfig
@@ -3630,6 +4465,15 @@ class ProcessGroupConfigTests(unittest.TestCase):
         self.assertEqual(instance.name, 'whatever')
         self.assertEqual(instance.priority, 999)
         self.assertEqual(instance.process_configs, [])
+        self.assertEqual(instance.maxstarting, 0)
+
+    def test_eq_compares_maxstarting(self):
+        options = DummyOptions()
+        instance1 = self._makeOne(options, 'whatever', 999, [])
+        instance2 = self._makeOne(options, 'whatever', 999, [])
+        self.assertEqual(instance1, instance2)
+        instance2.maxstarting = 1
+        self.assertNotEqual(instance1, instance2)
 
     def test_after_setuid(self):
         options = DummyOptions()
@@ -3637,6 +4481,7 @@ class ProcessGroupConfigTests(unittest.TestCase):
         instance = self._makeOne(options, 'whatever', 999, pconfigs)
         instance.after_setuid()
         self.assertEqual(pconfigs[0].autochildlogs_created, True)
+        self.assertEqual(pconfigs[0].spawn_plan_compiled, True)
 
     def test_make_group(self):
         options = DummyOptions()
@@ -3753,6 +4598,15 @@ class SignalReceiverTests(unittest.TestCase):
         self.assertEqual(sr.get_signal(), signal.SIGCHLD)
         self.assertEqual(sr.get_signal(), None)
 
+    def test_has_signal(self):
+        from supervisor.options import SignalReceiver
+        sr = SignalReceiver()
+        self.assertFalse(sr.has_signal())
+        sr.receive(signal.SIGTERM, 'frame')
+        self.assertTrue(sr.has_signal())
+        sr.get_signal()
+        self.assertFalse(sr.has_signal())
+
 class UnhosedConfigParserTests(unittest.TestCase):
     def _getTargetClass(self):
         from supervisor.options import UnhosedConfigParser
@@ -3877,3 +4731,115 @@ class UtilFunctionsTests(unittest.TestCase):
         self.assertEqual(s('process'), ('process', 'process'))
         self.assertEqual(s('group:'), ('group', None))
         self.assertEqual(s('group:*'), ('group', None))
+
+class LogReaderCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def _makeOne(self, *arg, **kw):
+        from supervisor.options import LogReaderCache
+        cache = LogReaderCache(*arg, **kw)
+        self.addCleanup(cache.close)
+        return cache
+
+    def _makeLog(self, name, data):
+        filename = os.path.join(self.dirname, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def test_open_keeps_file_open(self):
+        filename = self._makeLog('foo.log', b'abc')
+        cache = self._makeOne()
+        f = cache.open(filename)
+        self.assertEqual(f.read(), b'abc')
+        self.assertTrue(cache.open(filename) is f)
+        self.assertFalse(f.closed)
+
+    def test_open_sees_growth(self):
+        from supervisor.options import tailFile
+        filename = self._makeLog('foo.log', b'abc')
+        cache = self._makeOne()
+        self.assertEqual(tailFile(filename, 0, 10, cache), ['abc', 3, False])
+        with open(filename, 'ab') as f:
+            f.write(b'def')
+        self.assertEqual(tailFile(filename, 3, 3, cache), ['def', 6, False])
+        self.assertEqual(len(cache.files), 1)
+
+    def test_open_rotated(self):
+        from supervisor.options import readFile
+        filename = self._makeLog('foo.log', b'abc')
+        cache = self._makeOne()
+        f = cache.open(filename)
+        os.rename(filename, filename + '.1')
+        self._makeLog('foo.log', b'def')
+        self.assertEqual(readFile(filename, 0, 0, cache), b'def')
+        self.assertTrue(f.closed)
+
+    def test_open_truncated_in_place(self):
+        from supervisor.options import readFile
+        filename = self._makeLog('foo.log', b'OLD-' * 10)
+        cache = self._makeOne()
+        self.assertEqual(readFile(filename, 0, 10, cache), b'OLD-OLD-OL')
+        with open(filename, 'r+b') as f:
+            f.truncate(0)
+            f.write(b'NEW-' * 10)
+        self.assertEqual(readFile(filename, 0, 10, cache), b'NEW-NEW-NE')
+        self.assertEqual(len(cache.files), 1)
+
+    def test_open_removed(self):
+        from supervisor.options import readFile
+        filename = self._makeLog('foo.log', b'abc')
+        cache = self._makeOne()
+        f = cache.open(filename)
+        os.remove(filename)
+        try:
+            readFile(filename, 0, 0, cache)
+        except ValueError as inst:
+            self.assertEqual(inst.args[0], 'FAILED')
+        else:
+            raise AssertionError("Didn't raise")
+        self.assertTrue(f.closed)
+        self.assertEqual(cache.files, {})
+
+    def test_open_closes_least_recently_read(self):
+        foo = self._makeLog('foo.log', b'foo')
+        bar = self._makeLog('bar.log', b'bar')
+        baz = self._makeLog('baz.log', b'baz')
+        cache = self._makeOne(maxfiles=2)
+        f = cache.open(foo)
+        cache.open(bar)
+        cache.open(foo)
+        cache.open(baz)
+        self.assertEqual(list(cache.files.keys()), [foo, baz])
+        self.assertFalse(f.closed)
+
+    def test_open_closes_idle(self):
+        foo = self._makeLog('foo.log', b'foo')
+        bar = self._makeLog('bar.log', b'bar')
+        cache = self._makeOne(maxidle=0)
+        f = cache.open(foo)
+        cache.open(bar)
+        self.assertTrue(f.closed)
+        self.assertEqual(list(cache.files.keys()), [bar])
+
+    def test_compressed_not_cached(self):
+        import gzip
+        from supervisor.options import readFile
+        filename = os.path.join(self.dirname, 'foo.log.1.gz')
+        with gzip.GzipFile(filename, 'wb') as f:
+            f.write(b'abc')
+        cache = self._makeOne()
+        self.assertEqual(readFile(filename, 0, 0, cache), b'abc')
+        self.assertEqual(cache.files, {})
+
+    def test_close(self):
+        filename = self._makeLog('foo.log', b'abc')
+        cache = self._makeOne()
+        f = cache.open(filename)
+        cache.close()
+        self.assertTrue(f.closed)
+        self.assertEqual(cache.files, {})
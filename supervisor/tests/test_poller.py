@@ -4,7 +4,9 @@ import select
 from supervisor.tests.base import Mock
 
 from supervisor.poller import SelectPoller, PollPoller, KQueuePoller
+from supervisor.poller import EPollPoller
 from supervisor.poller import implements_poll, implements_kqueue
+from supervisor.poller import implements_epoll
 from supervisor.tests.base import DummyOptions
 
 # this base class is used instead of unittest.TestCase to hide
@@ -220,6 +222,16 @@ class KQueuePollerTests(KQueuePollerTestsBase):
         self.assertEqual(options.logger.data[1],
                          'EBADF encountered in kqueue. Invalid file descriptor 7')
 
+    def test_unregister_ignores_enoent(self):
+        _kqueue = DummyKQueue(raise_errno_register=errno.ENOENT)
+        options = DummyOptions()
+        poller = self._makeOne(options)
+        poller._kqueue = _kqueue
+        poller.readables.add(6)
+        poller.unregister_readable(6)
+        self.assertEqual(options.logger.data[0],
+                         'ENOENT encountered in kqueue. Unknown file descriptor 6')
+
     def test_register_uncaught_exception(self):
         _kqueue = DummyKQueue(raise_errno_register=errno.ENOMEM)
         options = DummyOptions()
@@ -322,6 +334,20 @@ class PollerPollTests(PollerPollTestsBase):
         self.assertEqual(readables, [6,7,9])
         self.assertEqual(writables, [8])
 
+    def test_poll_timeout_in_milliseconds(self):
+        select_poll = DummySelectPoll()
+        poller = self._makeOne(DummyOptions())
+        poller._poller = select_poll
+        poller.poll(1.5)
+        self.assertEqual(select_poll.timeout, 1500)
+
+    def test_poll_without_timeout_blocks(self):
+        select_poll = DummySelectPoll()
+        poller = self._makeOne(DummyOptions())
+        poller._poller = select_poll
+        poller.poll(None)
+        self.assertEqual(select_poll.timeout, None)
+
     def test_poll_ignores_eintr(self):
         select_poll = DummySelectPoll(error=errno.EINTR)
         options = DummyOptions()
@@ -350,6 +376,173 @@ class PollerPollTests(PollerPollTestsBase):
         self.assertEqual(readables, [7])
         self.assertEqual(select_poll.unregistered, [6])
 
+if implements_epoll():
+    EPollPollerTestsBase = unittest.TestCase
+else:
+    EPollPollerTestsBase = SkipTestCase
+
+class EPollPollerTests(EPollPollerTestsBase):
+
+    def _makeOne(self, options):
+        return EPollPoller(options)
+
+    def _makeWithDummy(self, **kw):
+        options = DummyOptions()
+        poller = self._makeOne(options)
+        poller._epoll.close()
+        poller._epoll = DummyEPoll(**kw)
+        return poller
+
+    def test_register_readable(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        self.assertEqual(poller._epoll.calls,
+                         [('register', 6, poller.READ)])
+        self.assertEqual(poller.readables, set([6]))
+
+    def test_register_writable(self):
+        poller = self._makeWithDummy()
+        poller.register_writable(6)
+        self.assertEqual(poller._epoll.calls,
+                         [('register', 6, poller.WRITE)])
+        self.assertEqual(poller.writables, set([6]))
+
+    def test_register_readable_twice_is_noop(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller.register_readable(6)
+        self.assertEqual(len(poller._epoll.calls), 1)
+
+    def test_register_readable_and_writable_modifies(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller.register_writable(6)
+        self.assertEqual(poller._epoll.calls,
+                         [('register', 6, poller.READ),
+                          ('modify', 6, poller.READ | poller.WRITE)])
+
+    def test_unregister_readable(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller.unregister_readable(6)
+        self.assertEqual(poller._epoll.calls,
+                         [('register', 6, poller.READ),
+                          ('unregister', 6, None)])
+        self.assertEqual(poller.readables, set())
+        self.assertEqual(poller._eventmasks, {})
+
+    def test_unregister_writable_keeps_read_interest(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller.register_writable(6)
+        poller.unregister_writable(6)
+        self.assertEqual(poller._epoll.calls[-1],
+                         ('modify', 6, poller.READ))
+        self.assertEqual(poller.writables, set())
+
+    def test_unregister_unknown_fd_is_noop(self):
+        poller = self._makeWithDummy()
+        poller.unregister_readable(6)
+        poller.unregister_writable(6)
+        self.assertEqual(poller._epoll.calls, [])
+
+    def test_unregister_ignores_ebadf(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller._epoll.errno_ctl = errno.EBADF
+        poller.unregister_readable(6)
+        self.assertEqual(poller.options.logger.data[0],
+                         'EBADF encountered in epoll. Invalid file descriptor 6')
+        self.assertEqual(poller._eventmasks, {})
+
+    def test_register_ebadf_forgets_fd(self):
+        poller = self._makeWithDummy(errno_ctl=errno.EBADF)
+        poller.register_readable(6)
+        self.assertEqual(poller.readables, set())
+        self.assertEqual(poller._eventmasks, {})
+
+    def test_modify_enoent_reregisters(self):
+        poller = self._makeWithDummy()
+        poller.register_readable(6)
+        poller._epoll.errno_ctl = errno.ENOENT
+        poller.register_writable(6)
+        self.assertEqual(poller._epoll.calls[-1],
+                         ('register', 6, poller.READ | poller.WRITE))
+
+    def test_register_eexist_modifies(self):
+        poller = self._makeWithDummy(errno_ctl=errno.EEXIST)
+        poller.register_readable(6)
+        self.assertEqual(poller._epoll.calls[-1],
+                         ('modify', 6, poller.READ))
+
+    def test_register_uncaught_exception(self):
+        poller = self._makeWithDummy(errno_ctl=errno.ENOMEM)
+        self.assertRaises(OSError, poller.register_readable, 6)
+
+    def test_poll_returns_readables_and_writables(self):
+        poller = self._makeWithDummy(result=[(6, select.EPOLLIN),
+                                             (7, select.EPOLLPRI),
+                                             (8, select.EPOLLOUT),
+                                             (9, select.EPOLLHUP)])
+        poller.register_readable(6)
+        poller.register_readable(7)
+        poller.register_writable(8)
+        poller.register_readable(9)
+        readables, writables = poller.poll(1)
+        self.assertEqual(readables, [6,7,9])
+        self.assertEqual(writables, [8])
+
+    def test_poll_reports_errors_to_interested_side(self):
+        poller = self._makeWithDummy(result=[(6, select.EPOLLERR),
+                                             (7, select.EPOLLERR)])
+        poller.register_readable(6)
+        poller.register_writable(7)
+        readables, writables = poller.poll(1)
+        self.assertEqual(readables, [6])
+        self.assertEqual(writables, [7])
+
+    def test_poll_without_timeout_blocks(self):
+        poller = self._makeWithDummy()
+        poller.poll(None)
+        self.assertEqual(poller._epoll.timeout, -1)
+
+    def test_poll_ignores_eintr(self):
+        poller = self._makeWithDummy(errno_poll=errno.EINTR)
+        poller.register_readable(9)
+        self.assertEqual(poller.poll(1), ([], []))
+        self.assertEqual(poller.options.logger.data[0],
+                         'EINTR encountered in poll')
+
+    def test_poll_uncaught_exception(self):
+        poller = self._makeWithDummy(errno_poll=errno.EINVAL)
+        poller.register_readable(9)
+        self.assertRaises(OSError, poller.poll, 1)
+
+    def test_close_closes_epoll(self):
+        mock_epoll = Mock()
+        poller = self._makeOne(DummyOptions())
+        poller._epoll.close()
+        poller._epoll = mock_epoll
+        poller.close()
+        mock_epoll.close.assert_called_once_with()
+        self.assertEqual(poller._epoll, None)
+
+    def test_real_epoll_roundtrip(self):
+        import os
+        r, w = os.pipe()
+        try:
+            poller = self._makeOne(DummyOptions())
+            poller.register_readable(r)
+            poller.register_writable(w)
+            self.assertEqual(poller.poll(0), ([], [w]))
+            os.write(w, b'x')
+            poller.unregister_writable(w)
+            self.assertEqual(poller.poll(0), ([r], []))
+            poller.close()
+        finally:
+            os.close(r)
+            os.close(w)
+
 class DummySelect(object):
     '''
     Fake implementation of select.select()
@@ -387,7 +580,8 @@ class DummySelectPoll(object):
     def unregister(self, fd):
         self.unregistered.append(fd)
 
-    def poll(self, timeout):
+    def poll(self, timeout=None):
+        self.timeout = timeout
         if self.error:
             raise select.error(self.error)
         return self.result
@@ -432,6 +626,39 @@ class DummyKQueue(object):
         assert max_events == 0, (
             "`max_events` parameter of `kqueue.control()` should be 0 on register")
 
+class DummyEPoll(object):
+    '''
+    Fake implementation of select.epoll()
+    '''
+    def __init__(self, result=None, errno_poll=None, errno_ctl=None):
+        self.result = result or []
+        self.errno_poll = errno_poll
+        self.errno_ctl = errno_ctl
+        self.calls = []
+
+    def _ctl(self, name, fd, eventmask):
+        err = self.errno_ctl
+        if err:
+            # fail only once, like a real epoll_ctl followed by a retry
+            self.errno_ctl = None
+            raise OSError(err, 'error')
+        self.calls.append((name, fd, eventmask))
+
+    def register(self, fd, eventmask):
+        self._ctl('register', fd, eventmask)
+
+    def modify(self, fd, eventmask):
+        self._ctl('modify', fd, eventmask)
+
+    def unregister(self, fd):
+        self._ctl('unregister', fd, None)
+
+    def poll(self, timeout):
+        self.timeout = timeout
+        if self.errno_poll:
+            raise OSError(self.errno_poll, 'error')
+        return self.result
+
 class FakeKEvent(object):
     def __init__(self, ident, filter):
         self.ident = ident
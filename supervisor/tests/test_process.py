@@ -1,5 +1,6 @@
 import errno
 import os
+import shutil
 import signal
 import tempfile
 import time
@@ -14,6 +15,7 @@ from supervisor.tests.base import DummyPConfig
 from supervisor.tests.base import DummyProcess
 from supervisor.tests.base import DummyPGroupConfig
 from supervisor.tests.base import DummyDispatcher
+from supervisor.tests.base import DummyQueuedHandler
 from supervisor.tests.base import DummyEvent
 from supervisor.tests.base import DummyFCGIGroupConfig
 from supervisor.tests.base import DummySocketConfig
@@ -80,6 +82,16 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(instance.dispatchers[0].logs_reopened, True)
         self.assertEqual(instance.dispatchers[1].logs_reopened, False)
 
+    def test_flushlogs(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.dispatchers = {0:DummyDispatcher(readable=True),
+                                1:DummyDispatcher(writable=True)}
+        instance.flushlogs()
+        self.assertEqual(instance.dispatchers[0].logs_flushed, True)
+        self.assertEqual(instance.dispatchers[1].logs_flushed, False)
+
     def test_removelogs(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'test', '/test')
@@ -90,6 +102,128 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(instance.dispatchers[0].logs_removed, True)
         self.assertEqual(instance.dispatchers[1].logs_removed, False)
 
+    def test_removelogs_clears_output_tails(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        tail = OutputTail(10)
+        tail.write(b'abc')
+        instance.output_tails['stdout'] = tail
+        instance.removelogs()
+        self.assertEqual(tail.start, tail.end)
+        self.assertEqual(tail.read(0, 3), b'')
+
+    def test_get_output_tail_none(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        self.assertEqual(instance.get_output_tail('stdout'), (None, None))
+
+    def test_get_output_tail_no_logfile(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        tail = OutputTail(10)
+        tail.write(b'abcdefghijkl')
+        instance.output_tails['stdout'] = tail
+        self.assertEqual(instance.get_output_tail('stdout'), (tail, 12))
+
+    def test_get_output_tail_logfile(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'abc')
+            f.flush()
+            config = DummyPConfig(options, 'test', '/test',
+                                  stdout_logfile=f.name)
+            instance = self._makeOne(config)
+            tail = OutputTail(10)
+            tail.write(b'abcdef')
+            instance.output_tails['stdout'] = tail
+            self.assertEqual(instance.get_output_tail('stdout'), (tail, 3))
+            # bytes still queued for a writer thread aren't in the file
+            handler = DummyQueuedHandler()
+            handler.queued_bytes = 3
+            tail.queued_handlers = [handler]
+            self.assertEqual(instance.get_output_tail('stdout'),
+                             (tail, None))
+
+    def test_get_output_tail_logfile_of_both_channels(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'outerr')
+            f.flush()
+            config = DummyPConfig(options, 'test', '/test',
+                                  stdout_logfile=f.name,
+                                  stderr_logfile=f.name)
+            instance = self._makeOne(config)
+            tail = OutputTail(10)
+            tail.write(b'out')
+            instance.output_tails['stdout'] = tail
+            self.assertEqual(instance.get_output_tail('stdout'),
+                             (tail, None))
+
+    def test_get_output_tail_logfile_of_another_process(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'abc')
+            f.flush()
+            config = DummyPConfig(options, 'test', '/test',
+                                  stdout_logfile=f.name)
+            other = DummyPConfig(options, 'other', '/other',
+                                 stdout_logfile=f.name)
+            options.process_group_configs = [
+                DummyPGroupConfig(options, pconfigs=[config, other])]
+            instance = self._makeOne(config)
+            tail = OutputTail(10)
+            tail.write(b'abc')
+            instance.output_tails['stdout'] = tail
+            self.assertEqual(instance.get_output_tail('stdout'),
+                             (tail, None))
+            options.process_group_configs = [
+                DummyPGroupConfig(options, pconfigs=[config])]
+            self.assertEqual(instance.get_output_tail('stdout'), (tail, 3))
+
+    def test_get_output_tail_logfile_missing(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test',
+                              stdout_logfile='/nonexistent/foo.log')
+        instance = self._makeOne(config)
+        tail = OutputTail(10)
+        instance.output_tails['stdout'] = tail
+        self.assertEqual(instance.get_output_tail('stdout'), (tail, None))
+
+    def test_ctor_directlogs(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'cat', 'bin/cat',
+                              stderr_logfile='/tmp/temp456.log',
+                              stderr_logfile_direct=True)
+        instance = self._makeOne(config)
+        self.assertEqual([d.channel for d in instance.directlogs], ['stderr'])
+
+    def test_removelogs_truncates_direct_logfile(self):
+        from supervisor.loggers import LogOffsets
+        options = DummyOptions()
+        dirname = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dirname)
+        logfile = os.path.join(dirname, 'foo.log')
+        with open(logfile, 'wb') as f:
+            f.write(b'abc')
+        config = DummyPConfig(options, 'test', '/test',
+                              stdout_logfile=logfile,
+                              stdout_logfile_direct=True,
+                              stdout_logfile_rotation='segments')
+        instance = self._makeOne(config)
+        instance.removelogs()
+        self.assertEqual(os.path.getsize(logfile), 0)
+        # the bytes that were removed keep their offsets
+        self.assertEqual(LogOffsets(logfile).start, 3)
+
     def test_drain(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'test', '/test',
@@ -102,6 +236,22 @@ class SubprocessTests(unittest.TestCase):
         self.assertTrue(instance.dispatchers[0].read_event_handled)
         self.assertTrue(instance.dispatchers[1].write_event_handled)
 
+    def test_drain_reads_backlogged(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        backlogged = DummyDispatcher()
+        handler = DummyQueuedHandler()
+        handler.is_backlogged = True
+        backlogged.queued_handlers = [handler]
+        closed = DummyDispatcher()
+        closed.queued_handlers = [handler]
+        closed.closed = True
+        instance.dispatchers = {0:backlogged, 1:closed}
+        instance.drain()
+        self.assertTrue(backlogged.read_event_handled)
+        self.assertFalse(closed.read_event_handled)
+
     def test_get_execv_args_bad_command_extraquote(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'extraquote', 'extraquote"')
@@ -180,6 +330,74 @@ class SubprocessTests(unittest.TestCase):
             self.assertEqual(args[0], f.name)
             self.assertEqual(args[1], [basename, 'foo'])
 
+    def test_get_execv_args_reuses_spawn_plan(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'sh', 'sh foo')
+        instance = self._makeOne(config)
+        instance.get_execv_args()
+        plan = config.spawn_plan
+        stats = []
+        def stat(filename):
+            stats.append(filename)
+            return os.stat(filename)
+        options.stat = stat
+        args = instance.get_execv_args()
+        self.assertEqual(args, ('/bin/sh', ['sh', 'foo']))
+        self.assertTrue(config.spawn_plan is plan)
+        self.assertEqual(stats, ['/bin/sh']) # no $PATH search
+
+    def test_get_execv_args_resolves_again_when_executable_changes(self):
+        with tempfile.NamedTemporaryFile() as f:
+            os.chmod(f.name, 0o700)
+            dirname, basename = os.path.split(f.name)
+            options = DummyOptions()
+            config = DummyPConfig(options, 'sh', basename)
+            config.get_path = lambda: [ dirname ]
+            instance = self._makeOne(config)
+            self.assertEqual(instance.get_execv_args()[0], f.name)
+            config.get_path = lambda: [ '/bin' ]
+            # the executable is still there and unchanged
+            self.assertEqual(instance.get_execv_args()[0], f.name)
+            # it changed, so $PATH is searched again
+            os.chmod(f.name, 0o600)
+            self.assertEqual(instance.get_execv_args()[0], basename)
+
+    def test_get_execv_args_command_changed(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'sh', '/bin/sh foo')
+        instance = self._makeOne(config)
+        instance.get_execv_args()
+        config.command = '/bin/sh bar'
+        args = instance.get_execv_args()
+        self.assertEqual(args, ('/bin/sh', ['/bin/sh', 'bar']))
+
+    def test_get_execv_args_returns_copy_of_argv(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'sh', '/bin/sh foo')
+        instance = self._makeOne(config)
+        instance.get_execv_args()[1].append('bar')
+        self.assertEqual(instance.get_execv_args()[1], ['/bin/sh', 'foo'])
+
+    def test_child_env_per_group(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'cat', '/bin/cat')
+        instance = self._makeOne(config)
+        self.assertFalse('SUPERVISOR_GROUP_NAME' in instance._get_child_env())
+        instance.group = DummyProcessGroup(DummyPGroupConfig(options, 'foo'))
+        env = instance._get_child_env()
+        self.assertEqual(env['SUPERVISOR_GROUP_NAME'], 'foo')
+        env['FOO'] = 'bar'
+        self.assertFalse('FOO' in instance._get_child_env())
+
+    def test_child_env_environment_overrides_group_name(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'cat', '/bin/cat',
+                              environment={'SUPERVISOR_GROUP_NAME': 'mine'})
+        instance = self._makeOne(config)
+        instance.group = DummyProcessGroup(DummyPGroupConfig(options, 'foo'))
+        env = instance._get_child_env()
+        self.assertEqual(env['SUPERVISOR_GROUP_NAME'], 'mine')
+
     def test_record_spawnerr(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'test', '/test')
@@ -355,6 +573,85 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(event1.__class__, events.ProcessStateStartingEvent)
         self.assertEqual(event2.__class__, events.ProcessStateBackoffEvent)
 
+    def test_spawn_with_posix_spawn(self):
+        options = DummyOptions()
+        options.posix_spawn_available = True
+        options.forkpid = 10
+        options.inheritable_fds = [0, 1, 2, 9]
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        result = instance.spawn()
+        self.assertEqual(result, 10)
+        filename, argv, env, file_actions = options.posix_spawn_args
+        self.assertEqual(filename, '/good/filename')
+        self.assertEqual(argv, ['/good/filename'])
+        self.assertEqual(env['SUPERVISOR_PROCESS_NAME'], 'good')
+        self.assertEqual(file_actions, [(os.POSIX_SPAWN_DUP2, 3, 0),
+                                        (os.POSIX_SPAWN_DUP2, 6, 1),
+                                        (os.POSIX_SPAWN_DUP2, 8, 2),
+                                        (os.POSIX_SPAWN_CLOSE, 9)])
+        self.assertEqual(options.pgrp_set, None) # done by posix_spawn
+        self.assertEqual(options.execve_called, False)
+        self.assertEqual(len(options.child_pipes_closed), 6)
+        self.assertEqual(options.pidhistory[10], instance)
+        from supervisor.states import ProcessStates
+        self.assertEqual(instance.state, ProcessStates.STARTING)
+
+    def test_spawn_with_posix_spawn_stderr_redirected(self):
+        options = DummyOptions()
+        options.posix_spawn_available = True
+        options.forkpid = 10
+        config = DummyPConfig(options, 'good', '/good/filename',
+                              redirect_stderr=True)
+        instance = self._makeOne(config)
+        instance.spawn()
+        file_actions = options.posix_spawn_args[3]
+        self.assertEqual(file_actions, [(os.POSIX_SPAWN_DUP2, 3, 0),
+                                        (os.POSIX_SPAWN_DUP2, 6, 1),
+                                        (os.POSIX_SPAWN_DUP2, 6, 2)])
+
+    def test_spawn_with_posix_spawn_fail(self):
+        options = DummyOptions()
+        options.posix_spawn_available = True
+        options.fork_exception = OSError(errno.ENOEXEC,
+                                         os.strerror(errno.ENOEXEC))
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.BACKOFF
+        result = instance.spawn()
+        self.assertEqual(result, None)
+        msg = "couldn't exec /good/filename: ENOEXEC"
+        self.assertEqual(instance.spawnerr, msg)
+        self.assertEqual(options.logger.data[0], "spawnerr: %s" % msg)
+        self.assertEqual(len(options.parent_pipes_closed), 6)
+        self.assertEqual(len(options.child_pipes_closed), 6)
+        self.assertEqual(instance.state, ProcessStates.BACKOFF)
+
+    def test_spawn_with_posix_spawn_fail_eagain(self):
+        options = DummyOptions()
+        options.posix_spawn_available = True
+        options.fork_exception = OSError(errno.EAGAIN,
+                                         os.strerror(errno.EAGAIN))
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.BACKOFF
+        instance.spawn()
+        msg = "Too many processes in process table to spawn 'good'"
+        self.assertEqual(instance.spawnerr, msg)
+        self.assertEqual(instance.state, ProcessStates.BACKOFF)
+
+    def test_spawn_forks_when_posix_spawn_cannot_be_used(self):
+        for kw in ({'uid': 1}, {'directory': '/tmp'}, {'umask': 0o22}):
+            options = DummyOptions()
+            options.posix_spawn_available = True
+            options.forkpid = 10
+            config = DummyPConfig(options, 'good', '/good/filename', **kw)
+            instance = self._makeOne(config)
+            self.assertEqual(instance.spawn(), 10)
+            self.assertEqual(options.posix_spawn_args, None)
+
     def test_spawn_as_child_setuid_ok(self):
         options = DummyOptions()
         options.forkpid = 0
@@ -480,6 +777,116 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(options.privsdropped, None)
         self.assertEqual(options._exitcode, 127)
 
+    def test_spawn_as_child_reports_exec_failure_on_status_pipe(self):
+        options = DummyOptions()
+        options.forkpid = 0
+        options.exec_status_pipe = (3, 4)
+        options.execv_exception = OSError(errno.ENOENT,
+                                          os.strerror(errno.ENOENT))
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        result = instance.spawn()
+        self.assertEqual(result, None)
+        # the status pipe is kept open for the exec
+        self.assertEqual(options.fds_closed, [3])
+        self.assertEqual(options.written[4],
+                         "couldn't exec /good/filename: ENOENT")
+        self.assertEqual(options._exitcode, 127)
+
+    def test_spawn_as_parent_exec_succeeded(self):
+        options = DummyOptions()
+        options.forkpid = 10
+        options.exec_status_pipe = (50, 51)
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        result = instance.spawn()
+        self.assertEqual(result, 10)
+        # we don't wait for the child to exec
+        self.assertEqual(options.fds_closed, [51])
+        dispatcher = instance.exec_status_dispatcher
+        self.assertEqual(dispatcher.fd, 50)
+        self.assertTrue(options.process_map[50] is dispatcher)
+        self.assertEqual(options.pidhistory[10], instance)
+        from supervisor.states import ProcessStates
+        self.assertEqual(instance.state, ProcessStates.STARTING)
+        # not RUNNING until the child has exec'd, however long it takes
+        instance.laststart = time.time() - 10
+        instance.transition()
+        self.assertEqual(instance.state, ProcessStates.STARTING)
+        dispatcher.handle_read_event()
+        self.assertEqual(options.fds_closed, [51, 50])
+        self.assertEqual(instance.exec_status_dispatcher, None)
+        self.assertEqual(instance.exec_error, None)
+        self.assertFalse(50 in options.process_map)
+        instance.transition()
+        self.assertEqual(instance.state, ProcessStates.RUNNING)
+
+    def test_spawn_as_parent_exec_failed(self):
+        options = DummyOptions()
+        options.forkpid = 10
+        options.exec_status_pipe = (50, 51)
+        options.exec_status = b"couldn't exec /good/filename: ENOENT"
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.BACKOFF
+        from supervisor import events
+        L = []
+        events.subscribe(events.ProcessStateEvent, lambda x: L.append(x))
+        result = instance.spawn()
+        self.assertEqual(result, 10)
+        dispatcher = instance.exec_status_dispatcher
+        dispatcher.handle_read_event()
+        dispatcher.handle_read_event()
+        msg = "couldn't exec /good/filename: ENOENT"
+        self.assertEqual(instance.spawnerr, msg)
+        self.assertTrue("spawnerr: %s" % msg in options.logger.data)
+        # the child exits right after telling us; until it is reaped
+        # the process doesn't become RUNNING
+        instance.laststart = time.time() - 10
+        instance.transition()
+        self.assertEqual(instance.state, ProcessStates.STARTING)
+        instance.finish(10, 127 << 8)
+        self.assertEqual(instance.spawnerr, msg)
+        self.assertEqual(instance.exitstatus, None)
+        self.assertEqual(instance.exec_error, None)
+        self.assertEqual(instance.pid, 0)
+        self.assertEqual(len(options.parent_pipes_closed), 6)
+        self.assertEqual(instance.state, ProcessStates.BACKOFF)
+        self.assertEqual([e.__class__ for e in L],
+                         [events.ProcessStateStartingEvent,
+                          events.ProcessStateBackoffEvent])
+
+    def test_finish_reads_pending_exec_status(self):
+        options = DummyOptions()
+        options.forkpid = 10
+        options.exec_status_pipe = (50, 51)
+        config = DummyPConfig(options, 'good', '/good/filename',
+                              startsecs=0)
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.BACKOFF
+        instance.spawn()
+        # reaped before the mainloop got round to the status pipe
+        options.exec_status = b"couldn't chdir to /x: ENOENT"
+        instance.finish(10, 127 << 8)
+        self.assertEqual(instance.exec_status_dispatcher, None)
+        self.assertEqual(options.fds_closed, [51, 50])
+        self.assertEqual(instance.spawnerr, "couldn't chdir to /x: ENOENT")
+        self.assertEqual(instance.state, ProcessStates.BACKOFF)
+
+    def test_spawn_fork_fail_closes_status_pipe(self):
+        options = DummyOptions()
+        options.exec_status_pipe = (50, 51)
+        options.fork_exception = OSError(errno.EAGAIN,
+                                         os.strerror(errno.EAGAIN))
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.BACKOFF
+        instance.spawn()
+        self.assertEqual(options.fds_closed, [50, 51])
+
     def test_spawn_as_child_execv_fail_runtime_error(self):
         options = DummyOptions()
         options.forkpid = 0
@@ -577,6 +984,36 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(instance.config.options.pidhistory[10], instance)
         from supervisor.states import ProcessStates
         self.assertEqual(instance.state, ProcessStates.STARTING)
+        self.assertEqual(options.process_map, instance.dispatchers)
+        self.assertEqual(options.poller.readables, set([5, 7]))
+        self.assertEqual(options.poller.writables, set([4]))
+
+    def test_spawn_as_parent_starts_directlogs(self):
+        options = DummyOptions()
+        options.forkpid = 10
+        config = DummyPConfig(options, 'good', '/good/filename',
+                              stdout_logfile='/tmp/foo.log',
+                              stdout_logfile_maxbytes=1024,
+                              stdout_logfile_direct=True)
+        instance = self._makeOne(config)
+        instance.spawn()
+        directlog = instance.directlogs[0]
+        self.assertTrue(options.timers.get_deadline(directlog) > time.time())
+
+    def test_spawn_as_parent_opens_pidfd(self):
+        options = DummyOptions()
+        options.forkpid = 10
+        options.pidfd_open_result = 42
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        instance.spawn()
+        from supervisor.dispatchers import PExitDispatcher
+        dispatcher = instance.pidfd_dispatcher
+        self.assertEqual(dispatcher.__class__, PExitDispatcher)
+        self.assertEqual(dispatcher.fd, 42)
+        self.assertTrue(options.process_map[42] is dispatcher)
+        self.assertEqual(options.poller.readables, set([5, 7, 42]))
+        self.assertFalse(42 in instance.dispatchers)
 
     def test_spawn_redirect_stderr(self):
         options = DummyOptions()
@@ -607,6 +1044,21 @@ class SubprocessTests(unittest.TestCase):
         instance.killing = True
         self.assertRaises(OSError, instance.write, sent)
 
+    def test_write_leaves_unsent_input_to_mainloop(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'output', '/bin/cat')
+        instance = self._makeOne(config)
+        options.forkpid = 1
+        instance.spawn()
+        stdin_fd = instance.pipes['stdin']
+        dispatcher = instance.dispatchers[stdin_fd]
+        dispatcher._writable = False
+        options.update_dispatcher(dispatcher)
+        self.assertEqual(options.poller.writables, set())
+        dispatcher._writable = True
+        instance.write('foo')
+        self.assertEqual(options.poller.writables, set([stdin_fd]))
+
     def test_write_dispatcher_closed(self):
         executable = '/bin/cat'
         options = DummyOptions()
@@ -857,6 +1309,44 @@ class SubprocessTests(unittest.TestCase):
         event = L[0]
         self.assertEqual(event.__class__, events.ProcessStateStoppingEvent)
 
+    def test_kill_from_running_with_pidfd(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.pid = 11
+        instance.pidfd_dispatcher = DummyDispatcher(fd=42)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.RUNNING
+        instance.kill(signal.SIGTERM)
+        self.assertTrue(instance.killing)
+        self.assertEqual(options.pidfd_signals, {42: signal.SIGTERM})
+        self.assertEqual(options.kills, {})
+
+    def test_kill_with_pidfd_ESRCH(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.pid = 11
+        instance.pidfd_dispatcher = DummyDispatcher(fd=42)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.RUNNING
+        options.kill_exception = OSError(errno.ESRCH,
+                                         os.strerror(errno.ESRCH))
+        self.assertEqual(instance.kill(signal.SIGTERM), None)
+        self.assertEqual(instance.state, ProcessStates.STOPPING)
+
+    def test_kill_w_stopasgroup_ignores_pidfd(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test', stopasgroup=True)
+        instance = self._makeOne(config)
+        instance.pid = 11
+        instance.pidfd_dispatcher = DummyDispatcher(fd=42)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.RUNNING
+        instance.kill(signal.SIGTERM)
+        self.assertEqual(options.kills, {-11: signal.SIGTERM})
+        self.assertEqual(options.pidfd_signals, {})
+
     def test_kill_from_running_error(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'test', '/test')
@@ -1004,6 +1494,18 @@ class SubprocessTests(unittest.TestCase):
         self.assertTrue(instance.pid in options.kills)
         self.assertEqual(options.kills[instance.pid], signal.SIGWINCH)
 
+    def test_signal_from_running_with_pidfd(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.pid = 11
+        instance.pidfd_dispatcher = DummyDispatcher(fd=42)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.RUNNING
+        instance.signal(signal.SIGWINCH)
+        self.assertEqual(options.pidfd_signals, {42: signal.SIGWINCH})
+        self.assertEqual(options.kills, {})
+
     def test_signal_from_running_error_ESRCH(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'test', '/test')
@@ -1083,6 +1585,70 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(event.extra_values, [('pid', 123)])
         self.assertEqual(event.from_state, ProcessStates.STOPPING)
 
+    def test_finish_removes_dispatchers_from_process_map(self):
+        options = DummyOptions()
+        options.forkpid = 123
+        config = DummyPConfig(options, 'notthere', '/notthere')
+        instance = self._makeOne(config)
+        instance.spawn()
+        other = DummyDispatcher(readable=True, fd=99)
+        options.add_dispatcher(other)
+        instance.finish(123, 1)
+        self.assertEqual(options.process_map, {99: other})
+        self.assertEqual(options.poller.readables, set([99]))
+        self.assertEqual(options.poller.writables, set())
+
+    def test_finish_logs_output_of_backlogged_dispatcher(self):
+        from supervisor.dispatchers import POutputDispatcher
+        from supervisor.events import ProcessCommunicationStdoutEvent
+        options = DummyOptions()
+        options.readfd_result = b'goodbye'
+        config = DummyPConfig(options, 'notthere', '/notthere',
+                              stdout_logfile='/tmp/foo')
+        instance = self._makeOne(config)
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.STOPPING
+        instance.killing = True
+        instance.pid = 123
+        instance.pipes = {'stdout':5}
+        dispatcher = POutputDispatcher(instance,
+                                       ProcessCommunicationStdoutEvent, 5)
+        handler = DummyQueuedHandler()
+        handler.is_backlogged = True
+        dispatcher.queued_handlers = [handler]
+        instance.dispatchers = {5:dispatcher}
+        self.assertFalse(dispatcher.readable())
+        instance.finish(123, 1)
+        self.assertEqual(dispatcher.childlog.data, [b'goodbye'])
+
+    def test_finish_stops_directlogs(self):
+        options = DummyOptions()
+        options.forkpid = 123
+        config = DummyPConfig(options, 'notthere', '/notthere',
+                              stdout_logfile='/tmp/foo.log',
+                              stdout_logfile_maxbytes=1024,
+                              stdout_logfile_direct=True)
+        instance = self._makeOne(config)
+        instance.spawn()
+        instance.finish(123, 1)
+        directlog = instance.directlogs[0]
+        self.assertEqual(options.timers.get_deadline(directlog), None)
+
+    def test_finish_closes_pidfd(self):
+        options = DummyOptions()
+        options.forkpid = 123
+        options.pidfd_open_result = 42
+        config = DummyPConfig(options, 'notthere', '/notthere')
+        instance = self._makeOne(config)
+        instance.spawn()
+        dispatcher = instance.pidfd_dispatcher
+        instance.finish(123, 1)
+        self.assertEqual(instance.pidfd_dispatcher, None)
+        self.assertTrue(dispatcher.closed)
+        self.assertTrue(42 in options.fds_closed)
+        self.assertEqual(options.process_map, {})
+        self.assertEqual(options.poller.readables, set())
+
     def test_finish_running_state_exit_expected(self):
         options = DummyOptions()
         config = DummyPConfig(options, 'notthere', '/notthere',
@@ -1727,6 +2293,384 @@ class SubprocessTests(unittest.TestCase):
         self.assertEqual(instance.backoff, 1)
         self.assertTrue(instance.delay > 0)
 
+    def test_change_state_schedules_transition(self):
+        from supervisor.states import ProcessStates
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.STARTING
+        instance.change_state(ProcessStates.BACKOFF)
+        self.assertEqual(options.timers.get_deadline(instance), 0)
+
+    def test_change_state_no_change_doesnt_schedule_transition(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.state = 10
+        instance.change_state(10)
+        self.assertEqual(options.timers.get_deadline(instance), None)
+
+    def test_transition_reschedules_after_state_change(self):
+        from supervisor.states import ProcessStates
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test', startretries=10)
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.STARTING
+        instance.change_state(ProcessStates.BACKOFF)
+        instance.transition()
+        self.assertEqual(options.timers.get_deadline(instance),
+                         instance.delay)
+
+    def test_kill_from_stopping_reschedules_transition(self):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test', stopwaitsecs=10)
+        instance = self._makeOne(config)
+        instance.pid = 11
+        from supervisor.states import ProcessStates
+        instance.state = ProcessStates.STOPPING
+        instance.delay = 5
+        options.timers.schedule(instance, 5)
+        instance.kill(signal.SIGKILL)
+        self.assertEqual(options.timers.get_deadline(instance),
+                         instance.delay)
+        self.assertTrue(instance.delay > 5)
+
+    def test_transition_schedules_starting_deadline(self):
+        from supervisor.states import ProcessStates
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test', startsecs=10)
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.STARTING
+        instance.laststart = time.time()
+        instance.transition()
+        self.assertEqual(instance.state, ProcessStates.STARTING)
+        self.assertEqual(options.timers.get_deadline(instance),
+                         instance.laststart + 10)
+
+    def test_get_deadline(self):
+        from supervisor.states import ProcessStates
+        from supervisor.states import SupervisorStates
+        from supervisor.datatypes import RestartUnconditionally
+        options = DummyOptions()
+        options.mood = SupervisorStates.RUNNING
+        config = DummyPConfig(options, 'test', '/test', startsecs=10,
+                              startretries=3)
+        instance = self._makeOne(config)
+        instance.laststart = 100
+        instance.delay = 200
+        instance.state = ProcessStates.STARTING
+        self.assertEqual(instance._get_deadline(), 110)
+        instance.state = ProcessStates.STOPPING
+        self.assertEqual(instance._get_deadline(), 200)
+        instance.state = ProcessStates.RUNNING
+        self.assertEqual(instance._get_deadline(), None)
+        instance.state = ProcessStates.BACKOFF
+        instance.backoff = 1
+        self.assertEqual(instance._get_deadline(), 200)
+        instance.backoff = 4
+        self.assertEqual(instance._get_deadline(), 0)
+        instance.state = ProcessStates.EXITED
+        config.autorestart = RestartUnconditionally
+        self.assertEqual(instance._get_deadline(), 0)
+        config.autorestart = False
+        self.assertEqual(instance._get_deadline(), None)
+        instance.state = ProcessStates.STOPPED
+        config.autostart = True
+        self.assertEqual(instance._get_deadline(), None) # started before
+        instance.laststart = 0
+        self.assertEqual(instance._get_deadline(), 0)
+
+    def test_get_deadline_supervisor_stopping(self):
+        from supervisor.states import ProcessStates
+        from supervisor.states import SupervisorStates
+        options = DummyOptions()
+        options.mood = SupervisorStates.SHUTDOWN
+        config = DummyPConfig(options, 'test', '/test', startretries=3,
+                              autostart=True)
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.BACKOFF
+        instance.backoff = 1
+        instance.delay = 200
+        self.assertEqual(instance._get_deadline(), None)
+        instance.state = ProcessStates.STOPPED
+        self.assertEqual(instance._get_deadline(), None)
+
+    def test_get_deadline_queued_by_spawn_scheduler(self):
+        from supervisor.states import ProcessStates
+        from supervisor.states import SupervisorStates
+        options = DummyOptions()
+        options.mood = SupervisorStates.RUNNING
+        options.spawn_scheduler.maxstarting = 1
+        other = DummyProcess(DummyPConfig(options, 'other', '/bin/other'))
+        options.spawn_scheduler.started(other)
+        config = DummyPConfig(options, 'test', '/test', startretries=3,
+                              autostart=True)
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.STOPPED
+        options.spawn_scheduler.acquire(instance, 0)
+        self.assertEqual(instance._get_deadline(), None)
+        instance.state = ProcessStates.BACKOFF
+        instance.backoff = 4
+        self.assertEqual(instance._get_deadline(), 0) # give up right away
+
+    def test_transition_stopped_queued_by_spawn_scheduler(self):
+        from supervisor.states import ProcessStates, SupervisorStates
+        options = DummyOptions()
+        options.mood = SupervisorStates.RUNNING
+        options.spawn_scheduler.maxstarting = 1
+        pconfig1 = DummyPConfig(options, 'process1', '/bin/process1')
+        pconfig2 = DummyPConfig(options, 'process2', '/bin/process2')
+        process1 = self._makeOne(pconfig1)
+        process2 = self._makeOne(pconfig2)
+        process1.state = process2.state = ProcessStates.STOPPED
+        process1.transition()
+        self.assertEqual(process1.state, ProcessStates.STARTING)
+        process2.transition()
+        self.assertEqual(process2.state, ProcessStates.STOPPED)
+        self.assertTrue(options.spawn_scheduler.is_queued(process2))
+        self.assertEqual(options.timers.get_deadline(process2), None)
+        # process1 leaving STARTING makes room for process2
+        process1.change_state(ProcessStates.RUNNING)
+        self.assertEqual(options.timers.get_deadline(options.spawn_scheduler),
+                         0)
+        options.spawn_scheduler.transition()
+        self.assertEqual(process2.state, ProcessStates.STARTING)
+        self.assertFalse(options.spawn_scheduler.is_queued(process2))
+
+    def test_transition_backoff_queued_by_spawn_scheduler(self):
+        from supervisor.states import ProcessStates, SupervisorStates
+        options = DummyOptions()
+        options.mood = SupervisorStates.RUNNING
+        options.spawn_scheduler.spawnrate = 1
+        other = DummyProcess(DummyPConfig(options, 'other', '/bin/other'))
+        options.spawn_scheduler.acquire(other, time.time())
+        pconfig = DummyPConfig(options, 'process', '/bin/process')
+        process = self._makeOne(pconfig)
+        process.state = ProcessStates.BACKOFF
+        process.backoff = 1
+        process.delay = 0
+        process.transition()
+        self.assertEqual(process.state, ProcessStates.BACKOFF)
+        self.assertTrue(options.spawn_scheduler.is_queued(process))
+
+    def test_change_state_tracks_starting_processes(self):
+        from supervisor.states import ProcessStates
+        options = DummyOptions()
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.STOPPED
+        instance.change_state(ProcessStates.STARTING)
+        self.assertEqual(options.spawn_scheduler.get_starting_count(), 1)
+        instance.change_state(ProcessStates.BACKOFF)
+        self.assertEqual(options.spawn_scheduler.get_starting_count(), 0)
+
+    def test_change_state_discards_queued_process(self):
+        from supervisor.states import ProcessStates
+        options = DummyOptions()
+        options.spawn_scheduler.maxstarting = 1
+        other = DummyProcess(DummyPConfig(options, 'other', '/bin/other'))
+        options.spawn_scheduler.started(other)
+        config = DummyPConfig(options, 'test', '/test')
+        instance = self._makeOne(config)
+        instance.state = ProcessStates.BACKOFF
+        options.spawn_scheduler.acquire(instance, 0)
+        # e.g. stopped through the RPC interface
+        instance.change_state(ProcessStates.STOPPED)
+        self.assertFalse(options.spawn_scheduler.is_queued(instance))
+
+class DirectLogTests(unittest.TestCase):
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.basedir, 'foo.log')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.basedir)
+
+    def _getTargetClass(self):
+        from supervisor.process import DirectLog
+        return DirectLog
+
+    def _makeOne(self, maxbytes=10, backups=1, rotation='rename',
+                 compress=None):
+        options = DummyOptions()
+        config = DummyPConfig(options, 'foo', '/bin/foo',
+                              stdout_logfile=self.filename,
+                              stdout_logfile_maxbytes=maxbytes,
+                              stdout_logfile_backups=backups,
+                              stdout_logfile_direct=True,
+                              stdout_logfile_rotation=rotation,
+                              stdout_logfile_compress=compress)
+        process = DummyProcess(config)
+        return self._getTargetClass()(process, 'stdout')
+
+    def _write(self, data):
+        with open(self.filename, 'ab') as f:
+            f.write(data)
+
+    def test_repr(self):
+        instance = self._makeOne()
+        self.assertTrue(repr(instance).startswith('<DirectLog at'))
+        self.assertTrue(repr(instance).endswith('(stdout)>'))
+
+    def test_start_schedules_size_check(self):
+        instance = self._makeOne()
+        timers = instance.process.config.options.timers
+        before = time.time()
+        instance.start()
+        deadline = timers.get_deadline(instance)
+        self.assertTrue(before + instance.interval <= deadline)
+        self.assertTrue(deadline <= time.time() + instance.interval)
+
+    def test_start_no_maxbytes(self):
+        instance = self._makeOne(maxbytes=0)
+        instance.start()
+        timers = instance.process.config.options.timers
+        self.assertEqual(timers.get_deadline(instance), None)
+
+    def test_stop(self):
+        instance = self._makeOne()
+        instance.start()
+        instance.stop()
+        timers = instance.process.config.options.timers
+        self.assertEqual(timers.get_deadline(instance), None)
+
+    def test_transition_below_maxbytes(self):
+        instance = self._makeOne()
+        self._write(b'a' * 9)
+        instance.transition()
+        self.assertEqual(os.path.getsize(self.filename), 9)
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+        timers = instance.process.config.options.timers
+        self.assertNotEqual(timers.get_deadline(instance), None)
+
+    def test_transition_rolls_over(self):
+        instance = self._makeOne()
+        self._write(b'a' * 10)
+        instance.transition()
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        with open(self.filename + '.1', 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+        timers = instance.process.config.options.timers
+        self.assertNotEqual(timers.get_deadline(instance), None)
+        from supervisor.loggers import LogOffsets
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 10)
+        self.assertEqual(offsets.backups, [(0, 10)])
+
+    def test_transition_rolls_over_into_segments(self):
+        instance = self._makeOne(backups=2, rotation='segments')
+        for data in (b'a', b'b', b'c'):
+            self._write(data * 10)
+            instance.transition()
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        self.assertFalse(os.path.exists(self.filename + '.1'))
+        self.assertFalse(os.path.exists(self.filename + '.000001'))
+        self.assertEqual(instance.segments.get_names(),
+                         [self.filename + '.000002',
+                          self.filename + '.000003'])
+        with open(self.filename + '.000003', 'rb') as f:
+            self.assertEqual(f.read(), b'c' * 10)
+        from supervisor.loggers import LogOffsets
+        offsets = LogOffsets(self.filename)
+        self.assertEqual(offsets.start, 30)
+        self.assertEqual(offsets.backups, [(20, 10), (10, 10)])
+
+    def test_transition_compresses_segments(self):
+        with open(self.filename + '.000001', 'wb') as f:
+            f.write(b'old')
+        instance = self._makeOne(backups=2, rotation='segments',
+                                 compress='gzip')
+        compressor = instance.process.config.options.logcompressor
+        self._write(b'a' * 10)
+        instance.transition()
+        self.assertTrue(compressor.wait(5))
+        self.assertEqual(instance.segments.get_names(),
+                         [self.filename + '.000001.gz',
+                          self.filename + '.000002.gz'])
+        import gzip
+        with gzip.GzipFile(self.filename + '.000002.gz', 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+
+    def test_transition_logfile_missing(self):
+        instance = self._makeOne()
+        instance.transition()
+        options = instance.process.config.options
+        self.assertEqual(options.logger.data, [])
+        self.assertNotEqual(options.timers.get_deadline(instance), None)
+
+    def test_transition_rollover_fails(self):
+        instance = self._makeOne()
+        self._write(b'a' * 10)
+        def raiser(filename, backups, segments=None, maxbytes=0,
+                   compress=False, offsets=None):
+            raise OSError(errno.EACCES, 'Permission denied')
+        with patch('supervisor.loggers.copytruncate', raiser):
+            instance.transition()
+        options = instance.process.config.options
+        self.assertEqual(options.logger.data[0],
+            "couldn't roll over %s: [Errno 13] Permission denied"
+            % self.filename)
+        self.assertNotEqual(options.timers.get_deadline(instance), None)
+
+    def test_removelogs(self):
+        instance = self._makeOne()
+        self._write(b'abc')
+        instance.removelogs()
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        # the bytes that were removed keep their offsets
+        from supervisor.loggers import LogOffsets
+        self.assertEqual(LogOffsets(self.filename).start, 3)
+
+    def test_removelogs_logfile_missing(self):
+        instance = self._makeOne()
+        instance.removelogs() # should not raise
+        self.assertFalse(os.path.exists(self.filename))
+
+    def _useWriterThread(self, instance):
+        from supervisor.logwriter import LogWriterPool
+        pool = LogWriterPool(nthreads=1)
+        self.addCleanup(pool.stop)
+        instance.process.config.options.logwriter = pool
+        return pool
+
+    def test_transition_rolls_over_in_writer_thread(self):
+        from supervisor.logwriter import QueuedHandler
+        instance = self._makeOne()
+        pool = self._useWriterThread(instance)
+        self._write(b'a' * 10)
+        instance.transition()
+        self.assertEqual(instance.handler.__class__, QueuedHandler)
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        with open(self.filename + '.1', 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 10)
+        timers = instance.process.config.options.timers
+        self.assertNotEqual(timers.get_deadline(instance), None)
+
+    def test_transition_skips_check_while_one_is_queued(self):
+        instance = self._makeOne()
+        calls = []
+        class DummyQueued:
+            queued_records = 1
+            def doRollover(self):
+                calls.append(True)
+        instance.handler = DummyQueued()
+        self._write(b'a' * 10)
+        instance.transition()
+        self.assertEqual(calls, [])
+        instance.handler.queued_records = 0
+        instance.transition()
+        self.assertEqual(calls, [True])
+
+    def test_removelogs_in_writer_thread(self):
+        instance = self._makeOne()
+        pool = self._useWriterThread(instance)
+        self._write(b'abc')
+        instance.removelogs()
+        self.assertTrue(pool.flush(5))
+        self.assertEqual(os.path.getsize(self.filename), 0)
+
 class FastCGISubprocessTests(unittest.TestCase):
     def _getTargetClass(self):
         from supervisor.process import FastCGISubprocess
@@ -1754,6 +2698,23 @@ class FastCGISubprocessTests(unittest.TestCase):
         instance.group = DummyProcessGroup(DummyPGroupConfig(options))
         self.assertRaises(NotImplementedError, instance.spawn)
 
+    def test_posix_spawn_file_actions(self):
+        options = DummyOptions()
+        options.posix_spawn_available = True
+        options.forkpid = 10
+        config = DummyPConfig(options, 'good', '/good/filename')
+        instance = self._makeOne(config)
+        sock_config = DummySocketConfig(7)
+        gconfig = DummyFCGIGroupConfig(options, 'whatever', 999, None,
+                                       sock_config)
+        instance.group = DummyFCGIProcessGroup(gconfig)
+        result = instance.spawn()
+        self.assertEqual(result, 10)
+        file_actions = options.posix_spawn_args[3]
+        self.assertEqual(file_actions, [(os.POSIX_SPAWN_DUP2, 7, 0),
+                                        (os.POSIX_SPAWN_DUP2, 6, 1),
+                                        (os.POSIX_SPAWN_DUP2, 8, 2)])
+
     def test_prepare_child_fds(self):
         options = DummyOptions()
         options.forkpid = 0
@@ -1946,6 +2907,16 @@ class ProcessGroupBaseTests(unittest.TestCase):
         group.reopenlogs()
         self.assertEqual(process1.logs_reopened, True)
 
+    def test_flushlogs(self):
+        options = DummyOptions()
+        pconfig1 = DummyPConfig(options, 'process1', 'process1','/bin/process1')
+        process1 = DummyProcess(pconfig1)
+        gconfig = DummyPGroupConfig(options, pconfigs=[pconfig1])
+        group = self._makeOne(gconfig)
+        group.processes = {'process1': process1}
+        group.flushlogs()
+        self.assertEqual(process1.logs_flushed, True)
+
     def test_removelogs(self):
         options = DummyOptions()
         from supervisor.states import ProcessStates
@@ -2058,11 +3029,13 @@ class EventListenerPoolTests(ProcessGroupBaseTests):
         gconfig.pool_events = (EventType,)
         pool = self._makeOne(gconfig)
         from supervisor import events
-        self.assertEqual(len(events.callbacks), 2)
+        self.assertEqual(len(events.callbacks), 3)
         self.assertEqual(events.callbacks[0],
             (EventType, pool._acceptEvent))
         self.assertEqual(events.callbacks[1],
             (events.EventRejectedEvent, pool.handle_rejected))
+        self.assertEqual(events.callbacks[2],
+            (events.ProcessStateEvent, pool.handle_process_state_change))
         self.assertEqual(pool.serial, -1)
 
     def test_before_remove_unsubscribes_from_events(self):
@@ -2073,7 +3046,7 @@ class EventListenerPoolTests(ProcessGroupBaseTests):
         gconfig.pool_events = (EventType,)
         pool = self._makeOne(gconfig)
         from supervisor import events
-        self.assertEqual(len(events.callbacks), 2)
+        self.assertEqual(len(events.callbacks), 3)
         pool.before_remove()
         self.assertEqual(len(events.callbacks), 0)
 
@@ -2206,6 +3179,33 @@ class EventListenerPoolTests(ProcessGroupBaseTests):
         self.assertEqual(process1.transitioned, True)
         self.assertEqual(pool.event_buffer, [event])
 
+    def test__acceptEvent_schedules_dispatch(self):
+        options = DummyOptions()
+        gconfig = DummyPGroupConfig(options)
+        pool = self._makeOne(gconfig)
+        pool.last_dispatch = 10
+        pool.dispatch_throttle = 5
+        event = DummyEvent()
+        event.serial = 'a'
+        pool._acceptEvent(event)
+        self.assertEqual(options.timers.get_deadline(pool), 15)
+
+    def test_transition_nobody_ready_cancels_dispatch(self):
+        options = DummyOptions()
+        from supervisor.states import ProcessStates
+        pconfig1 = DummyPConfig(options, 'process1', 'process1','/bin/process1')
+        process1 = DummyProcess(pconfig1, state=ProcessStates.RUNNING)
+        gconfig = DummyPGroupConfig(options, pconfigs=[pconfig1])
+        pool = self._makeOne(gconfig)
+        pool.processes = {'process1': process1}
+        event = DummyEvent()
+        event.serial = 'a'
+        from supervisor.states import EventListenerStates
+        process1.listener_state = EventListenerStates.BUSY
+        pool._acceptEvent(event)
+        pool.transition()
+        self.assertEqual(options.timers.get_deadline(pool), None)
+
     def test_transition_event_proc_not_running(self):
         options = DummyOptions()
         from supervisor.states import ProcessStates
@@ -2268,6 +3268,8 @@ class EventListenerPoolTests(ProcessGroupBaseTests):
         pool.transition()
         self.assertEqual(process1.transitioned, True)
         self.assertEqual(pool.event_buffer, [event]) # not popped
+        self.assertEqual(options.timers.get_deadline(pool),
+                         pool.last_dispatch + 5)
 
     def test_transition_event_proc_running_with_dispatch_throttle_ready(self):
         options = DummyOptions()
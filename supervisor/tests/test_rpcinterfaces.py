@@ -11,6 +11,8 @@ from supervisor.tests.base import DummyProcess
 from supervisor.tests.base import DummyPConfig
 from supervisor.tests.base import DummyPGroupConfig
 from supervisor.tests.base import DummyProcessGroup
+from supervisor.tests.base import DummyDispatcher
+from supervisor.tests.base import DummyQueuedHandler
 from supervisor.tests.base import PopulatedDummySupervisor
 from supervisor.tests.base import _NOW
 from supervisor.tests.base import _TIMEFORMAT
@@ -119,8 +121,25 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
         statename = getSupervisorStateDescription(statecode)
         self.assertEqual(stateinfo['statecode'], statecode)
         self.assertEqual(stateinfo['statename'], statename)
+        self.assertEqual(stateinfo['queued'], 0)
+        self.assertEqual(stateinfo['starting'], 0)
         self.assertEqual(interface.update_text, 'getState')
 
+    def test_getState_reports_spawn_scheduler(self):
+        options = DummyOptions()
+        options.spawn_scheduler.maxstarting = 1
+        supervisord = DummySupervisor(options)
+        interface = self._makeOne(supervisord)
+        pconfig1 = DummyPConfig(options, 'foo', '/bin/foo')
+        pconfig2 = DummyPConfig(options, 'bar', '/bin/bar')
+        process1 = DummyProcess(pconfig1)
+        process2 = DummyProcess(pconfig2)
+        options.spawn_scheduler.started(process1)
+        options.spawn_scheduler.acquire(process2, 0)
+        stateinfo = interface.getState()
+        self.assertEqual(stateinfo['queued'], 1)
+        self.assertEqual(stateinfo['starting'], 1)
+
     def test_getPID(self):
         options = DummyOptions()
         supervisord = DummySupervisor(options)
@@ -1173,6 +1192,18 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
         self.assertEqual(configs[0]['killasgroup'], False)
         self.assertEqual(configs[0]['process_prio'], 999)
         self.assertEqual(configs[0]['stdout_syslog'], False)
+        self.assertEqual(configs[0]['stdout_logfile_direct'], False)
+        self.assertEqual(configs[0]['stderr_logfile_direct'], False)
+        self.assertEqual(configs[0]['stdout_logfile_rotation'], 'rename')
+        self.assertEqual(configs[0]['stderr_logfile_rotation'], 'rename')
+        self.assertEqual(configs[0]['stdout_logfile_compress'], 'none')
+        self.assertEqual(configs[0]['stderr_logfile_compress'], 'none')
+        self.assertEqual(configs[0]['stdout_logfile_backups_maxbytes'], 0)
+        self.assertEqual(configs[0]['stderr_logfile_backups_maxbytes'], 0)
+        self.assertEqual(configs[0]['stdout_logfile_index'], False)
+        self.assertEqual(configs[0]['stderr_logfile_index'], False)
+        self.assertEqual(configs[0]['stdout_tail_maxbytes'], 0)
+        self.assertEqual(configs[0]['stderr_tail_maxbytes'], 0)
         self.assertEqual(configs[0]['stderr_logfile_maxbytes'], 0)
         self.assertEqual(configs[0]['startsecs'], 10)
         self.assertEqual(configs[0]['redirect_stderr'], False)
@@ -1531,6 +1562,7 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
             data = interface.readProcessStdoutLog('foo', offset=0, length=0)
             self.assertEqual(interface.update_text, 'readProcessStdoutLog')
             self.assertEqual(data, ('x' * 2048) + ('y' * 2048))
+            self.assertTrue(process.logs_flushed)
             data = interface.readProcessStdoutLog('foo', offset=2048, length=0)
             self.assertEqual(data, 'y' * 2048)
             data = interface.readProcessStdoutLog('foo', offset=0, length=2048)
@@ -1540,6 +1572,234 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
         finally:
             os.remove(logfile)
 
+    def test_readProcessStdoutLog_from_output_tail(self):
+        from supervisor import xmlrpc
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile='/nonexistent/foo.log')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        tail = OutputTail(4)
+        tail.write(b'abcdefghij')
+        process.output_tails['stdout'] = tail
+        process.output_tail_sizes['stdout'] = 10
+        data = interface.readProcessStdoutLog('foo', offset=-2, length=0)
+        self.assertEqual(data, 'ij')
+        self.assertTrue(process.logs_flushed)
+        data = interface.readProcessStdoutLog('foo', offset=6, length=2)
+        self.assertEqual(data, 'gh')
+        # older bytes are read from the file, which isn't there
+        self._assertRPCError(xmlrpc.Faults.NO_FILE,
+                             interface.readProcessStdoutLog,
+                             'foo', offset=0, length=0)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.readProcessStdoutLog,
+                             'foo', offset=-1, length=1)
+
+    def test_readProcessStdoutLog_output_tail_without_logfile(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        tail = OutputTail(4)
+        tail.write(b'abcdefghij')
+        process.output_tails['stdout'] = tail
+        data = interface.readProcessStdoutLog('foo', offset=0, length=0)
+        self.assertEqual(data, 'ghij')
+
+    def test_readProcessBackupLog(self):
+        import gzip
+        import shutil
+        import tempfile
+        from supervisor import xmlrpc
+        basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, basedir)
+        logfile = os.path.join(basedir, 'foo.log')
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile=logfile)
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        with gzip.GzipFile(logfile + '.000001.gz', 'wb') as f:
+            f.write(b'x' * 2048)
+        with open(logfile + '.000002', 'wb') as f:
+            f.write(b'y' * 2048)
+        data = interface.readProcessBackupLog('foo', 'stdout', 1, 0, 0)
+        self.assertEqual(interface.update_text, 'readProcessBackupLog')
+        self.assertEqual(data, 'y' * 2048)
+        data = interface.readProcessBackupLog('foo', 'stdout', 2, 0, 0)
+        self.assertEqual(data, 'x' * 2048)
+        data = interface.readProcessBackupLog('foo', 'stdout', 2, 2040, 4)
+        self.assertEqual(data, 'x' * 4)
+        data = interface.readProcessBackupLog('foo', 'stdout', 2, -4, 0)
+        self.assertEqual(data, 'x' * 4)
+        self._assertRPCError(xmlrpc.Faults.NO_FILE,
+                             interface.readProcessBackupLog,
+                             'foo', 'stdout', 3, 0, 0)
+        self._assertRPCError(xmlrpc.Faults.NO_FILE,
+                             interface.readProcessBackupLog,
+                             'foo', 'stderr', 1, 0, 0)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.readProcessBackupLog,
+                             'foo', 'stdin', 1, 0, 0)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.readProcessBackupLog,
+                             'foo', 'stdout', 1, -1, 1)
+        self._assertRPCError(xmlrpc.Faults.BAD_NAME,
+                             interface.readProcessBackupLog,
+                             'bar', 'stdout', 1, 0, 0)
+
+    def test_readProcessLogByTime(self):
+        import shutil
+        import tempfile
+        from supervisor import xmlrpc
+        basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, basedir)
+        logfile = os.path.join(basedir, 'foo.log')
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stderr_logfile=logfile)
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        self._assertRPCError(xmlrpc.Faults.NO_FILE,
+                             interface.readProcessLogByTime,
+                             'foo', 'stderr', 0, 0, 100)
+        with open(logfile + '.000001', 'wb') as f:
+            f.write(b'x' * 10)
+        with open(logfile + '.000001.idx', 'w') as f:
+            f.write('100.0 0\n')
+        with open(logfile, 'wb') as f:
+            f.write(b'y' * 10 + b'z' * 10)
+        with open(logfile + '.idx', 'w') as f:
+            f.write('200.0 0\n300.0 10\n')
+        data = interface.readProcessLogByTime('foo', 'stderr', 150, 250, 100)
+        self.assertEqual(interface.update_text, 'readProcessLogByTime')
+        self.assertEqual(data, 'x' * 10 + 'y' * 10)
+        process = supervisord.process_groups['foo'].processes['foo']
+        self.assertTrue(process.logs_flushed)
+        data = interface.readProcessLogByTime('foo', 'stderr', 250, 0, 5)
+        self.assertEqual(data, 'y' * 5)
+        for args in (('stdin', 0, 0, 1), ('stderr', -1, 0, 1),
+                     ('stderr', 10, 5, 1), ('stderr', 0, 0, 0)):
+            self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                                 interface.readProcessLogByTime, 'foo', *args)
+        self._assertRPCError(xmlrpc.Faults.BAD_NAME,
+                             interface.readProcessLogByTime,
+                             'bar', 'stderr', 0, 0, 1)
+
+    def test_readProcessLogSpan(self):
+        import shutil
+        import tempfile
+        from supervisor import xmlrpc
+        basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, basedir)
+        logfile = os.path.join(basedir, 'foo.log')
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile=logfile)
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        with open(logfile + '.1', 'wb') as f:
+            f.write(b'x' * 10)
+        with open(logfile, 'wb') as f:
+            f.write(b'y' * 10)
+        with open(logfile + '.offsets', 'w') as f:
+            f.write('110\n100 10\n')
+        result = interface.readProcessLogSpan('foo', 'stdout', 105, 10)
+        self.assertEqual(interface.update_text, 'readProcessLogSpan')
+        self.assertTrue(process.logs_flushed)
+        self.assertEqual(result, {'data': 'x' * 5 + 'y' * 5, 'offset': 105.0,
+                                  'next': 115.0, 'end': 120.0})
+        result = interface.readProcessLogSpan('foo', 'stdout', 0, 2)
+        self.assertEqual(result, {'data': 'xx', 'offset': 100.0,
+                                  'next': 102.0, 'end': 120.0})
+        result = interface.readProcessLogSpan('foo', 'stdout', -3.0, 100)
+        self.assertEqual(result, {'data': 'yyy', 'offset': 117.0,
+                                  'next': 120.0, 'end': 120.0})
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.readProcessLogSpan,
+                             'foo', 'stdout', 0, 0)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.readProcessLogSpan,
+                             'foo', 'stdin', 0, 1)
+        self._assertRPCError(xmlrpc.Faults.NO_FILE,
+                             interface.readProcessLogSpan,
+                             'foo', 'stderr', 0, 1)
+        self._assertRPCError(xmlrpc.Faults.BAD_NAME,
+                             interface.readProcessLogSpan,
+                             'bar', 'stdout', 0, 1)
+
+    def test_searchProcessLogs(self):
+        import shutil
+        import tempfile
+        from supervisor.http import NOT_DONE_YET
+        basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, basedir)
+        logfile = os.path.join(basedir, 'foo.log')
+        with open(logfile, 'wb') as f:
+            f.write(b'ok\nERROR here\nERROR \xff\n')
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile=logfile)
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        callback = interface.searchProcessLogs(['foo'], '^ERROR', 'stdout', 10)
+        self.assertEqual(interface.update_text, 'searchProcessLogs')
+        result = callback()
+        while result is NOT_DONE_YET:
+            time.sleep(0.01)
+            result = callback()
+        self.assertEqual(result, [
+            {'name': 'foo', 'channel': 'stdout', 'offset': 3.0,
+             'line': 'ERROR here'},
+            {'name': 'foo', 'channel': 'stdout', 'offset': 14.0,
+             'line': u'ERROR \ufffd'}])
+
+    def test_searchProcessLogs_failed(self):
+        from supervisor import logsearch
+        from supervisor import xmlrpc
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        started = []
+        def start(search):
+            started.append(search)
+            search.done = True
+            search.error = 'oops'
+        old_start = logsearch.LogSearch.start
+        logsearch.LogSearch.start = start
+        try:
+            callback = interface.searchProcessLogs([], 'x', 'stdout', 10)
+        finally:
+            logsearch.LogSearch.start = old_start
+        self.assertEqual(len(started), 1)
+        self._assertRPCError(xmlrpc.Faults.FAILED, callback)
+
+    def test_searchProcessLogs_badargs(self):
+        from supervisor import xmlrpc
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.searchProcessLogs,
+                             [], 'x', 'stdin', 10)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.searchProcessLogs,
+                             [], 'x', 'stdout', 0)
+        self._assertRPCError(xmlrpc.Faults.BAD_ARGUMENTS,
+                             interface.searchProcessLogs,
+                             [], '(', 'stdout', 10)
+        self._assertRPCError(xmlrpc.Faults.BAD_NAME,
+                             interface.searchProcessLogs,
+                             ['bar'], 'x', 'stdout', 10)
+
     def test_readProcessLogAliasedTo_readProcessStdoutLog(self):
         options = DummyOptions()
         pconfig = DummyPConfig(options, 'foo', '/bin/foo')
@@ -1654,6 +1914,7 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
             self.assertEqual(overflow, False)
             self.assertEqual(offset, len(letters))
             self.assertEqual(data, letters)
+            self.assertTrue(process.logs_flushed)
         finally:
             os.remove(logfile)
 
@@ -1729,6 +1990,43 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
         self.assertEqual(offset, 0)
         self.assertEqual(data, '')
 
+    def test_tailProcessStdoutLog_from_output_tail(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile='/nonexistent/foo.log')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        tail = OutputTail(4)
+        tail.write(b'abcdefghij')
+        process.output_tails['stdout'] = tail
+        process.output_tail_sizes['stdout'] = 10
+        data, offset, overflow = interface.tailProcessStdoutLog('foo',
+                                                    offset=0, length=3)
+        self.assertEqual(data, 'hij')
+        self.assertEqual(offset, 10)
+        self.assertEqual(overflow, True)
+        self.assertTrue(process.logs_flushed)
+        # older bytes are read from the file, which isn't there
+        data, offset, overflow = interface.tailProcessStdoutLog('foo',
+                                                    offset=0, length=100)
+        self.assertEqual([data, offset, overflow], ['', 0, False])
+
+    def test_tailProcessStdoutLog_output_tail_without_logfile(self):
+        from supervisor.dispatchers import OutputTail
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        tail = OutputTail(4)
+        tail.write(b'abcdefghij')
+        process.output_tails['stdout'] = tail
+        data, offset, overflow = interface.tailProcessStdoutLog('foo',
+                                                    offset=0, length=100)
+        self.assertEqual([data, offset, overflow], ['ghij', 10, False])
+
     def test_tailProcessLogAliasedTo_tailProcessStdoutLog(self):
         options = DummyOptions()
         pconfig = DummyPConfig(options, 'foo', '/bin/foo')
@@ -1850,6 +2148,45 @@ class SupervisorNamespaceXMLRPCInterfaceTests(TestBase):
         self.assertEqual(offset, 0)
         self.assertEqual(data, '')
 
+    def test_getProcessLogQueueInfo(self):
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',
+                               stdout_logfile='/tmp/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        process = supervisord.process_groups['foo'].processes['foo']
+        stdout = DummyDispatcher(readable=True)
+        stdout.channel = 'stdout'
+        handler = DummyQueuedHandler(stdout)
+        handler.is_backlogged = True
+        stdout.queued_handlers = [handler]
+        stdin = DummyDispatcher(writable=True)
+        stdin.channel = 'stdin'
+        process.dispatchers = {0: stdin, 1: stdout}
+        info = interface.getProcessLogQueueInfo('foo')
+        self.assertEqual(interface.update_text, 'getProcessLogQueueInfo')
+        self.assertEqual(info, [{'channel': 'stdout',
+                                 'logfile': '/tmp/foo',
+                                 'queued_bytes': 10,
+                                 'queued_records': 1,
+                                 'backlogged': True,
+                                 'last_latency': 0.5,
+                                 'max_latency': 1.0}])
+
+    def test_getProcessLogQueueInfo_not_running(self):
+        options = DummyOptions()
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo')
+        supervisord = PopulatedDummySupervisor(options, 'foo', pconfig)
+        interface = self._makeOne(supervisord)
+        self.assertEqual(interface.getProcessLogQueueInfo('foo'), [])
+
+    def test_getProcessLogQueueInfo_bad_name(self):
+        from supervisor import xmlrpc
+        supervisord = DummySupervisor()
+        interface = self._makeOne(supervisord)
+        self._assertRPCError(xmlrpc.Faults.BAD_NAME,
+                             interface.getProcessLogQueueInfo, 'BAD_NAME')
+
     def test_clearProcessLogs_bad_name_no_group(self):
         from supervisor import xmlrpc
         options = DummyOptions()
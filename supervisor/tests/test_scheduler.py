@@ -0,0 +1,279 @@
+import time
+import unittest
+
+from supervisor.timers import TimerQueue
+
+class SpawnSchedulerTests(unittest.TestCase):
+    def _getTargetClass(self):
+        from supervisor.scheduler import SpawnScheduler
+        return SpawnScheduler
+
+    def _makeOne(self, maxstarting=0, spawnrate=0):
+        return self._getTargetClass()(TimerQueue(), maxstarting, spawnrate)
+
+    def test_no_limits(self):
+        scheduler = self._makeOne()
+        group = Group()
+        processes = [Process(scheduler, group) for i in range(100)]
+        for process in processes:
+            self.assertTrue(scheduler.acquire(process, 0))
+            scheduler.started(process)
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.get_starting_count(), 100)
+        self.assertEqual(scheduler.timers.next_deadline(), None)
+
+    def test_maxstarting_queues_process(self):
+        scheduler = self._makeOne(maxstarting=1)
+        group = Group()
+        a, b = Process(scheduler, group), Process(scheduler, group)
+        self.assertTrue(scheduler.acquire(a, 0))
+        scheduler.started(a)
+        self.assertFalse(scheduler.acquire(b, 0))
+        self.assertEqual(len(scheduler), 1)
+        self.assertTrue(scheduler.is_queued(b))
+        self.assertFalse(scheduler.is_queued(a))
+        # nothing to do until a leaves STARTING
+        self.assertEqual(scheduler.timers.next_deadline(), None)
+
+    def test_acquire_queued_process_twice(self):
+        scheduler = self._makeOne(maxstarting=1)
+        group = Group()
+        a, b = Process(scheduler, group), Process(scheduler, group)
+        scheduler.started(a)
+        self.assertFalse(scheduler.acquire(b, 0))
+        self.assertFalse(scheduler.acquire(b, 0))
+        self.assertEqual(len(scheduler), 1)
+
+    def test_finished_wakes_scheduler_up(self):
+        scheduler = self._makeOne(maxstarting=1)
+        group = Group()
+        a, b = Process(scheduler, group), Process(scheduler, group)
+        scheduler.started(a)
+        scheduler.acquire(b, 0)
+        scheduler.finished(a)
+        self.assertEqual(scheduler.get_starting_count(), 0)
+        self.assertEqual(scheduler.timers.next_deadline(), 0)
+        self.assertEqual(scheduler.timers.pop_expired(0), [scheduler])
+
+    def test_finished_with_empty_queue_does_not_wake_scheduler(self):
+        scheduler = self._makeOne(maxstarting=1)
+        a = Process(scheduler, Group())
+        scheduler.started(a)
+        scheduler.finished(a)
+        self.assertEqual(scheduler.timers.next_deadline(), None)
+
+    def test_finished_not_started(self):
+        scheduler = self._makeOne()
+        scheduler.finished(Process(scheduler, Group()))
+        self.assertEqual(scheduler.get_starting_count(), 0)
+
+    def test_started_twice(self):
+        scheduler = self._makeOne()
+        a = Process(scheduler, Group())
+        scheduler.started(a)
+        scheduler.started(a)
+        self.assertEqual(scheduler.get_starting_count(), 1)
+        scheduler.finished(a)
+        self.assertEqual(scheduler.get_starting_count(), 0)
+        self.assertEqual(scheduler._group_starting, {})
+
+    def test_transition_spawns_in_priority_order(self):
+        scheduler = self._makeOne(maxstarting=2)
+        spawned = []
+        blocker1 = Process(scheduler, Group(), spawned=spawned)
+        blocker2 = Process(scheduler, Group(), spawned=spawned)
+        scheduler.started(blocker1)
+        scheduler.started(blocker2)
+        late = Process(scheduler, Group(priority=10), priority=1,
+                       spawned=spawned)
+        early = Process(scheduler, Group(priority=1), priority=5,
+                        spawned=spawned)
+        middle = Process(scheduler, Group(priority=1), priority=7,
+                         spawned=spawned)
+        for process in (late, middle, early):
+            self.assertFalse(scheduler.acquire(process, 0))
+        scheduler.finished(blocker1)
+        scheduler.finished(blocker2)
+        scheduler.transition()
+        self.assertEqual(spawned, [early, middle])
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(scheduler.timers.get_deadline(scheduler), None)
+        scheduler.finished(early)
+        scheduler.transition()
+        self.assertEqual(spawned, [early, middle, late])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_newcomer_queues_behind_waiting_processes(self):
+        scheduler = self._makeOne(maxstarting=1)
+        spawned = []
+        group = Group()
+        a = Process(scheduler, group, spawned=spawned)
+        b = Process(scheduler, group, priority=500, spawned=spawned)
+        c = Process(scheduler, group, priority=1, spawned=spawned)
+        scheduler.started(a)
+        scheduler.acquire(b, 0)
+        scheduler.finished(a)
+        # there is room now but b has been waiting; c (even with a better
+        # priority) doesn't get to jump the queue before the scheduler
+        # has been transitioned
+        self.assertFalse(scheduler.acquire(c, 0))
+        scheduler.transition()
+        self.assertEqual(spawned, [c])
+
+    def test_transition_skips_processes_that_no_longer_want_to_spawn(self):
+        scheduler = self._makeOne(maxstarting=1)
+        spawned = []
+        group = Group()
+        a = Process(scheduler, group)
+        b = Process(scheduler, group, spawned=spawned)
+        c = Process(scheduler, group, spawned=spawned)
+        scheduler.started(a)
+        scheduler.acquire(b, 0)
+        scheduler.acquire(c, 0)
+        b.wants_spawn = False
+        scheduler.finished(a)
+        scheduler.transition()
+        self.assertEqual(spawned, [c])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_discard(self):
+        scheduler = self._makeOne(maxstarting=1)
+        spawned = []
+        group = Group()
+        a = Process(scheduler, group)
+        b = Process(scheduler, group, spawned=spawned)
+        scheduler.started(a)
+        scheduler.acquire(b, 0)
+        scheduler.discard(b)
+        self.assertEqual(len(scheduler), 0)
+        self.assertFalse(scheduler.is_queued(b))
+        scheduler.finished(a)
+        scheduler.transition()
+        self.assertEqual(spawned, [])
+
+    def test_discard_not_queued(self):
+        scheduler = self._makeOne()
+        scheduler.discard(Process(scheduler, Group()))
+        self.assertEqual(len(scheduler), 0)
+
+    def test_group_maxstarting(self):
+        scheduler = self._makeOne()
+        spawned = []
+        limited = Group(name='limited', maxstarting=1)
+        other = Group(name='other')
+        a = Process(scheduler, limited, spawned=spawned)
+        b = Process(scheduler, limited, spawned=spawned)
+        c = Process(scheduler, other, spawned=spawned)
+        a.transition()
+        b.transition()
+        self.assertEqual(spawned, [a])
+        self.assertTrue(scheduler.is_queued(b))
+        # c is queued behind b but gets to start on the next pass since
+        # only the group of b is at its limit
+        self.assertFalse(scheduler.acquire(c, 0))
+        scheduler.transition()
+        self.assertEqual(spawned, [a, c])
+        self.assertTrue(scheduler.is_queued(b))
+        self.assertEqual(scheduler.timers.get_deadline(scheduler), None)
+        scheduler.finished(a)
+        scheduler.transition()
+        self.assertEqual(spawned, [a, c, b])
+
+    def test_group_maxstarting_does_not_count_other_groups(self):
+        scheduler = self._makeOne()
+        limited = Group(name='limited', maxstarting=1)
+        scheduler.started(Process(scheduler, Group(name='other')))
+        self.assertTrue(scheduler.acquire(Process(scheduler, limited), 0))
+
+    def test_process_without_group(self):
+        scheduler = self._makeOne(maxstarting=1)
+        a = Process(scheduler, None)
+        b = Process(scheduler, None)
+        self.assertTrue(scheduler.acquire(a, 0))
+        scheduler.started(a)
+        self.assertFalse(scheduler.acquire(b, 0))
+        scheduler.finished(a)
+        self.assertEqual(scheduler.get_starting_count(), 0)
+
+    def test_spawnrate(self):
+        scheduler = self._makeOne(spawnrate=2)
+        group = Group()
+        processes = [Process(scheduler, group) for i in range(3)]
+        self.assertTrue(scheduler.acquire(processes[0], 100))
+        self.assertTrue(scheduler.acquire(processes[1], 100))
+        self.assertFalse(scheduler.acquire(processes[2], 100))
+        # come back once the budget allows another spawn
+        self.assertEqual(scheduler.timers.get_deadline(scheduler), 100.5)
+
+    def test_spawnrate_refills_over_time(self):
+        scheduler = self._makeOne(spawnrate=1)
+        group = Group()
+        a, b = Process(scheduler, group), Process(scheduler, group)
+        self.assertTrue(scheduler.acquire(a, 100))
+        self.assertFalse(scheduler.acquire(b, 100.5))
+        self.assertEqual(scheduler.timers.get_deadline(scheduler), 101)
+        scheduler.discard(b)
+        self.assertTrue(scheduler.acquire(b, 101))
+
+    def test_spawnrate_budget_does_not_accumulate(self):
+        scheduler = self._makeOne(spawnrate=1)
+        group = Group()
+        processes = [Process(scheduler, group) for i in range(2)]
+        self.assertTrue(scheduler.acquire(processes[0], 100))
+        self.assertTrue(scheduler.acquire(processes[1], 1000))
+        self.assertFalse(scheduler.acquire(Process(scheduler, group), 1000))
+
+    def test_spawnrate_clock_rollback(self):
+        scheduler = self._makeOne(spawnrate=1)
+        group = Group()
+        a, b = Process(scheduler, group), Process(scheduler, group)
+        self.assertTrue(scheduler.acquire(a, 100))
+        self.assertFalse(scheduler.acquire(b, 50))
+        self.assertEqual(scheduler.timers.get_deadline(scheduler), 51)
+        scheduler.discard(b)
+        self.assertTrue(scheduler.acquire(b, 51))
+
+    def test_transition_reschedules_for_spawnrate(self):
+        scheduler = self._makeOne(spawnrate=1)
+        spawned = []
+        group = Group()
+        processes = [Process(scheduler, group, spawned=spawned)
+                     for i in range(3)]
+        now = time.time()
+        self.assertTrue(scheduler.acquire(processes[0], now))
+        self.assertFalse(scheduler.acquire(processes[1], now))
+        self.assertFalse(scheduler.acquire(processes[2], now))
+        # pretend a second has passed
+        scheduler._refilled -= 1
+        scheduler.transition()
+        self.assertEqual(spawned, [processes[1]])
+        deadline = scheduler.timers.get_deadline(scheduler)
+        self.assertTrue(deadline > now)
+
+class Config:
+    def __init__(self, name='foo', priority=999, maxstarting=0):
+        self.name = name
+        self.priority = priority
+        self.maxstarting = maxstarting
+
+class Group:
+    def __init__(self, name='foo', priority=999, maxstarting=0):
+        self.config = Config(name, priority, maxstarting)
+
+class Process:
+    """ Wants to spawn when transitioned, like an autostarted process """
+    wants_spawn = True
+
+    def __init__(self, scheduler, group, priority=999, spawned=None):
+        self.scheduler = scheduler
+        self.group = group
+        self.config = Config(priority=priority)
+        if spawned is None:
+            spawned = []
+        self.spawned = spawned
+
+    def transition(self):
+        if self.wants_spawn and self.scheduler.acquire(self, time.time()):
+            self.spawned.append(self)
+            self.scheduler.discard(self)
+            self.scheduler.started(self)
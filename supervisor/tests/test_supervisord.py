@@ -15,6 +15,7 @@ from supervisor.tests.base import DummyPGroupConfig
 from supervisor.tests.base import DummyProcess
 from supervisor.tests.base import DummyProcessGroup
 from supervisor.tests.base import DummyDispatcher
+from supervisor.tests.base import patch
 
 from supervisor.compat import StringIO
 
@@ -146,6 +147,7 @@ class SupervisordTests(unittest.TestCase):
         self.assertEqual(options.daemonized, True)
         self.assertEqual(options.pidfile_written, True)
         self.assertEqual(options.cleaned_up, True)
+        self.assertEqual(supervisord.process_groups['foo'].logs_flushed, True)
 
     def test_main_notfirst(self):
         options = DummyOptions()
@@ -574,6 +576,25 @@ class SupervisordTests(unittest.TestCase):
         self.assertEqual(group, supervisord.process_groups['foo'])
         self.assertTrue(not result)
 
+    def test_add_process_group_keeps_groups_sorted(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        gconfig1 = DummyPGroupConfig(options, 'foo', priority=2)
+        gconfig2 = DummyPGroupConfig(options, 'bar', priority=1)
+        gconfig3 = DummyPGroupConfig(options, 'baz', priority=2)
+        for gconfig in (gconfig1, gconfig2, gconfig3):
+            supervisord.add_process_group(gconfig)
+        names = [group.config.name for group in supervisord.sorted_groups]
+        self.assertEqual(names, ['bar', 'foo', 'baz'])
+
+    def test_add_process_group_schedules_transition(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        gconfig = DummyPGroupConfig(options, 'foo')
+        supervisord.add_process_group(gconfig)
+        group = supervisord.process_groups['foo']
+        self.assertEqual(options.timers.get_deadline(group), 0)
+
     def test_add_process_group_emits_event(self):
         from supervisor import events
         L = []
@@ -602,8 +623,17 @@ class SupervisordTests(unittest.TestCase):
 
         supervisord.add_process_group(gconfig)
         group = supervisord.process_groups['foo']
+        process = DummyProcess(pconfig)
+        group.processes = {'foo': process}
+        options.timers.schedule(process, 0)
+        options.spawn_scheduler.maxstarting = 1
+        other = DummyProcess(DummyPConfig(options, 'bar', '/bin/bar'))
+        options.spawn_scheduler.started(other)
+        options.spawn_scheduler.acquire(process, 0)
         result = supervisord.remove_process_group('foo')
         self.assertTrue(group.before_remove_called)
+        self.assertEqual(len(options.timers), 0)
+        self.assertEqual(len(options.spawn_scheduler), 0)
         self.assertEqual(supervisord.process_groups, {})
         self.assertTrue(result)
 
@@ -613,6 +643,18 @@ class SupervisordTests(unittest.TestCase):
         self.assertEqual(list(supervisord.process_groups.keys()), ['foo'])
         self.assertTrue(not result)
 
+    def test_remove_process_group_removes_sorted_group_by_identity(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        gconfig1 = DummyPGroupConfig(options, 'foo', priority=1)
+        gconfig2 = DummyPGroupConfig(options, 'bar', priority=1)
+        supervisord.add_process_group(gconfig1)
+        supervisord.add_process_group(gconfig2)
+        bar = supervisord.process_groups['bar']
+        supervisord.remove_process_group('foo')
+        self.assertEqual(len(supervisord.sorted_groups), 1)
+        self.assertTrue(supervisord.sorted_groups[0] is bar)
+
     def test_remove_process_group_event(self):
         from supervisor import events
         L = []
@@ -675,8 +717,10 @@ class SupervisordTests(unittest.TestCase):
         readable = DummyDispatcher(readable=True)
         writable = DummyDispatcher(writable=True)
         error = DummyDispatcher(writable=True, error=OSError)
-        pgroup.dispatchers = {6:readable, 7:writable, 8:error}
+        options.process_map = {6:readable, 7:writable, 8:error}
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
+        options.timers.schedule(pgroup, 0)
         options.test = True
         supervisord.runforever()
         self.assertEqual(pgroup.transitioned, True)
@@ -684,6 +728,119 @@ class SupervisordTests(unittest.TestCase):
         self.assertEqual(writable.write_event_handled, True)
         self.assertEqual(error.error_handled, True)
 
+    def test_runforever_syncs_poller_with_socket_map(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        idle = DummyDispatcher()
+        readable = DummyDispatcher(readable=True)
+        options.socket_map = {6:idle, 7:readable}
+        options.poller.readables.update([6, 7])
+        options.poller.writables.add(6)
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.readables, set([7]))
+        self.assertEqual(options.poller.writables, set())
+
+    def test_runforever_unregisters_stale_socket_fds(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        options.socket_map = {6:DummyDispatcher(readable=True),
+                              7:DummyDispatcher(readable=True)}
+        calls = []
+        def tick(now=None):
+            calls.append(1)
+            if len(calls) == 1:
+                # the channel on fd 6 goes away and fd 7 is reused
+                del options.socket_map[6]
+                options.socket_map[7] = DummyDispatcher(writable=True)
+            else:
+                options.test = True
+        supervisord.tick = tick
+        options.test = False
+        supervisord.runforever()
+        self.assertEqual(options.poller.readables, set())
+        self.assertEqual(options.poller.writables, set([7]))
+
+    def test_runforever_keeps_process_fd_reused_from_socket(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        options.socket_map = {6:DummyDispatcher(readable=True)}
+        calls = []
+        def tick(now=None):
+            calls.append(1)
+            if len(calls) == 1:
+                del options.socket_map[6]
+                options.add_dispatcher(DummyDispatcher(readable=True, fd=6))
+            else:
+                options.test = True
+        supervisord.tick = tick
+        options.test = False
+        supervisord.runforever()
+        self.assertEqual(options.poller.readables, set([6]))
+
+    def test_runforever_ignores_events_of_channel_closed_in_same_pass(self):
+        options = DummyOptions()
+        options.poller.result = [6], [6]
+        supervisord = self._makeOne(options)
+        channel = DummyDispatcher(readable=True, writable=True)
+        written = []
+        def handle_read_event():
+            del options.socket_map[6]
+        channel.handle_read_event = handle_read_event
+        channel.handle_write_event = lambda: written.append(True)
+        options.socket_map = {6:channel}
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(written, [])
+        self.assertEqual([m for m in options.logger.data
+                          if m.startswith('unexpected')], [])
+
+    def test_runforever_ignores_events_of_dispatcher_removed_in_same_pass(self):
+        options = DummyOptions()
+        options.poller.result = [6, 7], []
+        supervisord = self._makeOne(options)
+        pidfd = DummyDispatcher(readable=True, fd=6)
+        stdout = DummyDispatcher(readable=True, fd=7)
+        options.add_dispatcher(pidfd)
+        options.add_dispatcher(stdout)
+        def handle_read_event():
+            # the process was reaped and its pipes closed
+            options.remove_dispatcher(stdout)
+        pidfd.handle_read_event = handle_read_event
+        options.test = True
+        supervisord.runforever()
+        self.assertFalse(stdout.read_event_handled)
+        self.assertEqual([m for m in options.logger.data
+                          if m.startswith('unexpected')], [])
+
+    def test_runforever_warns_about_unexpected_events(self):
+        options = DummyOptions()
+        options.poller.result = [6], [7]
+        options.poller.readables.add(6)
+        options.poller.writables.add(7)
+        supervisord = self._makeOne(options)
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.logger.data,
+                         ['unexpected read event from fd 6',
+                          'unexpected write event from fd 7'])
+        self.assertEqual(options.poller.readables, set())
+        self.assertEqual(options.poller.writables, set())
+
+    def test_runforever_updates_process_dispatcher_after_event(self):
+        options = DummyOptions()
+        options.poller.result = [], [6]
+        supervisord = self._makeOne(options)
+        dispatcher = DummyDispatcher(writable=True, fd=6)
+        options.add_dispatcher(dispatcher)
+        self.assertEqual(options.poller.writables, set([6]))
+        def handle_write_event():
+            dispatcher._writable = False
+        dispatcher.handle_write_event = handle_write_event
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.writables, set())
+
     def test_runforever_select_dispatcher_exitnow_via_read(self):
         options = DummyOptions()
         options.poller.result = [6], []
@@ -693,8 +850,9 @@ class SupervisordTests(unittest.TestCase):
         pgroup = DummyProcessGroup(gconfig)
         from supervisor.medusa import asyncore_25 as asyncore
         exitnow = DummyDispatcher(readable=True, error=asyncore.ExitNow)
-        pgroup.dispatchers = {6:exitnow}
+        options.process_map = {6:exitnow}
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         options.test = True
         self.assertRaises(asyncore.ExitNow, supervisord.runforever)
 
@@ -707,8 +865,9 @@ class SupervisordTests(unittest.TestCase):
         pgroup = DummyProcessGroup(gconfig)
         from supervisor.medusa import asyncore_25 as asyncore
         exitnow = DummyDispatcher(readable=True, error=asyncore.ExitNow)
-        pgroup.dispatchers = {6:exitnow}
+        options.process_map = {6:exitnow}
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         options.test = True
         self.assertRaises(asyncore.ExitNow, supervisord.runforever)
 
@@ -720,8 +879,9 @@ class SupervisordTests(unittest.TestCase):
         gconfig = DummyPGroupConfig(options, pconfigs=[pconfig])
         pgroup = DummyProcessGroup(gconfig)
         notimpl = DummyDispatcher(readable=True, error=NotImplementedError)
-        pgroup.dispatchers = {6:notimpl}
+        options.process_map = {6:notimpl}
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         options.test = True
         supervisord.runforever()
         self.assertEqual(notimpl.error_handled, True)
@@ -734,8 +894,9 @@ class SupervisordTests(unittest.TestCase):
         gconfig = DummyPGroupConfig(options, pconfigs=[pconfig])
         pgroup = DummyProcessGroup(gconfig)
         notimpl = DummyDispatcher(readable=True, error=NotImplementedError)
-        pgroup.dispatchers = {6:notimpl}
+        options.process_map = {6:notimpl}
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         options.test = True
         supervisord.runforever()
         self.assertEqual(notimpl.error_handled, True)
@@ -746,6 +907,7 @@ class SupervisordTests(unittest.TestCase):
         gconfig = DummyPGroupConfig(options)
         pgroup = DummyProcessGroup(gconfig)
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         supervisord.options.mood = SupervisorStates.SHUTDOWN
         L = []
         def callback(event):
@@ -771,6 +933,7 @@ class SupervisordTests(unittest.TestCase):
         def callback():
             L.append(1)
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         supervisord.options.mood = SupervisorStates.RESTARTING
         supervisord.options.test = True
         from supervisor.medusa import asyncore_25 as asyncore
@@ -789,6 +952,7 @@ class SupervisordTests(unittest.TestCase):
         def callback():
             L.append(1)
         supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
         supervisord.options.mood = SupervisorStates.RESTARTING
         supervisord.options.test = True
         supervisord.runforever()
@@ -799,6 +963,180 @@ class SupervisordTests(unittest.TestCase):
         result = getSupervisorStateDescription(SupervisorStates.RUNNING)
         self.assertEqual(result, 'RUNNING')
 
+    def test_tick_schedules_next_tick(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        supervisord.tick(now=6)
+        self.assertEqual(options.timers.get_deadline(supervisord), 10)
+        supervisord.tick(now=10)
+        self.assertEqual(options.timers.get_deadline(supervisord), 15)
+
+    def test_runforever_polls_until_nearest_deadline(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.timers.schedule(object(), time.time() + 0.5)
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(0 < options.poller.timeout <= 0.5)
+
+    def test_runforever_expired_deadline_polls_without_sleeping(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        pconfig = DummyPConfig(options, 'foo', '/bin/foo',)
+        thing = DummyProcess(pconfig)
+        options.timers.schedule(thing, 0)
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.timeout, 0)
+        self.assertEqual(options.timers.get_deadline(thing), None)
+
+    def test_runforever_transitions_only_due_objects(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        pconfig1 = DummyPConfig(options, 'foo', '/bin/foo',)
+        pconfig2 = DummyPConfig(options, 'bar', '/bin/bar',)
+        due = DummyProcess(pconfig1)
+        notdue = DummyProcess(pconfig2)
+        gconfig = DummyPGroupConfig(options)
+        idle = DummyProcessGroup(gconfig)
+        supervisord.process_groups = {'foo': idle}
+        supervisord.sorted_groups = [idle]
+        options.timers.schedule(due, 0)
+        options.timers.schedule(notdue, time.time() + 3600)
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(due.transitioned)
+        self.assertFalse(notdue.transitioned)
+        self.assertFalse(idle.transitioned)
+
+    def test_runforever_transitions_in_priority_order(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        L = []
+        class Group(DummyProcessGroup):
+            def transition(self):
+                L.append(self.config.name)
+        class Process(DummyProcess):
+            def transition(self):
+                L.append(self.config.name)
+        group1 = Group(DummyPGroupConfig(options, 'group1', priority=1))
+        group2 = Group(DummyPGroupConfig(options, 'group2', priority=2))
+        proc1 = Process(DummyPConfig(options, 'proc1', '/bin/foo',
+                                     priority=5))
+        proc1.group = group1
+        proc2 = Process(DummyPConfig(options, 'proc2', '/bin/foo',
+                                     priority=1))
+        proc2.group = group2
+        for obj in (proc2, group2, proc1, group1):
+            options.timers.schedule(obj, 0)
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(L, ['group1', 'proc1', 'group2', 'proc2'])
+
+    def test_runforever_transitions_spawn_scheduler_last(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        L = []
+        class Process(DummyProcess):
+            def transition(self):
+                L.append(self.config.name)
+        class Scheduler(object):
+            def transition(self):
+                L.append('scheduler')
+        proc = Process(DummyPConfig(options, 'proc', '/bin/foo',
+                                    priority=999))
+        proc.group = DummyProcessGroup(DummyPGroupConfig(options,
+                                                         priority=999))
+        scheduler = Scheduler()
+        options.timers.schedule(scheduler, 0)
+        options.timers.schedule(proc, 0)
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(L, ['proc', 'scheduler'])
+
+    def test_runforever_clock_rollback_transitions_all_groups(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        gconfig = DummyPGroupConfig(options)
+        pgroup = DummyProcessGroup(gconfig)
+        supervisord.process_groups = {'foo': pgroup}
+        supervisord.sorted_groups = [pgroup]
+        options.test = True
+        times = [1000, 10]
+        with patch('time.time', lambda: times.pop(0) if times else 10):
+            supervisord.runforever()
+        self.assertTrue(pgroup.transitioned)
+
+    def test_runforever_caps_timeout(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.timeout, 1)
+
+    def test_runforever_no_timeout_cap_with_signal_wakeup_fd(self):
+        options = DummyOptions()
+        options.signal_wakeup_fd = 99
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.timeout, None)
+        self.assertTrue(99 in options.poller.readables)
+
+    def test_runforever_deadline_with_signal_wakeup_fd(self):
+        options = DummyOptions()
+        options.signal_wakeup_fd = 99
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.timers.schedule(object(), time.time() + 30)
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(1 < options.poller.timeout <= 30)
+
+    def test_runforever_pending_signal_polls_without_sleeping(self):
+        options = DummyOptions()
+        options.signal_wakeup_fd = 99
+        options._signal = signal.SIGCHLD
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.test = True
+        supervisord.runforever()
+        self.assertEqual(options.poller.timeout, 0)
+
+    def test_runforever_drains_signal_wakeup_fd(self):
+        options = DummyOptions()
+        options.signal_wakeup_fd = 99
+        options.poller.result = [99], []
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(options.signal_wakeup_drained)
+
+    def test_runforever_updates_log_readers(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(options.log_readers_updated)
+        self.assertEqual(options.logger.data, [])
+
+    def test_runforever_wakes_up_for_deferred_channel(self):
+        options = DummyOptions()
+        supervisord = self._makeOne(options)
+        supervisord.tick = lambda: None
+        channel = DummyDispatcher()
+        deadline = time.time() + 0.25
+        channel.get_deadline = lambda: deadline
+        options.socket_map = {6:channel}
+        options.test = True
+        supervisord.runforever()
+        self.assertTrue(0 < options.poller.timeout <= 0.25)
+
     def test_tick(self):
         from supervisor import events
         L = []
@@ -0,0 +1,92 @@
+import unittest
+
+class TimerQueueTests(unittest.TestCase):
+    def _getTargetClass(self):
+        from supervisor.timers import TimerQueue
+        return TimerQueue
+
+    def _makeOne(self):
+        return self._getTargetClass()()
+
+    def test_empty(self):
+        queue = self._makeOne()
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.next_deadline(), None)
+        self.assertEqual(queue.pop_expired(100), [])
+
+    def test_schedule(self):
+        queue = self._makeOne()
+        a, b = Thing(), Thing()
+        queue.schedule(a, 20)
+        queue.schedule(b, 10)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.next_deadline(), 10)
+        self.assertEqual(queue.get_deadline(a), 20)
+        self.assertEqual(queue.get_deadline(b), 10)
+
+    def test_schedule_replaces_deadline(self):
+        queue = self._makeOne()
+        a = Thing()
+        queue.schedule(a, 10)
+        queue.schedule(a, 20)
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.next_deadline(), 20)
+        self.assertEqual(queue.pop_expired(15), [])
+        self.assertEqual(queue.pop_expired(20), [a])
+
+    def test_schedule_same_deadline_is_noop(self):
+        queue = self._makeOne()
+        a = Thing()
+        queue.schedule(a, 10)
+        queue.schedule(a, 10)
+        self.assertEqual(len(queue._heap), 1)
+
+    def test_schedule_objects_that_compare_equal(self):
+        queue = self._makeOne()
+        a, b = Equal(), Equal()
+        queue.schedule(a, 10)
+        queue.schedule(b, 10)
+        expired = queue.pop_expired(10)
+        self.assertEqual(len(expired), 2)
+        self.assertTrue(expired[0] is a)
+        self.assertTrue(expired[1] is b)
+
+    def test_cancel(self):
+        queue = self._makeOne()
+        a, b = Thing(), Thing()
+        queue.schedule(a, 10)
+        queue.schedule(b, 20)
+        queue.cancel(a)
+        queue.cancel(a) # make sure we don't error if we cancel twice
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.get_deadline(a), None)
+        self.assertEqual(queue.next_deadline(), 20)
+        self.assertEqual(queue.pop_expired(30), [b])
+
+    def test_pop_expired(self):
+        queue = self._makeOne()
+        a, b, c = Thing(), Thing(), Thing()
+        queue.schedule(c, 30)
+        queue.schedule(a, 10)
+        queue.schedule(b, 20)
+        self.assertEqual(queue.pop_expired(5), [])
+        self.assertEqual(queue.pop_expired(20), [a, b])
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.next_deadline(), 30)
+
+    def test_compacts_superseded_entries(self):
+        queue = self._makeOne()
+        a = Thing()
+        for deadline in range(1000):
+            queue.schedule(a, 1000 - deadline)
+        self.assertTrue(len(queue._heap) < 100)
+        self.assertEqual(queue.next_deadline(), 1)
+        self.assertEqual(queue.pop_expired(1), [a])
+
+class Thing:
+    pass
+
+class Equal:
+    def __eq__(self, other):
+        return True
+    __hash__ = None
@@ -0,0 +1,72 @@
+# This module must not depend on any other non-stdlib module to prevent
+# circular import problems.
+
+import heapq
+
+class TimerQueue:
+    """ A priority queue of deadlines used by the mainloop to decide how
+    long it may sleep.  Each object (a process, a pool, the supervisor
+    itself) has at most one pending deadline; scheduling a new one
+    replaces the old one.  Objects are tracked by identity because
+    process and group objects compare equal by priority. """
+
+    def __init__(self):
+        self._heap = [] # heap of [deadline, seq, obj] entries
+        self._entries = {} # id(obj) -> live heap entry
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, obj, deadline):
+        """ Arrange for obj to be returned by pop_expired() once the time
+        reaches deadline, replacing any deadline obj already had. """
+        key = id(obj)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == deadline:
+            return
+        self._seq += 1
+        entry = [deadline, self._seq, obj]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def cancel(self, obj):
+        """ Forget the deadline of obj, if any. """
+        self._entries.pop(id(obj), None)
+
+    def get_deadline(self, obj):
+        entry = self._entries.get(id(obj))
+        if entry is None:
+            return None
+        return entry[0]
+
+    def next_deadline(self):
+        """ Return the earliest pending deadline, or None if there are no
+        pending deadlines. """
+        heap = self._heap
+        while heap:
+            entry = heap[0]
+            if self._entries.get(id(entry[2])) is entry:
+                return entry[0]
+            heapq.heappop(heap) # superseded or cancelled
+        return None
+
+    def pop_expired(self, now):
+        """ Remove and return the objects whose deadline is at or before
+        now, earliest first. """
+        expired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            key = id(entry[2])
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                expired.append(entry[2])
+        return expired
+
+    def _compact(self):
+        # drop superseded and cancelled entries that have piled up
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)